@@ -0,0 +1,5 @@
+import os
+import sys
+
+# watchmanlogs.py fica no diretório pai (executado como script, sem pacote)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
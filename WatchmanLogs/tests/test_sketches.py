@@ -0,0 +1,129 @@
+"""Sketches mescláveis: limite de erro do Misra-Gries, --merge misto e bytes fora do UTF-8"""
+
+import collections
+import json
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+from watchmanlogs import AccessLogStats, MisraGries, format_report
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'watchmanlogs.py')
+
+def _stream(seed: int, length: int, distinct: int = 5000):
+    """Fluxo com cauda longa (Zipf aproximado) e determinístico"""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(distinct)]
+    return [b"item-%d" % index for index in rng.choices(range(distinct), weights, k=length)]
+
+def _check_bound(sketch: MisraGries, exact: collections.Counter, epsilon: float):
+    total = sum(exact.values())
+    assert sketch.total == total
+    assert sketch.error <= total / (sketch.capacity + 1) <= epsilon * total
+    for item, count in exact.items():
+        estimate = sketch.counters.get(item, 0)
+        assert estimate <= count <= estimate + sketch.error
+    # Todo item acima de ε·N aparece no sketch
+    assert all(item in sketch.counters for item, count in exact.items() if count > epsilon * total)
+
+@pytest.mark.parametrize('epsilon', [0.01, 0.002])
+def test_misra_gries_error_is_bounded_by_epsilon_n(epsilon):
+    items = _stream(43, 60000)
+    sketch = MisraGries(epsilon)
+    sketch.update(items)
+    assert sketch.error > 0
+    _check_bound(sketch, collections.Counter(items), epsilon)
+
+def test_merged_sketches_keep_the_bound():
+    epsilon = 0.01
+    parts = [_stream(seed, 20000) for seed in (1, 2, 3)]
+    merged = MisraGries(epsilon)
+    for part in parts:
+        sketch = MisraGries(epsilon)
+        sketch.update(part)
+        merged.merge(MisraGries.from_dict(json.loads(json.dumps(sketch.to_dict()))))
+    _check_bound(merged, collections.Counter(item for part in parts for item in part), epsilon)
+
+def _log_lines(seed: int, count: int):
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(count):
+        ip = f"10.0.{rng.randrange(4)}.{rng.randrange(1, 60)}"
+        path = f"/page/{rng.randrange(300)}"
+        lines.append(f'{ip} - - [18/Oct/2026:14:00:00 +0000] "GET {path} HTTP/1.1" 200 512 "-" "agent/{rng.randrange(5)}"\n'
+                     .encode())
+    return lines
+
+def _roundtrip(stats: AccessLogStats) -> AccessLogStats:
+    return AccessLogStats.from_dict(json.loads(json.dumps(stats.to_dict())))
+
+@pytest.mark.parametrize('exact_first', [True, False])
+def test_mixed_mode_merge_converts_exact_side_and_keeps_bound(exact_first):
+    small, large = _log_lines(7, 3000), _log_lines(8, 20000)
+    exact_stats = AccessLogStats(exact=True)
+    exact_stats.add_lines(small)
+    sketch_stats = AccessLogStats(exact=False, epsilon=0.01)
+    sketch_stats.add_lines(large)
+    first, second = (exact_stats, sketch_stats) if exact_first else (sketch_stats, exact_stats)
+    
+    merged = _roundtrip(first)
+    merged.merge(_roundtrip(second))
+    assert not merged.exact
+    assert merged.lines == 23000
+    assert merged.counters['ip'].capacity == 100
+    
+    truth = AccessLogStats(exact=True)
+    truth.add_lines(small + large)
+    for field in ('ip', 'path', 'user_agent'):
+        _check_bound(merged.counters[field], collections.Counter(truth.counters[field].counters), 0.01)
+    assert abs(merged.distinct.estimate() - truth.distinct.estimate()) <= 0.05 * truth.distinct.estimate()
+    # A mesclagem não altera o estado exato original
+    assert exact_stats.exact
+
+def test_merge_rejects_different_status_filter():
+    with pytest.raises(ValueError):
+        AccessLogStats(status='404').merge(AccessLogStats())
+
+@pytest.mark.parametrize('exact', [True, False])
+def test_non_utf8_bytes_survive_state_roundtrip(exact):
+    path = b'/\xff\xfe%C3\xa9/\xc3'
+    agent = b'curl/\x80\x81'
+    line = b'192.0.2.1 - - [18/Oct/2026:14:00:00 +0000] "GET ' + path + b' HTTP/1.1" 404 0 "-" "' + agent + b'"\n'
+    stats = AccessLogStats(exact=exact)
+    stats.add_lines([line, line])
+    
+    state = json.dumps(stats.to_dict())
+    state.encode('utf-8')
+    restored = AccessLogStats.from_dict(json.loads(state))
+    assert restored.counters['path'].top(1)[0][:2] == (path, 2)
+    assert restored.counters['user_agent'].top(1)[0][:2] == (agent, 2)
+    assert '�' in format_report(restored)
+
+def _run(*args, **kwargs):
+    return subprocess.run([sys.executable, SCRIPT, *args], capture_output=True, **kwargs)
+
+def test_cli_merges_exact_and_sketch_states(tmp_path):
+    small, large = tmp_path / 'small.log', tmp_path / 'large.log'
+    small.write_bytes(b''.join(_log_lines(7, 3000)) + b'198.51.100.7 - - [x] "GET /\xff HTTP/1.1" 200 1 "-" "\xfe"\n')
+    large.write_bytes(b''.join(_log_lines(8, 20000)))
+    assert _run(str(small), '--exact', '--save-state', str(tmp_path / 'a.json')).returncode == 0
+    assert _run(str(large), '--sketch', '--epsilon', '0.01', '--save-state', str(tmp_path / 'b.json')).returncode == 0
+    
+    result = _run('--merge', str(tmp_path / 'a.json'), str(tmp_path / 'b.json'))
+    assert result.returncode == 0, result.stderr
+    assert b'23001' in result.stdout
+
+def test_cli_exits_quietly_when_stdout_pipe_closes(tmp_path):
+    log = tmp_path / 'access.log'
+    log.write_bytes(b''.join(_log_lines(9, 2000)))
+    process = subprocess.Popen([sys.executable, SCRIPT, str(log), '--top', '500'],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    process.stdout.close()
+    stderr = process.stderr.read()
+    process.stderr.close()
+    assert process.wait() == 1
+    assert b'Traceback' not in stderr
+    assert b'BrokenPipeError' not in stderr
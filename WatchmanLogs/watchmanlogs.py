@@ -0,0 +1,1450 @@
+#!/usr/bin/env python3
+"""
+WatchmanLogs - contagens em streaming para logs de acesso do Apache2
+
+Versão em Python das receitas 6 e 9 do README (IPs com mais 404 e
+requisições por IP) que não ordena o log inteiro: `sort | uniq -c` custa
+O(n log n) em tempo e memória, enquanto aqui cada linha é lida uma vez.
+
+- Top-K de IPs, caminhos e User-Agents com Misra-Gries: memória fixa
+  (no máximo 2/ε contadores por campo) e erro de contagem <= ε·N.
+- IPs distintos estimados com HyperLogLog: memória fixa (2^p bytes) e
+  erro relativo típico de 1,04/√(2^p).
+- Modo exato (Counter/set) para arquivos pequenos: sem erro algum.
+
+Os resultados são mescláveis: pedaços do mesmo arquivo (--jobs) ou de
+servidores diferentes (--save-state / --merge) se combinam sem reler logs.
+
+Uso:
+  python3 watchmanlogs.py access.log
+  python3 watchmanlogs.py access.log --status 404 --top 20
+  python3 watchmanlogs.py access.log --jobs 8 --save-state web1.json
+  python3 watchmanlogs.py --merge web1.json web2.json
+  python3 watchmanlogs.py /var/log/apache2/access.log --rotated --prefetch
+  python3 watchmanlogs.py '/var/log/apache2/access.log*'
+
+Segmentos rotacionados (.gz, .bz2, .xz; .zst via binário zstd) são lidos em
+streaming, em blocos grandes, sem descompactar nada para o disco.
+
+O formato do log é configurável (--log-format): LogFormat do Apache,
+log_format do nginx ou um preset (vhost_combined, proxy_combined, nginx...).
+Cada formato vira um parser gerado que extrai só os campos usados.
+
+Para investigações com muitas consultas sobre o mesmo log, --cache DIR
+interpreta o log uma única vez e guarda colunas de inteiros (códigos de
+IP/caminho/User-Agent, epoch, status, bytes) que as execuções seguintes
+abrem com mmap, sem reler o texto.
+"""
+
+import os
+import re
+import bz2
+import sys
+import glob
+import gzip
+import json
+import lzma
+import math
+import mmap
+import array
+import heapq
+import queue
+import bisect
+import shutil
+import socket
+import hashlib
+import argparse
+import calendar
+import datetime
+import functools
+import operator
+import itertools
+import threading
+import subprocess
+import collections
+import concurrent.futures
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+FIELDS = ('ip', 'path', 'user_agent')
+# Campos pedidos ao parser pelas contagens (na ordem da tupla devolvida)
+STATS_FIELDS = ('ip', 'path', 'status', 'user_agent')
+FIELD_TITLES = {'ip': 'IPs', 'path': 'Caminhos', 'user_agent': 'User-Agents'}
+DEFAULT_TOP = 10
+# ε = 0,0001: até 20 mil contadores por campo; a contagem de um item erra no máximo 0,01% do total
+DEFAULT_EPSILON = 0.0001
+DEFAULT_HLL_ERROR = 0.01
+# Modo automático: arquivos até este tamanho são contados de forma exata
+EXACT_MAX_BYTES = 64 * 1024 * 1024
+READ_BATCH = 65536
+STATE_VERSION = 1
+READ_BLOCK_SIZE = 1024 * 1024
+# Blocos já descompactados que a thread de leitura pode adiantar (--prefetch)
+PREFETCH_BLOCKS = 8
+DECOMPRESSORS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open, '.lzma': lzma.open}
+# zstd não faz parte da biblioteca padrão: usa o binário 'zstd -dc' quando instalado
+ZSTD_SUFFIXES = ('.zst', '.zstd')
+# Rotações do logrotate: access.log.1, access.log.2.gz (número) ou access.log-20261018.gz (dateext)
+ROTATION_SUFFIX = re.compile(r'^(?:\.(?P<index>\d+)|-(?P<date>\d{8,10}))(?:\.(?:gz|bz2|xz|lzma|zst|zstd))?$')
+
+# --- Serialização de itens (bytes do log <-> JSON) ---
+def _encode_item(item: bytes) -> str:
+    return item.decode('utf-8', 'surrogateescape')
+
+def _decode_item(item: str) -> bytes:
+    return item.encode('utf-8', 'surrogateescape')
+
+# --- Heavy Hitters ---
+class MisraGries:
+    """Top-K aproximado com memória fixa (Misra-Gries com compressão em lote)
+
+    Guarda até 2k contadores (k = ⌈1/ε⌉). Ao passar disso, subtrai de todos a
+    (k+1)-ésima maior contagem e descarta os que zeram. A estimativa de cada
+    item fica em [contagem, contagem + error], com error <= total/(k+1).
+    A mesclagem soma os contadores e comprime do mesmo jeito.
+    """
+    kind = 'misra-gries'
+    
+    def __init__(self, epsilon: float = DEFAULT_EPSILON, capacity: int = None):
+        self.capacity = capacity or math.ceil(1 / epsilon)
+        self.counters: Dict[bytes, int] = {}
+        self.total = 0
+        self.error = 0
+    
+    def update(self, items: Iterable[bytes]):
+        counters = self.counters
+        limit = 2 * self.capacity
+        get = counters.get
+        count = 0
+        for item in items:
+            counters[item] = get(item, 0) + 1
+            count += 1
+            if len(counters) > limit:
+                self._compress()
+                counters = self.counters
+                get = counters.get
+        self.total += count
+    
+    def _compress(self):
+        if len(self.counters) <= self.capacity:
+            return
+        threshold = heapq.nlargest(self.capacity + 1, self.counters.values())[-1]
+        self.error += threshold
+        self.counters = {item: count - threshold for item, count in self.counters.items() if count > threshold}
+    
+    def merge(self, other: 'MisraGries'):
+        self.capacity = min(self.capacity, other.capacity)
+        counters = self.counters
+        for item, count in other.counters.items():
+            counters[item] = counters.get(item, 0) + count
+        self.total += other.total
+        self.error += other.error
+        if len(counters) > self.capacity:
+            self._compress()
+    
+    @classmethod
+    def from_exact(cls, exact: 'ExactCounter', capacity: int) -> 'MisraGries':
+        """Converte uma contagem exata (para mesclar com sketches do mesmo tamanho)"""
+        sketch = cls(capacity=capacity)
+        sketch.counters = dict(exact.counters)
+        sketch.total = exact.total
+        sketch._compress()
+        return sketch
+    
+    def top(self, count: int) -> List[Tuple[bytes, int, int]]:
+        """(item, estimativa mínima, estimativa máxima) dos mais frequentes"""
+        return [(item, estimate, estimate + self.error)
+                for item, estimate in heapq.nlargest(count, self.counters.items(), key=operator.itemgetter(1))]
+    
+    def to_dict(self) -> Dict:
+        return {'kind': self.kind, 'capacity': self.capacity, 'total': self.total, 'error': self.error,
+                'counters': [[_encode_item(item), count] for item, count in self.counters.items()]}
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'MisraGries':
+        sketch = cls(capacity=data['capacity'])
+        sketch.total = data['total']
+        sketch.error = data['error']
+        sketch.counters = {_decode_item(item): count for item, count in data['counters']}
+        return sketch
+
+class ExactCounter:
+    """Contagem exata (mesma interface do MisraGries) para arquivos pequenos"""
+    kind = 'exact'
+    error = 0
+    
+    def __init__(self):
+        self.counters: collections.Counter = collections.Counter()
+        self.total = 0
+    
+    def update(self, items: Iterable[bytes]):
+        items = list(items)
+        self.counters.update(items)
+        self.total += len(items)
+    
+    def merge(self, other: 'ExactCounter'):
+        self.counters.update(other.counters)
+        self.total += other.total
+    
+    def top(self, count: int) -> List[Tuple[bytes, int, int]]:
+        return [(item, value, value) for item, value in self.counters.most_common(count)]
+    
+    def to_dict(self) -> Dict:
+        return {'kind': self.kind, 'total': self.total,
+                'counters': [[_encode_item(item), count] for item, count in self.counters.items()]}
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ExactCounter':
+        counter = cls()
+        counter.total = data['total']
+        counter.counters = collections.Counter({_decode_item(item): count for item, count in data['counters']})
+        return counter
+
+# --- Cardinalidade ---
+class HyperLogLog:
+    """Estimativa de elementos distintos em 2^p bytes (erro relativo típico 1,04/√2^p)"""
+    
+    def __init__(self, error: float = DEFAULT_HLL_ERROR, precision: int = None):
+        self.precision = precision or min(18, max(4, math.ceil(math.log2((1.04 / error) ** 2))))
+        self.registers = bytearray(1 << self.precision)
+    
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+    
+    def update(self, items: Iterable[bytes]):
+        registers = self.registers
+        shift = 64 - self.precision
+        mask = (1 << shift) - 1
+        blake2b = hashlib.blake2b
+        for item in items:
+            value = int.from_bytes(blake2b(item, digest_size=8).digest(), 'big')
+            index = value >> shift
+            # Posição do primeiro bit 1 nos bits restantes (1 = bit mais alto)
+            rank = shift - (value & mask).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+    
+    def estimate(self) -> int:
+        registers = self.registers
+        size = len(registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -rank for rank in registers)
+        zeros = registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            # Poucos elementos: contagem linear dos registradores vazios é mais precisa
+            estimate = size * math.log(size / zeros)
+        return round(estimate)
+    
+    @classmethod
+    def from_exact(cls, exact: 'ExactSet', precision: int) -> 'HyperLogLog':
+        sketch = cls(precision=precision)
+        sketch.update(exact.items)
+        return sketch
+    
+    def merge(self, other: 'HyperLogLog'):
+        if other.precision != self.precision:
+            raise ValueError(f"HyperLogLog com precisões diferentes ({self.precision} e {other.precision})")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+    
+    def to_dict(self) -> Dict:
+        return {'precision': self.precision, 'registers': self.registers.hex()}
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'HyperLogLog':
+        sketch = cls(precision=data['precision'])
+        sketch.registers = bytearray.fromhex(data['registers'])
+        return sketch
+
+class ExactSet:
+    """Distintos exatos (mesma interface do HyperLogLog)"""
+    relative_error = 0.0
+    
+    def __init__(self):
+        self.items = set()
+    
+    def update(self, items: Iterable[bytes]):
+        self.items.update(items)
+    
+    def estimate(self) -> int:
+        return len(self.items)
+    
+    def merge(self, other: 'ExactSet'):
+        self.items |= other.items
+    
+    def to_dict(self) -> Dict:
+        return {'items': [_encode_item(item) for item in self.items]}
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ExactSet':
+        distinct = cls()
+        distinct.items = {_decode_item(item) for item in data['items']}
+        return distinct
+
+# --- Entrada (rotação e compressão) ---
+def is_compressed(path: str) -> bool:
+    return os.path.splitext(path)[1] in DECOMPRESSORS or path.endswith(ZSTD_SUFFIXES)
+
+def rotation_set(path: str) -> List[str]:
+    """Arquivo atual e suas rotações, do segmento mais antigo ao atual"""
+    directory = os.path.dirname(path) or '.'
+    name = os.path.basename(path)
+    segments = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name == name:
+                segments.append(((2, 0), entry.path))
+                continue
+            if not entry.name.startswith(name):
+                continue
+            match = ROTATION_SUFFIX.match(entry.name[len(name):])
+            if match is None:
+                continue
+            if match.group('index'):
+                # Número maior = rotação mais antiga
+                segments.append(((1, -int(match.group('index'))), entry.path))
+            else:
+                segments.append(((0, int(match.group('date'))), entry.path))
+    if not segments:
+        raise ValueError(f"Nenhum segmento encontrado para '{path}'")
+    return [segment for _, segment in sorted(segments)]
+
+def order_segments(paths: Iterable[str]) -> List[str]:
+    """Ordena segmentos pelo fim do período que cobrem (mtime = última escrita)"""
+    return sorted(paths, key=lambda path: (os.stat(path).st_mtime, path))
+
+def expand_inputs(patterns: List[str], rotated: bool = False) -> List[str]:
+    """Resolve globs (ordenados por tempo) e, com rotated, o conjunto de rotação de cada arquivo"""
+    segments = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = order_segments(path for path in glob.glob(pattern) if os.path.isfile(path))
+            if not matches:
+                raise ValueError(f"Nenhum arquivo corresponde a '{pattern}'")
+        elif rotated:
+            matches = rotation_set(pattern)
+        else:
+            matches = [pattern]
+        segments.extend(path for path in matches if path not in segments)
+    return segments
+
+def _segment_blocks(path: str, block_size: int = READ_BLOCK_SIZE) -> Iterator[bytes]:
+    """Blocos descompactados de um segmento; sempre termina em quebra de linha"""
+    last = b''
+    if path.endswith(ZSTD_SUFFIXES):
+        zstd = shutil.which('zstd')
+        if zstd is None:
+            raise ValueError(f"{path}: zstd não é suportado pela biblioteca padrão; instale o binário 'zstd'")
+        with subprocess.Popen([zstd, '-dcq', path], stdout=subprocess.PIPE) as process:
+            for block in iter(lambda: process.stdout.read(block_size), b''):
+                last = block
+                yield block
+        if process.returncode != 0:
+            raise ValueError(f"{path}: zstd terminou com código {process.returncode}")
+    else:
+        opener = DECOMPRESSORS.get(os.path.splitext(path)[1], open)
+        try:
+            with opener(path, 'rb') as f:
+                for block in iter(lambda: f.read(block_size), b''):
+                    last = block
+                    yield block
+        except (EOFError, lzma.LZMAError) as e:
+            raise ValueError(f"{path}: arquivo compactado corrompido ou truncado ({e})")
+    # Última linha sem '\n' não pode se juntar à primeira do próximo segmento
+    if last and not last.endswith(b'\n'):
+        yield b'\n'
+
+def _prefetch(blocks: Iterator[bytes], depth: int = PREFETCH_BLOCKS) -> Iterator[bytes]:
+    """Lê/descompacta em uma thread em segundo plano (zlib, bz2 e lzma liberam o GIL)"""
+    pending: queue.Queue = queue.Queue(depth)
+    stop = threading.Event()
+    done = object()
+    
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def producer():
+        try:
+            for block in blocks:
+                if not put(block):
+                    return
+        except Exception as e:
+            put(e)
+        put(done)
+    
+    thread = threading.Thread(target=producer, name='watchmanlogs-prefetch', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = pending.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+def read_blocks(paths: List[str], block_size: int = READ_BLOCK_SIZE, prefetch: bool = False) -> Iterator[bytes]:
+    """Blocos de todos os segmentos em sequência, descompactados em streaming (nada vai para o disco)"""
+    blocks = (block for path in paths for block in _segment_blocks(path, block_size))
+    return _prefetch(blocks) if prefetch else blocks
+
+def line_batches(blocks: Iterable[bytes]) -> Iterator[List[bytes]]:
+    """Linhas completas (sem '\n') agrupadas por bloco lido"""
+    carry = b''
+    for block in blocks:
+        lines = (carry + block).split(b'\n')
+        carry = lines.pop()
+        yield lines
+    if carry:
+        yield [carry]
+
+# --- Formatos de Log ---
+# Formatos do Apache (LogFormat) e do nginx (log_format) mais comuns
+LOG_FORMAT_PRESETS = {
+    'combined': '%h %l %u %t "%r" %>s %O "%{Referer}i" "%{User-Agent}i"',
+    'common': '%h %l %u %t "%r" %>s %O',
+    'vhost_combined': '%v:%p %h %l %u %t "%r" %>s %O "%{Referer}i" "%{User-Agent}i"',
+    'proxy_combined': '%{X-Forwarded-For}i %l %u %t "%r" %>s %b "%{Referer}i" "%{User-Agent}i"',
+    'nginx': '$remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent '
+             '"$http_referer" "$http_user_agent"',
+    'nginx_main': '$remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent '
+                  '"$http_referer" "$http_user_agent" "$http_x_forwarded_for"',
+}
+DEFAULT_LOG_FORMAT = 'combined'
+MONTHS = {name: index for index, name in enumerate(
+    (b'Jan', b'Feb', b'Mar', b'Apr', b'May', b'Jun', b'Jul', b'Aug', b'Sep', b'Oct', b'Nov', b'Dec'), 1)}
+# Campos que o parser pode devolver; ip e path são derivados das fontes abaixo
+LOG_FIELDS = ('ip', 'time', 'path', 'status', 'bytes', 'user_agent', 'referer', 'vhost')
+APACHE_DIRECTIVES = {
+    'h': 'remote', 'a': 'remote', 't': 'time', 'r': 'request', 'U': 'path', 's': 'status',
+    'b': 'bytes', 'B': 'bytes', 'O': 'bytes', 'v': 'vhost', 'V': 'vhost',
+}
+APACHE_HEADERS = {'x-forwarded-for': 'forwarded_for', 'user-agent': 'user_agent', 'referer': 'referer'}
+NGINX_VARIABLES = {
+    'remote_addr': 'remote', 'http_x_forwarded_for': 'forwarded_for', 'time_local': 'time',
+    'time_iso8601': 'time_iso', 'request': 'request', 'request_uri': 'path', 'uri': 'path',
+    'status': 'status', 'body_bytes_sent': 'bytes', 'bytes_sent': 'bytes', 'http_user_agent': 'user_agent',
+    'http_referer': 'referer', 'host': 'vhost', 'server_name': 'vhost',
+}
+APACHE_TOKEN = re.compile(r'%%|%[<>]?(?:!?[\d,]+)?(?:\{([^}]*)\})?[<>]?([a-zA-Z])')
+NGINX_TOKEN = re.compile(r'\$\{?([a-zA-Z_][a-zA-Z0-9_]*)\}?')
+
+def tokenize_log_format(spec: str) -> List[Tuple[str, object]]:
+    """[('literal', bytes) | ('field', fonte ou None)] de um LogFormat/log_format"""
+    is_nginx = '$' in spec and '%' not in spec
+    tokens: List[Tuple[str, object]] = []
+    position = 0
+    for match in (NGINX_TOKEN if is_nginx else APACHE_TOKEN).finditer(spec):
+        literal = spec[position:match.start()]
+        position = match.end()
+        if not is_nginx and match.group(0) == '%%':
+            literal += '%'
+        if not is_nginx and match.group(2) == 't':
+            # %t do Apache já sai entre colchetes
+            literal += '['
+        _append_literal(tokens, literal)
+        if not is_nginx and match.group(0) == '%%':
+            continue
+        if is_nginx:
+            source = NGINX_VARIABLES.get(match.group(1))
+        elif match.group(2) == 'i':
+            source = APACHE_HEADERS.get((match.group(1) or '').lower())
+        elif match.group(2) == 't' and match.group(1):
+            raise ValueError(f"Formato de horário personalizado não suportado: {match.group(0)}")
+        else:
+            source = APACHE_DIRECTIVES.get(match.group(2))
+        tokens.append(('field', source))
+        if not is_nginx and match.group(2) == 't':
+            _append_literal(tokens, ']')
+    _append_literal(tokens, spec[position:])
+    return tokens
+
+def _append_literal(tokens: List[Tuple[str, object]], literal: str):
+    if not literal:
+        return
+    if tokens and tokens[-1][0] == 'literal':
+        tokens[-1] = ('literal', tokens[-1][1] + literal.encode())
+    else:
+        tokens.append(('literal', literal.encode()))
+
+def _required_sources(sources: List[str], fields: Tuple[str, ...],
+                      optional: Tuple[str, ...] = ()) -> Dict[str, List[str]]:
+    """Fontes do formato que alimentam cada campo pedido (na ordem de preferência)"""
+    options = {
+        'ip': ['forwarded_for', 'remote'],
+        'path': ['path', 'request'],
+        'time': ['time', 'time_iso'],
+    }
+    required = {}
+    for field in fields:
+        if field not in LOG_FIELDS:
+            raise ValueError(f"Campo desconhecido: {field} (use {', '.join(LOG_FIELDS)})")
+        available = [source for source in options.get(field, [field]) if source in sources]
+        if not available and field not in optional:
+            raise ValueError(f"O formato de log não contém o campo '{field}'")
+        required[field] = available
+    return required
+
+def _derive_expressions(required: Dict[str, List[str]]) -> Tuple[List[str], List[str]]:
+    """Código que deriva cada campo pedido a partir das variáveis v_<fonte>"""
+    body, values = [], []
+    for field, available in required.items():
+        source = available[0] if available else None
+        if source is None:
+            # Campo opcional ausente do formato
+            values.append("b'-'")
+        elif field == 'ip' and source == 'forwarded_for':
+            # X-Forwarded-For: o último endereço foi anexado pelo proxy (os anteriores vêm do cliente
+            # e podem ser forjados); ausente ('-') usa o endereço remoto
+            fallback = 'v_remote' if 'remote' in available else 'v_forwarded_for'
+            body.append("ip = v_forwarded_for.rsplit(b',', 1)[-1].strip() "
+                        f"if v_forwarded_for != b'-' else {fallback}")
+            values.append('ip')
+        elif field == 'path' and source == 'request':
+            body.append("request = v_request.split(b' ', 2)")
+            body.append("if len(request) < 2:")
+            body.append("    return None")
+            values.append('request[1]')
+        else:
+            values.append(f'v_{source}')
+    return body, values
+
+def _compile_regex(tokens: List[Tuple[str, object]], needed: set):
+    """Parser de referência: uma expressão regular com grupos só para as fontes usadas"""
+    parts = ['^']
+    named = set()
+    for index, (kind, value) in enumerate(tokens):
+        if kind == 'literal':
+            parts.append(re.escape(value))
+            continue
+        following = tokens[index + 1][1] if index + 1 < len(tokens) else None
+        if following is None:
+            pattern = rb'.*?(?=\r?\n?$)'
+        elif isinstance(following, bytes):
+            stop = following[:1]
+            # Dentro de aspas o Apache/nginx escapam '"' como '\"'
+            pattern = (rb'(?:[^"\\]|\\.)*' if stop == b'"' else b'[^' + re.escape(stop) + b']*')
+        else:
+            pattern = rb'\S*'
+        if value in needed and value not in named:
+            named.add(value)
+            parts.append(b'(?P<' + value.encode() + b'>' + pattern + b')')
+        else:
+            parts.append(b'(?:' + pattern + b')')
+    regex = re.compile(b''.join(part if isinstance(part, bytes) else part.encode() for part in parts))
+    return regex
+
+def _find_chain(tokens: List[Tuple[str, object]], needed: set, var: str, assigned: set) -> Optional[List[str]]:
+    """find/fatia sobre `var` até o último campo necessário; None se dois campos não têm separador"""
+    last = max((index for index, (kind, value) in enumerate(tokens)
+                if kind == 'field' and value in needed and value not in assigned), default=-1)
+    body = ["i = 0"]
+    index = 0
+    while index <= last:
+        kind, value = tokens[index]
+        if kind == 'literal':
+            body.append(f"if not {var}.startswith({value!r}, i):")
+            body.append("    return None")
+            body.append(f"i += {len(value)}")
+            index += 1
+            continue
+        following = tokens[index + 1] if index + 1 < len(tokens) else None
+        capture = value in needed and value not in assigned
+        if following is None:
+            if capture:
+                # Último campo do formato: a linha pode vir com a quebra de linha
+                body.append(f"v_{value} = {var}[i:].rstrip(b'\\r\\n')")
+            index += 1
+        elif following[0] == 'literal':
+            body.append(f"j = {var}.find({following[1]!r}, i)")
+            body.append("if j < 0:")
+            body.append("    return None")
+            if capture:
+                body.append(f"v_{value} = {var}[i:j]")
+            body.append(f"i = j + {len(following[1])}")
+            index += 2
+        else:
+            return None
+        if capture:
+            assigned.add(value)
+    return body
+
+def _split_quoted(tokens: List[Tuple[str, object]]) -> List[List[Tuple[str, object]]]:
+    """Tokens agrupados pelos trechos entre aspas do formato (como line.split(b'"'))"""
+    segments: List[List[Tuple[str, object]]] = [[]]
+    for kind, value in tokens:
+        if kind == 'field':
+            segments[-1].append((kind, value))
+            continue
+        for position, piece in enumerate(value.split(b'"')):
+            if position:
+                segments.append([])
+            if piece:
+                segments[-1].append(('literal', piece))
+    return segments
+
+def _generate_fast_path(tokens: List[Tuple[str, object]], needed: set) -> Optional[List[str]]:
+    """Código do caminho rápido: split nas aspas e, em cada trecho, split() ou find/fatia"""
+    if not any(kind == 'literal' and b'"' in value for kind, value in tokens):
+        return _find_chain(tokens, needed, 'line', set())
+    
+    segments = _split_quoted(tokens)
+    body = [
+        # Aspas escapadas quebram a divisão por '"': essas linhas vão para a regex
+        "if b'\\\\\"' in line:",
+        "    return _regex_parse(line)",
+        "parts = line.split(b'\"')",
+        f"if len(parts) < {len(segments)}:",
+        "    return _regex_parse(line)",
+    ]
+    assigned: set = set()
+    for position, segment in enumerate(segments):
+        fields = [value for kind, value in segment if kind == 'field']
+        if not any(value in needed and value not in assigned for value in fields):
+            continue
+        var = f'part{position}'
+        body.append(f"{var} = parts[{position}]")
+        if segment == [('field', fields[0])]:
+            final = position == len(segments) - 1
+            body[-1] = f"v_{fields[0]} = parts[{position}]" + (".rstrip(b'\\r\\n')" if final else "")
+            assigned.add(fields[0])
+        elif all(kind == 'field' or not value.strip() for kind, value in segment) and 'time' not in fields:
+            # Só espaços entre os campos: um split() resolve o trecho inteiro
+            body.append(f"words = {var}.split()")
+            body.append(f"if len(words) < {len(fields)}:")
+            body.append("    return None")
+            for index, value in enumerate(fields):
+                if value in needed and value not in assigned:
+                    body.append(f"v_{value} = words[{index}]")
+                    assigned.add(value)
+        else:
+            chain = _find_chain(segment, needed, var, assigned)
+            if chain is None:
+                return None
+            body += chain
+    return body
+
+@functools.lru_cache(maxsize=None)
+def compile_log_format(spec: str = DEFAULT_LOG_FORMAT, fields: Tuple[str, ...] = STATS_FIELDS,
+                       optional: Tuple[str, ...] = (), fast: bool = True) -> Callable[[bytes], Optional[Tuple[bytes, ...]]]:
+    """Parser especializado que devolve só os campos pedidos (tupla na ordem de fields) ou None
+
+    spec é um nome de LOG_FORMAT_PRESETS ou a própria string LogFormat/log_format;
+    campos em optional ausentes do formato saem como b'-'.
+    O caminho rápido é código gerado com find/fatias, na ordem dos separadores do
+    formato; a regex equivalente atende linhas com aspas escapadas e formatos
+    sem separador entre campos (e com fast=False, para comparação).
+    """
+    spec = LOG_FORMAT_PRESETS.get(spec, spec)
+    tokens = tokenize_log_format(spec)
+    sources = [value for kind, value in tokens if kind == 'field' and value]
+    required = _required_sources(sources, fields, optional)
+    needed = {source for available in required.values() for source in available}
+    derive, values = _derive_expressions(required)
+    result = f"return ({', '.join(values)},)"
+    
+    regex = _compile_regex(tokens, needed)
+    regex_body = ["match = _regex_match(line)", "if match is None:", "    return None"]
+    regex_body += [f"v_{source} = match.group({source!r})" for source in sorted(needed)]
+    namespace = {'_regex_match': regex.match}
+    exec(_function_source('_regex_parse', regex_body + derive + [result]), namespace)
+    parser = namespace['_regex_parse']
+    
+    fast_body = _generate_fast_path(tokens, needed) if fast else None
+    if fast_body is not None:
+        exec(_function_source('_fast_parse', fast_body + derive + [result]), namespace)
+        parser = namespace['_fast_parse']
+    parser.time_parser = parse_iso_time if required.get('time', [''])[0] == 'time_iso' else parse_access_time
+    parser.fast = fast_body is not None
+    return parser
+
+def _function_source(name: str, body: List[str]) -> str:
+    return f"def {name}(line):\n" + "".join(f"    {line}\n" for line in body)
+
+def parse_access_time(value: bytes) -> int:
+    """Epoch de '01/Oct/2026:00:00:00 +0000' (%t do Apache, $time_local do nginx)"""
+    offset = int(value[22:24]) * 3600 + int(value[24:26]) * 60
+    epoch = calendar.timegm((int(value[7:11]), MONTHS[value[3:6]], int(value[0:2]),
+                             int(value[12:14]), int(value[15:17]), int(value[18:20])))
+    return epoch + offset if value[21:22] == b'-' else epoch - offset
+
+def parse_iso_time(value: bytes) -> int:
+    """Epoch de '2026-10-01T00:00:00+00:00' ($time_iso8601 do nginx)"""
+    return int(datetime.datetime.fromisoformat(value.decode()).timestamp())
+
+# --- Log de Acesso ---
+class AccessLogStats:
+    """Top-K por campo e IPs distintos de um log de acesso (mesclável)"""
+    
+    def __init__(self, exact: bool = False, epsilon: float = DEFAULT_EPSILON,
+                 hll_error: float = DEFAULT_HLL_ERROR, status: Optional[str] = None,
+                 log_format: str = DEFAULT_LOG_FORMAT):
+        self.exact = exact
+        self.status = status
+        self.log_format = log_format
+        self.parse = compile_log_format(log_format, STATS_FIELDS, ('user_agent',))
+        self.counters = {field: ExactCounter() if exact else MisraGries(epsilon) for field in FIELDS}
+        self.distinct = ExactSet() if exact else HyperLogLog(hll_error)
+        self.lines = 0
+        self.invalid = 0
+    
+    def add_lines(self, lines: Iterable[bytes]):
+        wanted = self.status.encode() if self.status else None
+        columns = ([], [], [])
+        ips, paths, agents = columns
+        parse = self.parse
+        for line in lines:
+            self.lines += 1
+            fields = parse(line)
+            if fields is None:
+                self.invalid += 1
+                continue
+            ip, path, status, agent = fields
+            if wanted is not None and status != wanted:
+                continue
+            ips.append(ip)
+            paths.append(path)
+            agents.append(agent)
+        for field, values in zip(FIELDS, columns):
+            self.counters[field].update(values)
+        self.distinct.update(ips)
+    
+    def add_stream(self, blocks: Iterable[bytes]):
+        for batch in line_batches(blocks):
+            self.add_lines(batch)
+    
+    def add_file(self, path: str, start: int = 0, end: Optional[int] = None):
+        """Conta as linhas que começam em [start, end) (pedaço alinhado em quebras de linha)"""
+        with open(path, 'rb', buffering=1024 * 1024) as f:
+            if start:
+                f.seek(start - 1)
+                # Linha que atravessa 'start' pertence ao pedaço anterior
+                f.readline()
+            position = f.tell()
+            batch = []
+            for line in f:
+                if end is not None and position >= end:
+                    break
+                position += len(line)
+                batch.append(line)
+                if len(batch) >= READ_BATCH:
+                    self.add_lines(batch)
+                    batch = []
+            self.add_lines(batch)
+    
+    def to_sketches(self, capacity: int, precision: int):
+        """Passa contagens exatas para sketches (arquivo pequeno mesclado com um grande)"""
+        if not self.exact:
+            return
+        self.counters = {field: MisraGries.from_exact(counter, capacity) for field, counter in self.counters.items()}
+        self.distinct = HyperLogLog.from_exact(self.distinct, precision)
+        self.exact = False
+    
+    def merge(self, other: 'AccessLogStats'):
+        if other.status != self.status:
+            raise ValueError("Só é possível mesclar resultados do mesmo filtro de status")
+        if LOG_FORMAT_PRESETS.get(other.log_format, other.log_format) != \
+                LOG_FORMAT_PRESETS.get(self.log_format, self.log_format):
+            raise ValueError("Só é possível mesclar resultados do mesmo formato de log")
+        if other.exact != self.exact:
+            # Exato + aproximado: o lado exato vira sketch com os parâmetros do outro
+            if self.exact:
+                self.to_sketches(other.counters['ip'].capacity, other.distinct.precision)
+            else:
+                other = AccessLogStats.from_dict(other.to_dict())
+                other.to_sketches(self.counters['ip'].capacity, self.distinct.precision)
+        for field in FIELDS:
+            self.counters[field].merge(other.counters[field])
+        self.distinct.merge(other.distinct)
+        self.lines += other.lines
+        self.invalid += other.invalid
+    
+    def to_dict(self) -> Dict:
+        return {
+            'version': STATE_VERSION,
+            'exact': self.exact,
+            'status': self.status,
+            'log_format': self.log_format,
+            'lines': self.lines,
+            'invalid': self.invalid,
+            'counters': {field: counter.to_dict() for field, counter in self.counters.items()},
+            'distinct': self.distinct.to_dict(),
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'AccessLogStats':
+        if data.get('version') != STATE_VERSION:
+            raise ValueError(f"Versão de estado não suportada: {data.get('version')}")
+        stats = cls(exact=data['exact'], status=data['status'],
+                    log_format=data.get('log_format', DEFAULT_LOG_FORMAT))
+        counter_class = ExactCounter if stats.exact else MisraGries
+        stats.counters = {field: counter_class.from_dict(data['counters'][field]) for field in FIELDS}
+        stats.distinct = (ExactSet if stats.exact else HyperLogLog).from_dict(data['distinct'])
+        stats.lines = data['lines']
+        stats.invalid = data['invalid']
+        return stats
+
+def _chunk_worker(path: str, start: int, end: int, options: Dict) -> Dict:
+    stats = AccessLogStats(**options)
+    stats.add_file(path, start, end)
+    return stats.to_dict()
+
+def _segment_worker(path: str, options: Dict) -> Dict:
+    stats = AccessLogStats(**options)
+    stats.add_stream(read_blocks([path]))
+    return stats.to_dict()
+
+def analyze_files(paths: List[str], jobs: int = 1, prefetch: bool = False, **options) -> AccessLogStats:
+    """Analisa os segmentos em ordem; com jobs > 1 os segmentos são processados em paralelo"""
+    stats = AccessLogStats(**options)
+    if jobs <= 1:
+        stats.add_stream(read_blocks(paths, prefetch=prefetch))
+        return stats
+    
+    # Arquivos planos são divididos em pedaços; compactados não têm acesso aleatório: um por tarefa
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = []
+        for path in paths:
+            if is_compressed(path):
+                futures.append(executor.submit(_segment_worker, path, options))
+                continue
+            size = os.path.getsize(path)
+            step = max(1, -(-size // jobs))
+            for start in range(0, max(size, 1), step):
+                futures.append(executor.submit(_chunk_worker, path, start, min(start + step, size), options))
+        for future in futures:
+            stats.merge(AccessLogStats.from_dict(future.result()))
+    return stats
+
+# --- Cache Colunar ---
+COLUMNAR_VERSION = 1
+# Colunas gravadas como arrays crus na ordem de bytes nativa (legíveis também com numpy.memmap)
+COLUMN_TYPES = {'time': 'q', 'ip': 'I', 'path': 'I', 'status': 'H', 'bytes': 'Q', 'user_agent': 'I'}
+DICTIONARY_COLUMNS = ('ip', 'path', 'user_agent')
+# Ordem dos campos pedidos ao parser na construção do cache
+COLUMNAR_FIELDS = ('ip', 'time', 'path', 'status', 'bytes', 'user_agent')
+# Receitas 1-5 do README aplicadas à coluna em que o padrão aparece
+DETECTORS = {
+    'xss': ('path', re.compile(rb'(?i)<script|%3Cscript')),
+    'sqli': ('path', re.compile(rb'(?i)union|select|insert|drop|%27|%22')),
+    'traversal': ('path', re.compile(rb'(?i)\.\./|\.\.%2f')),
+    'scanner': ('user_agent', re.compile(rb'(?i)nikto|nmap|sqlmap|acunetix|curl|masscan|python')),
+    'sensitive': ('path', re.compile(rb'(?i)\.env|\.git|\.htaccess|\.bak')),
+}
+
+def _segment_signature(paths: List[str]) -> List[List]:
+    signature = []
+    for path in paths:
+        st = os.stat(path)
+        signature.append([os.path.abspath(path), st.st_size, st.st_mtime_ns])
+    return signature
+
+class ColumnarLog:
+    """Log de acesso já interpretado, em colunas mapeadas em memória
+
+    Construído uma vez a partir dos segmentos (IPs, caminhos e User-Agents
+    viram códigos inteiros de um dicionário; horário vira epoch) e ordenado
+    por horário. Nas execuções seguintes as colunas são abertas com mmap:
+    intervalos de tempo são buscas binárias, contagens rodam sobre inteiros
+    e cada detector avalia uma vez cada valor distinto do dicionário.
+    """
+    
+    def __init__(self, directory: str, meta: Dict):
+        self.directory = directory
+        self.meta = meta
+        self.rows = meta['rows']
+        self._maps = []
+        self.columns = {name: self._map_column(name, typecode) for name, typecode in COLUMN_TYPES.items()}
+        self.dictionaries = {name: self._read_dictionary(name) for name in DICTIONARY_COLUMNS}
+    
+    def _map_column(self, name: str, typecode: str):
+        if not self.rows:
+            return array.array(typecode)
+        with open(os.path.join(self.directory, f'{name}.col'), 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return memoryview(mapped).cast(typecode)
+    
+    def _read_dictionary(self, name: str) -> List[bytes]:
+        with open(os.path.join(self.directory, f'{name}.dict'), 'rb') as f:
+            data = f.read()
+        return data.split(b'\n') if self.meta['dictionaries'][name] else []
+    
+    def close(self):
+        for column in self.columns.values():
+            if isinstance(column, memoryview):
+                column.release()
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
+    
+    @classmethod
+    def build(cls, segments: List[str], directory: str, prefetch: bool = False,
+              log_format: str = DEFAULT_LOG_FORMAT) -> 'ColumnarLog':
+        """Interpreta os segmentos uma vez e grava as colunas em directory"""
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, 'meta.json')
+        # meta.json é gravado por último: sem ele o cache nunca é considerado válido
+        if os.path.exists(meta_path):
+            os.unlink(meta_path)
+        signature = _segment_signature(segments)
+        parse = compile_log_format(log_format, COLUMNAR_FIELDS, ('bytes', 'user_agent'))
+        parse_time = parse.time_parser
+        
+        columns = {name: array.array(typecode) for name, typecode in COLUMN_TYPES.items()}
+        codes: Dict[str, Dict[bytes, int]] = {name: {} for name in DICTIONARY_COLUMNS}
+        times: Dict[bytes, int] = {}
+        invalid = 0
+        append_time, append_status, append_bytes = columns['time'].append, columns['status'].append, columns['bytes'].append
+        interned = [(codes[name], columns[name].append) for name in ('ip', 'path', 'user_agent')]
+        for batch in line_batches(read_blocks(segments, prefetch=prefetch)):
+            for line in batch:
+                record = parse(line)
+                if record is None:
+                    invalid += 1
+                    continue
+                ip, timestamp, path, status, size, agent = record
+                epoch = times.get(timestamp)
+                if epoch is None:
+                    try:
+                        epoch = times[timestamp] = parse_time(timestamp)
+                    except (ValueError, KeyError):
+                        invalid += 1
+                        continue
+                for value, (table, append) in zip((ip, path, agent), interned):
+                    code = table.get(value)
+                    if code is None:
+                        code = table[value] = len(table)
+                    append(code)
+                append_time(epoch)
+                append_status(int(status) if status.isdigit() else 0)
+                append_bytes(int(size) if size.isdigit() else 0)
+        
+        # O Apache registra o início da requisição ao terminá-la: quase ordenado, timsort resolve rápido
+        time_column = columns['time']
+        if any(map(operator.gt, time_column, itertools.islice(time_column, 1, None))):
+            order = sorted(range(len(time_column)), key=time_column.__getitem__)
+            for name, column in columns.items():
+                columns[name] = array.array(COLUMN_TYPES[name], map(column.__getitem__, order))
+        
+        for name, column in columns.items():
+            with open(os.path.join(directory, f'{name}.col'), 'wb') as f:
+                column.tofile(f)
+        for name in DICTIONARY_COLUMNS:
+            with open(os.path.join(directory, f'{name}.dict'), 'wb') as f:
+                f.write(b'\n'.join(codes[name]))
+        meta = {
+            'version': COLUMNAR_VERSION,
+            'byteorder': sys.byteorder,
+            'segments': signature,
+            'log_format': LOG_FORMAT_PRESETS.get(log_format, log_format),
+            'rows': len(columns['time']),
+            'invalid': invalid,
+            'columns': COLUMN_TYPES,
+            'dictionaries': {name: len(codes[name]) for name in DICTIONARY_COLUMNS},
+        }
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(meta_path + '.tmp', meta_path)
+        return cls(directory, meta)
+    
+    @classmethod
+    def open(cls, directory: str, segments: Optional[List[str]] = None,
+             log_format: Optional[str] = None) -> Optional['ColumnarLog']:
+        """Abre o cache; None se não existe ou se os segmentos (ou o formato) mudaram desde a construção"""
+        try:
+            with open(os.path.join(directory, 'meta.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (meta.get('version') != COLUMNAR_VERSION or meta.get('byteorder') != sys.byteorder
+                or meta.get('columns') != COLUMN_TYPES):
+            return None
+        if segments is not None and meta['segments'] != _segment_signature(segments):
+            return None
+        if log_format is not None and meta.get('log_format') != LOG_FORMAT_PRESETS.get(log_format, log_format):
+            return None
+        return cls(directory, meta)
+    
+    @classmethod
+    def load(cls, segments: List[str], directory: str, prefetch: bool = False,
+             log_format: str = DEFAULT_LOG_FORMAT) -> 'ColumnarLog':
+        return (cls.open(directory, segments, log_format)
+                or cls.build(segments, directory, prefetch, log_format))
+    
+    def time_range(self, since: Optional[int] = None, until: Optional[int] = None) -> Tuple[int, int]:
+        """Linhas [início, fim) com since <= horário < until (busca binária: colunas ordenadas)"""
+        times = self.columns['time']
+        start = bisect.bisect_left(times, since) if since is not None else 0
+        end = bisect.bisect_left(times, until, start) if until is not None else self.rows
+        return start, end
+    
+    def status_mask(self, status: int, start: int, end: int) -> bytes:
+        return bytes(map(status.__eq__, self.columns['status'][start:end]))
+    
+    def detector_mask(self, name: str, start: int, end: int) -> bytes:
+        """Máscara por linha; o padrão roda uma vez por valor distinto, não por linha"""
+        column, pattern = DETECTORS[name]
+        lookup = bytes(pattern.search(value) is not None for value in self.dictionaries[column])
+        return bytes(map(lookup.__getitem__, self.columns[column][start:end]))
+    
+    def counts(self, column: str, start: int, end: int, mask: Optional[bytes] = None) -> collections.Counter:
+        values = self.columns[column][start:end]
+        return collections.Counter(values if mask is None else itertools.compress(values, mask))
+    
+    def stats(self, start: int, end: int, status: Optional[str] = None) -> AccessLogStats:
+        """Contagens exatas do intervalo no mesmo formato de analyze_files"""
+        stats = AccessLogStats(exact=True, status=status)
+        mask = self.status_mask(int(status), start, end) if status else None
+        for name in DICTIONARY_COLUMNS:
+            dictionary = self.dictionaries[name]
+            counter = stats.counters[name]
+            counter.counters = collections.Counter(
+                {dictionary[code]: count for code, count in self.counts(name, start, end, mask).items()})
+            counter.total = sum(counter.counters.values())
+        stats.distinct.items = set(stats.counters['ip'].counters)
+        stats.lines = end - start
+        stats.invalid = self.meta['invalid'] if (start, end) == (0, self.rows) else 0
+        return stats
+    
+    def detections(self, start: int, end: int, top: int = DEFAULT_TOP) -> Dict[str, Tuple[int, List[Tuple[bytes, int]]]]:
+        """Por detector: (linhas suspeitas, IPs com mais ocorrências)"""
+        results = {}
+        ips = self.dictionaries['ip']
+        for name in DETECTORS:
+            hits = self.counts('ip', start, end, self.detector_mask(name, start, end))
+            results[name] = (sum(hits.values()), [(ips[code], count) for code, count in hits.most_common(top)])
+        return results
+
+def parse_time_argument(value: str) -> int:
+    """Epoch de 'AAAA-MM-DDTHH:MM[:SS][+HH:MM]'; sem fuso, assume UTC"""
+    moment = datetime.datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return int(moment.timestamp())
+
+# --- Correlação Web + SSH ---
+CORRELATION_FEATURES = ('requests', 'not_found') + tuple(DETECTORS) + ('ssh_failed', 'ssh_invalid_user')
+WEB_ATTACK_DETECTORS = ('xss', 'sqli', 'traversal', 'sensitive')
+# Pesos sobre log2(1 + contagem): volume alto não apaga sinais de outros tipos
+SCORE_WEIGHTS = {'attack': 5.0, 'scanner': 2.0, 'not_found': 3.0, 'ssh_invalid_user': 2.0, 'ssh_failed': 1.0}
+# IP que ataca a web e o sshd ao mesmo tempo pesa em dobro
+CROSS_SOURCE_FACTOR = 2.0
+# Valores distintos de caminho/User-Agent com resultado dos detectores em memória
+DETECTOR_MEMO_LIMIT = 200000
+# '.*' guloso e campos finais ancorados: o nome de usuário vem do atacante e pode
+# conter outro " from X port N"; o endereço real é sempre o último
+SSH_AUTH_EVENT = re.compile(rb'\b(Failed \S+ for|Invalid user) .* from (\S+) port \d+(?: ssh2)?(?:: .*)?\s*$')
+BLOCKLIST_FORMATS = ('plain', 'ipset', 'fail2ban')
+DEFAULT_MIN_SCORE = 10.0
+
+def pack_ip(value: bytes) -> Optional[bytes]:
+    """Endereço em 4 (IPv4) ou 16 bytes (IPv6); None se não é um IP (ex: HostnameLookups)"""
+    text = value.decode('ascii', 'replace')
+    try:
+        return socket.inet_pton(socket.AF_INET, text)
+    except OSError:
+        pass
+    try:
+        return socket.inet_pton(socket.AF_INET6, text.strip('[]'))
+    except OSError:
+        return None
+
+def unpack_ip(packed: bytes) -> str:
+    return socket.inet_ntop(socket.AF_INET if len(packed) == 4 else socket.AF_INET6, packed)
+
+class IPFeatureIndex:
+    """Contadores por IP de várias fontes, em colunas compactas (array 'I' por contador)
+
+    Cada IP ocupa uma linha: uma entrada no dicionário (chave empacotada em
+    4/16 bytes) e 4 bytes por contador. Índices de fontes diferentes se juntam
+    por IP com merge(), sem reler logs.
+    """
+    
+    def __init__(self):
+        self.rows: Dict[bytes, int] = {}
+        self.columns = {feature: array.array('I') for feature in CORRELATION_FEATURES}
+        self.ignored = 0
+    
+    def _row(self, packed: bytes) -> int:
+        row = self.rows.get(packed)
+        if row is None:
+            row = self.rows[packed] = len(self.rows)
+            for column in self.columns.values():
+                column.append(0)
+        return row
+    
+    def add_counts(self, feature: str, counts: Dict[bytes, int]):
+        """Soma contagens indexadas pelo IP como aparece no log"""
+        column = self.columns[feature]
+        for ip, count in counts.items():
+            packed = pack_ip(ip)
+            if packed is None:
+                self.ignored += count
+                continue
+            row = self._row(packed)
+            column[row] = min(column[row] + count, 0xFFFFFFFF)
+    
+    def merge(self, other: 'IPFeatureIndex'):
+        """Junta outro índice (outra fonte, outro servidor) linha a linha por IP"""
+        for packed, other_row in other.rows.items():
+            row = self._row(packed)
+            for feature, column in self.columns.items():
+                column[row] = min(column[row] + other.columns[feature][other_row], 0xFFFFFFFF)
+        self.ignored += other.ignored
+    
+    def features(self, row: int) -> Dict[str, int]:
+        return {feature: column[row] for feature, column in self.columns.items()}
+    
+    def score(self, row: int) -> float:
+        columns = self.columns
+        requests = columns['requests'][row]
+        attack = sum(columns[name][row] for name in WEB_ATTACK_DETECTORS)
+        web = (SCORE_WEIGHTS['attack'] * math.log2(1 + attack)
+               + SCORE_WEIGHTS['scanner'] * math.log2(1 + columns['scanner'][row]))
+        if requests:
+            # Taxa de 404 ponderada pelo volume: um único 404 não pesa como mil
+            web += SCORE_WEIGHTS['not_found'] * columns['not_found'][row] / requests * math.log2(1 + requests)
+        ssh = (SCORE_WEIGHTS['ssh_invalid_user'] * math.log2(1 + columns['ssh_invalid_user'][row])
+               + SCORE_WEIGHTS['ssh_failed'] * math.log2(1 + columns['ssh_failed'][row]))
+        score = web + ssh
+        return score * CROSS_SOURCE_FACTOR if web and ssh else score
+    
+    def ranked(self, limit: int = DEFAULT_TOP, min_score: float = 0.0) -> List[Tuple[str, float, Dict[str, int]]]:
+        """(IP, pontuação, contadores) dos maiores ofensores"""
+        scored = ((self.score(row), packed, row) for packed, row in self.rows.items())
+        best = heapq.nlargest(limit, (entry for entry in scored if entry[0] > min_score), key=operator.itemgetter(0))
+        return [(unpack_ip(packed), round(score, 2), self.features(row)) for score, packed, row in best]
+
+def _detector_hits(memo: Dict[bytes, Tuple[str, ...]], column: str, value: bytes) -> Tuple[str, ...]:
+    hits = memo.get(value)
+    if hits is None:
+        if len(memo) >= DETECTOR_MEMO_LIMIT:
+            memo.clear()
+        hits = memo[value] = tuple(name for name, (target, pattern) in DETECTORS.items()
+                                   if target == column and pattern.search(value))
+    return hits
+
+def web_features(segments: List[str], log_format: str = DEFAULT_LOG_FORMAT, prefetch: bool = False) -> IPFeatureIndex:
+    """Requisições, 404 e acertos dos detectores por IP, lendo os logs de acesso em streaming"""
+    parse = compile_log_format(log_format, STATS_FIELDS, ('user_agent',))
+    counters = {feature: collections.Counter() for feature in ('requests', 'not_found') + tuple(DETECTORS)}
+    memos: Dict[str, Dict[bytes, Tuple[str, ...]]] = {'path': {}, 'user_agent': {}}
+    for batch in line_batches(read_blocks(segments, prefetch=prefetch)):
+        columns = {feature: [] for feature in counters}
+        requests, not_found = columns['requests'], columns['not_found']
+        for line in batch:
+            record = parse(line)
+            if record is None:
+                continue
+            ip, path, status, agent = record
+            requests.append(ip)
+            if status == b'404':
+                not_found.append(ip)
+            for name in _detector_hits(memos['path'], 'path', path) + _detector_hits(memos['user_agent'], 'user_agent', agent):
+                columns[name].append(ip)
+        for feature, values in columns.items():
+            counters[feature].update(values)
+    index = IPFeatureIndex()
+    for feature, counts in counters.items():
+        index.add_counts(feature, counts)
+    return index
+
+def columnar_web_features(columnar: 'ColumnarLog', start: int = 0, end: Optional[int] = None) -> IPFeatureIndex:
+    """Mesmos contadores de web_features a partir do cache colunar (sem reinterpretar texto)"""
+    end = columnar.rows if end is None else end
+    ips = columnar.dictionaries['ip']
+    masks = {'requests': None, 'not_found': columnar.status_mask(404, start, end)}
+    masks.update((name, columnar.detector_mask(name, start, end)) for name in DETECTORS)
+    index = IPFeatureIndex()
+    for feature, mask in masks.items():
+        index.add_counts(feature, {ips[code]: count for code, count in columnar.counts('ip', start, end, mask).items()})
+    return index
+
+def ssh_features(segments: List[str], prefetch: bool = False) -> IPFeatureIndex:
+    """Falhas de autenticação e usuários inválidos por IP no auth.log/secure do sshd"""
+    failed, invalid = collections.Counter(), collections.Counter()
+    search = SSH_AUTH_EVENT.search
+    ignored = 0
+    for batch in line_batches(read_blocks(segments, prefetch=prefetch)):
+        failures, unknown = [], []
+        for line in batch:
+            if b' from ' not in line or b'sshd' not in line:
+                continue
+            match = search(line)
+            if match is None:
+                continue
+            if pack_ip(match.group(2)) is None:
+                ignored += 1
+                continue
+            (unknown if match.group(1) == b'Invalid user' else failures).append(match.group(2))
+        failed.update(failures)
+        invalid.update(unknown)
+    index = IPFeatureIndex()
+    index.ignored = ignored
+    index.add_counts('ssh_failed', failed)
+    index.add_counts('ssh_invalid_user', invalid)
+    return index
+
+def format_correlation(ranked: List[Tuple[str, float, Dict[str, int]]], ignored: int = 0) -> str:
+    lines = []
+    lines.append("=" * 80)
+    lines.append("WATCHMANLOGS - CORRELAÇÃO WEB + SSH")
+    lines.append("=" * 80)
+    if not ranked:
+        lines.append("\nNenhum IP suspeito encontrado.")
+    else:
+        lines.append(f"\n{'IP':<40} {'Pontos':>7} {'Req':>8} {'404%':>5} {'Ataque':>7} {'Scan':>6} "
+                     f"{'SSH-F':>7} {'SSH-I':>7}")
+        for ip, score, features in ranked:
+            requests = features['requests']
+            rate = f"{features['not_found'] / requests:.0%}" if requests else '-'
+            attack = sum(features[name] for name in WEB_ATTACK_DETECTORS)
+            web_and_ssh = ' *' if requests and (features['ssh_failed'] or features['ssh_invalid_user']) else ''
+            lines.append(f"{ip:<40} {score:>7} {requests:>8} {rate:>5} {attack:>7} {features['scanner']:>6} "
+                         f"{features['ssh_failed']:>7} {features['ssh_invalid_user']:>7}{web_and_ssh}")
+        lines.append("\n* IP presente nos logs web e do sshd")
+    if ignored:
+        lines.append(f"Ocorrências ignoradas (origem não é um endereço IP): {ignored}")
+    lines.append("\n" + "=" * 80)
+    return "\n".join(lines)
+
+def write_blocklist(path: str, ips: List[str], output_format: str = 'plain',
+                    set_name: str = 'watchmanlogs', jail: str = 'sshd'):
+    """Lista de bloqueio: um IP por linha, 'ipset restore' ou comandos fail2ban-client"""
+    if output_format == 'ipset':
+        lines = [f"create {set_name} hash:ip family inet -exist",
+                 f"create {set_name}6 hash:ip family inet6 -exist"]
+        lines += [f"add {set_name}{'6' if ':' in ip else ''} {ip} -exist" for ip in ips]
+    elif output_format == 'fail2ban':
+        lines = [f"fail2ban-client set {jail} banip {ip}" for ip in ips]
+    else:
+        lines = list(ips)
+    content = "\n".join(lines) + ("\n" if lines else "")
+    if path == '-':
+        sys.stdout.write(content)
+        return
+    with open(path, 'w') as f:
+        f.write(content)
+
+# --- Relatório ---
+def _display(item: bytes, width: int = 100) -> str:
+    text = item.decode('utf-8', 'replace')
+    return text if len(text) <= width else text[:width - 3] + '...'
+
+def format_report(stats: AccessLogStats, top: int = DEFAULT_TOP) -> str:
+    lines = []
+    lines.append("=" * 80)
+    lines.append("WATCHMANLOGS - CONTAGENS DO LOG DE ACESSO")
+    mode = 'exato' if stats.exact else (f"aproximado (Misra-Gries k={stats.counters['ip'].capacity}, "
+                                        f"HyperLogLog p={stats.distinct.precision})")
+    lines.append(f"Linhas: {stats.lines} | inválidas: {stats.invalid} | modo: {mode}")
+    if stats.status:
+        lines.append(f"Filtro: status {stats.status}")
+    lines.append("=" * 80)
+    
+    distinct = stats.distinct.estimate()
+    if stats.exact:
+        lines.append(f"\nIPs distintos: {distinct}")
+    else:
+        lines.append(f"\nIPs distintos: ~{distinct} (±{stats.distinct.relative_error:.1%})")
+    
+    for field in FIELDS:
+        counter = stats.counters[field]
+        title = f"Top {top} {FIELD_TITLES[field]}"
+        if counter.error:
+            title += f" (contagem real até +{counter.error})"
+        lines.append(f"\n{title}:")
+        for item, low, _ in counter.top(top):
+            lines.append(f"   {low:>10}  {_display(item)}")
+    
+    lines.append("\n" + "=" * 80)
+    return "\n".join(lines)
+
+def format_detections(detections: Dict[str, Tuple[int, List[Tuple[bytes, int]]]], top: int = DEFAULT_TOP) -> str:
+    lines = ["DETECTORES (receitas 1-5 do README)", "-" * 80]
+    for name, (hits, ips) in detections.items():
+        column = DETECTORS[name][0]
+        lines.append(f"\n{name} ({column}): {hits} linha(s)")
+        for ip, count in ips[:top]:
+            lines.append(f"   {count:>10}  {_display(ip)}")
+    lines.append("\n" + "=" * 80)
+    return "\n".join(lines)
+
+# --- CLI ---
+def main():
+    parser = argparse.ArgumentParser(
+        description="Top IPs/caminhos/User-Agents e IPs distintos de logs do Apache2 em uma passada",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Exemplos:
+  %(prog)s access.log                          # Receita 9: requisições por IP
+  %(prog)s access.log --status 404             # Receita 6: IPs com mais 404
+  %(prog)s access.log --exact                  # Contagem exata (Counter)
+  %(prog)s access.log --jobs 8 --save-state web1.json
+  %(prog)s --merge web1.json web2.json         # Combinar servidores
+  %(prog)s access.log --rotated --prefetch     # Semana de histórico (access.log.1, .2.gz, ...)
+  %(prog)s access.log --log-format vhost_combined
+  %(prog)s access.log -f '%%{X-Forwarded-For}i %%l %%u %%t "%%r" %%>s %%b "%%{Referer}i" "%%{User-Agent}i"'
+  %(prog)s access.log --correlate --auth-log /var/log/auth.log --blocklist bloqueio.ipset --blocklist-format ipset
+  %(prog)s access.log --cache /var/tmp/wl --detect --since 2026-10-18T14:00 --until 2026-10-18T15:00
+        """
+    )
+    parser.add_argument('logs', nargs='*', metavar='LOG',
+                        help='Arquivos access.log (.gz/.bz2/.xz/.zst) ou globs entre aspas, ordenados por tempo')
+    parser.add_argument('--rotated', '-r', action='store_true',
+                        help='Incluir as rotações de cada LOG (access.log.1, access.log.2.gz, ...)')
+    parser.add_argument('--prefetch', action='store_true',
+                        help='Descompactar em uma thread em segundo plano, em paralelo à contagem')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help='Itens por ranking (padrão: %(default)s)')
+    parser.add_argument('--status', metavar='CÓDIGO', help='Contar só requisições com este status (ex: 404)')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--exact', action='store_true', help='Contagem exata (memória cresce com itens distintos)')
+    mode.add_argument('--sketch', action='store_true',
+                      help=f'Sempre usar sketches (padrão: exato até {EXACT_MAX_BYTES // (1024 * 1024)} MiB)')
+    parser.add_argument('--epsilon', type=float, default=DEFAULT_EPSILON,
+                        help='Erro máximo do top-K como fração do total de linhas (padrão: %(default)s)')
+    parser.add_argument('--hll-error', type=float, default=DEFAULT_HLL_ERROR,
+                        help='Erro relativo típico de IPs distintos (padrão: %(default)s)')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='Processos paralelos por arquivo (padrão: 1)')
+    parser.add_argument('--save-state', metavar='ARQUIVO', help='Gravar os sketches em JSON para mesclar depois')
+    parser.add_argument('--merge', metavar='ESTADO', nargs='+', help='Mesclar estados gravados com --save-state')
+    parser.add_argument('--log-format', '-f', default=DEFAULT_LOG_FORMAT, metavar='FORMATO',
+                        help=f"LogFormat do Apache/log_format do nginx ou um de: {', '.join(LOG_FORMAT_PRESETS)} "
+                             "(padrão: %(default)s)")
+    parser.add_argument('--cache', metavar='DIR',
+                        help='Cache colunar dos LOGs: criado na 1ª execução, reaberto com mmap enquanto não mudarem')
+    parser.add_argument('--since', metavar='AAAA-MM-DDTHH:MM', help='Com --cache: só requisições a partir deste horário')
+    parser.add_argument('--until', metavar='AAAA-MM-DDTHH:MM', help='Com --cache: só requisições antes deste horário')
+    parser.add_argument('--detect', action='store_true', help='Com --cache: rodar os detectores XSS/SQLi/traversal/...')
+    parser.add_argument('--correlate', action='store_true',
+                        help='Ranquear IPs combinando detectores/404 dos LOGs e falhas do sshd (--auth-log)')
+    parser.add_argument('--auth-log', metavar='LOG', nargs='+', default=[],
+                        help='auth.log/secure do sshd para --correlate (aceita globs e --rotated)')
+    parser.add_argument('--min-score', type=float, default=DEFAULT_MIN_SCORE,
+                        help='Com --correlate: pontuação mínima para entrar no ranking (padrão: %(default)s)')
+    parser.add_argument('--blocklist', metavar='ARQUIVO', help="Com --correlate: gravar os IPs ranqueados ('-' = stdout)")
+    parser.add_argument('--blocklist-format', choices=BLOCKLIST_FORMATS, default='plain',
+                        help='plain (um IP por linha), ipset (ipset restore) ou fail2ban (fail2ban-client banip)')
+    parser.add_argument('--jail', default='sshd', help='Jail do Fail2ban para --blocklist-format fail2ban (padrão: sshd)')
+    args = parser.parse_args()
+    
+    if not args.logs and not args.merge and not (args.correlate and args.auth_log):
+        parser.error("informe ao menos um LOG ou --merge")
+    if (args.auth_log or args.blocklist) and not args.correlate:
+        parser.error("--auth-log e --blocklist exigem --correlate")
+    if args.correlate and (args.merge or args.save_state):
+        parser.error("--correlate não pode ser combinado com --merge/--save-state")
+    if not 0 < args.epsilon < 1 or not 0 < args.hll_error < 1:
+        parser.error("--epsilon e --hll-error devem estar entre 0 e 1")
+    if args.cache and (args.merge or args.save_state):
+        parser.error("--cache não pode ser combinado com --merge/--save-state")
+    if (args.since or args.until) and not args.cache:
+        parser.error("--since e --until exigem --cache")
+    if args.detect and not args.cache:
+        parser.error("--detect exige --cache")
+    if args.status and not args.status.isdigit():
+        parser.error("--status deve ser um código numérico (ex: 404)")
+    try:
+        compile_log_format(args.log_format, STATS_FIELDS, ('user_agent',))
+    except ValueError as e:
+        parser.error(f"--log-format: {e}")
+    try:
+        since = parse_time_argument(args.since) if args.since else None
+        until = parse_time_argument(args.until) if args.until else None
+    except ValueError as e:
+        parser.error(f"horário inválido: {e}")
+    
+    if args.correlate:
+        try:
+            index = IPFeatureIndex()
+            if args.logs and args.cache:
+                columnar = ColumnarLog.load(expand_inputs(args.logs, args.rotated), args.cache, args.prefetch,
+                                            args.log_format)
+                try:
+                    index.merge(columnar_web_features(columnar, *columnar.time_range(since, until)))
+                finally:
+                    columnar.close()
+            elif args.logs:
+                index.merge(web_features(expand_inputs(args.logs, args.rotated), args.log_format, args.prefetch))
+            if args.auth_log:
+                index.merge(ssh_features(expand_inputs(args.auth_log, args.rotated), args.prefetch))
+            ranked = index.ranked(args.top, args.min_score)
+            if args.blocklist:
+                write_blocklist(args.blocklist, [ip for ip, _, _ in ranked], args.blocklist_format, jail=args.jail)
+        except BrokenPipeError:
+            # --blocklist - lido por um pipe que fechou: tratado em run()
+            raise
+        except (OSError, ValueError) as e:
+            print(f"Erro: {e}", file=sys.stderr)
+            sys.exit(1)
+        # Com a lista de bloqueio no stdout, o relatório vai para o stderr
+        print(format_correlation(ranked, index.ignored), file=sys.stderr if args.blocklist == '-' else sys.stdout)
+        return
+    
+    if args.cache:
+        try:
+            columnar = ColumnarLog.load(expand_inputs(args.logs, args.rotated), args.cache, args.prefetch,
+                                        args.log_format)
+            try:
+                start, end = columnar.time_range(since, until)
+                report = format_report(columnar.stats(start, end, args.status), args.top)
+                if args.detect:
+                    report += "\n" + format_detections(columnar.detections(start, end, args.top), args.top)
+            finally:
+                columnar.close()
+        except (OSError, ValueError) as e:
+            print(f"Erro: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(report)
+        return
+    
+    try:
+        stats = None
+        if args.logs:
+            segments = expand_inputs(args.logs, args.rotated)
+            # Tamanho compactado não indica o volume de linhas: segmentos compactados usam sketches
+            small = (not any(map(is_compressed, segments))
+                     and sum(map(os.path.getsize, segments)) <= EXACT_MAX_BYTES)
+            stats = analyze_files(segments, args.jobs, args.prefetch, exact=args.exact or (not args.sketch and small),
+                                  epsilon=args.epsilon, hll_error=args.hll_error, status=args.status,
+                                  log_format=args.log_format)
+        for state_path in args.merge or []:
+            with open(state_path) as f:
+                state = AccessLogStats.from_dict(json.load(f))
+            if stats is None:
+                stats = state
+            else:
+                stats.merge(state)
+        
+        if args.save_state:
+            with open(args.save_state, 'w') as f:
+                json.dump(stats.to_dict(), f)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        sys.exit(1)
+    
+    print(format_report(stats, args.top))
+
+def run():
+    """Ponto de entrada da CLI: leitor do pipe que fecha cedo (| head) encerra sem traceback"""
+    try:
+        main()
+        # O flush acontece aqui: no fim do interpretador o pipe fechado só geraria um aviso
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # stdout passa a apontar para /dev/null para o flush final do Python não falhar de novo
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
+
+if __name__ == '__main__':
+    run()
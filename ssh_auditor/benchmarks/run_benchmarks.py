@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+"""
+Benchmarks dos caminhos críticos do SSH Auditor.
+
+Gera fixtures sintéticas (sshd_config com Includes e blocos Match,
+passwd com dezenas de milhares de usuários, homes com authorized_keys, chaves de host e
+logs de acesso/autenticação) e executa cada auditoria, planejamento de
+correção (dry-run) e análise de logs contra essa raiz. Cada benchmark
+roda em um processo filho isolado e reporta tempo, alocações e pico de
+RSS em JSON comparável entre commits.
+
+Uso:
+  python3 run_benchmarks.py --root /tmp/ssh_bench -o base.json
+  python3 run_benchmarks.py --root /tmp/ssh_bench --users 50000 --log-size 2G -o novo.json
+  python3 run_benchmarks.py --compare base.json novo.json
+  python3 run_benchmarks.py --check-startup --import-budget-ms 60
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import resource
+import datetime
+import subprocess
+import tracemalloc
+import multiprocessing
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import fixtures  # noqa: E402
+import ssh_auditor  # noqa: E402
+
+MANIFEST = 'fixture.json'
+
+# --- Registro de Benchmarks ---
+BENCHMARKS: List[Dict] = []
+
+def benchmark(name: str, setup: Optional[Callable] = None):
+    """Registra benchmark; setup(ctx) roda fora da medição e seu retorno é repassado"""
+    def decorator(func):
+        BENCHMARKS.append({'name': name, 'func': func, 'setup': setup})
+        return func
+    return decorator
+
+def configure_module(ctx: Dict):
+    """Aponta o ssh_auditor para a raiz das fixtures (mesmo caminho do --root)"""
+    root = ctx['root']
+    ssh_auditor.set_audit_root(ssh_auditor.LocalRoot(root))
+    ssh_auditor.BACKUP_DIR = os.path.join(root, 'var', 'backups', 'ssh_auditor')
+    ssh_auditor.LOG_FILE = os.path.join(root, 'var', 'log', 'ssh_auditor.log')
+
+def shell(command: str):
+    subprocess.run(['sh', '-c', command], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+
+# --- sshd_config ---
+@benchmark('config/parse')
+def bench_parse(ctx, _):
+    ssh_auditor.SSHDConfigParser()
+
+def _setup_updates(ctx):
+    return {param: value for param, (value, _, _) in ssh_auditor.CIS_COMPLIANT_CONFIG.items()}
+
+@benchmark('config/update', setup=_setup_updates)
+def bench_update(ctx, updates):
+    ssh_auditor.SSHDConfigParser().update_config(updates)
+
+# --- Auditorias ---
+@benchmark('audit/ssh_config')
+def bench_audit_ssh_config(ctx, _):
+    ssh_auditor.audit_ssh_config()
+
+@benchmark('audit/file_permissions')
+def bench_audit_file_permissions(ctx, _):
+    ssh_auditor.audit_file_permissions()
+
+@benchmark('audit/host_keys')
+def bench_audit_host_keys(ctx, _):
+    ssh_auditor.audit_host_keys()
+
+@benchmark('audit/authorized_keys')
+def bench_audit_authorized_keys(ctx, _):
+    ssh_auditor.audit_authorized_keys()
+
+@benchmark('audit/fail2ban')
+def bench_audit_fail2ban(ctx, _):
+    ssh_auditor.audit_fail2ban()
+
+@benchmark('audit/full')
+def bench_audit_full(ctx, _):
+    ssh_auditor.run_full_audit()
+
+def _setup_warm_cache(ctx):
+    # Mesmo estado do --serve após a auditoria de aquecimento
+    ssh_auditor.FILE_CACHE.enabled = True
+    ssh_auditor.run_full_audit()
+
+@benchmark('audit/full_warm_cache', setup=_setup_warm_cache)
+def bench_audit_full_warm(ctx, _):
+    ssh_auditor.run_full_audit()
+
+@benchmark('fix/plan_warm_cache', setup=_setup_warm_cache)
+def bench_plan_warm(ctx, _):
+    ssh_auditor.plan_fixes()
+
+def _setup_report(ctx):
+    return {
+        'ssh_config': ssh_auditor.audit_ssh_config(),
+        'file_permissions': ssh_auditor.audit_file_permissions(),
+        'host_keys': ssh_auditor.audit_host_keys(),
+        'authorized_keys': ssh_auditor.audit_authorized_keys(),
+        'fail2ban': ssh_auditor.audit_fail2ban()
+    }
+
+@benchmark('report/generate_audit_report', setup=_setup_report)
+def bench_report(ctx, all_issues):
+    ssh_auditor.generate_audit_report(all_issues)
+
+def _setup_fleet(ctx):
+    base = ssh_auditor.SSHDConfigParser().config
+    snapshots = []
+    for index in range(ctx['fleet_hosts']):
+        config = dict(base)
+        config['MaxAuthTries'] = str(1 + index % 6)
+        config['PermitRootLogin'] = 'yes' if index % 7 == 0 else 'no'
+        snapshots.append((f"host{index:06d}", config))
+    return ssh_auditor.ConfigTable.from_snapshots(snapshots)
+
+@benchmark('fleet/evaluate', setup=_setup_fleet)
+def bench_fleet(ctx, table):
+    ssh_auditor.evaluate_fleet(table)
+
+@benchmark('fleet/authorized_keys_index')
+def bench_key_index(ctx, _):
+    ssh_auditor.AuthorizedKeyIndex().add_host_directory('bench', os.path.join(ctx['root'], 'home'))
+
+# --- Planejamento de Correções (dry-run) ---
+@benchmark('fix/ssh_config_dry_run')
+def bench_fix_ssh_config(ctx, _):
+    ssh_auditor.fix_ssh_config(dry_run=True)
+
+@benchmark('fix/file_permissions_dry_run')
+def bench_fix_file_permissions(ctx, _):
+    ssh_auditor.fix_file_permissions(dry_run=True)
+
+@benchmark('fix/authorized_keys_dry_run')
+def bench_fix_authorized_keys(ctx, _):
+    ssh_auditor.fix_authorized_keys(dry_run=True)
+
+@benchmark('fix/session_probe')
+def bench_session_probe(ctx, _):
+    ssh_auditor.check_active_ssh_sessions()
+
+def _setup_bans(ctx):
+    # Onda distribuída: sub-redes densas de botnet e IPs esparsos, como após um ataque
+    import random
+    generator = random.Random(48)
+    bans = [f"91.200.{subnet}.{host}" for subnet in range(64) for host in range(256) if generator.random() < 0.8]
+    bans += [f"45.{generator.randrange(256)}.{generator.randrange(256)}.{generator.randrange(256)}" for _ in range(20000)]
+    bans += [f"2001:db8:{generator.randrange(64):x}::{generator.randrange(4096):x}" for _ in range(5000)]
+    return bans, ssh_auditor.parse_allowlist(list(ssh_auditor.BAN_ALLOWLIST) + ['91.200.7.0/24'])
+
+@benchmark('fix/aggregate_bans', setup=_setup_bans)
+def bench_aggregate_bans(ctx, prepared):
+    bans, allowlist = prepared
+    ssh_auditor.format_ban_set(ssh_auditor.aggregate_bans(bans, allowlist)['networks'])
+
+# --- Análise de Logs (receitas do WatchmanLogs como linha de base) ---
+@benchmark('logs/watchman_xss')
+def bench_logs_xss(ctx, _):
+    shell(f"grep -iE '<script|%3Cscript' '{ctx['access_log']}'")
+
+@benchmark('logs/watchman_sqli')
+def bench_logs_sqli(ctx, _):
+    shell(f"grep -iE 'union|select|insert|drop|%27|%22' '{ctx['access_log']}'")
+
+@benchmark('logs/watchman_404_top_ips')
+def bench_logs_404(ctx, _):
+    shell(f"grep ' 404 ' '{ctx['access_log']}' | cut -d ' ' -f 1 | sort | uniq -c | sort -nr | head")
+
+@benchmark('logs/watchman_requests_per_ip')
+def bench_logs_requests(ctx, _):
+    shell(f"cut -d ' ' -f 1 '{ctx['access_log']}' | sort | uniq -c")
+
+def _watchmanlogs():
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(BENCH_DIR)), 'WatchmanLogs'))
+    import watchmanlogs
+    return watchmanlogs
+
+@benchmark('logs/watchmanlogs_sketch', setup=lambda ctx: _watchmanlogs())
+def bench_logs_sketch(ctx, watchmanlogs):
+    watchmanlogs.analyze_files([ctx['access_log']], exact=False)
+
+@benchmark('logs/watchmanlogs_exact', setup=lambda ctx: _watchmanlogs())
+def bench_logs_exact(ctx, watchmanlogs):
+    watchmanlogs.analyze_files([ctx['access_log']], exact=True)
+
+def _setup_rotated_logs(ctx):
+    """access.log.1.gz ao lado do atual: mede a leitura compactada em streaming"""
+    rotated = ctx['access_log'] + '.1.gz'
+    if not os.path.exists(rotated):
+        subprocess.run(['sh', '-c', f"gzip -c '{ctx['access_log']}' > '{rotated}'"], check=True)
+    watchmanlogs = _watchmanlogs()
+    return watchmanlogs, watchmanlogs.rotation_set(ctx['access_log'])
+
+@benchmark('logs/watchmanlogs_rotated', setup=_setup_rotated_logs)
+def bench_logs_rotated(ctx, prepared):
+    watchmanlogs, segments = prepared
+    watchmanlogs.analyze_files(segments, exact=False)
+
+@benchmark('logs/watchmanlogs_rotated_prefetch', setup=_setup_rotated_logs)
+def bench_logs_rotated_prefetch(ctx, prepared):
+    watchmanlogs, segments = prepared
+    watchmanlogs.analyze_files(segments, prefetch=True, exact=False)
+
+def _setup_columnar(ctx):
+    watchmanlogs = _watchmanlogs()
+    directory = os.path.join(ctx['root'], 'var', 'cache', 'watchmanlogs')
+    watchmanlogs.ColumnarLog.load([ctx['access_log']], directory).close()
+    return watchmanlogs, directory
+
+@benchmark('logs/watchmanlogs_columnar_query', setup=_setup_columnar)
+def bench_logs_columnar(ctx, prepared):
+    watchmanlogs, directory = prepared
+    columnar = watchmanlogs.ColumnarLog.open(directory, [ctx['access_log']])
+    try:
+        start, end = columnar.time_range()
+        columnar.stats(start, end, '404')
+        columnar.detections(start, end)
+    finally:
+        columnar.close()
+
+def _setup_log_format(fast: bool):
+    def setup(ctx):
+        watchmanlogs = _watchmanlogs()
+        with open(ctx['access_log'], 'rb') as f:
+            lines = f.read().split(b'\n')
+        return watchmanlogs.compile_log_format('combined', watchmanlogs.COLUMNAR_FIELDS, fast=fast), lines
+    return setup
+
+# Parser compilado do LogFormat: caminho rápido (split/find gerado) contra a regex equivalente
+@benchmark('logs/logformat_fast', setup=_setup_log_format(True))
+def bench_logformat_fast(ctx, prepared):
+    parse, lines = prepared
+    for line in lines:
+        parse(line)
+
+@benchmark('logs/logformat_regex', setup=_setup_log_format(False))
+def bench_logformat_regex(ctx, prepared):
+    parse, lines = prepared
+    for line in lines:
+        parse(line)
+
+@benchmark('logs/correlate_web_ssh', setup=lambda ctx: _watchmanlogs())
+def bench_logs_correlate(ctx, watchmanlogs):
+    index = watchmanlogs.web_features([ctx['access_log']])
+    index.merge(watchmanlogs.ssh_features([ctx['auth_log']]))
+    index.ranked(100)
+
+@benchmark('logs/auth_failed_top_ips')
+def bench_logs_auth(ctx, _):
+    shell(f"grep 'Failed password' '{ctx['auth_log']}' | awk '{{print $(NF-3)}}' | sort | uniq -c | sort -nr | head")
+
+# --- Fixtures ---
+def ensure_fixtures(args) -> Dict:
+    """Gera as fixtures se a raiz não existir ou os parâmetros mudaram"""
+    params = {
+        'users': args.users,
+        'includes': args.includes,
+        'config_lines': args.config_lines,
+        'log_size': args.log_size,
+        'rsa_bits': args.rsa_bits,
+        'seed': fixtures.SEED,
+    }
+    root = os.path.abspath(args.root)
+    manifest_path = os.path.join(root, MANIFEST)
+    
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        manifest = None
+    
+    if args.regenerate or not manifest or manifest.get('params') != params:
+        print(f"Gerando fixtures em {root} ...", file=sys.stderr)
+        start = time.perf_counter()
+        os.makedirs(root, exist_ok=True)
+        fixtures.generate_sshd_tree(root, args.includes, args.config_lines)
+        fixtures.generate_host_keys(root, args.rsa_bits)
+        users = fixtures.generate_passwd(root, args.users)
+        size = fixtures.parse_size(args.log_size)
+        access_lines = fixtures.generate_access_log(os.path.join(root, 'var', 'log', 'apache2', 'access.log'), size)
+        auth_lines = fixtures.generate_auth_log(os.path.join(root, 'var', 'log', 'auth.log'), size)
+        manifest = {
+            'params': params,
+            'stats': dict(users, access_log_lines=access_lines, auth_log_lines=auth_lines),
+            'generated_in': round(time.perf_counter() - start, 2),
+        }
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+    
+    return {
+        'root': root,
+        'access_log': os.path.join(root, 'var', 'log', 'apache2', 'access.log'),
+        'auth_log': os.path.join(root, 'var', 'log', 'auth.log'),
+        'fleet_hosts': args.fleet_hosts,
+        'manifest': manifest,
+    }
+
+# --- Medição ---
+def _child(entry: Dict, ctx: Dict, repeat: int, conn):
+    """Executa um benchmark em processo isolado e envia as métricas ao pai"""
+    try:
+        configure_module(ctx)
+        prepared = entry['setup'](ctx) if entry['setup'] else None
+        
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            entry['func'](ctx, prepared)
+            timings.append(time.perf_counter() - start)
+        
+        blocks_before = sys.getallocatedblocks()
+        tracemalloc.start()
+        entry['func'](ctx, prepared)
+        _, alloc_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        blocks_after = sys.getallocatedblocks()
+        
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        conn.send({
+            'time_best_s': round(min(timings), 6),
+            'time_mean_s': round(sum(timings) / len(timings), 6),
+            'repeat': repeat,
+            'alloc_peak_bytes': alloc_peak,
+            'alloc_net_blocks': blocks_after - blocks_before,
+            'peak_rss_kb': own.ru_maxrss,
+            'children_peak_rss_kb': children.ru_maxrss,
+            'cpu_user_s': round(own.ru_utime + children.ru_utime, 4),
+            'cpu_system_s': round(own.ru_stime + children.ru_stime, 4),
+        })
+    except Exception as e:
+        conn.send({'error': f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+def run_benchmark(entry: Dict, ctx: Dict, repeat: int) -> Dict:
+    context = multiprocessing.get_context('fork')
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=_child, args=(entry, ctx, repeat, child_conn))
+    process.start()
+    child_conn.close()
+    try:
+        result = parent_conn.recv()
+    except EOFError:
+        result = {'error': 'processo filho terminou sem resultado'}
+    process.join()
+    return result
+
+def git_revision() -> str:
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                            capture_output=True, text=True, check=False)
+    return result.stdout.strip() or 'unknown'
+
+# --- Inicialização ---
+# Orçamento de 'import ssh_auditor' (execuções via cron pagam esse custo a cada chamada)
+STARTUP_BUDGET_MS = 60.0
+# Módulos que o import do núcleo não deve carregar (componentes e dependências pesadas)
+STARTUP_FORBIDDEN = ('asyncio', 'subprocess', 'argparse', 'tarfile', 'random',
+                     'ssh_audit', 'ssh_fix', 'ssh_fleet', 'ssh_logs', 'ssh_menu', 'ssh_server')
+
+def measure_startup(repeat: int) -> Dict:
+    """Tempo cumulativo de 'import ssh_auditor' segundo python -X importtime (melhor de N)"""
+    code = ("import sys, ssh_auditor; "
+            f"print(','.join(m for m in {STARTUP_FORBIDDEN!r} if m in sys.modules))")
+    samples = []
+    loaded = ''
+    for _ in range(max(repeat, 1)):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                                cwd=os.path.dirname(BENCH_DIR), capture_output=True, text=True, check=True)
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == 'ssh_auditor':
+                samples.append(int(fields[1]) / 1000)
+        loaded = result.stdout.strip()
+    return {'import_best_ms': min(samples), 'import_samples_ms': samples,
+            'forbidden_loaded': [name for name in loaded.split(',') if name]}
+
+def check_startup(budget_ms: float, repeat: int) -> int:
+    """Falha (código 1) se o import passar do orçamento ou carregar módulos proibidos"""
+    result = measure_startup(repeat)
+    print(f"{'startup/import':<36} {result['import_best_ms']:>8.1f} ms  (orçamento {budget_ms:.0f} ms)", file=sys.stderr)
+    failed = False
+    if result['import_best_ms'] > budget_ms:
+        print(f"ERRO: import acima do orçamento ({result['import_best_ms']:.1f} ms > {budget_ms:.0f} ms)",
+              file=sys.stderr)
+        failed = True
+    if result['forbidden_loaded']:
+        print(f"ERRO: import do núcleo carregou: {', '.join(result['forbidden_loaded'])}", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+# --- Comparação ---
+def compare(base_path: str, new_path: str) -> int:
+    """Imprime diferenças entre dois resultados JSON"""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    
+    print(f"Base: {base['meta']['commit']}  Novo: {new['meta']['commit']}")
+    print(f"{'benchmark':<36} {'base (s)':>10} {'novo (s)':>10} {'Δ tempo':>9} {'Δ alloc':>9} {'Δ RSS':>9}")
+    print("-" * 88)
+    
+    def delta(old, current):
+        if not old:
+            return '    n/a'
+        return f"{(current - old) / old * 100:+8.1f}%"
+    
+    for name, current in new['results'].items():
+        previous = base['results'].get(name)
+        if not previous or 'error' in previous or 'error' in current:
+            print(f"{name:<36} {'-':>10} {'-':>10}")
+            continue
+        print(f"{name:<36} {previous['time_best_s']:>10.4f} {current['time_best_s']:>10.4f} "
+              f"{delta(previous['time_best_s'], current['time_best_s'])} "
+              f"{delta(previous['alloc_peak_bytes'], current['alloc_peak_bytes'])} "
+              f"{delta(previous['peak_rss_kb'], current['peak_rss_kb'])}")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do SSH Auditor",
+                                     formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+    parser.add_argument('--root', default='/tmp/ssh_auditor_bench', help='Raiz das fixtures (padrão: %(default)s)')
+    parser.add_argument('--users', type=int, default=20000, help='Usuários no passwd sintético')
+    parser.add_argument('--includes', type=int, default=20, help='Arquivos em sshd_config.d')
+    parser.add_argument('--config-lines', type=int, default=200, help='Linhas por arquivo de configuração')
+    parser.add_argument('--rsa-bits', type=int, default=2048, help='Tamanho da chave de host RSA')
+    parser.add_argument('--log-size', default='64M', help='Tamanho de cada log sintético (ex: 512M, 2G)')
+    parser.add_argument('--fleet-hosts', type=int, default=100000, help='Snapshots no benchmark de frota')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetições cronometradas por benchmark')
+    parser.add_argument('--only', metavar='FILTRO', help='Executar apenas benchmarks cujo nome contém FILTRO')
+    parser.add_argument('--regenerate', action='store_true', help='Forçar regeneração das fixtures')
+    parser.add_argument('--output', '-o', metavar='ARQUIVO', help='Salvar resultados JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NOVO'), help='Comparar dois resultados JSON')
+    parser.add_argument('--check-startup', action='store_true',
+                        help='Medir o import (python -X importtime) e falhar acima do orçamento')
+    parser.add_argument('--import-budget-ms', type=float, default=STARTUP_BUDGET_MS,
+                        help='Orçamento do import em ms (padrão: %(default)s)')
+    args = parser.parse_args()
+    
+    if args.compare:
+        sys.exit(compare(*args.compare))
+    
+    if args.check_startup:
+        sys.exit(check_startup(args.import_budget_ms, args.repeat))
+    
+    logging.disable(logging.CRITICAL)
+    ctx = ensure_fixtures(args)
+    
+    results = {}
+    for entry in BENCHMARKS:
+        if args.only and args.only not in entry['name']:
+            continue
+        result = run_benchmark(entry, ctx, args.repeat)
+        results[entry['name']] = result
+        if 'error' in result:
+            print(f"{entry['name']:<36} ERRO: {result['error']}", file=sys.stderr)
+        else:
+            print(f"{entry['name']:<36} {result['time_best_s']:>10.4f}s  "
+                  f"alloc {result['alloc_peak_bytes'] / 1024:>10.0f} KiB  "
+                  f"rss {result['peak_rss_kb']:>8} KiB", file=sys.stderr)
+    
+    output = {
+        'meta': {
+            'commit': git_revision(),
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'fixture': ctx['manifest'],
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+        print(f"Resultados salvos em: {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(output, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,999 @@
+"""
+SSH Auditor - auditoria
+
+Verificações de sshd_config, permissões, chaves de host, authorized_keys e
+Fail2ban, relatório, auditoria de várias raízes e métricas Prometheus.
+"""
+
+import os
+import json
+import fnmatch
+import posixpath
+import time
+import logging
+import datetime
+import base64
+import hashlib
+import operator
+import collections
+import concurrent.futures
+from stat import S_ISDIR, S_ISLNK
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import ssh_auditor as core
+from ssh_auditor import (DEFAULT_PROFILE, FILE_CACHE, LIMITS, SEVERITIES, SEVERITY_EMOJI, VERSION, AuditDeadlineExceeded,
+                         ComplianceProfile, Issue, LocalRoot, PasswdEntry, Severity, load_profile, load_sshd_config, normalize_logical,
+                         persistent_cache_dir, run_command, run_commands, set_audit_root, subsystem_rule, traced,
+                         write_file_atomic)
+
+# --- Conteúdo de authorized_keys ---
+AUTHORIZED_KEY_TYPES = {
+    'ssh-rsa': 'RSA',
+    'ssh-dss': 'DSA',
+    'ssh-ed25519': 'ED25519',
+    'ecdsa-sha2-nistp256': 'ECDSA',
+    'ecdsa-sha2-nistp384': 'ECDSA',
+    'ecdsa-sha2-nistp521': 'ECDSA',
+    'sk-ecdsa-sha2-nistp256@openssh.com': 'ECDSA-SK',
+    'sk-ssh-ed25519@openssh.com': 'ED25519-SK',
+}
+# Certificados (ex: ssh-rsa-cert-v01@openssh.com) têm o mesmo tipo da chave base
+AUTHORIZED_KEY_TYPES.update({
+    algorithm.replace('@openssh.com', '') + '-cert-v01@openssh.com': key_type
+    for algorithm, key_type in list(AUTHORIZED_KEY_TYPES.items())
+})
+_ECDSA_CURVE_BITS = {b'nistp256': 256, b'nistp384': 384, b'nistp521': 521}
+
+# Opções que limitam o uso da chave (origem, comando forçado ou 'restrict')
+RESTRICTING_KEY_OPTIONS = ('from', 'command', 'restrict')
+MIN_RSA_KEY_BITS = 3072
+
+class AuthorizedKey(NamedTuple):
+    """Linha de authorized_keys decodificada (sem guardar o blob da chave)"""
+    key_type: str
+    bits: int
+    options: Dict[str, Optional[str]]
+    digest: bytes
+    comment: str
+
+def split_key_options(text: str) -> Tuple[Dict[str, Optional[str]], str]:
+    """Separa as opções iniciais (ex: from="10.0.0.0/8",no-pty) do restante da linha"""
+    options: Dict[str, Optional[str]] = {}
+    index, length = 0, len(text)
+    while index < length and text[index] not in ' \t':
+        start = index
+        quoted = False
+        while index < length and (quoted or text[index] not in ', \t'):
+            if text[index] == '\\' and quoted:
+                index += 1
+            elif text[index] == '"':
+                quoted = not quoted
+            index += 1
+        if quoted:
+            raise ValueError("Aspas não fechadas nas opções")
+        name, separator, value = text[start:index].partition('=')
+        if separator and len(value) >= 2 and value[0] == value[-1] == '"':
+            value = value[1:-1].replace('\\"', '"')
+        options[name.lower()] = value if separator else None
+        if index < length and text[index] == ',':
+            index += 1
+    return options, text[index:].lstrip()
+
+def _ssh_string(blob: bytes, offset: int) -> Tuple[bytes, int]:
+    """Lê um campo 'string' do formato de chave SSH (tamanho big-endian de 4 bytes)"""
+    end = offset + 4 + int.from_bytes(blob[offset:offset + 4], 'big')
+    if end > len(blob):
+        raise ValueError("Blob de chave truncado")
+    return blob[offset + 4:end], end
+
+def _key_bits(algorithm: str, blob: bytes) -> int:
+    name, offset = _ssh_string(blob, 0)
+    if name.decode('ascii', 'replace') != algorithm:
+        raise ValueError(f"Tipo declarado '{algorithm}' difere do blob")
+    if algorithm.endswith('-cert-v01@openssh.com'):
+        _, offset = _ssh_string(blob, offset)  # nonce
+    
+    key_type = AUTHORIZED_KEY_TYPES[algorithm]
+    if key_type == 'RSA':
+        _, offset = _ssh_string(blob, offset)  # expoente público
+        modulus, _ = _ssh_string(blob, offset)
+        return int.from_bytes(modulus, 'big').bit_length()
+    if key_type == 'DSA':
+        prime, _ = _ssh_string(blob, offset)
+        return int.from_bytes(prime, 'big').bit_length()
+    if key_type.startswith('ECDSA'):
+        curve, _ = _ssh_string(blob, offset)
+        return _ECDSA_CURVE_BITS.get(curve, 0)
+    return 256
+
+def parse_authorized_key(line: str) -> Optional[AuthorizedKey]:
+    """Decodifica uma linha de authorized_keys; None para linhas vazias ou comentários"""
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    
+    options: Dict[str, Optional[str]] = {}
+    if line.split(None, 1)[0] not in AUTHORIZED_KEY_TYPES:
+        options, line = split_key_options(line)
+    parts = line.split(None, 2)
+    if len(parts) < 2 or parts[0] not in AUTHORIZED_KEY_TYPES:
+        raise ValueError("Tipo de chave ausente ou desconhecido")
+    
+    try:
+        blob = base64.b64decode(parts[1], validate=True)
+    except ValueError:
+        raise ValueError("Chave em base64 inválida")
+    return AuthorizedKey(AUTHORIZED_KEY_TYPES[parts[0]], _key_bits(parts[0], blob), options,
+                         hashlib.sha256(blob).digest(), parts[2] if len(parts) > 2 else '')
+
+def format_fingerprint(digest: bytes) -> str:
+    """Fingerprint no formato do ssh-keygen -l (SHA256:...)"""
+    return 'SHA256:' + base64.b64encode(digest).decode('ascii').rstrip('=')
+
+def authorized_key_issues(key: AuthorizedKey, path: str, user: str, line_number: int,
+                          privileged: bool = False) -> List[Issue]:
+    """Issues de conteúdo de uma chave: algoritmo fraco e ausência de restrições"""
+    issues = []
+    location = {'path': path, 'user': user, 'line': line_number,
+                'key_type': key.key_type, 'key_size': key.bits, 'fingerprint': format_fingerprint(key.digest)}
+    
+    if key.key_type == 'DSA':
+        issues.append(Issue('weak_authorized_key', Severity.HIGH, **location,
+                            comment='Chave DSA: algoritmo desabilitado por padrão desde o OpenSSH 7.0'))
+    elif key.key_type == 'RSA' and key.bits < MIN_RSA_KEY_BITS:
+        issues.append(Issue('weak_authorized_key', Severity.HIGH if key.bits < 2048 else Severity.MEDIUM,
+                            **location,
+                            comment=f"Chave RSA com {key.bits} bits. NIST recomenda mínimo {MIN_RSA_KEY_BITS} bits"))
+    
+    if not any(option in key.options for option in RESTRICTING_KEY_OPTIONS):
+        issues.append(Issue('unrestricted_authorized_key', Severity.MEDIUM if privileged else Severity.LOW,
+                            **location,
+                            comment='Chave sem from=, command= ou restrict: aceita de qualquer origem sem limites'))
+    return issues
+
+# --- Auditoria ---
+def incomplete_issue(detail: str) -> Issue:
+    """Marca um resultado parcial: o prazo do modo de baixo impacto acabou antes do coletor"""
+    return Issue('audit_incomplete', Severity.MEDIUM,
+                 comment=f"Prazo de {LIMITS.deadline:g}s esgotado: {detail}. Resultado parcial")
+
+def is_complete(all_issues: Dict[str, List[Issue]]) -> bool:
+    return not any(issue.type == 'audit_incomplete' for issues in all_issues.values() for issue in issues)
+
+@traced('audit')
+def audit_ssh_config(profile: Optional[ComplianceProfile] = None) -> List[Issue]:
+    """Audita configurações SSH contra o perfil de conformidade (padrão: CIS L1)"""
+    parser = load_sshd_config()
+    profile = profile or load_profile(DEFAULT_PROFILE)
+    
+    extra_rules = [] if profile.has_rule('Subsystem') else [subsystem_rule()]
+    return profile.evaluate(parser.config, extra_rules)
+
+# --- Política de Permissões ---
+class PermissionPolicy(NamedTuple):
+    """Modo máximo e dono esperados para um caminho lógico
+    
+    O glob só é aceito no último componente; '~' é a home de cada usuário e o
+    dono '$user' é o dono dessa home. group=None não verifica o grupo.
+    """
+    pattern: str
+    mode: int
+    owner: str
+    group: Optional[str]
+    severity: Severity
+    is_dir: bool = False
+    required: bool = False
+
+# Ordem importa: o primeiro padrão que casa com uma entrada vence.
+# authorized_keys fica com audit_authorized_keys (permissões e conteúdo).
+PERMISSION_POLICIES = (
+    PermissionPolicy('/etc/ssh', 0o755, 'root', 'root', Severity.HIGH, is_dir=True, required=True),
+    PermissionPolicy('/etc/ssh/sshd_config', 0o600, 'root', 'root', Severity.HIGH, required=True),
+    PermissionPolicy('/etc/ssh/ssh_host_*_key', 0o600, 'root', 'root', Severity.HIGH),
+    PermissionPolicy('/etc/ssh/ssh_host_*_key.pub', 0o644, 'root', 'root', Severity.HIGH),
+    PermissionPolicy('/etc/ssh/moduli', 0o644, 'root', 'root', Severity.MEDIUM),
+    PermissionPolicy('/etc/ssh/ssh_known_hosts', 0o644, 'root', 'root', Severity.MEDIUM),
+    PermissionPolicy('/etc/ssh/sshd_config.d', 0o755, 'root', 'root', Severity.HIGH, is_dir=True),
+    PermissionPolicy('/etc/ssh/sshd_config.d/*', 0o600, 'root', 'root', Severity.HIGH),
+    PermissionPolicy('~/.ssh', 0o700, '$user', None, Severity.HIGH, is_dir=True),
+    PermissionPolicy('~/.ssh/*.pub', 0o644, '$user', None, Severity.LOW),
+    PermissionPolicy('~/.ssh/id_*', 0o600, '$user', None, Severity.HIGH),
+    PermissionPolicy('~/.ssh/config', 0o644, '$user', None, Severity.MEDIUM),
+    PermissionPolicy('~/.ssh/known_hosts', 0o644, '$user', None, Severity.LOW),
+)
+# Homes por tarefa e tarefas simultâneas (homes em NFS: limita operações em voo)
+PERMISSION_BATCH = 256
+PERMISSION_WORKERS = 16
+
+def _has_glob(pattern: str) -> bool:
+    return any(char in pattern for char in '*?[')
+
+class PermissionWalker:
+    """Aplica uma tabela de políticas à raiz ativa com um scandir por diretório
+    
+    Donos e grupos esperados são resolvidos para uid/gid uma vez; a comparação é
+    numérica e nomes só são resolvidos para descrever divergências.
+    """
+    
+    def __init__(self, policies=PERMISSION_POLICIES):
+        self.root = core.AUDIT_ROOT
+        self.uids: Dict[str, Optional[int]] = {}
+        self.gids: Dict[str, Optional[int]] = {}
+        # diretório pai -> [(política, nome ou glob, é glob?)], na ordem da tabela
+        system: Dict[str, List[Tuple[PermissionPolicy, str, bool]]] = {}
+        home: Dict[str, List[Tuple[PermissionPolicy, str, bool]]] = {}
+        for policy in policies:
+            table = home if policy.pattern.startswith('~/') else system
+            parent, name = posixpath.split(policy.pattern)
+            table.setdefault(parent[1:] if table is home else parent, []).append((policy, name, _has_glob(name)))
+            if policy.owner != '$user' and policy.owner not in self.uids:
+                self.uids[policy.owner] = self.root.user_id(policy.owner)
+            if policy.group is not None and policy.group not in self.gids:
+                self.gids[policy.group] = self.root.group_id(policy.group)
+        # (pai, políticas, algum glob?): diretórios com glob são listados com um scandir,
+        # os demais recebem um stat por nome
+        self.system = [(parent, rules, any(rule[2] for rule in rules)) for parent, rules in system.items()]
+        self.home = [(parent, rules, any(rule[2] for rule in rules)) for parent, rules in home.items()]
+        # Homes puladas por prazo esgotado (um total por lote; list.append é seguro entre threads)
+        self.skipped: List[int] = []
+    
+    def check_system(self) -> List[Issue]:
+        return self._check(self.system, '', None)
+    
+    def check_homes(self, entries: List[PasswdEntry]) -> List[Issue]:
+        issues = []
+        for position, entry in enumerate(entries):
+            if LIMITS.active and LIMITS.expired():
+                self.skipped.append(len(entries) - position)
+                break
+            issues.extend(self._check(self.home, entry.home, entry))
+        return issues
+    
+    def _check(self, table: List[Tuple[str, List[Tuple[PermissionPolicy, str, bool]], bool]], prefix: str,
+               user: Optional[PasswdEntry]) -> List[Issue]:
+        issues = []
+        missing_dirs: List[str] = []
+        # Dentro de homes o usuário controla as entradas: links não são seguidos (um link para
+        # /etc/shadow viraria um chown para o usuário no --fix) e são só reportados
+        follow = user is None
+        stat = self.root.stat if follow else self.root.lstat
+        for parent, rules, globbed in table:
+            logical_parent = prefix + parent or '/'
+            parent_missing = missing_dirs and any(logical_parent == d or logical_parent.startswith(d + '/')
+                                                  for d in missing_dirs)
+            
+            listing = []
+            if parent_missing:
+                pass
+            elif globbed:
+                listing = self.root.scan(logical_parent, follow_symlinks=follow)
+            else:
+                for _, name, _ in rules:
+                    logical = logical_parent.rstrip('/') + '/' + name
+                    try:
+                        listing.append((name, stat(logical)))
+                    except (FileNotFoundError, NotADirectoryError):
+                        continue
+                    except OSError as e:
+                        issues.append(Issue('audit_error', Severity.MEDIUM, path=self.root.path(logical),
+                                            error=str(e)))
+            
+            found = set()
+            for entry_name, stat_info in listing:
+                if S_ISLNK(stat_info.st_mode):
+                    issues.extend(self._symlink(rules, logical_parent.rstrip('/') + '/' + entry_name, user))
+                    continue
+                is_dir = S_ISDIR(stat_info.st_mode)
+                for policy, name, is_glob in rules:
+                    matches = fnmatch.fnmatchcase(entry_name, name) if is_glob else name == entry_name
+                    if matches and policy.is_dir == is_dir:
+                        found.add(name)
+                        issues.extend(self._compare(policy, logical_parent.rstrip('/') + '/' + entry_name,
+                                                    stat_info, user))
+                        break
+            
+            for policy, name, is_glob in rules:
+                if is_glob or name in found:
+                    continue
+                logical = logical_parent.rstrip('/') + '/' + name
+                if policy.is_dir:
+                    missing_dirs.append(logical)
+                if policy.required:
+                    issues.append(Issue('missing_file', policy.severity, path=self.root.path(logical),
+                                        comment='Arquivo crítico não encontrado'))
+        return issues
+    
+    def _symlink(self, rules: List[Tuple[PermissionPolicy, str, bool]], logical: str,
+                 user: PasswdEntry) -> List[Issue]:
+        """Link no lugar de um caminho da política: não é seguido nem corrigido automaticamente"""
+        name = posixpath.basename(logical)
+        for policy, pattern, is_glob in rules:
+            if fnmatch.fnmatchcase(name, pattern) if is_glob else pattern == name:
+                return [Issue('unexpected_symlink', policy.severity, path=self.root.entry_path(logical), user=user.name,
+                              comment='Link simbólico em ~/.ssh: não é seguido nem corrigido, verifique manualmente')]
+        return []
+    
+    def _compare(self, policy: PermissionPolicy, logical: str, stat_info,
+                 user: Optional[PasswdEntry]) -> List[Issue]:
+        issues = []
+        location = {'path': self.root.path(logical)}
+        if user is not None:
+            location['user'] = user.name
+        
+        current_perms = stat_info.st_mode & 0o777
+        if current_perms & ~policy.mode:
+            issues.append(Issue(
+                'wrong_permissions',
+                policy.severity,
+                **location,
+                current=f"0o{current_perms:o}",
+                expected=f"0o{current_perms & policy.mode:o}"
+            ))
+        
+        owner = user.name if policy.owner == '$user' else policy.owner
+        owner_uid = user.uid if policy.owner == '$user' else self.uids[policy.owner]
+        group_gid = self.gids[policy.group] if policy.group is not None else None
+        if (owner_uid is not None and stat_info.st_uid != owner_uid) or \
+                (group_gid is not None and stat_info.st_gid != group_gid):
+            current = self.root.user_name(stat_info.st_uid)
+            expected = owner
+            if policy.group is not None:
+                current += f":{self.root.group_name(stat_info.st_gid)}"
+                expected += f":{policy.group}"
+            issues.append(Issue(
+                'wrong_ownership',
+                policy.severity,
+                **location,
+                current=current,
+                expected=expected
+            ))
+        return issues
+
+@traced('audit')
+def audit_file_permissions() -> List[Issue]:
+    """Audita permissões de /etc/ssh e de ~/.ssh de todos os usuários (PERMISSION_POLICIES)"""
+    walker = PermissionWalker()
+    issues = walker.check_system()
+    
+    try:
+        entries = core.AUDIT_ROOT.passwd_entries()
+    except AuditDeadlineExceeded:
+        return issues + [incomplete_issue("homes não verificadas (lista de usuários não obtida)")]
+    except Exception as e:
+        logging.error(f"Erro ao listar usuários para auditoria de ~/.ssh: {e}")
+        return issues
+    
+    # Homes compartilhadas pelo mesmo uid são verificadas uma vez; por uids diferentes não
+    # há dono certo: a home é reportada e não entra na verificação (nem no --fix)
+    homes: Dict[str, List[PasswdEntry]] = {}
+    for entry in entries:
+        if entry.home and entry.home != '/':
+            home = normalize_logical(entry.home)
+            homes.setdefault(home, []).append(entry._replace(home=home))
+    users = []
+    for home, owners in homes.items():
+        if len({owner.uid for owner in owners}) == 1:
+            users.append(owners[0])
+        elif core.AUDIT_ROOT.exists(home):
+            issues.append(Issue('shared_home', Severity.MEDIUM, path=core.AUDIT_ROOT.path(home),
+                                users=', '.join(owner.name for owner in owners),
+                                comment='Home de usuários com uids diferentes: dono de ~/.ssh indefinido, '
+                                        'permissões não verificadas'))
+    batches = [users[i:i + PERMISSION_BATCH] for i in range(0, len(users), PERMISSION_BATCH)]
+    if len(batches) <= 1:
+        issues.extend(walker.check_homes(users))
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(PERMISSION_WORKERS, len(batches))) as executor:
+            for batch_issues in executor.map(walker.check_homes, batches):
+                issues.extend(batch_issues)
+    
+    if walker.skipped:
+        issues.append(incomplete_issue(f"{sum(walker.skipped)} de {len(users)} homes não verificadas"))
+    return issues
+
+@traced('audit')
+def audit_host_keys() -> List[Issue]:
+    """Audita força das chaves de host SSH (ssh-keygen em paralelo para todas as chaves)"""
+    logical_paths = core.AUDIT_ROOT.glob(core.SSH_DIR, 'ssh_host_*_key.pub')
+    # Servidor: só reexecuta ssh-keygen se alguma chave (ou o diretório) mudou
+    watched = [core.AUDIT_ROOT.path(path) for path in [core.SSH_DIR] + logical_paths]
+    key = ('host_keys', repr(core.AUDIT_ROOT))
+    issues = list(FILE_CACHE.get(key, watched, lambda: _host_key_issues(logical_paths)))
+    if any(issue.type == 'audit_incomplete' for issue in issues):
+        # Resultado parcial não pode ser servido do cache na próxima auditoria
+        FILE_CACHE.discard(key)
+    return issues
+
+def _host_key_issues(logical_paths: List[str]) -> List[Issue]:
+    issues = []
+    
+    key_files, commands, inputs = [], [], []
+    for logical_path in logical_paths:
+        key_file = core.AUDIT_ROOT.path(logical_path)
+        if core.AUDIT_ROOT.has_local_files:
+            commands.append(['ssh-keygen', '-l', '-f', key_file])
+            inputs.append(None)
+        else:
+            try:
+                with core.AUDIT_ROOT.open(logical_path) as f:
+                    inputs.append(f.read())
+            except OSError as e:
+                logging.debug(f"Erro ao auditar chave {key_file}: {e}")
+                continue
+            commands.append(['ssh-keygen', '-l', '-f', '-'])
+        key_files.append(key_file)
+    
+    skipped = 0
+    for key_file, result in zip(key_files, run_commands(commands, input_data=inputs)):
+        if isinstance(result, AuditDeadlineExceeded):
+            skipped += 1
+            continue
+        try:
+            if isinstance(result, BaseException):
+                raise result
+            output = result.stdout.strip()
+            
+            parts = output.split()
+            if len(parts) < 1:
+                continue
+            
+            key_size = int(parts[0])
+            key_type = parts[-1].strip('()')
+            
+            if key_type == 'RSA' and key_size < 3072:
+                issues.append(Issue(
+                    'weak_host_key',
+                    Severity.HIGH,
+                    path=key_file,
+                    key_type=key_type,
+                    key_size=key_size,
+                    comment=f"Chave RSA com {key_size} bits. NIST recomenda mínimo 3072 bits"
+                ))
+        
+        except Exception as e:
+            logging.debug(f"Erro ao auditar chave {key_file}: {e}")
+    
+    if skipped:
+        issues.append(incomplete_issue(f"{skipped} de {len(key_files)} chaves de host não verificadas"))
+    return issues
+
+# --- Moduli (Grupos Diffie-Hellman) ---
+# Usados pelo diffie-hellman-group-exchange; NIST SP 800-57 pede no mínimo 3072 bits
+MIN_MODULI_BITS = 3072
+MODULI_CACHE_VERSION = 1
+
+def moduli_group_bits(fields: List[bytes]) -> Optional[int]:
+    """Bits do grupo em uma linha do moduli já dividida; None se não for um grupo válido
+    
+    Formato: Time Type Tests Tries Size Generator Modulus, onde Size é o
+    tamanho em bits menos 1 (3071 para um grupo de 3072 bits).
+    """
+    if len(fields) != 7 or not fields[4].isdigit():
+        return None
+    return int(fields[4]) + 1
+
+def scan_moduli(f) -> Dict:
+    """Conta os grupos do moduli (aberto em binário) por tamanho, linha a linha"""
+    sizes: Dict[int, int] = {}
+    invalid = 0
+    for line in f:
+        fields = line.split()
+        if not fields or fields[0].startswith(b'#'):
+            continue
+        bits = moduli_group_bits(fields)
+        if bits is None:
+            invalid += 1
+            continue
+        sizes[bits] = sizes.get(bits, 0) + 1
+    return {
+        'groups': sum(sizes.values()),
+        'weak': sum(count for bits, count in sizes.items() if bits < MIN_MODULI_BITS),
+        'invalid': invalid,
+        'sizes': sorted(sizes.items()),
+    }
+
+def filter_moduli_lines(lines):
+    """Linhas do moduli (texto) sem os grupos fracos; comentários são mantidos"""
+    for line in lines:
+        fields = line.split()
+        if fields and not fields[0].startswith('#'):
+            bits = moduli_group_bits([field.encode() for field in fields])
+            if bits is None or bits < MIN_MODULI_BITS:
+                continue
+        yield line
+
+def _moduli_digest(f, chunk_size: int = 65536) -> str:
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+def _read_cache_json(path: Optional[str]) -> Optional[Dict]:
+    if not path:
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_cache_json(path: Optional[str], data: Dict) -> None:
+    if not path:
+        return
+    try:
+        write_file_atomic(path, json.dumps(data, separators=(',', ':')))
+    except OSError as e:
+        logging.debug(f"Não foi possível gravar cache '{path}': {e}")
+
+def _stat_key(path: str) -> Optional[str]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return hashlib.sha256(f"{os.path.abspath(path)}\0{st.st_mtime_ns}\0{st.st_size}\0{st.st_ino}".encode()).hexdigest()
+
+def moduli_summary(opener: Callable, local_path: Optional[str] = None,
+                   memo: Optional[Dict[str, Dict]] = None) -> Dict:
+    """Resumo do moduli (sha256, grupos, fracos, tamanhos) com cache persistente
+    
+    Com 'local_path', uma auditoria repetida de um arquivo inalterado custa um
+    stat e a leitura de um JSON pequeno. Sem entrada por stat (ou em camadas de
+    imagem), o conteúdo é identificado pelo SHA-256: arquivos idênticos em
+    raízes, imagens ou hosts diferentes são analisados uma única vez. 'memo'
+    deduplica por conteúdo também quando não há diretório de cache gravável.
+    """
+    try:
+        cache_dir = os.path.join(persistent_cache_dir(('moduli',)), 'moduli')
+    except OSError:
+        cache_dir = None
+    
+    stat_path = None
+    stat_key = _stat_key(local_path) if cache_dir and local_path else None
+    if stat_key:
+        stat_path = os.path.join(cache_dir, f"v{MODULI_CACHE_VERSION}_stat_{stat_key}.json")
+        summary = _read_cache_json(stat_path)
+        if summary:
+            return summary
+    
+    with opener() as f:
+        sha256 = _moduli_digest(f)
+        content_path = cache_dir and os.path.join(cache_dir, f"v{MODULI_CACHE_VERSION}_{sha256}.json")
+        summary = (memo or {}).get(sha256) or _read_cache_json(content_path)
+        if not summary:
+            f.seek(0)
+            summary = {'sha256': sha256, **scan_moduli(f)}
+            _write_cache_json(content_path, summary)
+    if memo is not None:
+        memo[sha256] = summary
+    
+    # Só associa o stat ao resultado se o arquivo não mudou durante a leitura
+    if stat_path and _stat_key(local_path) == stat_key:
+        _write_cache_json(stat_path, summary)
+    return summary
+
+def moduli_issue(summary: Dict, path: str) -> Optional[Issue]:
+    """Issue weak_moduli para um resumo com grupos fracos (None se não houver)"""
+    if not summary['weak']:
+        return None
+    strong = summary['groups'] - summary['weak']
+    weak_sizes = [bits for bits, _ in summary['sizes'] if bits < MIN_MODULI_BITS]
+    return Issue(
+        'weak_moduli',
+        # Sem nenhum grupo forte, todo group-exchange negocia um grupo fraco
+        Severity.HIGH if strong == 0 else Severity.MEDIUM,
+        path=path,
+        weak_groups=summary['weak'],
+        total_groups=summary['groups'],
+        weak_sizes=weak_sizes,
+        sha256=summary['sha256'],
+        comment=f"{summary['weak']} de {summary['groups']} grupos Diffie-Hellman com menos de "
+                f"{MIN_MODULI_BITS} bits ({', '.join(map(str, weak_sizes))})"
+    )
+
+@traced('audit')
+def audit_moduli() -> List[Issue]:
+    """Audita grupos Diffie-Hellman fracos no moduli (resultado em cache por stat e SHA-256)"""
+    root = core.AUDIT_ROOT
+    logical_path = posixpath.join(core.SSH_DIR, 'moduli')
+    path = root.path(logical_path)
+    local_path = path if root.has_local_files else None
+    try:
+        # Servidor: sem mudança no arquivo nem o JSON do cache é relido
+        summary = FILE_CACHE.get(('moduli', repr(root)), [path],
+                                 lambda: moduli_summary(lambda: root.open(logical_path, 'rb'), local_path))
+    except (FileNotFoundError, NotADirectoryError):
+        # Sem moduli o sshd recorre aos grupos fixos embutidos (RFC 3526)
+        return []
+    except OSError as e:
+        logging.debug(f"Erro ao auditar {path}: {e}")
+        return []
+    
+    issue = moduli_issue(summary, path)
+    return [issue] if issue else []
+
+@traced('audit')
+def audit_authorized_keys() -> List[Issue]:
+    """Audita permissões e conteúdo (chaves fracas, sem restrições, duplicadas) de authorized_keys"""
+    issues = []
+    # fingerprint -> usuários com a chave neste host
+    key_users: Dict[bytes, List[str]] = {}
+    
+    try:
+        entries = core.AUDIT_ROOT.passwd_entries()
+        for position, entry in enumerate(entries):
+            if LIMITS.active and LIMITS.expired():
+                issues.append(incomplete_issue(f"{len(entries) - position} de {len(entries)} usuários não verificados"))
+                break
+            username = entry.name
+            logical_path = os.path.join(entry.home, '.ssh', 'authorized_keys')
+            
+            try:
+                # lstat: o arquivo é do usuário, um link poderia apontar para qualquer arquivo do root
+                stat_info = core.AUDIT_ROOT.lstat(logical_path)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            except OSError as e:
+                logging.debug(f"Erro ao auditar {logical_path}: {e}")
+                continue
+            
+            auth_keys_path = core.AUDIT_ROOT.path(logical_path)
+            if S_ISLNK(stat_info.st_mode):
+                issues.append(Issue(
+                    'unexpected_symlink',
+                    Severity.HIGH,
+                    path=core.AUDIT_ROOT.entry_path(logical_path),
+                    user=username,
+                    comment='authorized_keys é um link simbólico: não é lido nem corrigido, verifique manualmente'
+                ))
+                continue
+            
+            try:
+                current_perms = stat_info.st_mode & 0o777
+                current_owner = core.AUDIT_ROOT.user_name(stat_info.st_uid)
+                
+                if current_perms not in [0o600, 0o400]:
+                    issues.append(Issue(
+                        'insecure_authorized_keys',
+                        Severity.CRITICAL,
+                        path=auth_keys_path,
+                        user=username,
+                        current_perms=f"0o{current_perms:o}",
+                        comment='authorized_keys deve ter permissões 0o600 ou 0o400'
+                    ))
+                
+                if current_owner != username:
+                    issues.append(Issue(
+                        'wrong_authorized_keys_owner',
+                        Severity.CRITICAL,
+                        path=auth_keys_path,
+                        user=username,
+                        current_owner=current_owner,
+                        comment=f'authorized_keys deve pertencer a {username}'
+                    ))
+                
+                # Servidor: conteúdo só é relido quando o arquivo muda (mesma assinatura do stat acima)
+                content_issues, digests = FILE_CACHE.get(
+                    ('authorized_keys', repr(core.AUDIT_ROOT), logical_path, username, entry.uid == 0), [],
+                    lambda: _authorized_keys_content(logical_path, auth_keys_path, username, entry.uid == 0),
+                    signature=(stat_info.st_mtime_ns, stat_info.st_size, stat_info.st_ino))
+                issues.extend(content_issues)
+                for digest in digests:
+                    users = key_users.setdefault(digest, [])
+                    if username not in users:
+                        users.append(username)
+            
+            except Exception as e:
+                logging.debug(f"Erro ao auditar {auth_keys_path}: {e}")
+    
+    except AuditDeadlineExceeded:
+        issues.append(incomplete_issue("lista de usuários não obtida"))
+    except Exception as e:
+        logging.error(f"Erro ao auditar authorized_keys: {e}")
+    
+    for digest, users in key_users.items():
+        if len(users) > 1:
+            issues.append(Issue(
+                'duplicate_authorized_key',
+                Severity.MEDIUM,
+                fingerprint=format_fingerprint(digest),
+                users=', '.join(users),
+                comment=f'Mesma chave autorizada em {len(users)} contas: chave privada compartilhada'
+            ))
+    
+    return issues
+
+def _authorized_keys_content(logical_path: str, auth_keys_path: str, username: str,
+                             privileged: bool) -> Tuple[List[Issue], List[bytes]]:
+    """Issues de conteúdo e fingerprints (em ordem) de um authorized_keys"""
+    issues = []
+    digests = []
+    with core.AUDIT_ROOT.open(logical_path) as f:
+        for line_number, line in enumerate(f, 1):
+            try:
+                key = parse_authorized_key(line)
+            except (ValueError, KeyError) as e:
+                issues.append(Issue(
+                    'invalid_authorized_key',
+                    Severity.LOW,
+                    path=auth_keys_path,
+                    user=username,
+                    line=line_number,
+                    comment=f'Linha inválida: {e}'
+                ))
+                continue
+            if key is None:
+                continue
+            
+            issues.extend(authorized_key_issues(key, auth_keys_path, username, line_number, privileged))
+            digests.append(key.digest)
+    return issues, digests
+
+@traced('audit')
+def audit_fail2ban() -> List[Issue]:
+    """Verifica status do Fail2ban"""
+    issues = []
+    
+    if not core.AUDIT_ROOT.is_live:
+        return audit_fail2ban_offline()
+    
+    try:
+        result = run_command(['systemctl', 'is-active', 'fail2ban'], check=False)
+        if result.stdout.strip() != 'active':
+            issues.append(Issue(
+                'fail2ban_inactive',
+                Severity.HIGH,
+                comment='Fail2ban não está ativo. Servidor vulnerável a brute-force'
+            ))
+    except FileNotFoundError:
+        issues.append(Issue(
+            'fail2ban_missing',
+            Severity.HIGH,
+            comment='Fail2ban não está instalado'
+        ))
+    
+    return issues
+
+def audit_fail2ban_offline() -> List[Issue]:
+    """Verifica Fail2ban em raiz offline: instalado e habilitado no systemd/OpenRC"""
+    issues = []
+    
+    if not core.AUDIT_ROOT.exists('/etc/fail2ban'):
+        issues.append(Issue(
+            'fail2ban_missing',
+            Severity.HIGH,
+            comment='Fail2ban não está instalado'
+        ))
+        return issues
+    
+    enabled_links = [
+        '/etc/systemd/system/multi-user.target.wants/fail2ban.service',
+        '/etc/runlevels/default/fail2ban',
+    ]
+    if not any(core.AUDIT_ROOT.exists(link) for link in enabled_links):
+        issues.append(Issue(
+            'fail2ban_inactive',
+            Severity.HIGH,
+            comment='Fail2ban instalado mas não habilitado na inicialização'
+        ))
+    
+    return issues
+
+@traced('phase')
+def run_full_audit(profile: Optional[ComplianceProfile] = None,
+                   durations: Optional[Dict[str, float]] = None) -> Dict[str, List[Issue]]:
+    """Executa todas as auditorias contra a raiz ativa
+    
+    As auditorias são independentes: rodam em threads para que as sondas externas
+    (ssh-keygen, systemctl, getent) se sobreponham no COMMAND_RUNNER. Se 'durations'
+    for informado, recebe o tempo de cada coletor em segundos. Cada issue recebe a
+    categoria do coletor que a produziu. Com --deadline, coletores interrompidos pelo
+    prazo devolvem o que já coletaram mais uma issue 'audit_incomplete'.
+    """
+    def timed(category: str, audit: Callable[[], List[Issue]]) -> List[Issue]:
+        start = time.perf_counter()
+        try:
+            try:
+                issues = audit()
+            except AuditDeadlineExceeded:
+                issues = [incomplete_issue("coletor interrompido")]
+            for issue in issues:
+                issue.category = category
+            return issues
+        finally:
+            if durations is not None:
+                durations[category] = time.perf_counter() - start
+    
+    audits = {
+        'ssh_config': lambda: audit_ssh_config(profile),
+        'file_permissions': audit_file_permissions,
+        'host_keys': audit_host_keys,
+        'authorized_keys': audit_authorized_keys,
+        'moduli': audit_moduli,
+        'fail2ban': audit_fail2ban
+    }
+    LIMITS.start()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(audits)) as executor:
+            futures = {category: executor.submit(timed, category, audit) for category, audit in audits.items()}
+            return {category: future.result() for category, future in futures.items()}
+    finally:
+        LIMITS.finish()
+
+@traced('report')
+def generate_audit_report(all_issues: Dict[str, List[Issue]]) -> str:
+    """Gera relatório de auditoria formatado"""
+    report = []
+    report.append("=" * 80)
+    report.append("RELATÓRIO DE AUDITORIA SSH - ENTERPRISE EDITION")
+    report.append(f"Data: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    report.append(f"Servidor: {core.AUDIT_ROOT.hostname()}")
+    if not is_complete(all_issues):
+        report.append(f"⚠️  AUDITORIA INCOMPLETA: prazo de {LIMITS.deadline:g}s esgotado, resultados parciais")
+    report.append("=" * 80)
+    report.append("")
+    
+    total_issues = sum(len(issues) for issues in all_issues.values())
+    
+    if total_issues == 0:
+        report.append("✅ NENHUMA FALHA DETECTADA")
+        report.append("   Sistema em conformidade com CIS Benchmark")
+    else:
+        report.append(f"❌ TOTAL DE ISSUES: {total_issues}")
+        report.append("")
+        
+        for category, issues in all_issues.items():
+            if not issues:
+                continue
+            
+            report.append(f"\n{'─' * 80}")
+            report.append(f"CATEGORIA: {category.upper()}")
+            report.append(f"{'─' * 80}")
+            
+            # Severity é IntEnum: ordena pelo valor, sem procurar em uma tabela por issue
+            for issue in sorted(issues, key=operator.attrgetter('severity')):
+                report.append(f"\n{SEVERITY_EMOJI[issue.severity]} [{SEVERITIES[issue.severity]}] {issue.type}")
+                for key, value in issue.fields():
+                    report.append(f"   {key}: {value}")
+    
+    report.append("\n" + "=" * 80)
+    return "\n".join(report)
+
+def audit_root_worker(root_path: str, profile_name: str) -> Tuple[str, Optional[str], object]:
+    """Audita uma raiz offline em processo isolado: retorna (raiz, relatório, total ou erro)"""
+    set_audit_root(LocalRoot(root_path))
+    try:
+        all_issues = run_full_audit(load_profile(profile_name))
+    except Exception as e:
+        return root_path, None, f"{type(e).__name__}: {e}"
+    return root_path, generate_audit_report(all_issues), sum(len(issues) for issues in all_issues.values())
+
+def run_multi_root_audit(roots: List[str], profile_name: str = DEFAULT_PROFILE, jobs: int = None) -> bool:
+    """Audita várias raízes offline em paralelo (um processo por raiz, até 'jobs' simultâneos)"""
+    success = True
+    with_issues = 0
+    
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(audit_root_worker, root, profile_name) for root in roots]
+        for future in concurrent.futures.as_completed(futures):
+            root_path, report, result = future.result()
+            if report is None:
+                logging.error(f"❌ Falha ao auditar '{root_path}': {result}")
+                success = False
+                continue
+            if result:
+                with_issues += 1
+            print("\n" + report + "\n")
+    
+    logging.info(f"{len(roots)} raiz(es) auditada(s), {with_issues} com issues")
+    return success
+
+# --- Métricas Prometheus (textfile do node_exporter) ---
+METRICS_PREFIX = 'ssh_auditor'
+
+def load_state() -> Dict:
+    """Estado persistente entre execuções (ex: horário do último hardening)"""
+    try:
+        with open(core.STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def record_hardening():
+    """Registra o horário do último hardening aplicado com sucesso"""
+    state = load_state()
+    state['last_hardening'] = time.time()
+    try:
+        os.makedirs(os.path.dirname(core.STATE_FILE), exist_ok=True)
+        write_file_atomic(core.STATE_FILE, json.dumps(state), 0o600)
+    except OSError as e:
+        logging.warning(f"Não foi possível gravar estado em {core.STATE_FILE}: {e}")
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class MetricsBuilder:
+    """Monta o formato de exposição de texto do Prometheus (HELP/TYPE uma vez por métrica)"""
+    
+    def __init__(self):
+        self.lines: List[str] = []
+    
+    def metric(self, name: str, kind: str, help_text: str, samples: List[Tuple[Dict, float]]):
+        full_name = f"{METRICS_PREFIX}_{name}"
+        self.lines.append(f"# HELP {full_name} {help_text}")
+        self.lines.append(f"# TYPE {full_name} {kind}")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{_escape_label(val)}"' for key, val in labels.items())
+            value_text = str(int(value)) if float(value).is_integer() else repr(float(value))
+            self.lines.append(f"{full_name}{{{label_text}}} {value_text}" if label_text else f"{full_name} {value_text}")
+    
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+def format_metrics(all_issues: Dict[str, List[Issue]], profile: ComplianceProfile,
+                   durations: Dict[str, float], finished_at: float = None) -> str:
+    """Converte o resultado da auditoria em métricas do Prometheus"""
+    builder = MetricsBuilder()
+    host = core.AUDIT_ROOT.hostname()
+    
+    builder.metric('info', 'gauge', 'Versão, perfil e host auditado',
+                   [({'version': VERSION, 'profile': profile.name, 'host': host}, 1)])
+    
+    counts = collections.Counter({(category, severity): 0 for category in all_issues for severity in Severity})
+    for category, issues in all_issues.items():
+        counts.update((category, issue.severity) for issue in issues)
+    builder.metric('issues', 'gauge', 'Issues por categoria e severidade',
+                   [({'category': category, 'severity': severity}, count)
+                    for (category, severity), count in sorted(counts.items())])
+    
+    failing = {issue.get('parameter') for issue in all_issues.get('ssh_config', [])}
+    builder.metric('rule_compliant', 'gauge', 'Conformidade por regra do perfil (1 = conforme)',
+                   [({'parameter': rule.param, 'severity': rule.severity, 'profile': profile.name},
+                     0 if rule.param in failing else 1) for rule in profile.rules])
+    
+    builder.metric('audit_complete', 'gauge', 'Auditoria concluída (1) ou interrompida pelo prazo (0)',
+                   [({}, 1 if is_complete(all_issues) else 0)])
+    
+    builder.metric('collector_duration_seconds', 'gauge', 'Duração de cada coletor da auditoria',
+                   [({'collector': category}, round(duration, 6)) for category, duration in sorted(durations.items())])
+    
+    # Coletor ausente ou interrompido: sem amostra (desconhecido), nunca um 1 por omissão
+    fail2ban_types = {issue.type for issue in all_issues.get('fail2ban', [])}
+    fail2ban_known = 'fail2ban' in all_issues and 'audit_incomplete' not in fail2ban_types
+    builder.metric('fail2ban_installed', 'gauge', 'Fail2ban instalado (1) ou ausente (0)',
+                   [({}, 0 if 'fail2ban_missing' in fail2ban_types else 1)] if fail2ban_known else [])
+    builder.metric('fail2ban_active', 'gauge', 'Fail2ban ativo/habilitado (1) ou não (0)',
+                   [({}, 0 if fail2ban_types & {'fail2ban_inactive', 'fail2ban_missing'} else 1)]
+                   if fail2ban_known else [])
+    
+    last_hardening = load_state().get('last_hardening')
+    if last_hardening:
+        builder.metric('last_hardening_timestamp_seconds', 'gauge',
+                       'Horário (epoch) do último hardening aplicado com sucesso', [({}, round(last_hardening))])
+    builder.metric('last_run_timestamp_seconds', 'gauge', 'Horário (epoch) do fim da última auditoria',
+                   [({}, round(finished_at or time.time()))])
+    return builder.render()
+
+def export_metrics(path: str, all_issues: Dict[str, List[Issue]], profile: ComplianceProfile,
+                   durations: Dict[str, float]) -> bool:
+    """Grava o textfile atomicamente (o node_exporter nunca lê um arquivo parcial)"""
+    try:
+        write_file_atomic(path, format_metrics(all_issues, profile, durations))
+    except OSError as e:
+        logging.error(f"Não foi possível gravar métricas em {path}: {e}")
+        return False
+    logging.info(f"📈 Métricas exportadas em: {path}")
+    return True
+
+def run_metrics_watch(path: str, profile: ComplianceProfile, interval: int) -> bool:
+    """Modo watch: audita e regrava o textfile a cada 'interval' segundos até Ctrl+C"""
+    logging.info(f"Modo watch: métricas em {path} a cada {interval}s (Ctrl+C para sair)")
+    try:
+        while True:
+            started = time.monotonic()
+            durations: Dict[str, float] = {}
+            all_issues = run_full_audit(profile, durations)
+            export_metrics(path, all_issues, profile, durations)
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        logging.info("Modo watch encerrado")
+    return True
@@ -13,24 +13,44 @@ Changelog v1.0.0:
 - Parser robusto para continuação de linha
 - Validação completa de sintaxe
 - Logging estruturado JSON
+
+Este módulo contém o núcleo (configuração, raiz auditada, execução de comandos,
+parser e motor de regras) e a CLI. Auditoria, correções, frota/imagens, logs e
+menu ficam em módulos irmãos importados sob demanda: uma execução via cron não
+paga o custo de importar o menu interativo nem asyncio/tarfile sem usá-los.
 """
 
-import os
+from __future__ import annotations
+
 import sys
-import subprocess
+
+# Executado como script, o módulo se chama __main__: os componentes fazem
+# 'import ssh_auditor' e devem receber este mesmo módulo (e seus globais)
+if __name__ == '__main__':
+    sys.modules.setdefault('ssh_auditor', sys.modules[__name__])
+
+import os
 import logging
-import argparse
 import shutil
 import datetime
-import random
-import string
 import json
 import time
+import threading
 import re
-import pwd
-import grp
-from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+import enum
+import errno
+import fnmatch
+import posixpath
+import contextlib
+import functools
+import atexit
+import importlib
+from typing import TYPE_CHECKING, Callable, Dict, List, NamedTuple, Tuple, Optional
+
+if TYPE_CHECKING:
+    # Só para as anotações: em execução o núcleo importa os dois sob demanda
+    import asyncio
+    import subprocess
 
 # --- Configurações Globais ---
 VERSION = "2.0.0-enterprise"
@@ -38,6 +58,14 @@ LOG_FILE = "/var/log/ssh_auditor.log"
 BACKUP_DIR = "/var/backups/ssh_auditor"
 SSHD_CONFIG = "/etc/ssh/sshd_config"
 SSH_DIR = "/etc/ssh"
+CACHE_DIR = "/var/cache/ssh_auditor"
+STATE_FILE = "/var/lib/ssh_auditor/state.json"
+SERVER_SOCKET = "/run/ssh_auditor.sock"
+FAIL2BAN_DB = "/var/lib/fail2ban/fail2ban.sqlite3"
+# Agregação de banimentos: fração mínima de endereços banidos para um bloco virar regra
+BAN_MIN_DENSITY = 0.5
+PROFILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+DEFAULT_PROFILE = "cis-l1"
 
 # Conformidade CIS Benchmark 5.2.x
 CIS_COMPLIANT_CONFIG = {
@@ -66,6 +94,34 @@ CIS_COMPLIANT_CONFIG = {
     'KexAlgorithms': ('sntrup761x25519-sha512@openssh.com,curve25519-sha256,curve25519-sha256@libssh.org,diffie-hellman-group16-sha512,diffie-hellman-group18-sha512,diffie-hellman-group14-sha256', 'HIGH', "KEX pós-quântico + curvas elípticas + DH forte"),
 }
 
+# Comparadores do perfil CIS L1 embutido. Parâmetros ausentes aqui usam
+# igualdade exata com o valor recomendado em CIS_COMPLIANT_CONFIG.
+CIS_RULE_CHECKS = {
+    'PermitRootLogin': {'check': 'enum', 'allowed': ['no']},
+    'PasswordAuthentication': {'check': 'enum', 'allowed': ['no']},
+    'PubkeyAuthentication': {'check': 'enum', 'allowed': ['yes']},
+    'PermitEmptyPasswords': {'check': 'enum', 'allowed': ['no']},
+    'X11Forwarding': {'check': 'enum', 'allowed': ['no']},
+    'MaxAuthTries': {'check': 'range', 'min': 1, 'max': 3},
+    'IgnoreRhosts': {'check': 'enum', 'allowed': ['yes']},
+    'HostbasedAuthentication': {'check': 'enum', 'allowed': ['no']},
+    'PermitUserEnvironment': {'check': 'enum', 'allowed': ['no']},
+    'LoginGraceTime': {'check': 'range', 'min': 1, 'max': 60, 'units': 'time'},
+    'ClientAliveInterval': {'check': 'range', 'min': 1, 'max': 300, 'units': 'time'},
+    'ClientAliveCountMax': {'check': 'range', 'min': 0, 'max': 0},
+    'LogLevel': {'check': 'enum', 'allowed': ['VERBOSE']},
+    'MaxStartups': {'check': 'regex', 'pattern': r'([1-9]|10):([3-9][0-9]|100):([1-9]|[1-5][0-9]|60)'},
+    'MaxSessions': {'check': 'range', 'min': 1, 'max': 10},
+    'UsePAM': {'check': 'enum', 'allowed': ['yes']},
+    'AllowTcpForwarding': {'check': 'enum', 'allowed': ['no']},
+    'AllowAgentForwarding': {'check': 'enum', 'allowed': ['no']},
+    'PermitTunnel': {'check': 'enum', 'allowed': ['no']},
+    'Banner': {'check': 'regex', 'pattern': r'/\S+'},
+    'Ciphers': {'check': 'subset'},
+    'MACs': {'check': 'subset'},
+    'KexAlgorithms': {'check': 'subset'},
+}
+
 # --- Configuração de Logging Estruturado ---
 class JSONFormatter(logging.Formatter):
     """Formatter para logs estruturados em JSON (SIEM-ready)"""
@@ -86,11 +142,14 @@ class JSONFormatter(logging.Formatter):
 
 def setup_logging(verbose: bool = False):
     """Configura logging dual: JSON para arquivo, human-readable para console"""
-    os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
-    
-    file_handler = logging.FileHandler(LOG_FILE)
-    file_handler.setFormatter(JSONFormatter())
-    file_handler.setLevel(logging.DEBUG)
+    try:
+        os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+        file_handler = logging.FileHandler(LOG_FILE)
+        file_handler.setFormatter(JSONFormatter())
+        file_handler.setLevel(logging.DEBUG)
+    except OSError:
+        # Modos offline podem rodar sem root: segue apenas com o console
+        file_handler = None
     
     console_handler = logging.StreamHandler()
     console_formatter = logging.Formatter(
@@ -102,8 +161,12 @@ def setup_logging(verbose: bool = False):
     
     logger = logging.getLogger()
     logger.setLevel(logging.DEBUG)
-    logger.addHandler(file_handler)
+    if file_handler:
+        logger.addHandler(file_handler)
     logger.addHandler(console_handler)
+    
+    if file_handler is None:
+        logging.warning(f"Não foi possível abrir '{LOG_FILE}': log apenas no console")
 
 def log_event(event_type: str, message: str, details: dict = None, level: str = 'INFO'):
     """Log estruturado para eventos de auditoria/hardening"""
@@ -116,37 +179,854 @@ def log_event(event_type: str, message: str, details: dict = None, level: str =
     
     logger.log(log_level, message, extra=extra)
 
-# --- Funções Auxiliares ---
+# --- Cache por Assinatura de Arquivo ---
+class StatCache:
+    """Valores derivados de arquivos, reaproveitados enquanto (mtime, tamanho, inode) não mudarem
+    
+    Desabilitado por padrão (cada execução da CLI lê tudo uma vez); o servidor
+    (--serve) habilita para manter modelo do sshd_config, mapas uid/gid e fatos
+    do host quentes entre requisições. 'ttl' limita a idade de dados que não
+    dependem só dos arquivos (ex: usuários de NSS/LDAP via getent).
+    """
+    
+    def __init__(self, ttl: Optional[float] = None):
+        self.enabled = False
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def signature(paths: List[str]) -> Tuple:
+        signature = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+                signature.append((st.st_mtime_ns, st.st_size, st.st_ino))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+    
+    def get(self, key, paths: List[str], loader: Callable, signature: Optional[Tuple] = None):
+        """Valor em cache para 'key' se os arquivos não mudaram; senão recalcula com loader()
+        
+        'signature' substitui o stat de 'paths' quando o chamador já tem o stat_result.
+        """
+        if not self.enabled:
+            return loader()
+        if signature is None:
+            signature = self.signature(paths)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == signature and (self.ttl is None or now - entry[1] < self.ttl):
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+        value = loader()
+        with self._lock:
+            self._entries[key] = (signature, now, value)
+        return value
+    
+    def discard(self, key):
+        """Esquece um valor (ex: resultado parcial que não deve ser reaproveitado)"""
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict:
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+FILE_CACHE = StatCache()
+
+# --- Modo de Baixo Impacto (hosts de produção sob carga) ---
+LOW_IMPACT_NICE = 10
+LOW_IMPACT_STAT_RATE = 500
+LOW_IMPACT_COMMAND_RATE = 5
+LOW_IMPACT_NETWORK_CONCURRENCY = 2
+IO_CLASSES = {'best-effort': ['-c', '2', '-n', '7'], 'idle': ['-c', '3']}
+# Tipos de /proc/self/mountinfo tratados como sistema de arquivos de rede
+NETWORK_FILESYSTEMS = frozenset(('nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'ceph', 'glusterfs', 'fuse.glusterfs',
+                                 'fuse.sshfs', 'lustre', 'gpfs', 'afs', '9p'))
+
+class AuditDeadlineExceeded(Exception):
+    """Operação recusada porque o prazo da auditoria (--deadline) acabou"""
+
+class RateLimiter:
+    """No máximo 'rate' operações por segundo, espaçadas (compartilhado entre threads)"""
+    
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+    
+    def reserve(self) -> float:
+        """Reserva a próxima vaga e retorna quantos segundos esperar por ela"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + 1.0 / self.rate
+        return slot - now
+    
+    def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+def network_mounts(mountinfo: str = '/proc/self/mountinfo') -> List[str]:
+    """Pontos de montagem de rede (NFS, CIFS...), do mais específico para o mais geral"""
+    mounts = []
+    try:
+        with open(mountinfo) as f:
+            for line in f:
+                fields, _, tail = line.partition(' - ')
+                fields, tail = fields.split(), tail.split()
+                if len(fields) >= 5 and tail and tail[0] in NETWORK_FILESYSTEMS:
+                    mounts.append(fields[4].replace('\\040', ' '))
+    except OSError as e:
+        logging.debug(f"Não foi possível ler {mountinfo}: {e}")
+    return sorted(mounts, key=len, reverse=True)
+
+class AuditLimits:
+    """Limites do modo de baixo impacto, consultados pela AuditRoot e pelo COMMAND_RUNNER
+    
+    Inativo por padrão: cada operação paga só o teste de 'active'. O prazo vale
+    para uma execução de run_full_audit (start/finish); esgotado, os coletores
+    param de iniciar trabalho novo e marcam o resultado como incompleto.
+    """
+    
+    def __init__(self):
+        self.active = False
+        self.stats: Optional[RateLimiter] = None
+        self.commands: Optional[RateLimiter] = None
+        self.network_concurrency: Optional[int] = None
+        self.deadline: Optional[float] = None
+        self._network: Optional[threading.BoundedSemaphore] = None
+        self._mounts: List[str] = []
+        self._expires: Optional[float] = None
+    
+    def configure(self, stat_rate: Optional[float] = None, command_rate: Optional[float] = None,
+                  network_concurrency: Optional[int] = None, deadline: Optional[float] = None):
+        self.stats = RateLimiter(stat_rate) if stat_rate else None
+        self.commands = RateLimiter(command_rate) if command_rate else None
+        self.network_concurrency = network_concurrency
+        self._network = threading.BoundedSemaphore(network_concurrency) if network_concurrency else None
+        self._mounts = network_mounts() if network_concurrency else []
+        self.deadline = deadline
+        self.active = bool(self.stats or self.commands or self._network or deadline)
+    
+    def start(self):
+        """Inicia o prazo de uma auditoria"""
+        self._expires = time.monotonic() + self.deadline if self.deadline else None
+    
+    def finish(self):
+        self._expires = None
+    
+    def expired(self) -> bool:
+        return self._expires is not None and time.monotonic() >= self._expires
+    
+    def command_timeout(self, timeout: float) -> float:
+        """Timeout do comando limitado ao que resta do prazo (recusa se já acabou)"""
+        if self._expires is None:
+            return timeout
+        remaining = self._expires - time.monotonic()
+        if remaining <= 0:
+            raise AuditDeadlineExceeded(f"prazo de {self.deadline:g}s esgotado")
+        return min(timeout, remaining)
+    
+    def is_network(self, path: str) -> bool:
+        return any(path == mount or path.startswith(mount.rstrip('/') + '/') for mount in self._mounts)
+    
+    @contextlib.contextmanager
+    def network_slot(self):
+        """Vaga para uma operação de rede (NFS, consultas NSS/LDAP); sem limite, não espera"""
+        if self._network is None:
+            yield
+            return
+        with self._network:
+            yield
+    
+    @contextlib.contextmanager
+    def file_operation(self, path: str):
+        """Envolve um stat/scandir/open: respeita a taxa e o limite de operações em voo na rede"""
+        if self.stats is not None:
+            self.stats.wait()
+        if self._network is not None and self.is_network(path):
+            with self._network:
+                yield
+        else:
+            yield
+    
+    def describe(self) -> str:
+        parts = []
+        if self.stats:
+            parts.append(f"{self.stats.rate:g} stats/s")
+        if self.commands:
+            parts.append(f"{self.commands.rate:g} comandos/s")
+        if self._network:
+            parts.append(f"{self.network_concurrency} operação(ões) de rede simultânea(s) "
+                         f"(NSS/LDAP e {len(self._mounts)} montagem(ns) de rede)")
+        if self.deadline:
+            parts.append(f"prazo de {self.deadline:g}s")
+        return ', '.join(parts) or 'sem limites'
+
+LIMITS = AuditLimits()
+
+def lower_process_priority(nice: int = LOW_IMPACT_NICE, io_class: Optional[str] = 'best-effort') -> None:
+    """Reduz a prioridade de CPU (nice) e de IO (ionice) do processo; filhos herdam as duas
+    
+    Deve rodar antes de qualquer thread: no Linux a prioridade de IO é por thread
+    e só as threads criadas depois a herdam.
+    """
+    if nice:
+        try:
+            os.nice(nice)
+        except OSError as e:
+            logging.warning(f"Não foi possível aplicar nice {nice}: {e}")
+    if io_class:
+        import subprocess
+        try:
+            subprocess.run(['ionice', *IO_CLASSES[io_class], '-p', str(os.getpid())], check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=5)
+        except (OSError, subprocess.SubprocessError) as e:
+            logging.warning(f"Não foi possível aplicar ionice ({io_class}): {e}")
+
+# --- Raiz Auditada (Sistema de Arquivos Plugável) ---
+class PasswdEntry(NamedTuple):
+    """Entrada do banco de usuários (formato /etc/passwd)"""
+    name: str
+    uid: int
+    gid: int
+    home: str
+    shell: str
+
+def parse_passwd_lines(lines) -> List[PasswdEntry]:
+    """Converte linhas no formato /etc/passwd em entradas"""
+    entries = []
+    for line in lines:
+        parts = line.rstrip('\n').split(':')
+        if len(parts) < 7 or not parts[2].isdigit() or not parts[3].isdigit():
+            continue
+        entries.append(PasswdEntry(parts[0], int(parts[2]), int(parts[3]), parts[5], parts[6]))
+    return entries
+
+def normalize_logical(path: str) -> str:
+    """Caminho lógico absoluto e normalizado ('etc/./ssh', '//etc/ssh' -> '/etc/ssh')"""
+    return posixpath.normpath('/' + path.lstrip('/'))
+
+class AuditRoot:
+    """Interface de leitura do sistema auditado: todas as auditorias leem por aqui"""
+    is_live = False
+    # Falso quando os arquivos não existem no disco local (ex: camadas de imagem em memória)
+    has_local_files = True
+    
+    def path(self, logical: str) -> str:
+        """Caminho físico correspondente ao caminho lógico (ex: /etc/ssh/sshd_config)"""
+        raise NotImplementedError
+    
+    def exists(self, logical: str) -> bool:
+        path = self.path(logical)
+        if LIMITS.active:
+            with LIMITS.file_operation(path):
+                return os.path.exists(path)
+        return os.path.exists(path)
+    
+    def stat(self, logical: str) -> os.stat_result:
+        path = self.path(logical)
+        if LIMITS.active:
+            with LIMITS.file_operation(path):
+                return os.stat(path)
+        return os.stat(path)
+    
+    def entry_path(self, logical: str) -> str:
+        """Como path(), mas sem resolver o último componente se for um link"""
+        parent, name = posixpath.split(normalize_logical(logical))
+        return posixpath.join(self.path(parent), name)
+    
+    def lstat(self, logical: str) -> os.stat_result:
+        """stat sem seguir o último componente (diretórios controlados por usuários)"""
+        path = self.entry_path(logical)
+        if LIMITS.active:
+            with LIMITS.file_operation(path):
+                return os.lstat(path)
+        return os.lstat(path)
+    
+    def open(self, logical: str, mode: str = 'r'):
+        """Abre o arquivo da raiz; no modo de baixo impacto só a abertura conta como operação
+        
+        As leituras seguintes não passam pelos limites (a vaga de rede já foi
+        devolvida): os leitores da auditoria leem arquivos pequenos de uma vez.
+        """
+        path = self.path(logical)
+        if LIMITS.active:
+            with LIMITS.file_operation(path):
+                return open(path, mode)
+        return open(path, mode)
+    
+    def glob(self, logical_dir: str, pattern: str) -> List[str]:
+        """Lista caminhos lógicos em logical_dir que casam com o padrão"""
+        try:
+            names = os.listdir(self.path(logical_dir))
+        except OSError:
+            return []
+        return sorted(os.path.join(logical_dir, name) for name in fnmatch.filter(names, pattern))
+    
+    def scan(self, logical_dir: str, follow_symlinks: bool = True) -> List[Tuple[str, os.stat_result]]:
+        """(nome, stat) das entradas de logical_dir: um os.scandir, reaproveitando o stat do DirEntry
+        
+        follow_symlinks=False devolve o lstat das entradas: links aparecem como
+        links (S_ISLNK) em vez do arquivo para onde apontam.
+        """
+        path = self.path(logical_dir)
+        if LIMITS.active:
+            # Listagem e cada stat de entrada contam como operações no modo de baixo impacto;
+            # links são resolvidos depois de devolver a vaga (o semáforo não é reentrante)
+            with LIMITS.file_operation(path):
+                entries = self._scan(path, follow_symlinks)
+        else:
+            entries = self._scan(path, follow_symlinks)
+        if self.is_live or not follow_symlinks:
+            return entries
+        return self._resolve_links(logical_dir, entries)
+    
+    def _scan(self, path: str, follow_symlinks: bool = True) -> List[Tuple[str, Optional[os.stat_result]]]:
+        """Entradas do diretório; em raízes offline, links ficam com stat None para resolver depois"""
+        entries = []
+        try:
+            with os.scandir(path) as iterator:
+                for entry in iterator:
+                    try:
+                        if follow_symlinks and not self.is_live and entry.is_symlink():
+                            entries.append((entry.name, None))
+                            continue
+                        if LIMITS.stats is not None:
+                            LIMITS.stats.wait()
+                        stat_info = entry.stat(follow_symlinks=follow_symlinks)
+                    except OSError:
+                        continue
+                    entries.append((entry.name, stat_info))
+        except OSError:
+            return []
+        return entries
+    
+    def _resolve_links(self, logical_dir: str, entries: List[Tuple[str, Optional[os.stat_result]]]
+                       ) -> List[Tuple[str, os.stat_result]]:
+        """Links absolutos em imagens resolvem dentro da raiz, não no host"""
+        resolved = []
+        for name, stat_info in entries:
+            if stat_info is None:
+                try:
+                    stat_info = self.stat(posixpath.join(logical_dir, name))
+                except OSError:
+                    continue
+            resolved.append((name, stat_info))
+        return resolved
+    
+    def passwd_entries(self) -> List[PasswdEntry]:
+        raise NotImplementedError
+    
+    def _load_maps(self):
+        """Mapas uid/gid -> nome lidos de etc/passwd e etc/group da raiz (raízes offline)"""
+        users: Dict[int, str] = {}
+        groups: Dict[int, str] = {}
+        try:
+            with self.open('/etc/passwd') as f:
+                for entry in parse_passwd_lines(f):
+                    users.setdefault(entry.uid, entry.name)
+        except OSError as e:
+            logging.debug(f"Sem /etc/passwd em {self!r}: {e}")
+        try:
+            with self.open('/etc/group') as f:
+                for line in f:
+                    parts = line.split(':')
+                    if len(parts) >= 3 and parts[2].isdigit():
+                        groups.setdefault(int(parts[2]), parts[0])
+        except OSError as e:
+            logging.debug(f"Sem /etc/group em {self!r}: {e}")
+        self._users, self._groups = users, groups
+    
+    def user_name(self, uid: int) -> str:
+        raise NotImplementedError
+    
+    def group_name(self, gid: int) -> str:
+        raise NotImplementedError
+    
+    def user_id(self, name: str) -> Optional[int]:
+        """uid do usuário na raiz (None se não existir)"""
+        if self._users is None:
+            self._load_maps()
+        return next((uid for uid, user in self._users.items() if user == name), None)
+    
+    def group_id(self, name: str) -> Optional[int]:
+        """gid do grupo na raiz (None se não existir)"""
+        if self._groups is None:
+            self._load_maps()
+        return next((gid for gid, group in self._groups.items() if group == name), None)
+    
+    def hostname(self) -> str:
+        raise NotImplementedError
+
+class LocalRoot(AuditRoot):
+    """Raiz em diretório local: '/' é o sistema vivo; outro caminho é uma imagem montada/extraída"""
+    
+    def __init__(self, root: str = '/'):
+        self.root = os.path.abspath(root)
+        self.is_live = self.root == '/'
+        self._users: Optional[Dict[int, str]] = None
+        self._groups: Optional[Dict[int, str]] = None
+        self._passwd: Optional[List[PasswdEntry]] = None
+        # Cache de diretórios lógicos já resolvidos para caminhos físicos
+        self._dirs: Dict[str, str] = {}
+    
+    def __repr__(self):
+        return f"LocalRoot({self.root!r})"
+    
+    def path(self, logical: str) -> str:
+        if self.is_live:
+            return logical
+        return self._resolve(logical)
+    
+    def _resolve(self, logical: str, depth: int = 0) -> str:
+        """Resolve symlinks dentro da raiz: links absolutos não escapam da imagem"""
+        logical = normalize_logical(logical)
+        if logical == '/':
+            return self.root
+        
+        parent, name = posixpath.split(logical)
+        physical_parent = self._dirs.get(parent)
+        if physical_parent is None:
+            physical_parent = self._dirs[parent] = self._resolve(parent, depth)
+        
+        candidate = os.path.join(physical_parent, name)
+        if not os.path.islink(candidate):
+            return candidate
+        
+        if depth >= 40:
+            raise OSError(errno.ELOOP, "Muitos níveis de links simbólicos", logical)
+        target = os.readlink(candidate)
+        if not target.startswith('/'):
+            target = posixpath.join(physical_parent[len(self.root):] or '/', target)
+        return self._resolve(target, depth + 1)
+    
+    def passwd_entries(self) -> List[PasswdEntry]:
+        """Usuários da raiz: getent no sistema vivo (inclui NSS/LDAP), etc/passwd em imagens"""
+        if self._passwd is None or FILE_CACHE.enabled:
+            self._passwd = FILE_CACHE.get(('passwd', self.root), [self.path('/etc/passwd')], self._read_passwd)
+        return self._passwd
+    
+    def _read_passwd(self) -> List[PasswdEntry]:
+        if self.is_live:
+            # getent enumera NSS inteiro: com LDAP/SSSD é uma consulta de rede
+            with LIMITS.network_slot():
+                result = run_command(['getent', 'passwd'])
+            return parse_passwd_lines(result.stdout.split('\n'))
+        with self.open('/etc/passwd') as f:
+            return parse_passwd_lines(f)
+    
+    def user_name(self, uid: int) -> str:
+        if self.is_live:
+            # Com FILE_CACHE habilitado o mapa vive até /etc/passwd mudar; senão é descartado
+            names = FILE_CACHE.get('user_names', ['/etc/passwd'], dict)
+            if uid not in names:
+                import pwd
+                try:
+                    with LIMITS.network_slot():
+                        names[uid] = pwd.getpwuid(uid).pw_name
+                except KeyError:
+                    names[uid] = str(uid)
+            return names[uid]
+        if self._users is None:
+            self._load_maps()
+        return self._users.get(uid, str(uid))
+    
+    def group_name(self, gid: int) -> str:
+        if self.is_live:
+            names = FILE_CACHE.get('group_names', ['/etc/group'], dict)
+            if gid not in names:
+                import grp
+                try:
+                    with LIMITS.network_slot():
+                        names[gid] = grp.getgrgid(gid).gr_name
+                except KeyError:
+                    names[gid] = str(gid)
+            return names[gid]
+        if self._groups is None:
+            self._load_maps()
+        return self._groups.get(gid, str(gid))
+    
+    def user_id(self, name: str) -> Optional[int]:
+        if not self.is_live:
+            return super().user_id(name)
+        import pwd
+        try:
+            return pwd.getpwnam(name).pw_uid
+        except KeyError:
+            return None
+    
+    def group_id(self, name: str) -> Optional[int]:
+        if not self.is_live:
+            return super().group_id(name)
+        import grp
+        try:
+            return grp.getgrnam(name).gr_gid
+        except KeyError:
+            return None
+    
+    def hostname(self) -> str:
+        if self.is_live:
+            return os.uname().nodename
+        try:
+            with self.open('/etc/hostname') as f:
+                name = f.read().strip()
+            return f"{name} ({self.root})" if name else self.root
+        except OSError:
+            return self.root
+
+AUDIT_ROOT: AuditRoot = LocalRoot('/')
+
+def set_audit_root(root: AuditRoot):
+    """Define a raiz lida por todas as auditorias"""
+    global AUDIT_ROOT
+    AUDIT_ROOT = root
+    logging.debug(f"Raiz auditada: {root!r}")
+
+# --- Instrumentação (Spans e Trace) ---
+class Span(NamedTuple):
+    """Intervalo medido: início relativo à habilitação do tracer, em segundos"""
+    name: str
+    category: str
+    start: float
+    duration: float
+    lane: str
+    args: Dict
+
+class Tracer:
+    """Coleta spans de auditorias, correções e comandos (desligado por padrão, custo ~zero)"""
+    
+    def __init__(self):
+        self.enabled = False
+        self.spans: List[Span] = []
+        self.origin = time.perf_counter()
+    
+    def enable(self):
+        self.enabled = True
+        self.spans = []
+        self.origin = time.perf_counter()
+    
+    def record(self, name: str, category: str, start: float, end: float, lane: str = None, args: Dict = None):
+        """Registra um span já medido (start/end em time.perf_counter())"""
+        if self.enabled:
+            # list.append é atômico: seguro entre threads de auditoria e o loop de comandos
+            self.spans.append(Span(name, category, start - self.origin, end - start,
+                                   lane or threading.current_thread().name, args or {}))
+    
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, **args):
+        """Mede o bloco; o dicionário produzido aceita campos extras (ex: contagem de issues)"""
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self.record(name, category, start, time.perf_counter(), args=args)
+    
+    def summary(self, top: int = 10) -> str:
+        """Tabela por fase/função e os comandos mais lentos (saída de --profile)"""
+        phases: Dict[Tuple[str, str], List[float]] = {}
+        for span in self.spans:
+            if span.category != 'command':
+                phases.setdefault((span.category, span.name), []).append(span.duration)
+        commands = sorted((span for span in self.spans if span.category == 'command'),
+                          key=lambda span: -span.duration)
+        
+        lines = ["=" * 80, "PERFIL DE EXECUÇÃO", "=" * 80]
+        lines.append(f"{'Fase/Função':<40} {'Chamadas':>9} {'Total (s)':>11} {'Máx (s)':>10}")
+        for (category, name), durations in sorted(phases.items(), key=lambda item: -sum(item[1])):
+            lines.append(f"{category + ':' + name:<40} {len(durations):>9} {sum(durations):>11.3f} {max(durations):>10.3f}")
+        
+        lines.append(f"\nComandos: {len(commands)} em {sum(span.duration for span in commands):.3f}s "
+                     f"(mais lentos primeiro)")
+        for span in commands[:top]:
+            status = span.args.get('status', f"rc={span.args.get('returncode')}")
+            lines.append(f"  {span.duration:8.3f}s  {status:<10} {span.args.get('stdout_bytes', 0):>10} B  {span.name}")
+        lines.append("=" * 80)
+        return "\n".join(lines)
+    
+    def chrome_trace(self) -> Dict:
+        """Eventos no formato Trace Event (chrome://tracing, Perfetto)"""
+        pid = os.getpid()
+        lanes: Dict[str, int] = {}
+        events = []
+        for span in self.spans:
+            tid = lanes.setdefault(span.lane, len(lanes) + 1)
+            events.append({'name': span.name, 'cat': span.category, 'ph': 'X', 'pid': pid, 'tid': tid,
+                           'ts': round(span.start * 1e6, 1), 'dur': round(span.duration * 1e6, 1),
+                           'args': span.args})
+        for lane, tid in lanes.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': lane}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'version': VERSION, 'host': AUDIT_ROOT.hostname()}}
+    
+    def export(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+TRACER = Tracer()
+
+def finish_tracing(show_profile: bool, trace_path: Optional[str]):
+    """Emite o perfil (stderr) e/ou o trace ao final da execução"""
+    if show_profile:
+        print("\n" + TRACER.summary(), file=sys.stderr)
+    if trace_path:
+        try:
+            TRACER.export(trace_path)
+            logging.info(f"📄 Trace exportado em: {trace_path} (abrir em chrome://tracing ou ui.perfetto.dev)")
+        except OSError as e:
+            logging.error(f"Não foi possível exportar o trace: {e}")
+
+def traced(category: str):
+    """Decorador: span com o nome da função (audit_*, fix_*) quando o tracer está ativo"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return func(*args, **kwargs)
+            with TRACER.span(func.__name__, category) as fields:
+                result = func(*args, **kwargs)
+                if isinstance(result, list):
+                    fields['issues'] = len(result)
+                return result
+        return wrapper
+    return decorator
+
+# --- Execução de Comandos (asyncio) ---
+COMMAND_CONCURRENCY = 8
+# Limite de saída capturada por stream (ex: getent passwd em LDAP com milhões de contas)
+COMMAND_MAX_OUTPUT = 32 * 1024 * 1024
+
+class CommandRunner:
+    """Executa comandos em um loop asyncio dedicado, com limite de concorrência
+    
+    O loop roda em uma thread em segundo plano: chamadores síncronos (de qualquer
+    thread) submetem corrotinas e aguardam o resultado; código assíncrono usa run().
+    """
+    
+    def __init__(self, concurrency: int = COMMAND_CONCURRENCY, max_output: int = COMMAND_MAX_OUTPUT):
+        self.concurrency = concurrency
+        self.max_output = max_output
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lanes: List[int] = []
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+    
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            # Após fork (ProcessPoolExecutor) a thread do loop não existe no filho
+            if self._loop is None or self._pid != os.getpid():
+                import asyncio
+                self._loop = asyncio.new_event_loop()
+                self._semaphore = None
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='command-runner', daemon=True)
+                self._thread.start()
+            return self._loop
+    
+    async def _read_bounded(self, stream, command: List[str]) -> bytes:
+        """Lê o stream até o fim, guardando no máximo max_output bytes"""
+        chunks = []
+        size = 0
+        truncated = False
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                break
+            if size < self.max_output:
+                chunk = chunk[:self.max_output - size]
+                chunks.append(chunk)
+                size += len(chunk)
+            else:
+                # Continua drenando para o processo não travar com o pipe cheio
+                truncated = True
+        
+        data = b''.join(chunks)
+        if truncated:
+            logging.warning(f"Saída de '{' '.join(command)}' truncada em {self.max_output} bytes")
+            data = data[:data.rfind(b'\n') + 1]
+        return data
+    
+    async def _communicate(self, process, command: List[str], input_data: Optional[str]) -> Tuple[bytes, bytes]:
+        if input_data is not None:
+            try:
+                process.stdin.write(input_data.encode())
+                await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            process.stdin.close()
+        import asyncio
+        stdout, stderr = await asyncio.gather(self._read_bounded(process.stdout, command),
+                                              self._read_bounded(process.stderr, command))
+        await process.wait()
+        return stdout, stderr
+    
+    @staticmethod
+    def _kill(process):
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+    
+    async def run(self, command: List[str], check: bool = True, input_data: str = None,
+                  timeout: int = 30) -> subprocess.CompletedProcess:
+        """Executa um comando no loop do runner (mesma semântica de subprocess.run)"""
+        import asyncio
+        import subprocess
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._lanes = list(range(self.concurrency, 0, -1))
+        
+        if LIMITS.active:
+            if LIMITS.commands is not None:
+                await asyncio.sleep(LIMITS.commands.reserve())
+            # Depois da espera: um comando que só ganharia vaga após o prazo nem começa
+            timeout = LIMITS.command_timeout(timeout)
+        
+        async with self._semaphore:
+            # Raia fixa por vaga do semáforo: comandos concorrentes não se sobrepõem no trace
+            lane = self._lanes.pop()
+            fields: Dict = {}
+            start = time.perf_counter()
+            try:
+                result = await self._execute(command, input_data, timeout, fields)
+            finally:
+                elapsed = time.perf_counter() - start
+                self._lanes.append(lane)
+                TRACER.record(' '.join(command), 'command', start, start + elapsed, f"comando #{lane}", fields)
+                logging.debug(f"Concluído em {elapsed:.3f}s ({fields.get('status', 'rc=' + str(fields.get('returncode')))}, "
+                              f"stdout={fields.get('stdout_bytes', 0)} B): {' '.join(command)}")
+        
+        if check and result.returncode != 0:
+            logging.error(f"Comando falhou: {' '.join(command)}\nErro: {result.stderr.strip()}")
+            raise subprocess.CalledProcessError(result.returncode, command, result.stdout, result.stderr)
+        return result
+    
+    async def _execute(self, command: List[str], input_data: Optional[str], timeout: int,
+                       fields: Dict) -> subprocess.CompletedProcess:
+        import asyncio
+        import subprocess
+        logging.debug(f"Executando: {' '.join(command)}")
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=subprocess.PIPE if input_data is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+        except FileNotFoundError:
+            fields['status'] = 'not-found'
+            logging.error(f"Comando não encontrado: {command[0]}")
+            raise
+        
+        try:
+            stdout, stderr = await asyncio.wait_for(self._communicate(process, command, input_data), timeout)
+        except asyncio.TimeoutError:
+            fields['status'] = 'timeout'
+            self._kill(process)
+            await process.wait()
+            logging.error(f"Timeout ao executar: {' '.join(command)}")
+            raise subprocess.TimeoutExpired(command, timeout)
+        except asyncio.CancelledError:
+            fields['status'] = 'cancelled'
+            self._kill(process)
+            await process.wait()
+            raise
+        
+        fields.update(returncode=process.returncode, stdout_bytes=len(stdout), stderr_bytes=len(stderr))
+        return subprocess.CompletedProcess(command, process.returncode,
+                                           stdout.decode(errors='replace'), stderr.decode(errors='replace'))
+    
+    def submit(self, coroutine):
+        """Executa a corrotina no loop do runner e aguarda; Ctrl+C cancela (e mata) os processos"""
+        import asyncio
+        loop = self.loop()
+        if threading.current_thread() is self._thread:
+            coroutine.close()
+            raise RuntimeError("Chamada síncrona dentro do loop do runner: use 'await run_command_async(...)'")
+        future = asyncio.run_coroutine_threadsafe(coroutine, loop)
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+COMMAND_RUNNER = CommandRunner()
+
+async def run_command_async(command: List[str], check: bool = True, input_data: str = None,
+                            timeout: int = 30) -> subprocess.CompletedProcess:
+    """Versão assíncrona de run_command (deve rodar no loop do COMMAND_RUNNER)"""
+    return await COMMAND_RUNNER.run(command, check, input_data, timeout)
+
 def run_command(command: List[str], check: bool = True, input_data: str = None, 
                 timeout: int = 30) -> subprocess.CompletedProcess:
     """Executa comando com timeout e tratamento robusto de erros"""
-    logging.debug(f"Executando: {' '.join(command)}")
+    return COMMAND_RUNNER.submit(COMMAND_RUNNER.run(command, check, input_data, timeout))
+
+def run_commands(commands: List[List[str]], check: bool = True, input_data: List[Optional[str]] = None,
+                 timeout: int = 30) -> List[object]:
+    """Executa comandos independentes em paralelo: retorna resultado ou exceção de cada um, na ordem"""
+    inputs = input_data or [None] * len(commands)
+    
+    async def gather():
+        import asyncio
+        return await asyncio.gather(*(COMMAND_RUNNER.run(command, check, data, timeout)
+                                      for command, data in zip(commands, inputs)),
+                                    return_exceptions=True)
+    return COMMAND_RUNNER.submit(gather())
+
+# --- Funções Auxiliares ---
+def write_file_atomic(path: str, content, mode: int = 0o644) -> None:
+    """Escrita atômica (temporário no mesmo diretório + rename): leitores nunca veem arquivo parcial"""
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
     try:
-        result = subprocess.run(
-            command,
-            check=check,
-            capture_output=True,
-            text=True,
-            input=input_data,
-            timeout=timeout
-        )
-        return result
-    except subprocess.TimeoutExpired:
-        logging.error(f"Timeout ao executar: {' '.join(command)}")
-        raise
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Comando falhou: {' '.join(command)}\nErro: {e.stderr.strip()}")
-        if check:
-            raise
-        return e
-    except FileNotFoundError:
-        logging.error(f"Comando não encontrado: {command[0]}")
+        # Criado já com o modo final: um 0600 nunca fica legível nem por um instante
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+        with open(fd, 'wb' if isinstance(content, bytes) else 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
         raise
 
+def persistent_cache_dir(subdirs: Tuple[str, ...], cache_dir: str = None) -> str:
+    """Diretório de cache entre execuções: CACHE_DIR, ou ~/.cache/ssh_auditor sem permissão"""
+    for candidate in (cache_dir or CACHE_DIR, os.path.expanduser('~/.cache/ssh_auditor')):
+        try:
+            for subdir in subdirs:
+                os.makedirs(os.path.join(candidate, subdir), exist_ok=True)
+            return candidate
+        except OSError as e:
+            if cache_dir:
+                raise
+            logging.debug(f"Cache indisponível em '{candidate}': {e}")
+    raise OSError(errno.EACCES, "Nenhum diretório de cache gravável")
+
 def detect_distro() -> str:
     """Detecta família da distribuição Linux"""
+    return FILE_CACHE.get(('distro', repr(AUDIT_ROOT)), [AUDIT_ROOT.path('/etc/os-release')], _detect_distro)
+
+def _detect_distro() -> str:
     try:
-        with open('/etc/os-release', 'r') as f:
+        with AUDIT_ROOT.open('/etc/os-release', 'r') as f:
             content = f.read().lower()
             if any(x in content for x in ['debian', 'ubuntu']):
                 return 'debian'
@@ -157,6 +1037,9 @@ def detect_distro() -> str:
     except FileNotFoundError:
         pass
     
+    if not AUDIT_ROOT.is_live:
+        return 'unknown'
+    
     if shutil.which('apt'):
         return 'debian'
     elif shutil.which('yum') or shutil.which('dnf'):
@@ -164,160 +1047,78 @@ def detect_distro() -> str:
     
     return 'unknown'
 
+SFTP_SERVER_PATHS = {
+    'debian': '/usr/lib/openssh/sftp-server',
+    'rhel': '/usr/libexec/openssh/sftp-server',
+    'alpine': '/usr/lib/ssh/sftp-server',
+}
+
 def get_sftp_server_path() -> str:
     """Retorna path correto do sftp-server baseado na distro"""
+    watched = [AUDIT_ROOT.path(path) for path in ['/etc/os-release', *SFTP_SERVER_PATHS.values()]]
+    return FILE_CACHE.get(('sftp_server', repr(AUDIT_ROOT)), watched, _find_sftp_server)
+
+def _find_sftp_server() -> str:
     distro = detect_distro()
+    paths = SFTP_SERVER_PATHS
     
-    paths = {
-        'debian': '/usr/lib/openssh/sftp-server',
-        'rhel': '/usr/libexec/openssh/sftp-server',
-        'alpine': '/usr/lib/ssh/sftp-server',
-    }
-    
-    if distro in paths and os.path.exists(paths[distro]):
+    if distro in paths and AUDIT_ROOT.exists(paths[distro]):
         return paths[distro]
     
     for path in paths.values():
-        if os.path.exists(path):
+        if AUDIT_ROOT.exists(path):
             return path
     
-    result = run_command(['which', 'sftp-server'], check=False)
-    if result.returncode == 0:
-        return result.stdout.strip()
+    if AUDIT_ROOT.is_live:
+        result = run_command(['which', 'sftp-server'], check=False)
+        if result.returncode == 0:
+            return result.stdout.strip()
     
     logging.warning("sftp-server não encontrado, usando path Debian como fallback")
     return paths['debian']
 
-def backup_config(filepath: str) -> Optional[str]:
-    """Cria backup timestampado do arquivo de configuração"""
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_path = os.path.join(BACKUP_DIR, f"{os.path.basename(filepath)}.bak_{timestamp}")
-    
-    try:
-        os.makedirs(BACKUP_DIR, exist_ok=True)
-        shutil.copy2(filepath, backup_path)
-        
-        log_event('backup_created', f"Backup criado: {backup_path}", {
-            'original_file': filepath,
-            'backup_file': backup_path
-        })
-        return backup_path
-    except Exception as e:
-        logging.error(f"Falha ao criar backup de '{filepath}': {e}")
-        return None
-
-def restore_backup(backup_path: str, original_path: str) -> bool:
-    """Restaura arquivo de backup"""
-    try:
-        shutil.copy2(backup_path, original_path)
-        log_event('backup_restored', f"Backup restaurado: {backup_path} -> {original_path}", {
-            'backup_file': backup_path,
-            'restored_to': original_path
-        }, level='WARNING')
-        return True
-    except Exception as e:
-        logging.error(f"Falha ao restaurar backup '{backup_path}': {e}")
-        return False
-
-def validate_sshd_config(config_path: str = SSHD_CONFIG) -> bool:
-    """Valida sintaxe do sshd_config usando sshd -t"""
-    logging.info(f"Validando sintaxe de '{config_path}'...")
-    result = run_command(['sshd', '-t', '-f', config_path], check=False)
-    
-    if result.returncode == 0:
-        logging.info("✅ Sintaxe do sshd_config válida")
-        return True
-    else:
-        logging.error(f"❌ Sintaxe inválida no sshd_config:\n{result.stderr}")
-        return False
-
-def check_active_ssh_sessions() -> int:
-    """Verifica número de sessões SSH ativas"""
-    try:
-        result = run_command(['who'], check=False)
-        sessions = [line for line in result.stdout.split('\n') if 'pts/' in line]
-        return len(sessions)
-    except Exception:
-        return 0
-
-def restart_ssh_with_retry(max_retries: int = 3, retry_delay: int = 2) -> bool:
-    """Reinicia SSH com retry e rollback automático em caso de falha"""
-    logging.info("Reiniciando serviço SSH...")
-    
-    active_sessions = check_active_ssh_sessions()
-    if active_sessions > 0:
-        logging.warning(f"⚠️  ATENÇÃO: {active_sessions} sessão(ões) SSH ativa(s) detectada(s)")
-        logging.warning("⚠️  O restart pode desconectar usuários ativos")
-    
-    try:
-        run_command(['systemctl', 'restart', 'sshd'])
-    except Exception as e:
-        logging.error(f"Falha ao executar restart: {e}")
-        return False
-    
-    for attempt in range(1, max_retries + 1):
-        time.sleep(retry_delay * attempt)
-        
-        result = run_command(['systemctl', 'is-active', 'sshd'], check=False)
-        status = result.stdout.strip()
-        
-        if status == 'active':
-            log_event('ssh_restarted', "Serviço SSH reiniciado com sucesso", {
-                'attempts': attempt,
-                'status': status
-            })
-            return True
-        
-        logging.warning(f"Tentativa {attempt}/{max_retries}: SSH status = {status}")
-    
-    logging.error(f"❌ SSH não está ativo após {max_retries} tentativas")
-    return False
-
-def generate_secure_password(length: int = 20) -> str:
-    """Gera senha segura com requisitos de complexidade"""
-    letters = string.ascii_letters.replace('O', '').replace('l', '').replace('I', '')
-    digits = string.digits.replace('0', '').replace('1', '')
-    symbols = '!@#$%^&*()-_=+[]{}|;:,.<>?'
-    
-    password = [
-        random.choice(string.ascii_uppercase.replace('O', '').replace('I', '')),
-        random.choice(string.ascii_lowercase.replace('l', '')),
-        random.choice(digits),
-        random.choice(symbols)
-    ]
-    
-    all_chars = letters + digits + symbols
-    password.extend(random.choice(all_chars) for _ in range(length - 4))
-    
-    random.shuffle(password)
-    return ''.join(password)
-
-def validate_username(username: str) -> bool:
-    """Valida username segundo POSIX.1-2008"""
-    pattern = r'^[a-z_][a-z0-9_-]{0,31}$'
-    return bool(re.match(pattern, username))
 
 # --- Parser Robusto de sshd_config ---
+SSHD_CONFIG_DIR = "/etc/ssh/sshd_config.d"
+# Como o sshd (READCONF_MAX_DEPTH): limita Includes aninhados e ciclos
+SSHD_INCLUDE_MAX_DEPTH = 16
+
 class SSHDConfigParser:
-    """Parser que suporta multilinhas e comentários"""
+    """Parser que suporta multilinhas, comentários e Include
+    
+    Lido da raiz de auditoria, segue Include como o sshd: padrões glob em
+    ordem alfabética, caminhos relativos a /etc/ssh, cada arquivo expandido
+    no ponto da diretiva (a primeira ocorrência vale também entre arquivos).
+    Com config_path explícito (snapshot isolado) Include não é seguido.
+    """
     
-    def __init__(self, config_path: str = SSHD_CONFIG):
-        self.config_path = config_path
+    def __init__(self, config_path: str = None):
+        self.config_path = config_path or AUDIT_ROOT.path(SSHD_CONFIG)
+        self._from_root = config_path is None
         self.raw_lines = []
         self.config = {}
+        # keyword minúsculo -> keyword como escrito no arquivo
+        self._keys: Dict[str, str] = {}
+        # keyword minúsculo -> arquivo da ocorrência que vale (None = arquivo principal)
+        self.origins: Dict[str, Optional[str]] = {}
+        # Arquivos incluídos lidos, na ordem de expansão (caminhos lógicos)
+        self.includes: List[str] = []
         self._parse()
     
     def _parse(self):
         """Parse do arquivo com suporte a continuação de linha"""
         try:
-            with open(self.config_path, 'r') as f:
+            with (AUDIT_ROOT.open(SSHD_CONFIG) if self._from_root else open(self.config_path, 'r')) as f:
                 self.raw_lines = f.readlines()
         except FileNotFoundError:
             logging.error(f"Arquivo '{self.config_path}' não encontrado")
             return
         
+        self._parse_lines(self.raw_lines, None, 0)
+    
+    def _parse_lines(self, lines: List[str], origin: Optional[str], depth: int):
         current_line = ""
-        for line in self.raw_lines:
+        for line in lines:
             stripped = line.strip()
             
             if not stripped or stripped.startswith('#'):
@@ -336,22 +1137,61 @@ class SSHDConfigParser:
             parts = current_line.split(maxsplit=1)
             if len(parts) == 2:
                 param, value = parts
-                self.config[param] = value.strip()
+                if param.lower() == 'include':
+                    self._include(value, depth)
+                # Como o sshd: keywords case-insensitive, vale a primeira ocorrência
+                elif param.lower() not in self._keys:
+                    self._keys[param.lower()] = param
+                    self.config[param] = value.strip()
+                    self.origins[param.lower()] = origin
             
             current_line = ""
     
+    def _include(self, value: str, depth: int):
+        """Expande um Include no ponto da diretiva (só na raiz de auditoria)"""
+        if not self._from_root:
+            logging.debug(f"Include ignorado em '{self.config_path}': {value}")
+            return
+        if depth >= SSHD_INCLUDE_MAX_DEPTH:
+            logging.warning(f"Include aninhado demais (ciclo?), ignorado: {value}")
+            return
+        
+        for pattern in value.split():
+            if not pattern.startswith('/'):
+                pattern = posixpath.join(SSH_DIR, pattern)
+            directory, name = posixpath.split(normalize_logical(pattern))
+            for logical in AUDIT_ROOT.glob(directory, name):
+                try:
+                    with AUDIT_ROOT.open(logical) as f:
+                        lines = f.readlines()
+                except OSError as e:
+                    logging.warning(f"Include '{logical}' não pôde ser lido: {e}")
+                    continue
+                self.includes.append(logical)
+                self._parse_lines(lines, logical, depth + 1)
+    
     def get(self, param: str, default: str = None) -> Optional[str]:
         """Retorna valor do parâmetro"""
-        return self.config.get(param, default)
+        key = self._keys.get(param.lower())
+        return default if key is None else self.config[key]
     
     def has_param(self, param: str) -> bool:
         """Verifica se parâmetro existe"""
-        return param in self.config
+        return param.lower() in self._keys
     
     def update_config(self, updates: Dict[str, str]) -> List[str]:
-        """Atualiza configurações mantendo idempotência"""
+        """Atualiza configurações mantendo idempotência
+        
+        Só o arquivo principal é reescrito. Parâmetros ausentes dele, ou cuja
+        ocorrência que vale vem de um arquivo incluído, entram antes do
+        primeiro Include/Match: como vale a primeira ocorrência, o valor novo
+        prevalece sobre os arquivos incluídos e não cai dentro de um Match.
+        """
         new_lines = []
         updated_params = set()
+        # Keywords do sshd são case-insensitive: 'permitrootlogin yes' também é substituído
+        targets = {param.lower(): param for param in updates}
+        insert_at = None
         
         for line in self.raw_lines:
             stripped = line.strip()
@@ -365,906 +1205,456 @@ class SSHDConfigParser:
                 new_lines.append(line)
                 continue
             
-            param = parts[0]
+            if insert_at is None and parts[0].lower() in ('include', 'match'):
+                insert_at = len(new_lines)
+            
+            param = targets.get(parts[0].lower())
             
-            if param in updates:
+            if param is not None:
                 new_value = updates[param]
                 new_lines.append(f"{param} {new_value}\n")
-                updated_params.add(param)
+                if self.origins.get(param.lower()) is None:
+                    updated_params.add(param)
                 logging.debug(f"Atualizado: {param} = {new_value}")
             else:
                 new_lines.append(line)
         
+        added = []
         for param, value in updates.items():
             if param not in updated_params:
-                new_lines.append(f"{param} {value}\n")
+                added.append(f"{param} {value}\n")
                 logging.debug(f"Adicionado: {param} = {value}")
         
+        if insert_at is None:
+            insert_at = len(new_lines)
+        new_lines[insert_at:insert_at] = added
         return new_lines
 
-# --- Auditoria ---
-def audit_ssh_config() -> List[Dict]:
-    """Audita configurações SSH contra CIS Benchmark"""
-    issues = []
-    parser = SSHDConfigParser()
-    
-    sftp_path = get_sftp_server_path()
-    config_to_check = CIS_COMPLIANT_CONFIG.copy()
-    config_to_check['Subsystem'] = (f'sftp {sftp_path}', 'MEDIUM', "Configuração correta do subsistema SFTP")
-    
-    for param, (recommended, severity, comment) in config_to_check.items():
-        current_value = parser.get(param)
-        
-        if current_value is None:
-            issues.append({
-                'type': 'missing',
-                'severity': severity,
-                'parameter': param,
-                'recommended': recommended,
-                'comment': comment
-            })
-        elif current_value != recommended:
-            issues.append({
-                'type': 'misconfigured',
-                'severity': severity,
-                'parameter': param,
-                'current': current_value,
-                'recommended': recommended,
-                'comment': comment
-            })
-    
-    return issues
-
-def audit_file_permissions() -> List[Dict]:
-    """Audita permissões de arquivos SSH críticos"""
-    issues = []
-    
-    critical_files = [
-        (SSHD_CONFIG, 0o600, 'root', 'root'),
-        (SSH_DIR, 0o755, 'root', 'root'),
-    ]
-    
-    for key_file in Path(SSH_DIR).glob('ssh_host_*_key'):
-        critical_files.append((str(key_file), 0o600, 'root', 'root'))
-        pub_key = f"{key_file}.pub"
-        if os.path.exists(pub_key):
-            critical_files.append((pub_key, 0o644, 'root', 'root'))
-    
-    for filepath, expected_perms, expected_owner, expected_group in critical_files:
-        if not os.path.exists(filepath):
-            issues.append({
-                'type': 'missing_file',
-                'severity': 'HIGH',
-                'path': filepath,
-                'comment': 'Arquivo crítico não encontrado'
-            })
-            continue
-        
-        try:
-            stat_info = os.stat(filepath)
-            current_perms = stat_info.st_mode & 0o777
-            current_owner = pwd.getpwuid(stat_info.st_uid).pw_name
-            current_group = grp.getgrgid(stat_info.st_gid).gr_name
-            
-            if current_perms != expected_perms:
-                issues.append({
-                    'type': 'wrong_permissions',
-                    'severity': 'HIGH',
-                    'path': filepath,
-                    'current': f"0o{current_perms:o}",
-                    'expected': f"0o{expected_perms:o}"
-                })
-            
-            if current_owner != expected_owner or current_group != expected_group:
-                issues.append({
-                    'type': 'wrong_ownership',
-                    'severity': 'HIGH',
-                    'path': filepath,
-                    'current': f"{current_owner}:{current_group}",
-                    'expected': f"{expected_owner}:{expected_group}"
-                })
-        
-        except Exception as e:
-            issues.append({
-                'type': 'audit_error',
-                'severity': 'MEDIUM',
-                'path': filepath,
-                'error': str(e)
-            })
-    
-    return issues
+def load_sshd_config() -> SSHDConfigParser:
+    """sshd_config da raiz ativa (reaproveitado do FILE_CACHE enquanto os arquivos não mudarem)
+    
+    Além do principal, observa sshd_config.d e seus arquivos (o Include
+    padrão das distros); Includes em outros diretórios não invalidam o cache.
+    """
+    watched = [AUDIT_ROOT.path(SSHD_CONFIG), AUDIT_ROOT.path(SSHD_CONFIG_DIR)]
+    watched += [AUDIT_ROOT.path(path) for path in AUDIT_ROOT.glob(SSHD_CONFIG_DIR, '*')]
+    return FILE_CACHE.get(('sshd_config', repr(AUDIT_ROOT)), watched, SSHDConfigParser)
 
-def audit_host_keys() -> List[Dict]:
-    """Audita força das chaves de host SSH"""
-    issues = []
-    
-    for key_file in Path(SSH_DIR).glob('ssh_host_*_key.pub'):
+# --- Modelo de Issues ---
+class Severity(enum.IntEnum):
+    """Severidade de uma issue; a ordem numérica é a do relatório (CRITICAL primeiro)"""
+    CRITICAL = 0
+    HIGH = 1
+    MEDIUM = 2
+    LOW = 3
+    
+    def __str__(self):
+        return self.name
+    
+    def __format__(self, spec):
+        return format(self.name, spec)
+    
+    @classmethod
+    def parse(cls, value) -> 'Severity':
+        """Aceita Severity ou o nome (case-insensitive), como nos perfis e no JSON"""
+        if isinstance(value, cls):
+            return value
         try:
-            result = run_command(['ssh-keygen', '-l', '-f', str(key_file)])
-            output = result.stdout.strip()
-            
-            parts = output.split()
-            if len(parts) < 1:
-                continue
-            
-            key_size = int(parts[0])
-            key_type = parts[-1].strip('()')
-            
-            if key_type == 'RSA' and key_size < 3072:
-                issues.append({
-                    'type': 'weak_host_key',
-                    'severity': 'HIGH',
-                    'path': str(key_file),
-                    'key_type': key_type,
-                    'key_size': key_size,
-                    'comment': f"Chave RSA com {key_size} bits. NIST recomenda mínimo 3072 bits"
-                })
-        
-        except Exception as e:
-            logging.debug(f"Erro ao auditar chave {key_file}: {e}")
-    
-    return issues
+            return cls[str(value).upper()]
+        except KeyError:
+            raise ValueError(f"Severidade inválida '{value}' (válidas: {', '.join(SEVERITIES)})")
 
-def audit_authorized_keys() -> List[Dict]:
-    """Audita permissões de authorized_keys de todos os usuários"""
-    issues = []
-    
-    try:
-        result = run_command(['getent', 'passwd'])
-        users = []
-        
-        for line in result.stdout.split('\n'):
-            if not line.strip():
-                continue
-            parts = line.split(':')
-            if len(parts) >= 6:
-                username = parts[0]
-                home_dir = parts[5]
-                users.append((username, home_dir))
-        
-        for username, home_dir in users:
-            auth_keys_path = os.path.join(home_dir, '.ssh', 'authorized_keys')
-            
-            if not os.path.exists(auth_keys_path):
-                continue
-            
-            try:
-                stat_info = os.stat(auth_keys_path)
-                current_perms = stat_info.st_mode & 0o777
-                current_owner = pwd.getpwuid(stat_info.st_uid).pw_name
-                
-                if current_perms not in [0o600, 0o400]:
-                    issues.append({
-                        'type': 'insecure_authorized_keys',
-                        'severity': 'CRITICAL',
-                        'path': auth_keys_path,
-                        'user': username,
-                        'current_perms': f"0o{current_perms:o}",
-                        'comment': 'authorized_keys deve ter permissões 0o600 ou 0o400'
-                    })
-                
-                if current_owner != username:
-                    issues.append({
-                        'type': 'wrong_authorized_keys_owner',
-                        'severity': 'CRITICAL',
-                        'path': auth_keys_path,
-                        'user': username,
-                        'current_owner': current_owner,
-                        'comment': f'authorized_keys deve pertencer a {username}'
-                    })
-            
-            except Exception as e:
-                logging.debug(f"Erro ao auditar {auth_keys_path}: {e}")
-    
-    except Exception as e:
-        logging.error(f"Erro ao auditar authorized_keys: {e}")
-    
-    return issues
+SEVERITIES = tuple(severity.name for severity in Severity)
+SEVERITY_EMOJI = {Severity.CRITICAL: '🔴', Severity.HIGH: '🟠', Severity.MEDIUM: '🟡', Severity.LOW: '🔵'}
 
-def audit_fail2ban() -> List[Dict]:
-    """Verifica status do Fail2ban"""
-    issues = []
-    
-    try:
-        result = run_command(['systemctl', 'is-active', 'fail2ban'], check=False)
-        if result.stdout.strip() != 'active':
-            issues.append({
-                'type': 'fail2ban_inactive',
-                'severity': 'HIGH',
-                'comment': 'Fail2ban não está ativo. Servidor vulnerável a brute-force'
-            })
-    except FileNotFoundError:
-        issues.append({
-            'type': 'fail2ban_missing',
-            'severity': 'HIGH',
-            'comment': 'Fail2ban não está instalado'
-        })
-    
-    return issues
-
-def generate_audit_report(all_issues: Dict[str, List[Dict]]) -> str:
-    """Gera relatório de auditoria formatado"""
-    report = []
-    report.append("=" * 80)
-    report.append("RELATÓRIO DE AUDITORIA SSH - ENTERPRISE EDITION")
-    report.append(f"Data: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    report.append(f"Servidor: {os.uname().nodename}")
-    report.append("=" * 80)
-    report.append("")
-    
-    total_issues = sum(len(issues) for issues in all_issues.values())
-    
-    if total_issues == 0:
-        report.append("✅ NENHUMA FALHA DETECTADA")
-        report.append("   Sistema em conformidade com CIS Benchmark")
-    else:
-        report.append(f"❌ TOTAL DE ISSUES: {total_issues}")
-        report.append("")
-        
-        severity_order = ['CRITICAL', 'HIGH', 'MEDIUM', 'LOW']
-        
-        for category, issues in all_issues.items():
-            if not issues:
-                continue
-            
-            report.append(f"\n{'─' * 80}")
-            report.append(f"CATEGORIA: {category.upper()}")
-            report.append(f"{'─' * 80}")
-            
-            sorted_issues = sorted(
-                issues,
-                key=lambda x: severity_order.index(x.get('severity', 'LOW'))
-            )
-            
-            for issue in sorted_issues:
-                severity = issue.get('severity', 'UNKNOWN')
-                issue_type = issue.get('type', 'unknown')
-                
-                emoji = {
-                    'CRITICAL': '🔴',
-                    'HIGH': '🟠',
-                    'MEDIUM': '🟡',
-                    'LOW': '🔵'
-                }.get(severity, '⚪')
-                
-                report.append(f"\n{emoji} [{severity}] {issue_type}")
-                
-                for key, value in issue.items():
-                    if key not in ['type', 'severity']:
-                        report.append(f"   {key}: {value}")
-    
-    report.append("\n" + "=" * 80)
-    return "\n".join(report)
+# Ordem dos campos conhecidos no relatório e no JSON (os demais vêm depois, na ordem recebida)
+ISSUE_FIELDS = ('parameter', 'path', 'user', 'line', 'key_type', 'key_size', 'fingerprint', 'users',
+                'current', 'current_perms', 'current_owner', 'expected', 'recommended',
+                'weak_groups', 'total_groups', 'weak_sizes', 'sha256', 'error', 'comment')
+_ISSUE_FIELD_ORDER = {name: position for position, name in enumerate(ISSUE_FIELDS)}
+_ISSUE_HEADER = ('type', 'severity', 'category')
+_UNSET = object()
 
-# --- Correções (Hardening) ---
-def fix_ssh_config(dry_run: bool = False) -> bool:
-    """Aplica correções no sshd_config"""
-    logging.info("Iniciando correção de configurações SSH...")
-    
-    if dry_run:
-        logging.info("🔍 MODO DRY-RUN: Simulação sem alterações reais")
-    
-    parser = SSHDConfigParser()
-    
-    sftp_path = get_sftp_server_path()
-    updates = {param: value for param, (value, _, _) in CIS_COMPLIANT_CONFIG.items()}
-    updates['Subsystem'] = f'sftp {sftp_path}'
-    
-    new_lines = parser.update_config(updates)
-    
-    if dry_run:
-        logging.info(f"Dry-Run: {len(updates)} parâmetros seriam atualizados")
-        return True
-    
-    backup_path = backup_config(SSHD_CONFIG)
-    if not backup_path:
-        logging.error("Não foi possível criar backup. Abortando correção.")
-        return False
-    
-    try:
-        with open(SSHD_CONFIG, 'w') as f:
-            f.writelines(new_lines)
-        
-        log_event('config_updated', f"Configuração SSH atualizada", {
-            'backup': backup_path,
-            'parameters_updated': len(updates)
-        })
-    except Exception as e:
-        logging.error(f"Falha ao escrever {SSHD_CONFIG}: {e}")
-        return False
-    
-    if not validate_sshd_config():
-        logging.error("❌ VALIDAÇÃO FALHOU: Restaurando backup...")
-        restore_backup(backup_path, SSHD_CONFIG)
-        return False
-    
-    return True
-
-def fix_file_permissions(dry_run: bool = False) -> bool:
-    """Corrige permissões de arquivos SSH"""
-    logging.info("Iniciando correção de permissões...")
-    
-    if dry_run:
-        logging.info("🔍 MODO DRY-RUN: Simulação sem alterações reais")
-    
-    issues = audit_file_permissions()
-    fixed_count = 0
-    
-    for issue in issues:
-        if issue['type'] == 'missing_file':
-            logging.warning(f"Arquivo ausente: {issue['path']}")
-            continue
-        
-        filepath = issue['path']
-        
-        try:
-            if issue['type'] == 'wrong_permissions':
-                expected_perms = int(issue['expected'], 8)
-                if not dry_run:
-                    os.chmod(filepath, expected_perms)
-                logging.info(f"Corrigido: {filepath} -> {issue['expected']}")
-                fixed_count += 1
-            
-            elif issue['type'] == 'wrong_ownership':
-                owner, group = issue['expected'].split(':')
-                if not dry_run:
-                    shutil.chown(filepath, user=owner, group=group)
-                logging.info(f"Corrigido: {filepath} -> {owner}:{group}")
-                fixed_count += 1
-        
-        except Exception as e:
-            logging.error(f"Erro ao corrigir {filepath}: {e}")
-    
-    if dry_run:
-        logging.info(f"Dry-Run: {fixed_count} permissões seriam corrigidas")
-    else:
-        logging.info(f"✅ {fixed_count} permissões corrigidas")
-    
-    return True
+class IssueLayout(NamedTuple):
+    """Campos de um formato de issue, compartilhado por todas as issues com os mesmos campos"""
+    names: Tuple[str, ...]
+    index: Dict[str, int]
 
-def fix_authorized_keys(dry_run: bool = False) -> bool:
-    """Corrige permissões de authorized_keys"""
-    logging.info("Iniciando correção de authorized_keys...")
-    
-    if dry_run:
-        logging.info("🔍 MODO DRY-RUN: Simulação sem alterações reais")
-    
-    issues = audit_authorized_keys()
-    fixed_count = 0
-    
-    for issue in issues:
-        filepath = issue['path']
-        username = issue['user']
-        
-        try:
-            if issue['type'] == 'insecure_authorized_keys':
-                if not dry_run:
-                    os.chmod(filepath, 0o600)
-                logging.info(f"Corrigido: {filepath} -> 0o600")
-                fixed_count += 1
-            
-            elif issue['type'] == 'wrong_authorized_keys_owner':
-                if not dry_run:
-                    shutil.chown(filepath, user=username, group=username)
-                logging.info(f"Corrigido: {filepath} -> {username}:{username}")
-                fixed_count += 1
-        
-        except Exception as e:
-            logging.error(f"Erro ao corrigir {filepath}: {e}")
-    
-    if dry_run:
-        logging.info(f"Dry-Run: {fixed_count} authorized_keys seriam corrigidos")
-    else:
-        logging.info(f"✅ {fixed_count} authorized_keys corrigidos")
-    
-    return True
+# Campos na ordem recebida -> layout
+_ISSUE_LAYOUTS: Dict[Tuple[str, ...], IssueLayout] = {}
 
-# --- Fail2ban ---
-def install_fail2ban(dry_run: bool = False) -> bool:
-    """Instala e configura Fail2ban"""
-    logging.info("Verificando Fail2ban...")
-    
-    if dry_run:
-        logging.info("🔍 MODO DRY-RUN: Simulação sem alterações reais")
-    
-    try:
-        result = run_command(['systemctl', 'is-active', 'fail2ban'], check=False)
-        if result.stdout.strip() == 'active':
-            logging.info("✅ Fail2ban já está ativo")
-            return True
-    except FileNotFoundError:
-        pass
-    
-    distro = detect_distro()
-    
-    try:
-        if distro == 'debian':
-            if not dry_run:
-                run_command(['apt-get', 'update', '-y'])
-                run_command(['apt-get', 'install', 'fail2ban', '-y'])
-            logging.info("Fail2ban instalado (Debian)")
-        
-        elif distro == 'rhel':
-            if not dry_run:
-                run_command(['yum', 'install', 'epel-release', '-y'])
-                run_command(['yum', 'install', 'fail2ban', '-y'])
-            logging.info("Fail2ban instalado (RHEL)")
-        
-        else:
-            logging.warning(f"Distro '{distro}' não suportada para instalação automática")
-            return False
-    
-    except Exception as e:
-        logging.error(f"Erro ao instalar Fail2ban: {e}")
-        return False
-    
-    jail_config = """[sshd]
-enabled = true
-port = ssh
-filter = sshd
-logpath = /var/log/auth.log
-maxretry = 3
-bantime = 3600
-findtime = 600
-"""
-    
-    jail_path = "/etc/fail2ban/jail.d/sshd.local"
-    
-    if not dry_run:
+def issue_layout(names: Tuple[str, ...]) -> IssueLayout:
+    layout = _ISSUE_LAYOUTS.get(names)
+    if layout is None:
+        ordered = tuple(sorted(names, key=lambda name: _ISSUE_FIELD_ORDER.get(name, len(ISSUE_FIELDS))))
+        layout = _ISSUE_LAYOUTS.setdefault(names, IssueLayout(
+            tuple(sys.intern(name) for name in ordered), {name: position for position, name in enumerate(ordered)}))
+    return layout
+
+class Issue:
+    """Falha encontrada pela auditoria
+    
+    Frota e histórico guardam milhões de issues: em vez de um dicionário por
+    issue, os valores ficam em uma tupla e os nomes dos campos em um
+    IssueLayout compartilhado por todas as issues do mesmo formato. Tipo e
+    categoria são internados e a severidade é um Severity, que ordena sem
+    tabela auxiliar. to_dict/from_dict preservam qualquer campo; issue.path,
+    issue['path'], issue.get('path') e issue.items() continuam funcionando.
+    """
+    __slots__ = ('type', 'severity', 'category', 'layout', 'values')
+    
+    def __init__(self, type: str, severity, category: Optional[str] = None, **fields):
+        # Caminho quente (uma chamada por issue): evita chamadas quando já está no formato final
+        self.type = sys.intern(type)
+        self.severity = severity if severity.__class__ is Severity else Severity.parse(severity)
+        self.category = sys.intern(category) if category is not None else None
+        names = tuple(fields)
+        layout = _ISSUE_LAYOUTS.get(names) or issue_layout(names)
+        self.layout = layout
+        self.values = tuple(fields.values()) if layout.names == names else tuple(map(fields.__getitem__, layout.names))
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Issue':
+        """Inverso de to_dict (também lê issues gravadas como dicionário por versões anteriores)"""
+        fields = dict(data)
         try:
-            with open(jail_path, 'w') as f:
-                f.write(jail_config)
-            logging.info(f"Configuração criada: {jail_path}")
-        except Exception as e:
-            logging.error(f"Erro ao criar {jail_path}: {e}")
-            return False
-        
-        run_command(['systemctl', 'enable', 'fail2ban'])
-        run_command(['systemctl', 'start', 'fail2ban'])
-        
-        result = run_command(['systemctl', 'is-active', 'fail2ban'], check=False)
-        if result.stdout.strip() == 'active':
-            logging.info("✅ Fail2ban ativo e configurado")
-            return True
-        else:
-            logging.error("❌ Fail2ban não está ativo após configuração")
-            return False
-    else:
-        logging.info("Dry-Run: Fail2ban seria instalado e configurado")
-        return True
+            return cls(fields.pop('type'), fields.pop('severity'), fields.pop('category', None), **fields)
+        except KeyError as e:
+            raise ValueError(f"Issue sem o campo obrigatório {e}")
+    
+    def fields(self):
+        """Pares (campo, valor) dos detalhes, sem type/severity/category, na ordem do relatório"""
+        return zip(self.layout.names, self.values)
+    
+    def items(self) -> List[Tuple[str, object]]:
+        """Todos os pares (campo, valor): type, severity, category (se houver) e os detalhes"""
+        header = [('type', self.type), ('severity', self.severity)]
+        if self.category is not None:
+            header.append(('category', self.category))
+        return header + list(self.fields())
+    
+    def to_dict(self) -> Dict:
+        """Dicionário serializável em JSON (severidade pelo nome)"""
+        data = dict(self.items())
+        data['severity'] = self.severity.name
+        return data
+    
+    def get(self, key: str, default=None):
+        position = self.layout.index.get(key)
+        if position is not None:
+            return self.values[position]
+        if key in _ISSUE_HEADER:
+            value = getattr(self, key)
+            return default if value is None else value
+        return default
+    
+    def __getattr__(self, name: str):
+        # Só é chamado para nomes fora dos slots: campos de detalhe
+        if name in Issue.__slots__ or name.startswith('__'):
+            raise AttributeError(name)
+        position = self.layout.index.get(name)
+        if position is None:
+            raise AttributeError(f"Issue '{self.type}' não tem o campo '{name}'")
+        return self.values[position]
+    
+    def __getitem__(self, key: str):
+        value = self.get(key, _UNSET)
+        if value is _UNSET:
+            raise KeyError(key)
+        return value
+    
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _UNSET) is not _UNSET
+    
+    def __eq__(self, other):
+        if not isinstance(other, Issue):
+            return NotImplemented
+        return self.items() == other.items()
+    
+    __hash__ = None
+    
+    def __repr__(self):
+        return f"Issue({', '.join(f'{key}={value!r}' for key, value in self.items())})"
 
-# --- Gerenciamento de Usuários ---
-def create_sudo_user(username: str, dry_run: bool = False) -> bool:
-    """Cria usuário com permissões sudo e senha segura"""
-    logging.info(f"Iniciando criação do usuário '{username}'...")
-    
-    if dry_run:
-        logging.info("🔍 MODO DRY-RUN: Simulação sem alterações reais")
-        return True
-    
-    if not validate_username(username):
-        logging.error(f"Username inválido: '{username}'")
-        logging.error("Formato válido: [a-z_][a-z0-9_-]{{0,31}}")
-        return False
-    
-    try:
-        pwd.getpwnam(username)
-        logging.error(f"Usuário '{username}' já existe")
-        return False
-    except KeyError:
-        pass
-    
-    password = generate_secure_password()
+def issues_to_json(all_issues: Dict[str, List[Issue]]) -> Dict[str, List[Dict]]:
+    """Resultado de run_full_audit em formato JSON (categoria -> lista de dicionários)"""
+    return {category: [issue.to_dict() for issue in issues] for category, issues in all_issues.items()}
+
+def issues_from_json(data: Dict[str, List[Dict]]) -> Dict[str, List[Issue]]:
+    """Inverso de issues_to_json"""
+    return {category: [Issue.from_dict(item) for item in items] for category, items in data.items()}
+
+# --- Motor de Regras de Conformidade ---
+RULE_CHECKS = ('equals', 'enum', 'range', 'subset', 'forbidden', 'regex')
+
+_TIME_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+_TIME_FORMAT = re.compile(r'(?:\d+[smhdw]?)+', re.IGNORECASE)
+_TIME_PART = re.compile(r'(\d+)([smhdw]?)', re.IGNORECASE)
+_INTEGER = re.compile(r'-?[0-9]+')
+
+_PROFILE_CACHE: Dict[str, 'ComplianceProfile'] = {}
+
+def parse_sshd_time(value: str) -> Optional[int]:
+    """Converte formato de tempo do sshd (ex: 1m30s) para segundos"""
+    if not _TIME_FORMAT.fullmatch(value):
+        return None
+    return sum(int(amount) * _TIME_UNITS[unit.lower()] for amount, unit in _TIME_PART.findall(value))
+
+def split_algorithms(value: str) -> List[str]:
+    """Separa lista de algoritmos (Ciphers, MACs, KexAlgorithms) em membros"""
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+def compile_rule_check(param: str, spec: Dict, recommended: str) -> Callable[[str], bool]:
+    """Pré-compila o comparador de uma regra em uma função value -> conforme"""
+    check = spec.get('check', 'equals')
+    
+    if check == 'equals':
+        expected = spec.get('value', recommended)
+        return lambda value: value == expected
+    
+    if check == 'enum':
+        allowed = frozenset(item.lower() for item in spec.get('allowed', [recommended]))
+        return lambda value: value.lower() in allowed
+    
+    if check == 'range':
+        low, high = spec.get('min'), spec.get('max')
+        to_number = parse_sshd_time if spec.get('units') == 'time' else (
+            lambda value: int(value) if _INTEGER.fullmatch(value) else None)
+        
+        def check_range(value):
+            number = to_number(value)
+            if number is None:
+                return False
+            return (low is None or number >= low) and (high is None or number <= high)
+        return check_range
     
-    try:
-        run_command(['useradd', '-m', '-s', '/bin/bash', username])
-        logging.info(f"Usuário '{username}' criado")
-        
-        run_command(['chpasswd'], input_data=f"{username}:{password}\n")
-        logging.info(f"Senha definida para '{username}'")
-        
-        distro = detect_distro()
-        sudo_group = 'sudo' if distro == 'debian' else 'wheel'
-        
-        run_command(['usermod', '-aG', sudo_group, username])
-        logging.info(f"Usuário '{username}' adicionado ao grupo '{sudo_group}'")
+    if check == 'subset':
+        allowed = frozenset(spec.get('allowed') or split_algorithms(recommended))
+        forbidden = frozenset(spec.get('forbidden', []))
         
-        print("\n" + "=" * 80)
-        print("🔐 CREDENCIAIS DO NOVO USUÁRIO SUDO")
-        print("=" * 80)
-        print(f"Username: {username}")
-        print(f"Password: {password}")
-        print("=" * 80)
-        print("⚠️  ATENÇÃO: Salve esta senha AGORA. Ela não será exibida novamente.")
-        print("=" * 80 + "\n")
-        
-        log_event('user_created', f"Usuário sudo criado: {username}", {
-            'username': username,
-            'sudo_group': sudo_group
-        })
-        
-        return True
+        def check_subset(value):
+            # Prefixos +, - e ^ alteram a lista padrão do OpenSSH: não é possível provar o subconjunto
+            if value[:1] in ('+', '-', '^'):
+                return False
+            members = split_algorithms(value)
+            return bool(members) and allowed.issuperset(members) and forbidden.isdisjoint(members)
+        return check_subset
     
-    except Exception as e:
-        logging.error(f"Erro ao criar usuário '{username}': {e}")
-        
-        try:
-            run_command(['userdel', '-r', username], check=False)
-            logging.warning(f"Rollback: usuário '{username}' removido")
-        except Exception:
-            pass
+    if check == 'forbidden':
+        forbidden = frozenset(spec.get('forbidden', []))
         
-        return False
-
-# --- Menu Interativo ---
-def interactive_menu():
-    """Menu interativo para facilitar o uso do script"""
-    
-    def print_header():
-        os.system('clear' if os.name == 'posix' else 'cls')
-        print("=" * 80)
-        print("SSH AUDITOR AND HARDENING TOOL - ENTERPRISE EDITION v1.0")
-        print(f"Servidor: {os.uname().nodename}")
-        print(f"Distro: {detect_distro()}")
-        print("=" * 80)
-        print()
-    
-    def print_menu():
-        print("MENU PRINCIPAL:")
-        print()
-        print("  [1] Auditoria de Segurança SSH")
-        print("  [2] Simular Correções (Dry-Run)")
-        print("  [3] Aplicar Correções (CUIDADO!)")
-        print("  [4] Instalar/Configurar Fail2ban")
-        print("  [5] Criar Usuário Sudo")
-        print("  [6] Auditoria + Hardening Completo")
-        print("  [7] Ver Logs de Auditoria")
-        print("  [8] Ver Relatórios Salvos")
-        print()
-        print("  [0] Sair")
-        print()
-        print("-" * 80)
-    
-    def wait_key():
-        input("\nPressione ENTER para continuar...")
-    
-    def confirm_action(message):
-        while True:
-            response = input(f"\n{message} (s/n): ").lower().strip()
-            if response in ['s', 'sim', 'y', 'yes']:
+        def check_forbidden(value):
+            # Lista com prefixo '-' apenas remove algoritmos do padrão
+            if value[:1] == '-':
                 return True
-            elif response in ['n', 'nao', 'não', 'no']:
-                return False
-            print("Resposta inválida. Digite 's' para sim ou 'n' para não.")
+            return forbidden.isdisjoint(split_algorithms(value.lstrip('+^')))
+        return check_forbidden
     
-    def run_audit():
-        print_header()
-        print("EXECUTANDO AUDITORIA DE SEGURANÇA SSH...")
-        print("-" * 80)
-        print()
-        
-        all_issues = {
-            'ssh_config': audit_ssh_config(),
-            'file_permissions': audit_file_permissions(),
-            'host_keys': audit_host_keys(),
-            'authorized_keys': audit_authorized_keys(),
-            'fail2ban': audit_fail2ban()
-        }
-        
-        report = generate_audit_report(all_issues)
-        print(report)
-        
-        report_path = f"/var/log/ssh_audit_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    if check == 'regex':
+        flags = 0 if spec.get('case_sensitive', True) else re.IGNORECASE
         try:
-            with open(report_path, 'w') as f:
-                f.write(report)
-            print(f"\nRelatório salvo em: {report_path}")
-        except Exception as e:
-            logging.warning(f"Não foi possível salvar relatório: {e}")
-        
-        wait_key()
+            pattern = re.compile(spec['pattern'], flags)
+        except (KeyError, re.error) as e:
+            raise ValueError(f"Regra '{param}': expressão regular inválida ({e})")
+        return lambda value: pattern.fullmatch(value) is not None
     
-    def run_dry_run():
-        print_header()
-        print("SIMULAÇÃO DE CORREÇÕES (DRY-RUN)")
-        print("-" * 80)
-        print()
-        
-        logging.info("Modo Dry-Run ativado - nenhuma alteração será feita")
-        print()
-        
-        fix_ssh_config(dry_run=True)
-        fix_file_permissions(dry_run=True)
-        fix_authorized_keys(dry_run=True)
-        
-        print()
-        print("=" * 80)
-        print("SIMULAÇÃO CONCLUÍDA")
-        print("Nenhuma alteração foi aplicada ao sistema.")
-        print("=" * 80)
-        
-        wait_key()
-    
-    def run_fix():
-        print_header()
-        print("APLICAR CORREÇÕES DE HARDENING")
-        print("-" * 80)
-        print()
-        print("ATENÇÃO: Esta operação irá modificar configurações do SSH!")
-        print()
-        print("Recomendações antes de continuar:")
-        print("  - Certifique-se de ter acesso alternativo ao servidor (console/IPMI)")
-        print("  - Verifique se há pelo menos 1 usuário com chave SSH configurada")
-        print("  - Backup do sshd_config será criado automaticamente")
-        print()
-        
-        if not confirm_action("Deseja continuar com as correções?"):
-            print("\nOperação cancelada pelo usuário.")
-            wait_key()
-            return
-        
-        print()
-        print("Aplicando correções...")
-        print("-" * 80)
-        print()
-        
-        success = True
-        
-        if not fix_ssh_config(dry_run=False):
-            logging.error("Falha ao corrigir configurações SSH")
-            success = False
-        
-        if not fix_file_permissions(dry_run=False):
-            logging.error("Falha ao corrigir permissões")
-            success = False
-        
-        if not fix_authorized_keys(dry_run=False):
-            logging.error("Falha ao corrigir authorized_keys")
-            success = False
-        
-        if success:
-            print()
-            print("Reiniciando serviço SSH...")
-            if not restart_ssh_with_retry():
-                logging.error("FALHA CRÍTICA: SSH não reiniciou corretamente")
-                print()
-                print("ATENÇÃO: Verifique o serviço SSH manualmente!")
-                print("Comando: systemctl status sshd")
-                success = False
-        
-        print()
-        print("=" * 80)
-        if success:
-            print("CORREÇÕES APLICADAS COM SUCESSO")
-        else:
-            print("CORREÇÕES CONCLUÍDAS COM FALHAS")
-            print("Verifique os logs em: " + LOG_FILE)
-        print("=" * 80)
-        
-        wait_key()
-    
-    def run_fail2ban():
-        print_header()
-        print("INSTALAR/CONFIGURAR FAIL2BAN")
-        print("-" * 80)
-        print()
-        
-        if install_fail2ban(dry_run=False):
-            print()
-            print("=" * 80)
-            print("FAIL2BAN CONFIGURADO COM SUCESSO")
-            print("=" * 80)
-        else:
-            print()
-            print("=" * 80)
-            print("FALHA AO CONFIGURAR FAIL2BAN")
-            print("=" * 80)
-        
-        wait_key()
-    
-    def run_create_user():
-        print_header()
-        print("CRIAR USUÁRIO SUDO")
-        print("-" * 80)
-        print()
-        
-        username = input("Digite o nome do usuário (formato: [a-z_][a-z0-9_-]{0,31}): ").strip()
-        
-        if not username:
-            print("\nOperação cancelada.")
-            wait_key()
-            return
-        
-        print()
-        if create_sudo_user(username, dry_run=False):
-            print()
-            print("=" * 80)
-            print("USUÁRIO CRIADO COM SUCESSO")
-            print("=" * 80)
-        else:
-            print()
-            print("=" * 80)
-            print("FALHA AO CRIAR USUÁRIO")
-            print("=" * 80)
-        
-        wait_key()
-    
-    def run_full_hardening():
-        print_header()
-        print("AUDITORIA + HARDENING COMPLETO")
-        print("-" * 80)
-        print()
-        print("Esta operação irá:")
-        print("  1. Executar auditoria completa")
-        print("  2. Aplicar todas as correções de hardening")
-        print("  3. Instalar e configurar Fail2ban")
-        print()
-        print("ATENÇÃO: Certifique-se de ter acesso alternativo ao servidor!")
-        print()
-        
-        if not confirm_action("Deseja continuar?"):
-            print("\nOperação cancelada pelo usuário.")
-            wait_key()
-            return
-        
-        print()
-        print("Executando auditoria...")
-        print("-" * 80)
-        
-        all_issues = {
-            'ssh_config': audit_ssh_config(),
-            'file_permissions': audit_file_permissions(),
-            'host_keys': audit_host_keys(),
-            'authorized_keys': audit_authorized_keys(),
-            'fail2ban': audit_fail2ban()
-        }
-        
-        report = generate_audit_report(all_issues)
-        print(report)
-        
-        print()
-        if not confirm_action("Deseja aplicar as correções?"):
-            print("\nOperação cancelada pelo usuário.")
-            wait_key()
-            return
-        
-        print()
-        print("Aplicando correções...")
-        print("-" * 80)
-        
-        success = True
-        
-        if not fix_ssh_config(dry_run=False):
-            success = False
-        
-        if not fix_file_permissions(dry_run=False):
-            success = False
-        
-        if not fix_authorized_keys(dry_run=False):
-            success = False
-        
-        if success:
-            if not restart_ssh_with_retry():
-                success = False
-        
-        print()
-        print("Instalando Fail2ban...")
-        if not install_fail2ban(dry_run=False):
-            success = False
-        
-        print()
-        print("=" * 80)
-        if success:
-            print("HARDENING COMPLETO APLICADO COM SUCESSO")
-        else:
-            print("HARDENING CONCLUÍDO COM FALHAS")
-        print("=" * 80)
-        
-        wait_key()
-    
-    def view_logs():
-        print_header()
-        print("LOGS DE AUDITORIA")
-        print("-" * 80)
-        print()
-        
-        if not os.path.exists(LOG_FILE):
-            print(f"Arquivo de log não encontrado: {LOG_FILE}")
-            wait_key()
-            return
-        
-        print(f"Exibindo últimas 30 linhas de: {LOG_FILE}")
-        print()
-        
+    raise ValueError(f"Regra '{param}': comparador desconhecido '{check}' (válidos: {', '.join(RULE_CHECKS)})")
+
+class ComplianceRule:
+    """Regra compilada: parâmetro do sshd_config + comparador pré-construído"""
+    __slots__ = ('param', 'key', 'recommended', 'severity', 'comment', 'test')
+    
+    def __init__(self, param: str, recommended: str, severity: Severity, comment: str,
+                 test: Callable[[str], bool]):
+        self.param = param
+        self.key = param.lower()
+        self.recommended = recommended
+        self.severity = severity
+        self.comment = comment
+        self.test = test
+    
+    @classmethod
+    def from_spec(cls, param: str, spec: Dict) -> 'ComplianceRule':
+        """Compila regra a partir da especificação de um perfil"""
+        recommended = spec.get('recommended')
+        if recommended is None:
+            raise ValueError(f"Regra '{param}': campo 'recommended' é obrigatório")
         try:
-            with open(LOG_FILE, 'r') as f:
-                lines = f.readlines()
-                for line in lines[-30:]:
-                    try:
-                        log_entry = json.loads(line)
-                        timestamp = log_entry.get('timestamp', 'N/A')
-                        level = log_entry.get('level', 'N/A')
-                        message = log_entry.get('message', 'N/A')
-                        print(f"[{timestamp}] [{level}] {message}")
-                    except json.JSONDecodeError:
-                        print(line.strip())
-        except Exception as e:
-            print(f"Erro ao ler logs: {e}")
-        
-        wait_key()
+            severity = Severity.parse(spec.get('severity', 'MEDIUM'))
+        except ValueError as e:
+            raise ValueError(f"Regra '{param}': {e}")
+        test = compile_rule_check(param, spec, str(recommended))
+        return cls(param, str(recommended), severity, spec.get('comment', ''), test)
+    
+    def evaluate(self, current_value: Optional[str]) -> Optional[Issue]:
+        """Retorna issue no formato de audit_ssh_config ou None se conforme"""
+        if current_value is None:
+            return Issue('missing', self.severity, parameter=self.param, recommended=self.recommended,
+                         comment=self.comment)
+        if not self.test(current_value):
+            return Issue('misconfigured', self.severity, parameter=self.param, current=current_value,
+                         recommended=self.recommended, comment=self.comment)
+        return None
+
+class ComplianceProfile:
+    """Perfil compilado com índice keyword (minúsculo) -> regra"""
+    
+    def __init__(self, name: str, rules: List[ComplianceRule], description: str = ''):
+        self.name = name
+        self.description = description
+        self.rules = rules
+        self.index = {rule.key: rule for rule in rules}
+    
+    def has_rule(self, param: str) -> bool:
+        """Verifica se o perfil possui regra para o parâmetro"""
+        return param.lower() in self.index
+    
+    def evaluate(self, config: Dict[str, str], extra_rules: List[ComplianceRule] = ()) -> List[Issue]:
+        """Avalia um snapshot de configuração (keywords do sshd são case-insensitive)"""
+        values = {param.lower(): value for param, value in config.items()}
+        issues = []
+        for rule in self.rules:
+            issue = rule.evaluate(values.get(rule.key))
+            if issue is not None:
+                issues.append(issue)
+        for rule in extra_rules:
+            issue = rule.evaluate(values.get(rule.key))
+            if issue is not None:
+                issues.append(issue)
+        return issues
+
+def builtin_profile_spec() -> Dict:
+    """Especificação do perfil CIS L1 embutido (CIS_COMPLIANT_CONFIG + CIS_RULE_CHECKS)"""
+    rules = {}
+    for param, (recommended, severity, comment) in CIS_COMPLIANT_CONFIG.items():
+        rule = dict(CIS_RULE_CHECKS.get(param, {'check': 'equals'}))
+        rule.update(recommended=recommended, severity=severity, comment=comment)
+        rules[param] = rule
+    return {
+        'name': DEFAULT_PROFILE,
+        'description': 'CIS Benchmark 5.2.x Level 1 (embutido)',
+        'rules': rules
+    }
+
+def read_profile_spec(name_or_path: str, _chain: Tuple[str, ...] = ()) -> Dict:
+    """Lê especificação de perfil (JSON) resolvendo herança via 'extends'"""
+    if name_or_path in _chain:
+        raise ValueError(f"Herança circular entre perfis: {' -> '.join(_chain + (name_or_path,))}")
     
-    def view_reports():
-        print_header()
-        print("RELATÓRIOS SALVOS")
-        print("-" * 80)
-        print()
-        
-        reports = sorted(Path('/var/log').glob('ssh_audit_*.txt'), reverse=True)
-        
-        if not reports:
-            print("Nenhum relatório encontrado.")
-            wait_key()
-            return
-        
-        print(f"Encontrados {len(reports)} relatório(s):\n")
-        
-        for i, report in enumerate(reports[:10], 1):
-            stat = report.stat()
-            size = stat.st_size
-            mtime = datetime.datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
-            print(f"  [{i}] {report.name}")
-            print(f"      Data: {mtime} | Tamanho: {size} bytes")
-            print()
-        
-        if len(reports) > 10:
-            print(f"... e mais {len(reports) - 10} relatório(s)")
-            print()
-        
-        choice = input("Digite o número do relatório para visualizar (ou ENTER para voltar): ").strip()
-        
-        if choice.isdigit() and 1 <= int(choice) <= min(10, len(reports)):
-            print()
-            print("=" * 80)
-            with open(reports[int(choice) - 1], 'r') as f:
-                print(f.read())
-            print("=" * 80)
-        
-        wait_key()
+    if name_or_path == DEFAULT_PROFILE:
+        return builtin_profile_spec()
     
-    # Loop principal do menu
-    while True:
-        print_header()
-        print_menu()
-        
-        choice = input("Escolha uma opção: ").strip()
-        
-        if choice == '1':
-            run_audit()
-        elif choice == '2':
-            run_dry_run()
-        elif choice == '3':
-            run_fix()
-        elif choice == '4':
-            run_fail2ban()
-        elif choice == '5':
-            run_create_user()
-        elif choice == '6':
-            run_full_hardening()
-        elif choice == '7':
-            view_logs()
-        elif choice == '8':
-            view_reports()
-        elif choice == '0':
-            print()
-            print("Encerrando...")
-            sys.exit(0)
+    if os.path.isfile(name_or_path):
+        profile_path = name_or_path
+    else:
+        profile_path = os.path.join(PROFILES_DIR, f"{name_or_path}.json")
+    
+    try:
+        with open(profile_path, 'r') as f:
+            spec = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"Perfil de conformidade não encontrado: '{name_or_path}'")
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Perfil '{profile_path}' contém JSON inválido: {e}")
+    
+    if not isinstance(spec.get('rules', {}), dict):
+        raise ValueError(f"Perfil '{profile_path}': 'rules' deve ser um objeto")
+    
+    parent = spec.get('extends')
+    if not parent:
+        return spec
+    
+    base = read_profile_spec(parent, _chain + (name_or_path,))
+    rules = {param: dict(rule) for param, rule in base.get('rules', {}).items()}
+    for param, rule in spec.get('rules', {}).items():
+        if rule is None:
+            # null remove a regra herdada
+            rules.pop(param, None)
         else:
-            print()
-            print("Opção inválida. Tente novamente.")
-            time.sleep(1)
+            rules.setdefault(param, {}).update(rule)
+    
+    return dict(spec, rules=rules)
+
+def compile_profile(spec: Dict) -> ComplianceProfile:
+    """Compila especificação em perfil pronto para avaliação"""
+    rules = [ComplianceRule.from_spec(param, rule) for param, rule in spec.get('rules', {}).items()]
+    return ComplianceProfile(spec.get('name', 'custom'), rules, spec.get('description', ''))
+
+def load_profile(name_or_path: str = DEFAULT_PROFILE) -> ComplianceProfile:
+    """Carrega e compila perfil de conformidade (cacheado por nome/caminho)"""
+    profile = _PROFILE_CACHE.get(name_or_path)
+    if profile is None:
+        profile = compile_profile(read_profile_spec(name_or_path))
+        _PROFILE_CACHE[name_or_path] = profile
+        logging.debug(f"Perfil de conformidade carregado: {profile.name} ({len(profile.rules)} regras)")
+    return profile
+
+def subsystem_rule() -> ComplianceRule:
+    """Regra dinâmica do subsistema SFTP (path depende da distro)"""
+    recommended = f'sftp {get_sftp_server_path()}'
+    return ComplianceRule('Subsystem', recommended, 'MEDIUM',
+                          "Configuração correta do subsistema SFTP",
+                          lambda value: value == recommended)
+
+# --- Componentes (importação sob demanda) ---
+# Nomes dos componentes reexportados pelo núcleo (PEP 562): 'ssh_auditor.run_full_audit'
+# importa ssh_audit só no primeiro acesso. Qualquer outro nome é AttributeError
+# sem importar nada (hasattr() e typos não carregam componentes)
+_LAZY_ATTRIBUTES = {
+    # Auditoria e relatório
+    'audit_ssh_config': 'ssh_audit',
+    'audit_file_permissions': 'ssh_audit',
+    'audit_authorized_keys': 'ssh_audit',
+    'audit_host_keys': 'ssh_audit',
+    'audit_fail2ban': 'ssh_audit',
+    'run_full_audit': 'ssh_audit',
+    'run_multi_root_audit': 'ssh_audit',
+    'generate_audit_report': 'ssh_audit',
+    'export_metrics': 'ssh_audit',
+    # Correções, sessões e banimentos
+    'plan_fixes': 'ssh_fix',
+    'fix_ssh_config': 'ssh_fix',
+    'fix_file_permissions': 'ssh_fix',
+    'fix_authorized_keys': 'ssh_fix',
+    'fix_moduli': 'ssh_fix',
+    'check_active_ssh_sessions': 'ssh_fix',
+    'install_fail2ban': 'ssh_fix',
+    'create_sudo_user': 'ssh_fix',
+    'create_sudo_users': 'ssh_fix',
+    'BAN_ALLOWLIST': 'ssh_fix',
+    'parse_allowlist': 'ssh_fix',
+    'aggregate_bans': 'ssh_fix',
+    'format_ban_set': 'ssh_fix',
+    'run_ban_aggregation': 'ssh_fix',
+    # Frota, chaves e imagens
+    'ConfigTable': 'ssh_fleet',
+    'evaluate_fleet': 'ssh_fleet',
+    'run_fleet_audit': 'ssh_fleet',
+    'AuthorizedKeyIndex': 'ssh_fleet',
+    'run_key_index': 'ssh_fleet',
+    'collect_host_keys': 'ssh_fleet',
+    'run_host_key_report': 'ssh_fleet',
+    'scan_images': 'ssh_fleet',
+    # Menu e servidor
+    'interactive_menu': 'ssh_menu',
+    'serve': 'ssh_server',
+}
+
+def __getattr__(name: str):
+    component = _LAZY_ATTRIBUTES.get(name)
+    if component is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(component), name)
 
 # --- Main ---
 def main():
+    # Caminho rápido: --version não precisa de argparse nem de logging
+    if sys.argv[1:] == ['--version']:
+        print(f"{os.path.basename(sys.argv[0])} {VERSION}")
+        return
+    
+    import argparse
+    
     parser = argparse.ArgumentParser(
         description=f"SSH Auditor and Hardening Tool v{VERSION}",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -1274,8 +1664,23 @@ Exemplos de uso:
   %(prog)s --audit                          # Auditoria completa
   %(prog)s --fix --dry-run                  # Simular correções
   %(prog)s --fix                            # Aplicar correções
+  %(prog)s --fix --drain-timeout 1800       # Restart só quando as sessões terminarem (até 30 min)
+  %(prog)s --restore-backup "2024-05-01 09:00" # Voltar configs a um instante
+  %(prog)s --audit --compliance-profile fips # Auditoria com perfil FIPS
+  %(prog)s --fleet /srv/snapshots           # Conformidade da frota (offline)
+  %(prog)s --root /mnt/image --audit        # Auditar imagem montada (sem root)
+  %(prog)s --root img1 --root img2 -j 8     # Auditar várias imagens em paralelo
+  %(prog)s --scan-images /srv/images        # Auditar imagens OCI/Docker (docker save)
+  %(prog)s --keys-index /srv/coleta         # Chaves reutilizadas entre contas/hosts
+  %(prog)s --host-keys-report /srv/hostkeys # Chaves de host repetidas (templates clonados)
+  %(prog)s --audit --profile --trace t.json # Tempo por fase e comandos mais lentos
+  %(prog)s --metrics-file /var/lib/node_exporter/textfile_collector/ssh_auditor.prom --watch 300
+  %(prog)s --serve                          # Servidor com caches quentes (socket Unix)
+  %(prog)s --audit --low-impact --deadline 120 # Produção sob carga: nice/ionice, taxas e prazo
   %(prog)s --create-user admin_backup       # Criar usuário sudo
+  %(prog)s --create-users equipe.csv        # Criar usuários sudo em lote
   %(prog)s --install-fail2ban               # Instalar Fail2ban
+  %(prog)s --aggregate-bans --ban-output /etc/nftables.d/bans.nft  # Banimentos do Fail2ban em CIDRs
   %(prog)s --audit --fix --install-fail2ban # Auditoria + Hardening completo
 
 ATENÇÃO: Execute sempre com --dry-run primeiro em produção!
@@ -1290,8 +1695,86 @@ ATENÇÃO: Execute sempre com --dry-run primeiro em produção!
                         help='Simular correções sem aplicar (usar com --fix)')
     parser.add_argument('--create-user', metavar='USERNAME',
                         help='Criar novo usuário com permissões sudo')
+    parser.add_argument('--create-users', metavar='ARQUIVO',
+                        help='Criar em lote os usuários sudo de um arquivo CSV (cabeçalho username,shell,comment) ou JSON')
+    parser.add_argument('--credentials-file', metavar='ARQUIVO',
+                        help='Arquivo 0600 com as senhas geradas por --create-users (padrão: /root/ssh_auditor_credentials_<data>.csv)')
     parser.add_argument('--install-fail2ban', action='store_true',
                         help='Instalar e configurar Fail2ban')
+    parser.add_argument('--aggregate-bans', action='store_true',
+                        help='Agregar os IPs banidos pelo Fail2ban em blocos CIDR (conjunto nftables/ipset)')
+    parser.add_argument('--fail2ban-db', metavar='ARQUIVO', default=FAIL2BAN_DB,
+                        help='Banco SQLite do Fail2ban lido por --aggregate-bans (padrão: %(default)s)')
+    parser.add_argument('--bans-file', metavar='ARQUIVO',
+                        help="Ler os IPs banidos de um dump (um por linha ou saída de 'fail2ban-client status') em vez do banco")
+    parser.add_argument('--ban-jail', metavar='JAIL',
+                        help='Considerar somente os banimentos deste jail (padrão: todos)')
+    parser.add_argument('--allowlist', metavar='CIDR', action='append',
+                        help='IP, CIDR ou arquivo que nunca entra em um bloco (repetível; ignoreip dos jails já é respeitado)')
+    parser.add_argument('--min-density', type=float, metavar='FRAÇÃO', default=BAN_MIN_DENSITY,
+                        help='Fração mínima de endereços banidos para um bloco virar regra (padrão: %(default)s)')
+    parser.add_argument('--ban-format', choices=('nft', 'ipset'), default='nft',
+                        help='Formato do conjunto gerado: nft -f ou ipset restore (padrão: %(default)s)')
+    parser.add_argument('--ban-output', metavar='ARQUIVO', default='-',
+                        help="Destino do conjunto gerado ('-' = stdout, padrão)")
+    parser.add_argument('--drain-timeout', type=int, metavar='SEGUNDOS', default=0,
+                        help='Adiar o restart do SSH até as sessões ativas terminarem ou o prazo acabar')
+    parser.add_argument('--reload', action='store_true',
+                        help='Recarregar o sshd (SIGHUP) em vez de reiniciar: sessões ativas são mantidas')
+    parser.add_argument('--list-backups', action='store_true',
+                        help=f'Listar versões guardadas no repositório de backups ({BACKUP_DIR})')
+    parser.add_argument('--restore-backup', metavar='QUANDO',
+                        help="Restaurar configs como estavam em QUANDO ('latest' ou 'AAAA-MM-DD HH:MM') e reiniciar o SSH")
+    parser.add_argument('--compliance-profile', metavar='PERFIL', default=DEFAULT_PROFILE,
+                        help=f'Perfil de conformidade: cis-l1, cis-l2, fips ou caminho de arquivo JSON (padrão: {DEFAULT_PROFILE})')
+    parser.add_argument('--root', metavar='DIR', action='append',
+                        help='Auditar imagem montada/extraída em DIR (repetível; não requer root)')
+    parser.add_argument('--jobs', '-j', type=int, metavar='N',
+                        help='Processos paralelos ao auditar várias raízes (padrão: núcleos da CPU)')
+    parser.add_argument('--fleet', metavar='DIR',
+                        help='Avaliar snapshots de sshd_config da frota (um arquivo por host)')
+    parser.add_argument('--fleet-json', metavar='ARQUIVO',
+                        help='Exportar issues da frota em JSON Lines (usar com --fleet)')
+    parser.add_argument('--fleet-moduli', metavar='DIR',
+                        help='Auditar moduli coletados da frota (um arquivo por host), deduplicados por conteúdo (usar com --fleet)')
+    parser.add_argument('--keys-index', metavar='DIR',
+                        help='Indexar authorized_keys coletados da frota (um subdiretório por host)')
+    parser.add_argument('--host-key-fingerprints', metavar='ARQUIVO',
+                        help="Acrescentar (host, tipo, fingerprint) das chaves de host em JSON Lines ('-' = stdout; aceita --root)")
+    parser.add_argument('--host-keys-report', metavar='CAMINHO', nargs='+',
+                        help='Agregar registros de --host-key-fingerprints da frota: chaves repetidas e fracas')
+    parser.add_argument('--scan-images', metavar='CAMINHO', nargs='+',
+                        help='Auditar imagens OCI/Docker (tar do docker save, layout OCI ou diretório com eles)')
+    parser.add_argument('--image-cache', metavar='DIR',
+                        help=f'Cache de camadas e resultados de imagens (padrão: {CACHE_DIR})')
+    parser.add_argument('--metrics-file', metavar='ARQUIVO',
+                        help='Gravar métricas Prometheus (textfile do node_exporter) ao final da auditoria')
+    parser.add_argument('--watch', type=int, metavar='SEGUNDOS',
+                        help='Reauditar e regravar --metrics-file a cada SEGUNDOS (até Ctrl+C)')
+    parser.add_argument('--serve', action='store_true',
+                        help='Atender auditorias/planos via socket Unix (JSON por linha) com caches quentes')
+    parser.add_argument('--socket', metavar='CAMINHO', default=SERVER_SOCKET,
+                        help='Socket Unix do --serve (padrão: %(default)s)')
+    parser.add_argument('--low-impact', action='store_true',
+                        help=f'Modo de baixo impacto: nice {LOW_IMPACT_NICE}, ionice best-effort, '
+                             f'{LOW_IMPACT_STAT_RATE} stats/s, {LOW_IMPACT_COMMAND_RATE} comandos/s, '
+                             f'{LOW_IMPACT_NETWORK_CONCURRENCY} operações simultâneas em NFS/LDAP')
+    parser.add_argument('--nice', type=int, metavar='N',
+                        help='Incremento de nice do processo e dos comandos filhos')
+    parser.add_argument('--io-class', choices=sorted(IO_CLASSES),
+                        help='Classe de IO (ionice) do processo e dos comandos filhos')
+    parser.add_argument('--stat-rate', type=float, metavar='N',
+                        help='Máximo de stats/listagens de arquivos por segundo')
+    parser.add_argument('--command-rate', type=float, metavar='N',
+                        help='Máximo de comandos externos iniciados por segundo')
+    parser.add_argument('--network-concurrency', type=int, metavar='N',
+                        help='Máximo de operações simultâneas em montagens de rede (NFS, CIFS) e consultas NSS/LDAP')
+    parser.add_argument('--deadline', type=float, metavar='SEGUNDOS',
+                        help='Prazo de cada auditoria: ao esgotar, reporta o parcial marcado como incompleto')
+    parser.add_argument('--profile', action='store_true',
+                        help='Exibir tempo por fase/função e os comandos mais lentos ao final')
+    parser.add_argument('--trace', metavar='ARQUIVO',
+                        help='Exportar spans em JSON Trace Event (chrome://tracing, Perfetto)')
     parser.add_argument('--verbose', '-v', action='store_true',
                         help='Modo verbose (debug)')
     parser.add_argument('--no-interactive', action='store_true',
@@ -1301,34 +1784,147 @@ ATENÇÃO: Execute sempre com --dry-run primeiro em produção!
     
     args = parser.parse_args()
     
+    # Argumentos inválidos saem antes de criar diretórios e handlers de log
+    if args.watch and not args.metrics_file:
+        parser.error("--watch requer --metrics-file")
+    if args.fleet_moduli and not args.fleet:
+        parser.error("--fleet-moduli requer --fleet")
+    if not 0 < args.min_density <= 1:
+        parser.error("--min-density deve estar entre 0 (exclusivo) e 1")
+    for option in ('stat_rate', 'command_rate', 'network_concurrency', 'deadline'):
+        value = getattr(args, option)
+        if value is not None and value <= 0:
+            parser.error(f"--{option.replace('_', '-')} deve ser maior que zero")
+    if args.nice is not None and args.nice < 0:
+        parser.error("--nice só aceita incrementos (>= 0): baixar a prioridade, nunca subir")
+    if args.deadline and args.fix and not args.dry_run:
+        parser.error("--deadline não combina com --fix: correções exigem auditoria completa (use --dry-run)")
+    if args.low_impact:
+        args.nice = LOW_IMPACT_NICE if args.nice is None else args.nice
+        args.io_class = args.io_class or 'best-effort'
+        args.stat_rate = args.stat_rate or LOW_IMPACT_STAT_RATE
+        args.command_rate = args.command_rate or LOW_IMPACT_COMMAND_RATE
+        args.network_concurrency = args.network_concurrency or LOW_IMPACT_NETWORK_CONCURRENCY
+    restore_time = None
+    if args.restore_backup and args.restore_backup != 'latest':
+        try:
+            restore_time = datetime.datetime.fromisoformat(args.restore_backup).timestamp()
+        except ValueError:
+            parser.error(f"--restore-backup: data inválida '{args.restore_backup}' (use 'latest' ou AAAA-MM-DD HH:MM)")
+    args.audit = args.audit or bool(args.metrics_file)
+    
     setup_logging(args.verbose)
     
-    if os.geteuid() != 0:
+    # Antes de qualquer thread (COMMAND_RUNNER, pools): prioridade de IO é herdada por thread
+    if args.nice or args.io_class:
+        lower_process_priority(args.nice or 0, args.io_class)
+    LIMITS.configure(args.stat_rate, args.command_rate, args.network_concurrency, args.deadline)
+    if LIMITS.active:
+        logging.info(f"🐢 Modo de baixo impacto: {LIMITS.describe()}")
+    
+    if args.profile or args.trace:
+        TRACER.enable()
+        atexit.register(finish_tracing, args.profile, args.trace)
+    
+    # Modo frota avalia snapshots offline e não requer root
+    if args.fleet:
+        from ssh_fleet import run_fleet_audit
+        sys.exit(0 if run_fleet_audit(args.fleet, args.compliance_profile, args.fleet_json, args.fleet_moduli) else 1)
+    
+    if args.keys_index:
+        from ssh_fleet import run_key_index
+        sys.exit(0 if run_key_index(args.keys_index) else 1)
+    
+    if args.host_keys_report:
+        from ssh_fleet import run_host_key_report
+        sys.exit(0 if run_host_key_report(args.host_keys_report) else 1)
+    
+    # Agregação só lê o banco do Fail2ban e grava o conjunto: não altera o firewall
+    if args.aggregate_bans:
+        from ssh_fix import run_ban_aggregation
+        sys.exit(0 if run_ban_aggregation(args.fail2ban_db, args.bans_file, args.ban_jail, args.allowlist or [],
+                                          args.min_density, args.ban_output, args.ban_format) else 1)
+    
+    # Chaves públicas de host são legíveis sem root: coleta em qualquer raiz
+    if args.host_key_fingerprints:
+        from ssh_fleet import collect_host_keys
+        sys.exit(0 if collect_host_keys(args.host_key_fingerprints, args.root or []) else 1)
+    
+    # Imagens OCI/Docker são lidas camada a camada, sem extrair nem montar
+    if args.scan_images:
+        from ssh_fleet import scan_images
+        sys.exit(0 if scan_images(args.scan_images, args.compliance_profile, args.jobs, args.image_cache) else 1)
+    
+    # Raízes offline (imagens de container/VM): somente auditoria e dry-run
+    offline_roots = [root for root in (args.root or []) if os.path.abspath(root) != '/']
+    if offline_roots:
+        if args.create_user or args.create_users or args.install_fail2ban or (args.fix and not args.dry_run):
+            logging.error("❌ Com --root somente --audit e --fix --dry-run são permitidos")
+            sys.exit(1)
+        missing_roots = [root for root in offline_roots if not os.path.isdir(root)]
+        if missing_roots:
+            logging.error(f"❌ Diretório(s) raiz inexistente(s): {', '.join(missing_roots)}")
+            sys.exit(1)
+        if len(offline_roots) > 1:
+            if args.fix:
+                logging.warning("--fix --dry-run é ignorado com múltiplas raízes")
+            from ssh_audit import run_multi_root_audit
+            sys.exit(0 if run_multi_root_audit(offline_roots, args.compliance_profile, args.jobs) else 1)
+        set_audit_root(LocalRoot(offline_roots[0]))
+        args.audit = args.audit or not args.fix
+    
+    if os.geteuid() != 0 and AUDIT_ROOT.is_live:
         logging.error("❌ Este script requer privilégios de root")
         logging.error("   Execute com: sudo python3 ssh_auditor_v2.py")
         sys.exit(1)
     
+    if args.list_backups:
+        from ssh_fix import BackupStore, format_backups
+        print(format_backups(BackupStore()))
+        return
+    
+    if args.restore_backup:
+        from ssh_fix import restart_ssh_with_retry, restore_point_in_time
+        sys.exit(0 if restore_point_in_time(restore_time)
+                 and restart_ssh_with_retry(drain_timeout=args.drain_timeout, reload=args.reload) else 1)
+    
     # Se nenhum argumento foi passado, iniciar menu interativo
-    if not any([args.audit, args.fix, args.create_user, args.install_fail2ban, args.no_interactive]):
+    if not any([args.audit, args.fix, args.create_user, args.create_users, args.install_fail2ban,
+                args.no_interactive, args.serve]):
+        from ssh_menu import interactive_menu
         interactive_menu()
         return
     
+    try:
+        profile = load_profile(args.compliance_profile)
+    except ValueError as e:
+        logging.error(f"❌ {e}")
+        sys.exit(1)
+    
     logging.info(f"SSH Auditor and Hardening Tool v{VERSION}")
     logging.info(f"Distro detectada: {detect_distro()}")
+    if not AUDIT_ROOT.is_live:
+        logging.info(f"Raiz auditada: {AUDIT_ROOT.hostname()}")
+    logging.info(f"Perfil de conformidade: {profile.name} ({len(profile.rules)} regras)")
     logging.info("=" * 80)
     
+    from ssh_audit import export_metrics, generate_audit_report, record_hardening, run_full_audit, run_metrics_watch
+    
+    if args.serve:
+        from ssh_server import serve
+        sys.exit(0 if serve(args.socket, args.compliance_profile) else 1)
+    
+    if args.watch:
+        sys.exit(0 if run_metrics_watch(args.metrics_file, profile, args.watch) else 1)
+    
     success = True
+    hardened = False
     
     if args.audit or args.fix:
         logging.info("🔍 INICIANDO AUDITORIA...")
         
-        all_issues = {
-            'ssh_config': audit_ssh_config(),
-            'file_permissions': audit_file_permissions(),
-            'host_keys': audit_host_keys(),
-            'authorized_keys': audit_authorized_keys(),
-            'fail2ban': audit_fail2ban()
-        }
+        durations: Dict[str, float] = {}
+        all_issues = run_full_audit(profile, durations)
         
         report = generate_audit_report(all_issues)
         print("\n" + report + "\n")
@@ -1341,13 +1937,18 @@ ATENÇÃO: Execute sempre com --dry-run primeiro em produção!
         except Exception as e:
             logging.warning(f"Não foi possível salvar relatório: {e}")
     
+    if args.fix or args.install_fail2ban or args.create_user or args.create_users:
+        from ssh_fix import (BackupStore, create_sudo_user, create_sudo_users, fix_authorized_keys,
+                             fix_file_permissions, fix_moduli, fix_ssh_config, install_fail2ban,
+                             restart_ssh_with_retry, restore_backup)
+    
     if args.fix:
         logging.info("\n🔧 INICIANDO CORREÇÕES...")
         
         if args.dry_run:
             logging.info("🔍 MODO DRY-RUN ATIVADO")
         
-        if not fix_ssh_config(args.dry_run):
+        if not fix_ssh_config(args.dry_run, profile):
             logging.error("❌ Falha ao corrigir configurações SSH")
             success = False
         
@@ -1359,14 +1960,22 @@ ATENÇÃO: Execute sempre com --dry-run primeiro em produção!
             logging.error("❌ Falha ao corrigir authorized_keys")
             success = False
         
+        if not fix_moduli(args.dry_run):
+            logging.error("❌ Falha ao filtrar moduli")
+            success = False
+        
         if not args.dry_run and success:
-            if not restart_ssh_with_retry():
+            if restart_ssh_with_retry(drain_timeout=args.drain_timeout, reload=args.reload):
+                record_hardening()
+                hardened = True
+            else:
                 logging.error("❌ FALHA CRÍTICA: SSH não reiniciou corretamente")
                 logging.error("   Verifique o serviço manualmente: systemctl status sshd")
                 
-                backups = sorted(Path(BACKUP_DIR).glob('sshd_config.bak_*'))
-                if backups:
-                    latest_backup = str(backups[-1])
+                store = BackupStore()
+                latest = store.latest(SSHD_CONFIG)
+                if latest:
+                    latest_backup = store.object_path(latest.sha256)
                     logging.warning(f"⚠️  Tentando restaurar backup: {latest_backup}")
                     if restore_backup(latest_backup, SSHD_CONFIG):
                         logging.warning("   Backup restaurado. Tentando reiniciar novamente...")
@@ -1386,6 +1995,22 @@ ATENÇÃO: Execute sempre com --dry-run primeiro em produção!
             logging.error(f"❌ Falha ao criar usuário '{args.create_user}'")
             success = False
     
+    if args.create_users:
+        logging.info("\n👥 CRIANDO USUÁRIOS SUDO EM LOTE...")
+        credentials_path = args.credentials_file or \
+            f"/root/ssh_auditor_credentials_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        if not create_sudo_users(args.create_users, credentials_path, args.dry_run):
+            logging.error(f"❌ Falha ao criar usuários de '{args.create_users}'")
+            success = False
+    
+    if args.metrics_file:
+        if hardened or (args.install_fail2ban and not args.dry_run):
+            # Métricas devem refletir o estado após o hardening
+            durations = {}
+            all_issues = run_full_audit(profile, durations)
+        if not export_metrics(args.metrics_file, all_issues, profile, durations):
+            success = False
+    
     logging.info("\n" + "=" * 80)
     if success:
         logging.info("✅ PROCESSO CONCLUÍDO COM SUCESSO")
@@ -0,0 +1,1333 @@
+"""
+SSH Auditor - correções
+
+Backup/restauração, validação e restart do sshd, correções de hardening,
+Fail2ban (instalação e agregação dos banimentos em CIDRs) e criação de
+usuários sudo.
+"""
+
+import os
+import re
+import errno
+import pwd
+import sys
+import grp
+import glob
+import posixpath
+import gzip
+import json
+import time
+import csv
+import bisect
+import string
+import secrets
+import shutil
+import hashlib
+import sqlite3
+import logging
+import datetime
+import ipaddress
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+import ssh_auditor as core
+from ssh_auditor import (BAN_MIN_DENSITY, DEFAULT_PROFILE, FAIL2BAN_DB, ComplianceProfile, SSHDConfigParser,
+                         detect_distro, load_profile, load_sshd_config, log_event, run_command, subsystem_rule,
+                         traced, write_file_atomic)
+from ssh_audit import (MIN_MODULI_BITS, audit_authorized_keys, audit_file_permissions, audit_moduli,
+                       filter_moduli_lines)
+
+# --- Backup, Validação e Restart ---
+# Retenção por arquivo: últimas BACKUP_KEEP versões e no máximo BACKUP_MAX_AGE_DAYS
+# dias; a versão mais recente de cada arquivo nunca é removida
+BACKUP_KEEP = 30
+BACKUP_MAX_AGE_DAYS = 180
+FAIL2BAN_JAIL_FILES = ('/etc/fail2ban/jail.local',)
+FAIL2BAN_JAIL_DIR = "/etc/fail2ban/jail.d"
+FAIL2BAN_JAIL_PATH = os.path.join(FAIL2BAN_JAIL_DIR, "sshd.local")
+FAIL2BAN_BANTIME = 3600
+# Blocos agregados nunca maiores que /16 (IPv4) ou /48 (IPv6)
+BAN_MIN_PREFIX = {4: 16, 6: 48}
+BAN_ALLOWLIST = ('127.0.0.0/8', '::1/128')
+BAN_SET_NAME = 'ssh_auditor_bans'
+BAN_NFT_TABLE = 'ssh_auditor'
+
+class BackupEntry(NamedTuple):
+    """Versão de um arquivo no BackupStore"""
+    timestamp: float
+    sha256: str
+    mode: int
+
+class BackupStore:
+    """Backups endereçados por conteúdo em BACKUP_DIR
+    
+    Cada conteúdo distinto é gravado uma única vez, comprimido, em
+    objects/<sha256>.gz. O index.json mapeia caminho -> versões em ordem
+    cronológica: a mais recente é a última da lista e a versão vigente em um
+    instante é achada por bisseção, sem listar o diretório.
+    """
+    INDEX_VERSION = 1
+    
+    def __init__(self, directory: str = None, keep: int = BACKUP_KEEP, max_age_days: int = BACKUP_MAX_AGE_DAYS):
+        self.directory = directory or core.BACKUP_DIR
+        self.keep = keep
+        self.max_age = max_age_days * 86400
+        self._index: Optional[Dict[str, List[BackupEntry]]] = None
+    
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, 'index.json')
+    
+    def object_path(self, sha256: str) -> str:
+        return os.path.join(self.directory, 'objects', sha256[:2], f"{sha256}.gz")
+    
+    @property
+    def index(self) -> Dict[str, List[BackupEntry]]:
+        if self._index is None:
+            try:
+                with open(self.index_path) as f:
+                    data = json.load(f)
+                self._index = {path: [BackupEntry(*version) for version in versions]
+                               for path, versions in data['files'].items()}
+            except FileNotFoundError:
+                self._index = {}
+        return self._index
+    
+    def _write_index(self):
+        data = {'version': self.INDEX_VERSION,
+                'files': {path: [list(entry) for entry in versions] for path, versions in self.index.items()}}
+        write_file_atomic(self.index_path, json.dumps(data, indent=1), 0o600)
+    
+    def save(self, paths: List[str], timestamp: float = None) -> Dict[str, BackupEntry]:
+        """Grava a versão atual dos arquivos; conteúdo já guardado só ganha uma entrada no índice"""
+        timestamp = timestamp or time.time()
+        saved = {}
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        for path in paths:
+            with open(path, 'rb') as f:
+                content = f.read()
+            mode = os.stat(path).st_mode & 0o7777
+            sha256 = hashlib.sha256(content).hexdigest()
+            
+            object_path = self.object_path(sha256)
+            if not os.path.exists(object_path):
+                os.makedirs(os.path.dirname(object_path), mode=0o700, exist_ok=True)
+                # mtime fixo: o mesmo conteúdo gera sempre o mesmo .gz
+                write_file_atomic(object_path, gzip.compress(content, mtime=0), 0o600)
+            
+            versions = self.index.setdefault(path, [])
+            if versions and versions[-1].sha256 == sha256 and versions[-1].mode == mode:
+                # Inalterado desde o último backup: a versão vigente já é essa
+                saved[path] = versions[-1]
+                continue
+            # Relógio que volta não pode quebrar a ordem usada na bisseção
+            entry = BackupEntry(max(timestamp, versions[-1].timestamp) if versions else timestamp, sha256, mode)
+            versions.append(entry)
+            saved[path] = entry
+        
+        self.prune(timestamp)
+        self._write_index()
+        return saved
+    
+    def latest(self, path: str) -> Optional[BackupEntry]:
+        versions = self.index.get(path)
+        return versions[-1] if versions else None
+    
+    def at(self, path: str, timestamp: float) -> Optional[BackupEntry]:
+        """Versão vigente em 'timestamp' (a última gravada até esse instante)"""
+        versions = self.index.get(path, [])
+        position = bisect.bisect_right([entry.timestamp for entry in versions], timestamp)
+        return versions[position - 1] if position else None
+    
+    def read(self, entry: BackupEntry) -> bytes:
+        with gzip.open(self.object_path(entry.sha256), 'rb') as f:
+            return f.read()
+    
+    def restore(self, path: str, entry: BackupEntry):
+        write_file_atomic(path, self.read(entry), entry.mode)
+    
+    def prune(self, now: float = None):
+        """Aplica a retenção e remove objetos que nenhuma versão referencia"""
+        now = now or time.time()
+        removed = 0
+        for path, versions in self.index.items():
+            kept = [entry for entry in versions[-self.keep:-1] if now - entry.timestamp <= self.max_age]
+            kept.append(versions[-1])
+            removed += len(versions) - len(kept)
+            versions[:] = kept
+        if not removed:
+            return
+        
+        referenced = {entry.sha256 for versions in self.index.values() for entry in versions}
+        objects_dir = os.path.join(self.directory, 'objects')
+        for current, _, filenames in os.walk(objects_dir):
+            for name in filenames:
+                if name.endswith('.gz') and name[:-3] not in referenced:
+                    os.unlink(os.path.join(current, name))
+        logging.debug(f"Retenção de backups: {removed} versão(ões) removida(s)")
+
+def format_backups(store: BackupStore) -> str:
+    """Versões guardadas por arquivo, da mais recente para a mais antiga"""
+    if not store.index:
+        return f"Nenhum backup em {store.directory}"
+    lines = []
+    for path, versions in sorted(store.index.items()):
+        lines.append(path)
+        for entry in reversed(versions):
+            when = datetime.datetime.fromtimestamp(entry.timestamp).strftime('%Y-%m-%d %H:%M:%S')
+            lines.append(f"   {when}  {entry.sha256[:12]}  {oct(entry.mode)}")
+    return "\n".join(lines)
+
+def backup_targets() -> List[str]:
+    """Arquivos salvos junto com o sshd_config: includes de sshd_config.d e jails do Fail2ban"""
+    paths = [core.SSHD_CONFIG]
+    paths.extend(sorted(glob.glob(os.path.join(core.SSH_DIR, 'sshd_config.d', '*.conf'))))
+    paths.extend(path for path in FAIL2BAN_JAIL_FILES if os.path.isfile(path))
+    paths.extend(sorted(glob.glob(os.path.join(FAIL2BAN_JAIL_DIR, '*.local')) +
+                        glob.glob(os.path.join(FAIL2BAN_JAIL_DIR, '*.conf'))))
+    return paths
+
+def backup_config(filepath: str, related: List[str] = ()) -> Optional[str]:
+    """Salva o arquivo (e 'related', no mesmo instante) no BackupStore; retorna o objeto do backup"""
+    paths = [filepath] + [path for path in related if path != filepath]
+    try:
+        store = BackupStore()
+        entry = store.save(paths)[filepath]
+        backup_path = store.object_path(entry.sha256)
+        
+        log_event('backup_created', f"Backup criado: {backup_path}", {
+            'original_file': filepath,
+            'backup_file': backup_path,
+            'files': len(paths)
+        })
+        return backup_path
+    except Exception as e:
+        logging.error(f"Falha ao criar backup de '{filepath}': {e}")
+        return None
+
+def restore_backup(backup_path: str, original_path: str) -> bool:
+    """Restaura arquivo de backup (objeto .gz do BackupStore ou cópia .bak_* antiga)"""
+    try:
+        if backup_path.endswith('.gz'):
+            with gzip.open(backup_path, 'rb') as f:
+                content = f.read()
+            mode = os.stat(original_path).st_mode & 0o7777 if os.path.exists(original_path) else 0o600
+            write_file_atomic(original_path, content, mode)
+        else:
+            shutil.copy2(backup_path, original_path)
+        log_event('backup_restored', f"Backup restaurado: {backup_path} -> {original_path}", {
+            'backup_file': backup_path,
+            'restored_to': original_path
+        }, level='WARNING')
+        return True
+    except Exception as e:
+        logging.error(f"Falha ao restaurar backup '{backup_path}': {e}")
+        return False
+
+def restore_point_in_time(timestamp: Optional[float] = None) -> bool:
+    """Restaura os arquivos do BackupStore como estavam em 'timestamp' (None: último backup do sshd_config)
+    
+    Arquivos sem versão até esse instante não são tocados. O estado atual é
+    salvo antes; se o sshd_config restaurado não passar no sshd -t, os
+    arquivos voltam a esse estado.
+    """
+    store = BackupStore()
+    if timestamp is None:
+        latest = store.latest(core.SSHD_CONFIG)
+        if latest is None:
+            logging.error(f"Nenhum backup de {core.SSHD_CONFIG} em {store.directory}")
+            return False
+        timestamp = latest.timestamp
+    
+    targets = {}
+    for path in sorted(store.index):
+        entry = store.at(path, timestamp)
+        if entry is None:
+            continue
+        try:
+            with open(path, 'rb') as f:
+                unchanged = hashlib.sha256(f.read()).hexdigest() == entry.sha256
+        except FileNotFoundError:
+            unchanged = False
+        if not unchanged:
+            targets[path] = entry
+    
+    when = datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+    if not targets:
+        logging.info(f"✅ Arquivos já estão como em {when}")
+        return True
+    
+    current = store.save([path for path in targets if os.path.exists(path)])
+    try:
+        for path, entry in targets.items():
+            store.restore(path, entry)
+            logging.info(f"Restaurado: {path} ({when})")
+    except OSError as e:
+        logging.error(f"Falha ao restaurar backup: {e}")
+        return False
+    
+    if not validate_sshd_config():
+        logging.error("❌ VALIDAÇÃO FALHOU: voltando ao estado anterior à restauração...")
+        for path, entry in current.items():
+            store.restore(path, entry)
+        return False
+    
+    log_event('backup_restored', f"Configuração restaurada para {when}", {
+        'timestamp': timestamp,
+        'files': sorted(targets)
+    }, level='WARNING')
+    return True
+
+@traced('fix')
+def validate_sshd_config(config_path: str = None) -> bool:
+    """Valida sintaxe do sshd_config usando sshd -t"""
+    config_path = config_path or core.SSHD_CONFIG
+    logging.info(f"Validando sintaxe de '{config_path}'...")
+    result = run_command(['sshd', '-t', '-f', config_path], check=False)
+    
+    if result.returncode == 0:
+        logging.info("✅ Sintaxe do sshd_config válida")
+        return True
+    else:
+        logging.error(f"❌ Sintaxe inválida no sshd_config:\n{result.stderr}")
+        return False
+
+# Sondagem de sessões por /proc: processos sshd de sessão (filhos de outro sshd)
+# e seus sockets TCP estabelecidos. Conta também SFTP e port-forwards (sem pty)
+PROC_DIR = "/proc"
+SSHD_PROCESS_NAMES = ('sshd', 'sshd-session')
+# Processos que ainda não autenticaram ou que só escutam não seguram sessões
+# ('[accepted]' é o monitor de uma conexão antes da autenticação)
+SSHD_IDLE_MARKERS = (b'[preauth]', b'[accepted]', b'[listener]', b'[net]')
+TCP_ESTABLISHED = '01'
+DRAIN_POLL_INTERVAL = 5
+
+def _process_stat(proc_dir: str, pid) -> Optional[Tuple[str, int]]:
+    """(nome, ppid) de /proc/<pid>/stat; None se o processo não existe mais"""
+    try:
+        with open(os.path.join(proc_dir, str(pid), 'stat')) as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # O nome (comm) pode conter espaços e parênteses: o último ')' delimita
+    name_end = stat.rfind(')')
+    return stat[stat.find('(') + 1:name_end], int(stat[name_end + 2:].split()[1])
+
+def _sshd_processes(proc_dir: str) -> Dict[int, int]:
+    """pid -> ppid dos processos sshd (lidos de /proc/<pid>/stat)"""
+    processes = {}
+    for entry in os.scandir(proc_dir):
+        if not entry.name.isdigit():
+            continue
+        info = _process_stat(proc_dir, entry.name)
+        if info is not None and info[0] in SSHD_PROCESS_NAMES:
+            processes[int(entry.name)] = info[1]
+    return processes
+
+def _ancestors(proc_dir: str, pid: int) -> Set[int]:
+    """pid e seus ancestrais pela cadeia de PPID (a sessão de quem executa a ferramenta)"""
+    chain = set()
+    while pid > 1 and pid not in chain:
+        chain.add(pid)
+        info = _process_stat(proc_dir, pid)
+        if info is None:
+            break
+        pid = info[1]
+    return chain
+
+def _established_sockets(proc_dir: str) -> Set[int]:
+    """Inodes dos sockets TCP (IPv4 e IPv6) em ESTABLISHED"""
+    inodes = set()
+    for table in ('tcp', 'tcp6'):
+        try:
+            with open(os.path.join(proc_dir, 'net', table)) as f:
+                next(f, None)
+                for line in f:
+                    fields = line.split()
+                    if len(fields) > 9 and fields[3] == TCP_ESTABLISHED:
+                        inodes.add(int(fields[9]))
+        except OSError:
+            continue
+    return inodes
+
+def _process_sockets(proc_dir: str, pid: int) -> Set[int]:
+    fd_dir = os.path.join(proc_dir, str(pid), 'fd')
+    inodes = set()
+    try:
+        for fd in os.listdir(fd_dir):
+            try:
+                target = os.readlink(os.path.join(fd_dir, fd))
+            except OSError:
+                continue
+            if target.startswith('socket:['):
+                inodes.add(int(target[8:-1]))
+    except OSError:
+        pass
+    return inodes
+
+def probe_ssh_sessions(proc_dir: str = None, own_pid: int = None) -> int:
+    """Conexões TCP estabelecidas que sessões SSH autenticadas mantêm (inclui SFTP e port-forwards)
+    
+    A sessão de quem executa a ferramenta (sshd ancestral de own_pid, padrão
+    o próprio processo) não conta: ela nunca drenaria antes do restart.
+    """
+    proc_dir = proc_dir or PROC_DIR
+    processes = _sshd_processes(proc_dir)
+    # Processos de sessão descendem do sshd que escuta; o monitor [priv] e o
+    # processo do usuário compartilham o mesmo socket, contado uma vez
+    session_pids = [pid for pid, ppid in processes.items() if ppid in processes]
+    if not session_pids:
+        return 0
+    
+    established = _established_sockets(proc_dir)
+    own_sockets = set()
+    for pid in _ancestors(proc_dir, own_pid or os.getpid()):
+        if pid in processes:
+            own_sockets |= _process_sockets(proc_dir, pid)
+    established -= own_sockets
+    sockets = set()
+    for pid in session_pids:
+        try:
+            with open(os.path.join(proc_dir, str(pid), 'cmdline'), 'rb') as f:
+                cmdline = f.read()
+        except OSError:
+            continue
+        if any(marker in cmdline for marker in SSHD_IDLE_MARKERS):
+            continue
+        sockets |= _process_sockets(proc_dir, pid) & established
+    return len(sockets)
+
+def check_active_ssh_sessions() -> int:
+    """Verifica número de sessões SSH ativas (/proc; 'who' quando /proc não está disponível)"""
+    if os.path.isdir(os.path.join(PROC_DIR, 'net')):
+        try:
+            return probe_ssh_sessions()
+        except OSError as e:
+            logging.debug(f"Sondagem de sessões por /proc falhou: {e}")
+    try:
+        result = run_command(['who'], check=False)
+        sessions = [line for line in result.stdout.split('\n') if 'pts/' in line]
+        return len(sessions)
+    except Exception:
+        return 0
+
+def wait_for_ssh_drain(timeout: float, max_sessions: int = 0,
+                       poll_interval: float = DRAIN_POLL_INTERVAL) -> bool:
+    """Aguarda as sessões SSH caírem para max_sessions ou menos; False se o prazo acabar antes"""
+    deadline = time.monotonic() + timeout
+    last_count = None
+    while True:
+        sessions = check_active_ssh_sessions()
+        if sessions <= max_sessions:
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        if sessions != last_count:
+            logging.info(f"⏳ {sessions} sessão(ões) SSH ativa(s); aguardando drenagem (até {remaining:.0f}s)")
+            last_count = sessions
+        time.sleep(min(poll_interval, remaining))
+
+@traced('fix')
+def restart_ssh_with_retry(max_retries: int = 3, retry_delay: int = 2,
+                           drain_timeout: float = 0, reload: bool = False) -> bool:
+    """Reinicia (ou recarrega) SSH com retry e rollback automático em caso de falha
+    
+    Com drain_timeout, o restart espera até esse prazo (segundos) as sessões
+    ativas terminarem; esgotado o prazo, segue com o restart assim mesmo.
+    """
+    action = 'reload' if reload else 'restart'
+    
+    active_sessions = check_active_ssh_sessions()
+    waited = 0.0
+    if active_sessions > 0 and drain_timeout > 0 and not reload:
+        start = time.monotonic()
+        drained = wait_for_ssh_drain(drain_timeout)
+        waited = time.monotonic() - start
+        if not drained:
+            active_sessions = check_active_ssh_sessions()
+            logging.warning(f"⚠️  Prazo de drenagem ({drain_timeout:.0f}s) esgotado com "
+                            f"{active_sessions} sessão(ões) ativa(s)")
+        else:
+            active_sessions = 0
+    if active_sessions > 0 and not reload:
+        logging.warning(f"⚠️  ATENÇÃO: {active_sessions} sessão(ões) SSH ativa(s) detectada(s)")
+        logging.warning("⚠️  O restart pode desconectar usuários ativos")
+    
+    logging.info("Recarregando serviço SSH..." if reload else "Reiniciando serviço SSH...")
+    try:
+        run_command(['systemctl', action, 'sshd'])
+    except Exception as e:
+        logging.error(f"Falha ao executar {action}: {e}")
+        return False
+    
+    for attempt in range(1, max_retries + 1):
+        time.sleep(retry_delay * attempt)
+        
+        result = run_command(['systemctl', 'is-active', 'sshd'], check=False)
+        status = result.stdout.strip()
+        
+        if status == 'active':
+            log_event('ssh_restarted', "Serviço SSH reiniciado com sucesso", {
+                'attempts': attempt,
+                'status': status,
+                'action': action,
+                'drain_wait_s': round(waited, 1),
+                'sessions_at_restart': active_sessions
+            })
+            return True
+        
+        logging.warning(f"Tentativa {attempt}/{max_retries}: SSH status = {status}")
+    
+    logging.error(f"❌ SSH não está ativo após {max_retries} tentativas")
+    return False
+
+def generate_secure_password(length: int = 20) -> str:
+    """Gera senha segura com requisitos de complexidade (CSPRNG do módulo secrets)"""
+    letters = string.ascii_letters.replace('O', '').replace('l', '').replace('I', '')
+    digits = string.digits.replace('0', '').replace('1', '')
+    # Sem ':' (separador de campos do newusers/chpasswd)
+    symbols = '!@#$%^&*()-_=+[]{}|;,.<>?'
+    
+    password = [
+        secrets.choice(string.ascii_uppercase.replace('O', '').replace('I', '')),
+        secrets.choice(string.ascii_lowercase.replace('l', '')),
+        secrets.choice(digits),
+        secrets.choice(symbols)
+    ]
+    
+    all_chars = letters + digits + symbols
+    password.extend(secrets.choice(all_chars) for _ in range(length - 4))
+    
+    secrets.SystemRandom().shuffle(password)
+    return ''.join(password)
+
+def validate_username(username: str) -> bool:
+    """Valida username segundo POSIX.1-2008"""
+    pattern = r'^[a-z_][a-z0-9_-]{0,31}$'
+    return bool(re.match(pattern, username))
+# --- Plano de Correções ---
+# Cada ação é um dict serializável: {'action': 'chmod', 'path', 'mode'},
+# {'action': 'chown', 'path', 'owner', 'group'} ou {'action': 'filter_moduli',
+# 'path', 'remove', 'keep'}; o dry-run e o servidor expõem o plano
+def plan_ssh_config(profile: Optional[ComplianceProfile] = None,
+                    parser: Optional[SSHDConfigParser] = None) -> List[Dict]:
+    """Parâmetros do sshd_config que fix_ssh_config alteraria (atual -> recomendado)"""
+    parser = parser or load_sshd_config()
+    profile = profile or load_profile(DEFAULT_PROFILE)
+    
+    extra_rules = [] if profile.has_rule('Subsystem') else [subsystem_rule()]
+    return [{'parameter': issue.parameter, 'current': issue.get('current'),
+             'recommended': issue.recommended, 'severity': issue.severity.name}
+            for issue in profile.evaluate(parser.config, extra_rules)]
+
+def plan_file_permissions() -> List[Dict]:
+    """Ações que fix_file_permissions aplicaria"""
+    actions = []
+    for issue in audit_file_permissions():
+        if issue.type == 'missing_file':
+            logging.warning(f"Arquivo ausente: {issue.path}")
+        elif issue.type in ('unexpected_symlink', 'shared_home'):
+            logging.warning(f"Não corrigido automaticamente ({issue.type}): {issue.path}")
+        elif issue.type == 'wrong_permissions':
+            actions.append({'action': 'chmod', 'path': issue.path, 'mode': issue.expected})
+        elif issue.type == 'wrong_ownership':
+            # 'dono:grupo', ou só 'dono' quando a política não verifica o grupo (~/.ssh)
+            owner, _, group = issue.expected.partition(':')
+            actions.append({'action': 'chown', 'path': issue.path, 'owner': owner, 'group': group or None})
+    return actions
+
+def plan_authorized_keys() -> List[Dict]:
+    """Ações que fix_authorized_keys aplicaria (issues de conteúdo exigem revisão manual)"""
+    actions = []
+    for issue in audit_authorized_keys():
+        if issue.type == 'insecure_authorized_keys':
+            actions.append({'action': 'chmod', 'path': issue.path, 'mode': '0o600'})
+        elif issue.type == 'wrong_authorized_keys_owner':
+            actions.append({'action': 'chown', 'path': issue.path, 'owner': issue.user, 'group': issue.user})
+    return actions
+
+def plan_moduli() -> List[Dict]:
+    """Ação que fix_moduli aplicaria: reescrever o moduli sem os grupos fracos"""
+    return [{'action': 'filter_moduli', 'path': issue.path, 'remove': issue.weak_groups,
+             'keep': issue.total_groups - issue.weak_groups}
+            for issue in audit_moduli()]
+
+def plan_fixes(profile: Optional[ComplianceProfile] = None) -> Dict[str, List[Dict]]:
+    """Plano completo do --fix --dry-run, sem alterar nada"""
+    return {
+        'ssh_config': plan_ssh_config(profile),
+        'file_permissions': plan_file_permissions(),
+        'authorized_keys': plan_authorized_keys(),
+        'moduli': plan_moduli(),
+    }
+
+def open_no_follow(path: str) -> int:
+    """fd do caminho sem seguir o último componente
+    
+    Componentes intermediários são abertos um a um com O_NOFOLLOW; um link só
+    é seguido se pertencer ao root (ex: /home -> /var/home), como no
+    fs.protected_symlinks. Um usuário que troque ~/.ssh ou um arquivo dele por
+    um link entre a auditoria e a correção recebe ELOOP, não o chown do alvo.
+    """
+    flags = os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK | os.O_NOCTTY | os.O_CLOEXEC
+    parts = [part for part in os.path.normpath(path).split('/') if part]
+    fd = os.open('/', os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC)
+    try:
+        for part in parts[:-1]:
+            try:
+                child = os.open(part, flags | os.O_DIRECTORY, dir_fd=fd)
+            except OSError as e:
+                if e.errno != errno.ELOOP or os.stat(part, dir_fd=fd, follow_symlinks=False).st_uid != 0:
+                    raise
+                child = os.open(part, (flags & ~os.O_NOFOLLOW) | os.O_DIRECTORY, dir_fd=fd)
+            os.close(fd)
+            fd = child
+        return os.open(parts[-1], flags, dir_fd=fd) if parts else os.dup(fd)
+    finally:
+        os.close(fd)
+
+def apply_fix_action(action: Dict, dry_run: bool = False) -> bool:
+    """Aplica uma ação do plano; retorna True se aplicada (ou simulada)
+    
+    chmod/chown são feitos no fd de open_no_follow: nunca alteram o alvo de um link.
+    """
+    filepath = action['path']
+    try:
+        if action['action'] == 'chmod':
+            if not dry_run:
+                fd = open_no_follow(filepath)
+                try:
+                    os.fchmod(fd, int(action['mode'], 8))
+                finally:
+                    os.close(fd)
+            logging.info(f"Corrigido: {filepath} -> {action['mode']}")
+        else:
+            if not dry_run:
+                uid = pwd.getpwnam(action['owner']).pw_uid
+                gid = grp.getgrnam(action['group']).gr_gid if action['group'] else -1
+                fd = open_no_follow(filepath)
+                try:
+                    os.fchown(fd, uid, gid)
+                finally:
+                    os.close(fd)
+            owner = action['owner'] + (f":{action['group']}" if action['group'] else '')
+            logging.info(f"Corrigido: {filepath} -> {owner}")
+        return True
+    except Exception as e:
+        logging.error(f"Erro ao corrigir {filepath}: {e}")
+        return False
+
+# --- Correções (Hardening) ---
+@traced('fix')
+def fix_ssh_config(dry_run: bool = False, profile: Optional[ComplianceProfile] = None) -> bool:
+    """Aplica correções no sshd_config (somente parâmetros fora do perfil)"""
+    logging.info("Iniciando correção de configurações SSH...")
+    
+    if dry_run:
+        logging.info("🔍 MODO DRY-RUN: Simulação sem alterações reais")
+    
+    parser = load_sshd_config()
+    profile = profile or load_profile(DEFAULT_PROFILE)
+    updates = {change['parameter']: change['recommended'] for change in plan_ssh_config(profile, parser)}
+    
+    if not updates:
+        logging.info(f"✅ sshd_config já está em conformidade com o perfil '{profile.name}'")
+        return True
+    
+    new_lines = parser.update_config(updates)
+    
+    if dry_run:
+        logging.info(f"Dry-Run: {len(updates)} parâmetros seriam atualizados")
+        return True
+    
+    backup_path = backup_config(core.SSHD_CONFIG, backup_targets())
+    if not backup_path:
+        logging.error("Não foi possível criar backup. Abortando correção.")
+        return False
+    
+    try:
+        with open(core.SSHD_CONFIG, 'w') as f:
+            f.writelines(new_lines)
+        
+        log_event('config_updated', f"Configuração SSH atualizada", {
+            'backup': backup_path,
+            'parameters_updated': len(updates)
+        })
+    except Exception as e:
+        logging.error(f"Falha ao escrever {core.SSHD_CONFIG}: {e}")
+        return False
+    
+    if not validate_sshd_config():
+        logging.error("❌ VALIDAÇÃO FALHOU: Restaurando backup...")
+        restore_backup(backup_path, core.SSHD_CONFIG)
+        return False
+    
+    return True
+
+@traced('fix')
+def fix_file_permissions(dry_run: bool = False) -> bool:
+    """Corrige permissões de arquivos SSH"""
+    logging.info("Iniciando correção de permissões...")
+    
+    if dry_run:
+        logging.info("🔍 MODO DRY-RUN: Simulação sem alterações reais")
+    
+    fixed_count = sum(apply_fix_action(action, dry_run) for action in plan_file_permissions())
+    
+    if dry_run:
+        logging.info(f"Dry-Run: {fixed_count} permissões seriam corrigidas")
+    else:
+        logging.info(f"✅ {fixed_count} permissões corrigidas")
+    
+    return True
+
+@traced('fix')
+def fix_authorized_keys(dry_run: bool = False) -> bool:
+    """Corrige permissões de authorized_keys"""
+    logging.info("Iniciando correção de authorized_keys...")
+    
+    if dry_run:
+        logging.info("🔍 MODO DRY-RUN: Simulação sem alterações reais")
+    
+    fixed_count = sum(apply_fix_action(action, dry_run) for action in plan_authorized_keys())
+    
+    if dry_run:
+        logging.info(f"Dry-Run: {fixed_count} authorized_keys seriam corrigidos")
+    else:
+        logging.info(f"✅ {fixed_count} authorized_keys corrigidos")
+    
+    return True
+
+@traced('fix')
+def fix_moduli(dry_run: bool = False) -> bool:
+    """Remove do moduli os grupos Diffie-Hellman com menos de MIN_MODULI_BITS bits (com backup)"""
+    logging.info("Iniciando filtragem do moduli...")
+    
+    if dry_run:
+        logging.info("🔍 MODO DRY-RUN: Simulação sem alterações reais")
+    
+    for action in plan_moduli():
+        moduli_path = action['path']
+        if not action['keep']:
+            # Um moduli vazio faria o sshd recorrer aos grupos fixos: exige regeneração manual
+            logging.error(f"❌ {moduli_path} não tem grupos com {MIN_MODULI_BITS}+ bits. Gere novos com "
+                          f"'ssh-keygen -M generate -O bits={MIN_MODULI_BITS}' e 'ssh-keygen -M screen'")
+            return False
+        
+        if dry_run:
+            logging.info(f"Dry-Run: {action['remove']} grupos fracos seriam removidos de {moduli_path} "
+                         f"({action['keep']} mantidos)")
+            continue
+        
+        backup_path = backup_config(moduli_path)
+        if not backup_path:
+            logging.error("Não foi possível criar backup. Abortando filtragem do moduli.")
+            return False
+        
+        try:
+            mode = os.stat(moduli_path).st_mode & 0o7777
+            with open(moduli_path) as f:
+                content = ''.join(filter_moduli_lines(f))
+            write_file_atomic(moduli_path, content, mode)
+        except OSError as e:
+            logging.error(f"Falha ao filtrar {moduli_path}: {e}")
+            return False
+        
+        log_event('moduli_filtered', f"Grupos fracos removidos de {moduli_path}", {
+            'backup': backup_path,
+            'removed': action['remove'],
+            'kept': action['keep']
+        })
+    
+    return True
+
+# --- Fail2ban ---
+@traced('fix')
+def install_fail2ban(dry_run: bool = False) -> bool:
+    """Instala e configura Fail2ban"""
+    logging.info("Verificando Fail2ban...")
+    
+    if dry_run:
+        logging.info("🔍 MODO DRY-RUN: Simulação sem alterações reais")
+    
+    try:
+        result = run_command(['systemctl', 'is-active', 'fail2ban'], check=False)
+        if result.stdout.strip() == 'active':
+            logging.info("✅ Fail2ban já está ativo")
+            return True
+    except FileNotFoundError:
+        pass
+    
+    distro = detect_distro()
+    
+    try:
+        if distro == 'debian':
+            if not dry_run:
+                run_command(['apt-get', 'update', '-y'])
+                run_command(['apt-get', 'install', 'fail2ban', '-y'])
+            logging.info("Fail2ban instalado (Debian)")
+        
+        elif distro == 'rhel':
+            if not dry_run:
+                run_command(['yum', 'install', 'epel-release', '-y'])
+                run_command(['yum', 'install', 'fail2ban', '-y'])
+            logging.info("Fail2ban instalado (RHEL)")
+        
+        else:
+            logging.warning(f"Distro '{distro}' não suportada para instalação automática")
+            return False
+    
+    except Exception as e:
+        logging.error(f"Erro ao instalar Fail2ban: {e}")
+        return False
+    
+    jail_config = f"""[sshd]
+enabled = true
+port = ssh
+filter = sshd
+logpath = /var/log/auth.log
+maxretry = 3
+bantime = {FAIL2BAN_BANTIME}
+findtime = 600
+"""
+    
+    jail_path = FAIL2BAN_JAIL_PATH
+    
+    if not dry_run:
+        try:
+            if os.path.exists(jail_path) and not backup_config(jail_path):
+                return False
+            with open(jail_path, 'w') as f:
+                f.write(jail_config)
+            logging.info(f"Configuração criada: {jail_path}")
+        except Exception as e:
+            logging.error(f"Erro ao criar {jail_path}: {e}")
+            return False
+        
+        run_command(['systemctl', 'enable', 'fail2ban'])
+        run_command(['systemctl', 'start', 'fail2ban'])
+        
+        result = run_command(['systemctl', 'is-active', 'fail2ban'], check=False)
+        if result.stdout.strip() == 'active':
+            logging.info("✅ Fail2ban ativo e configurado")
+            return True
+        else:
+            logging.error("❌ Fail2ban não está ativo após configuração")
+            return False
+    else:
+        logging.info("Dry-Run: Fail2ban seria instalado e configurado")
+        return True
+
+# --- Agregação de Banimentos (Fail2ban) ---
+def fail2ban_ignoreip(paths: List[str] = None) -> List[str]:
+    """Entradas de ignoreip dos jails (IPs/CIDRs; nomes de host são descartados depois)"""
+    if paths is None:
+        paths = list(FAIL2BAN_JAIL_FILES) + sorted(glob.glob(os.path.join(FAIL2BAN_JAIL_DIR, '*.local'))
+                                                   + glob.glob(os.path.join(FAIL2BAN_JAIL_DIR, '*.conf')))
+    entries = []
+    for path in paths:
+        try:
+            with open(path) as f:
+                for line in f:
+                    match = re.match(r'\s*ignoreip\s*=\s*(.*)', line)
+                    if match:
+                        entries.extend(entry for entry in re.split(r'[\s,]+', match.group(1)) if entry)
+        except OSError:
+            continue
+    return entries
+
+def load_fail2ban_bans(db_path: str = FAIL2BAN_DB, jail: Optional[str] = None,
+                       now: Optional[float] = None) -> List[str]:
+    """IPs banidos agora segundo o banco SQLite do Fail2ban (somente leitura)
+
+    Fail2ban >= 0.11 guarda os banimentos vigentes em 'bips' (com bantime);
+    versões antigas só têm 'bans', e aí vale o bantime do jail instalado.
+    """
+    now = time.time() if now is None else now
+    connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        table = 'bips' if 'bips' in tables else 'bans'
+        if table not in tables:
+            raise ValueError(f"{db_path} não parece um banco do Fail2ban (sem tabela 'bans')")
+        columns = {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}
+        query = f"SELECT DISTINCT ip FROM {table} WHERE "
+        if 'bantime' in columns:
+            query += "(bantime < 0 OR timeofban + bantime > ?)"
+            params: list = [now]
+        else:
+            query += "timeofban > ?"
+            params = [now - FAIL2BAN_BANTIME]
+        if jail:
+            query += " AND jail = ?"
+            params.append(jail)
+        return [row[0] for row in connection.execute(query, params)]
+    finally:
+        connection.close()
+
+def load_ban_dump(path: str) -> List[str]:
+    """IPs de um dump: um por linha, 'fail2ban-client status <jail>', 'ipset save' ou 'nft list set'
+
+    Blocos CIDR maiores que um host são devolvidos como estão (a agregação
+    os conta como inválidos): lê-los como o endereço de rede banindo um só
+    host esconderia o bloco inteiro.
+    """
+    addresses = []
+    with open(path) as f:
+        for token in re.findall(r'[0-9A-Fa-f:.]{3,}(?:/\d{1,3})?', f.read()):
+            try:
+                network = ipaddress.ip_network(token, strict=False)
+            except ValueError:
+                continue
+            addresses.append(str(network.network_address) if network.num_addresses == 1 else token)
+    return addresses
+
+def parse_allowlist(entries: List[str]) -> List[ipaddress._BaseNetwork]:
+    """Redes da allowlist: cada entrada é IP, CIDR ou arquivo com um por linha (# comenta)"""
+    networks = []
+    for entry in entries:
+        values = [entry]
+        if os.path.isfile(entry):
+            with open(entry) as f:
+                values = [line.split('#', 1)[0].strip() for line in f]
+        for value in values:
+            if not value:
+                continue
+            try:
+                networks.append(ipaddress.ip_network(value, strict=False))
+            except ValueError:
+                logging.debug(f"Allowlist: '{value}' ignorado (não é IP/CIDR)")
+    return networks
+
+def _merge_ranges(networks: List[ipaddress._BaseNetwork]) -> Tuple[List[int], List[int]]:
+    """Intervalos [início, fim] ordenados e sem sobreposição"""
+    starts: List[int] = []
+    ends: List[int] = []
+    for network in sorted(networks, key=lambda net: int(net.network_address)):
+        start, end = int(network.network_address), int(network.broadcast_address)
+        if ends and start <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+def _touches_ranges(ranges: Tuple[List[int], List[int]], first: int, last: int) -> bool:
+    starts, ends = ranges
+    position = bisect.bisect_right(starts, last) - 1
+    return position >= 0 and ends[position] >= first
+
+def aggregate_addresses(values: List[int], bits: int, allowed: Tuple[List[int], List[int]],
+                        min_density: float, min_prefix: int) -> List[Tuple[int, int]]:
+    """Menor conjunto de blocos CIDR (rede, prefixo) que cobre todos os valores
+
+    Um bloco é aceito se pelo menos min_density dos seus endereços estão banidos,
+    se não é maior que /min_prefix e se não toca a allowlist. A busca desce da
+    maior rede para as metades: o primeiro bloco aceito em cada ramo é ótimo
+    para ele (nunca usa mais regras que os filhos).
+    """
+    values = sorted(set(values))
+    blocks = []
+    index = 0
+    while index < len(values):
+        # Cada rede /min_prefix com endereços banidos é uma raiz independente
+        root = values[index] >> (bits - min_prefix) << (bits - min_prefix)
+        end = bisect.bisect_left(values, root + (1 << (bits - min_prefix)), index)
+        stack = [(root, min_prefix, index, end)]
+        while stack:
+            network, prefix, low, high = stack.pop()
+            size = 1 << (bits - prefix)
+            count = high - low
+            if count == 1 and size > 1:
+                blocks.append((values[low], bits))
+                continue
+            if count >= min_density * size and not _touches_ranges(allowed, network, network + size - 1):
+                blocks.append((network, prefix))
+                continue
+            half = size >> 1
+            middle = bisect.bisect_left(values, network + half, low, high)
+            if high > middle:
+                stack.append((network + half, prefix + 1, middle, high))
+            if middle > low:
+                stack.append((network, prefix + 1, low, middle))
+        index = end
+    return blocks
+
+def aggregate_bans(addresses: List[str], allowlist: List[ipaddress._BaseNetwork],
+                   min_density: float = BAN_MIN_DENSITY) -> Dict:
+    """Agrupa IPs banidos em blocos CIDR por família, respeitando a allowlist"""
+    result = {'banned': 0, 'allowlisted': [], 'invalid': 0, 'networks': [], 'covered': 0}
+    by_family: Dict[int, List[int]] = {4: [], 6: []}
+    allowed = {version: _merge_ranges([network for network in allowlist if network.version == version])
+               for version in by_family}
+    parsed = set()
+    for address in addresses:
+        try:
+            parsed.add(ipaddress.ip_address(address))
+        except ValueError:
+            result['invalid'] += 1
+    for address in sorted(parsed, key=lambda ip: (ip.version, int(ip))):
+        if _touches_ranges(allowed[address.version], int(address), int(address)):
+            result['allowlisted'].append(str(address))
+        else:
+            by_family[address.version].append(int(address))
+    result['banned'] = sum(len(values) for values in by_family.values())
+    
+    for version, values in by_family.items():
+        bits = 32 if version == 4 else 128
+        network_class = ipaddress.IPv4Network if version == 4 else ipaddress.IPv6Network
+        for network, prefix in aggregate_addresses(values, bits, allowed[version], min_density, BAN_MIN_PREFIX[version]):
+            result['networks'].append(network_class((network, prefix)))
+            result['covered'] += 1 << (bits - prefix)
+    return result
+
+def format_ban_set(networks: List[ipaddress._BaseNetwork], output_format: str = 'nft',
+                   set_name: str = BAN_SET_NAME, ports: List[int] = (22,)) -> str:
+    """Conjunto de bloqueio para 'nft -f' ou 'ipset restore' (IPv4 e IPv6 em conjuntos separados)
+
+    No formato nft a tabela é recriada a cada carga (o par table/delete table
+    é idempotente) e traz a chain com as regras que descartam os conjuntos
+    nas portas do SSH. O ipset só cria os conjuntos: a regra de iptables que
+    os usa fica com o operador (ver ipset_rule_hint).
+    """
+    # Host único sai sem o /32 (/128): os dois formatos aceitam endereço simples
+    members = [(network.version, str(network.network_address) if network.num_addresses == 1 else str(network))
+               for network in networks]
+    v4 = [member for version, member in members if version == 4]
+    v6 = [member for version, member in members if version == 6]
+    lines = []
+    if output_format == 'ipset':
+        lines.append(f"create {set_name} hash:net family inet -exist")
+        lines.append(f"create {set_name}6 hash:net family inet6 -exist")
+        lines += [f"add {set_name} {network} -exist" for network in v4]
+        lines += [f"add {set_name}6 {network} -exist" for network in v6]
+    else:
+        dports = str(ports[0]) if len(ports) == 1 else f"{{ {', '.join(str(port) for port in ports)} }}"
+        lines.append(f"table inet {BAN_NFT_TABLE}")
+        lines.append(f"delete table inet {BAN_NFT_TABLE}")
+        lines.append(f"table inet {BAN_NFT_TABLE} {{")
+        for suffix, kind, members in (('_v4', 'ipv4_addr', v4), ('_v6', 'ipv6_addr', v6)):
+            lines.append(f"    set {set_name}{suffix} {{")
+            lines.append(f"        type {kind}")
+            lines.append("        flags interval")
+            if members:
+                lines.append(f"        elements = {{ {', '.join(members)} }}")
+            lines.append("    }")
+        lines.append("    chain input {")
+        lines.append("        type filter hook input priority -1; policy accept;")
+        lines.append(f"        ip saddr @{set_name}_v4 tcp dport {dports} drop")
+        lines.append(f"        ip6 saddr @{set_name}_v6 tcp dport {dports} drop")
+        lines.append("    }")
+        lines.append("}")
+    return "\n".join(lines) + "\n"
+
+def ipset_rule_hint(set_name: str = BAN_SET_NAME, ports: List[int] = (22,)) -> List[str]:
+    """Regras de iptables/ip6tables que o operador aplica para usar os conjuntos do ipset"""
+    dports = ','.join(str(port) for port in ports)
+    return [f"{tool} -I INPUT -p tcp -m multiport --dports {dports} -m set --match-set {name} src -j DROP"
+            for tool, name in (('iptables', set_name), ('ip6tables', f"{set_name}6"))]
+
+def ssh_ports(parser: Optional[SSHDConfigParser] = None) -> List[int]:
+    """Portas do sshd segundo o sshd_config (22 se ausente ou inválida)"""
+    parser = parser or load_sshd_config()
+    ports = [int(value) for value in (parser.get('Port') or '').split() if value.isdigit()]
+    return ports or [22]
+
+def run_ban_aggregation(db_path: str = FAIL2BAN_DB, dump_path: Optional[str] = None, jail: Optional[str] = None,
+                        allowlist_entries: List[str] = (), min_density: float = BAN_MIN_DENSITY,
+                        output_path: str = '-', output_format: str = 'nft') -> bool:
+    """Lê os banimentos vigentes, agrega em CIDRs e grava o conjunto de bloqueio"""
+    try:
+        addresses = load_ban_dump(dump_path) if dump_path else load_fail2ban_bans(db_path, jail)
+    except (OSError, sqlite3.Error, ValueError) as e:
+        logging.error(f"❌ Não foi possível ler os banimentos ({dump_path or db_path}): {e}")
+        return False
+    
+    allowlist = parse_allowlist(list(BAN_ALLOWLIST) + fail2ban_ignoreip() + list(allowlist_entries))
+    result = aggregate_bans(addresses, allowlist, min_density)
+    ports = ssh_ports()
+    content = format_ban_set(result['networks'], output_format, ports=ports)
+    try:
+        if output_path == '-':
+            sys.stdout.write(content)
+        else:
+            write_file_atomic(output_path, content, 0o644)
+    except OSError as e:
+        logging.error(f"❌ Não foi possível gravar {output_path}: {e}")
+        return False
+    
+    banned, rules = result['banned'], len(result['networks'])
+    reduction = (1 - rules / banned) if banned else 0.0
+    logging.info(f"Banimentos: {banned} IP(s) → {rules} regra(s) CIDR (redução de {reduction:.1%})")
+    logging.info(f"Endereços cobertos: {result['covered']} ({result['covered'] - banned} além dos banidos; "
+                 f"densidade mínima {min_density:.0%})")
+    if result['allowlisted']:
+        logging.warning(f"⚠️  {len(result['allowlisted'])} IP(s) banido(s) estão na allowlist e ficaram de fora: "
+                        f"{', '.join(result['allowlisted'][:10])}")
+    if result['invalid']:
+        logging.warning(f"⚠️  {result['invalid']} entrada(s) inválida(s) ignorada(s)")
+    if output_format == 'ipset':
+        logging.info("ipset: só os conjuntos foram gerados; para bloquear, aplique:")
+        for rule in ipset_rule_hint(ports=ports):
+            logging.info(f"  {rule}")
+    log_event('bans_aggregated', f"{banned} banimentos agregados em {rules} regras", {
+        'source': dump_path or db_path,
+        'jail': jail,
+        'banned': banned,
+        'rules': rules,
+        'covered': result['covered'],
+        'allowlisted': len(result['allowlisted']),
+        'min_density': min_density,
+        'output': output_path,
+        'format': output_format,
+    })
+    return True
+
+# --- Gerenciamento de Usuários ---
+@traced('fix')
+def create_sudo_user(username: str, dry_run: bool = False) -> bool:
+    """Cria usuário com permissões sudo e senha segura"""
+    logging.info(f"Iniciando criação do usuário '{username}'...")
+    
+    if dry_run:
+        logging.info("🔍 MODO DRY-RUN: Simulação sem alterações reais")
+        return True
+    
+    if not validate_username(username):
+        logging.error(f"Username inválido: '{username}'")
+        logging.error("Formato válido: [a-z_][a-z0-9_-]{{0,31}}")
+        return False
+    
+    try:
+        pwd.getpwnam(username)
+        logging.error(f"Usuário '{username}' já existe")
+        return False
+    except KeyError:
+        pass
+    
+    password = generate_secure_password()
+    
+    try:
+        run_command(['useradd', '-m', '-s', '/bin/bash', username])
+        logging.info(f"Usuário '{username}' criado")
+        
+        run_command(['chpasswd'], input_data=f"{username}:{password}\n")
+        logging.info(f"Senha definida para '{username}'")
+        
+        distro = detect_distro()
+        sudo_group = 'sudo' if distro == 'debian' else 'wheel'
+        
+        run_command(['usermod', '-aG', sudo_group, username])
+        logging.info(f"Usuário '{username}' adicionado ao grupo '{sudo_group}'")
+        
+        print("\n" + "=" * 80)
+        print("🔐 CREDENCIAIS DO NOVO USUÁRIO SUDO")
+        print("=" * 80)
+        print(f"Username: {username}")
+        print(f"Password: {password}")
+        print("=" * 80)
+        print("⚠️  ATENÇÃO: Salve esta senha AGORA. Ela não será exibida novamente.")
+        print("=" * 80 + "\n")
+        
+        log_event('user_created', f"Usuário sudo criado: {username}", {
+            'username': username,
+            'sudo_group': sudo_group
+        })
+        
+        return True
+    
+    except Exception as e:
+        logging.error(f"Erro ao criar usuário '{username}': {e}")
+        
+        try:
+            run_command(['userdel', '-r', username], check=False)
+            logging.warning(f"Rollback: usuário '{username}' removido")
+        except Exception:
+            pass
+        
+        return False
+
+# Lote: newusers cifra as senhas (ENCRYPT_METHOD do login.defs); o prazo cresce com o lote
+USER_BATCH_TIMEOUT = 60
+USER_BATCH_TIMEOUT_PER_USER = 0.2
+DEFAULT_USER_SHELL = "/bin/bash"
+DEFAULT_HOME_BASE = "/home"
+GROUP_FILE = "/etc/group"
+
+class UserSpec(NamedTuple):
+    """Usuário a criar no lote"""
+    username: str
+    shell: str
+    comment: str
+
+def load_users_file(path: str) -> List[UserSpec]:
+    """Lê o arquivo de usuários: JSON (lista de nomes ou de objetos) ou CSV com cabeçalho
+    
+    Campos: username (obrigatório), shell e comment (GECOS).
+    """
+    with open(path, newline='') as f:
+        if path.endswith('.json'):
+            rows = json.load(f)
+            if not isinstance(rows, list):
+                raise ValueError("o JSON deve ser uma lista de usuários")
+            rows = [{'username': row} if isinstance(row, str) else row for row in rows]
+        else:
+            rows = list(csv.DictReader(f))
+    
+    users = []
+    for number, row in enumerate(rows, 1):
+        if not isinstance(row, dict):
+            raise ValueError(f"entrada {number}: esperado objeto ou nome de usuário")
+        users.append(UserSpec(str(row.get('username') or '').strip(),
+                              str(row.get('shell') or DEFAULT_USER_SHELL).strip(),
+                              str(row.get('comment') or '').strip()))
+    return users
+
+def validate_user_batch(users: List[UserSpec]) -> List[str]:
+    """Erros de todo o lote (vazio se válido): nada é criado se alguma entrada falhar"""
+    errors = []
+    seen = set()
+    for number, user in enumerate(users, 1):
+        label = f"entrada {number} ('{user.username}')"
+        if not validate_username(user.username):
+            errors.append(f"{label}: username inválido")
+        elif user.username in seen:
+            errors.append(f"{label}: duplicado no arquivo")
+        else:
+            try:
+                pwd.getpwnam(user.username)
+                errors.append(f"{label}: usuário já existe")
+            except KeyError:
+                pass
+            # newusers com GID vazio reaproveita um grupo existente de mesmo nome como
+            # grupo primário: 'docker', 'adm' ou 'shadow' dariam esse privilégio à conta
+            try:
+                grp.getgrnam(user.username)
+                errors.append(f"{label}: já existe um grupo com esse nome")
+            except KeyError:
+                pass
+        seen.add(user.username)
+        # ':' e quebras de linha corromperiam a linha do newusers/passwd
+        if not user.shell.startswith('/') or any(char in user.shell for char in ':\n'):
+            errors.append(f"{label}: shell inválido '{user.shell}'")
+        if any(char in user.comment for char in ':\n'):
+            errors.append(f"{label}: comment não pode conter ':' nem quebra de linha")
+    if not users:
+        errors.append("nenhum usuário no arquivo")
+    return errors
+
+def default_home_base() -> str:
+    """Diretório base das homes segundo o useradd (HOME de /etc/default/useradd)"""
+    try:
+        output = run_command(['useradd', '-D'], check=False).stdout
+    except Exception as e:
+        logging.debug(f"useradd -D falhou: {e}")
+        return DEFAULT_HOME_BASE
+    for line in output.splitlines():
+        key, _, value = line.partition('=')
+        if key.strip() == 'HOME' and value.strip().startswith('/'):
+            return value.strip()
+    return DEFAULT_HOME_BASE
+
+def local_group_members(group: str, group_file: str = GROUP_FILE) -> List[str]:
+    """Membros do grupo no arquivo local (sem membros vindos de NSS/LDAP)"""
+    with open(group_file) as f:
+        for line in f:
+            parts = line.rstrip('\n').split(':')
+            if len(parts) >= 4 and parts[0] == group:
+                return [member for member in parts[3].split(',') if member]
+    raise KeyError(group)
+
+def _open_credentials_file(path: str):
+    """Cria o arquivo de credenciais com 0600 (falha se já existir: nunca sobrescreve)"""
+    return os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w', newline='')
+
+@traced('fix')
+def create_sudo_users(users_file: str, credentials_path: str, dry_run: bool = False) -> bool:
+    """Cria em lote os usuários sudo de um arquivo CSV/JSON
+    
+    Todas as entradas são validadas antes de qualquer alteração. O lote é
+    aplicado com um único newusers (contas e senhas) e um único gpasswd
+    (grupo sudo/wheel); se qualquer passo falhar, todos os usuários do lote
+    são removidos. As senhas vão para credentials_path (0600), nunca para a tela.
+    """
+    logging.info(f"Iniciando criação em lote a partir de '{users_file}'...")
+    
+    try:
+        users = load_users_file(users_file)
+    except (OSError, ValueError) as e:
+        logging.error(f"Não foi possível ler '{users_file}': {e}")
+        return False
+    
+    errors = validate_user_batch(users)
+    if errors:
+        for error in errors:
+            logging.error(f"   {error}")
+        logging.error(f"❌ {len(errors)} erro(s) no arquivo de usuários: nenhum usuário criado")
+        return False
+    
+    sudo_group = 'sudo' if detect_distro() == 'debian' else 'wheel'
+    if dry_run:
+        logging.info("🔍 MODO DRY-RUN: Simulação sem alterações reais")
+        logging.info(f"Dry-Run: {len(users)} usuário(s) seriam criados e adicionados ao grupo '{sudo_group}'")
+        return True
+    
+    try:
+        grp.getgrnam(sudo_group)
+        credentials = _open_credentials_file(credentials_path)
+    except KeyError:
+        logging.error(f"Grupo '{sudo_group}' não existe")
+        return False
+    except OSError as e:
+        logging.error(f"Não foi possível criar o arquivo de credenciais '{credentials_path}': {e}")
+        return False
+    
+    passwords = [generate_secure_password() for _ in users]
+    home_base = default_home_base()
+    # name:senha:uid:gid:gecos:home:shell; uid/gid vazios = próximos livres; o grupo de mesmo
+    # nome é novo (validate_user_batch recusa nomes de grupos existentes)
+    batch = ''.join(f"{user.username}:{password}:::{user.comment}:"
+                    f"{posixpath.join(home_base, user.username)}:{user.shell}\n"
+                    for user, password in zip(users, passwords))
+    timeout = int(USER_BATCH_TIMEOUT + USER_BATCH_TIMEOUT_PER_USER * len(users))
+    
+    with credentials:
+        try:
+            run_command(['newusers'], input_data=batch, timeout=timeout)
+            logging.info(f"{len(users)} usuário(s) criado(s)")
+            
+            # gpasswd -M define a lista inteira de membros: um processo para o lote todo. A lista
+            # é relida do /etc/group logo antes (sem membros do NSS/LDAP, com mudanças recentes)
+            new_members = local_group_members(sudo_group) + [user.username for user in users]
+            run_command(['gpasswd', '-M', ','.join(new_members), sudo_group])
+            logging.info(f"{len(users)} usuário(s) adicionado(s) ao grupo '{sudo_group}'")
+            
+            writer = csv.writer(credentials)
+            writer.writerow(['username', 'password'])
+            writer.writerows((user.username, password) for user, password in zip(users, passwords))
+        
+        except Exception as e:
+            logging.error(f"Erro ao criar usuários em lote: {e}")
+            created = []
+            for user in users:
+                try:
+                    pwd.getpwnam(user.username)
+                    created.append(user.username)
+                except KeyError:
+                    pass
+            for username in created:
+                run_command(['userdel', '-r', username], check=False)
+            logging.warning(f"Rollback: {len(created)} usuário(s) do lote removido(s)")
+            credentials.close()
+            os.unlink(credentials_path)
+            return False
+    
+    print(f"\n🔐 Credenciais de {len(users)} usuário(s) salvas em: {credentials_path} (0600)")
+    print("⚠️  Distribua as senhas por canal seguro e remova o arquivo em seguida.\n")
+    
+    log_event('users_created', f"{len(users)} usuário(s) sudo criado(s) em lote", {
+        'usernames': [user.username for user in users],
+        'sudo_group': sudo_group,
+        'credentials_file': credentials_path
+    })
+    return True
@@ -0,0 +1,1037 @@
+"""
+SSH Auditor - frota e imagens
+
+Varredura de imagens OCI/Docker camada a camada, conformidade de snapshots
+de sshd_config da frota, índice de authorized_keys entre hosts e chaves de
+host repetidas (templates clonados).
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import errno
+import base64
+import fnmatch
+import hashlib
+import secrets
+import logging
+import tarfile
+import datetime
+import posixpath
+import contextlib
+import concurrent.futures
+from array import array
+from stat import S_IFDIR, S_IFLNK, S_IFREG
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import ssh_auditor as core
+from ssh_auditor import (DEFAULT_PROFILE, SEVERITY_EMOJI, VERSION, AuditRoot, ComplianceProfile, ComplianceRule,
+                         Issue, LocalRoot, PasswdEntry, SSHDConfigParser, issues_from_json, issues_to_json,
+                         load_profile, normalize_logical, parse_passwd_lines, persistent_cache_dir,
+                         read_profile_spec, set_audit_root, write_file_atomic)
+from ssh_audit import (MIN_MODULI_BITS, MIN_RSA_KEY_BITS, RESTRICTING_KEY_OPTIONS, format_fingerprint,
+                       generate_audit_report, moduli_issue, moduli_summary, parse_authorized_key, run_full_audit)
+
+# --- Varredura de Imagens OCI/Docker ---
+# Caminhos cujo conteúdo é guardado (as demais entradas relevantes guardam só metadados)
+IMAGE_CONTENT_PATHS = ('/etc/passwd', '/etc/group', '/etc/hostname', '/etc/os-release', '/usr/lib/os-release')
+IMAGE_PRESENCE_PATHS = (
+    '/etc/fail2ban',
+    '/etc/systemd/system/multi-user.target.wants/fail2ban.service',
+    '/etc/runlevels/default/fail2ban',
+    '/usr/lib/openssh/sftp-server',
+    '/usr/libexec/openssh/sftp-server',
+    '/usr/lib/ssh/sftp-server',
+)
+IMAGE_MAX_CONTENT = 4 * 1024 * 1024
+# Versão das regras de extração: muda quando image_path_wanted passa a guardar outras entradas
+IMAGE_FACTS_VERSION = 3
+_OCI_INDEX_TYPES = ('application/vnd.oci.image.index.v1+json',
+                    'application/vnd.docker.distribution.manifest.list.v2+json')
+
+class ImageLayer(NamedTuple):
+    """Camada de imagem: 'key' é o diff_id (sha256 do tar descomprimido)"""
+    key: str
+    source: str
+    member: str
+    media_type: str
+
+class ImageSpec(NamedTuple):
+    """Imagem como lista ordenada de camadas (da base para o topo)"""
+    name: str
+    layers: List[ImageLayer]
+
+class ImageStat(NamedTuple):
+    """Subconjunto de os.stat_result usado pelas auditorias"""
+    st_mode: int
+    st_uid: int
+    st_gid: int
+    st_size: int
+
+def image_content_allowed(path: str) -> bool:
+    """Só o conteúdo que as auditorias leem vai para o cache de camadas
+    
+    Lista fechada: o resto de /etc/ssh (chaves privadas, *.bak, chaves de CA,
+    *.key) e de ~/.ssh fica só com modo/dono, nunca com conteúdo.
+    """
+    if path in IMAGE_CONTENT_PATHS:
+        return True
+    if path.endswith('/.ssh/authorized_keys') or path.endswith('/.ssh/authorized_keys2'):
+        return True
+    directory, name = posixpath.split(path)
+    if name in ('sshd_config', 'moduli') or (name.startswith('ssh_host_') and name.endswith('_key.pub')):
+        return True
+    return posixpath.basename(directory) == 'sshd_config.d' and name.endswith('.conf')
+
+def image_path_wanted(path: str) -> Optional[bool]:
+    """True: guardar conteúdo; False: só metadados; None: ignorar a entrada"""
+    if image_content_allowed(path):
+        return True
+    if path == core.SSH_DIR or path.startswith(core.SSH_DIR + '/'):
+        return False
+    if path.endswith('/.ssh') or '/.ssh/' in path:
+        # Demais arquivos de ~/.ssh (chaves privadas inclusive): só modo/dono para a política de permissões
+        return False
+    for presence in IMAGE_PRESENCE_PATHS:
+        if path == presence or path.startswith(presence + '/'):
+            return False
+    return None
+
+class ImageRoot(AuditRoot):
+    """Raiz montada em memória a partir das entradas relevantes das camadas de uma imagem"""
+    has_local_files = False
+    
+    def __init__(self, name: str, entries: Dict[str, list]):
+        self.name = name
+        self.entries = entries
+        self._children: Dict[str, List[str]] = {}
+        for path in entries:
+            parent, base = posixpath.split(path)
+            self._children.setdefault(parent, []).append(base)
+        self._dirs: Dict[str, str] = {}
+        self._users: Optional[Dict[int, str]] = None
+        self._groups: Optional[Dict[int, str]] = None
+        self._passwd: Optional[List[PasswdEntry]] = None
+    
+    def __repr__(self):
+        return f"ImageRoot({self.name!r}, {len(self.entries)} entradas)"
+    
+    def path(self, logical: str) -> str:
+        """Identificação para relatórios (não é um caminho no disco local)"""
+        return f"{self.name}:{normalize_logical(logical)}"
+    
+    def _resolve(self, logical: str, depth: int = 0) -> str:
+        """Resolve symlinks entre as entradas da imagem, como LocalRoot._resolve"""
+        logical = normalize_logical(logical)
+        if logical == '/':
+            return logical
+        
+        parent, name = posixpath.split(logical)
+        resolved_parent = self._dirs.get(parent)
+        if resolved_parent is None:
+            resolved_parent = self._dirs[parent] = self._resolve(parent, depth)
+        
+        candidate = posixpath.join(resolved_parent, name)
+        entry = self.entries.get(candidate)
+        if entry is None or entry[0] != 'l':
+            return candidate
+        
+        if depth >= 40:
+            raise OSError(errno.ELOOP, "Muitos níveis de links simbólicos", logical)
+        target = entry[5]
+        if not target.startswith('/'):
+            target = posixpath.join(resolved_parent, target)
+        return self._resolve(target, depth + 1)
+    
+    def _entry(self, logical: str) -> list:
+        resolved = self._resolve(logical)
+        entry = self.entries.get(resolved)
+        if entry is None:
+            # Diretórios intermediários não são guardados: existem se tiverem filhos
+            if resolved in self._children:
+                return ['d', 0o755, 0, 0, 0, '', None]
+            raise FileNotFoundError(errno.ENOENT, "Não encontrado na imagem", self.path(logical))
+        return entry
+    
+    def exists(self, logical: str) -> bool:
+        try:
+            self._entry(logical)
+        except OSError:
+            return False
+        return True
+    
+    def stat(self, logical: str) -> ImageStat:
+        kind, mode, uid, gid, size = self._entry(logical)[:5]
+        file_type = S_IFDIR if kind == 'd' else S_IFREG
+        return ImageStat(file_type | mode, uid, gid, size)
+    
+    def lstat(self, logical: str) -> ImageStat:
+        parent, name = posixpath.split(normalize_logical(logical))
+        entry = self.entries.get(posixpath.join(self._resolve(parent), name))
+        if entry is not None and entry[0] == 'l':
+            return ImageStat(S_IFLNK | 0o777, entry[2], entry[3], len(entry[5]))
+        return self.stat(logical)
+    
+    def open(self, logical: str, mode: str = 'r'):
+        entry = self._entry(logical)
+        if entry[0] == 'd':
+            raise IsADirectoryError(errno.EISDIR, "É um diretório", self.path(logical))
+        content = entry[6]
+        if content is None:
+            raise OSError(errno.ENODATA, "Conteúdo não extraído da camada", self.path(logical))
+        if 'b' in mode:
+            return io.BytesIO(content)
+        return io.StringIO(content.decode('utf-8', 'replace'))
+    
+    def glob(self, logical_dir: str, pattern: str) -> List[str]:
+        try:
+            names = self._children.get(self._resolve(logical_dir), [])
+        except OSError:
+            return []
+        return sorted(posixpath.join(logical_dir, name) for name in fnmatch.filter(names, pattern))
+    
+    def scan(self, logical_dir: str, follow_symlinks: bool = True) -> List[Tuple[str, ImageStat]]:
+        entries = []
+        stat = self.stat if follow_symlinks else self.lstat
+        for path in self.glob(logical_dir, '*'):
+            try:
+                entries.append((posixpath.basename(path), stat(path)))
+            except OSError:
+                continue
+        return entries
+    
+    def passwd_entries(self) -> List[PasswdEntry]:
+        if self._passwd is None:
+            try:
+                with self.open('/etc/passwd') as f:
+                    self._passwd = parse_passwd_lines(f)
+            except OSError:
+                self._passwd = []
+        return self._passwd
+    
+    def user_name(self, uid: int) -> str:
+        if self._users is None:
+            self._load_maps()
+        return self._users.get(uid, str(uid))
+    
+    def group_name(self, gid: int) -> str:
+        if self._groups is None:
+            self._load_maps()
+        return self._groups.get(gid, str(gid))
+    
+    def hostname(self) -> str:
+        return self.name
+
+def _read_image_source(source: str, member: str) -> bytes:
+    """Lê um arquivo de um layout em diretório ou de dentro de um tar"""
+    if os.path.isdir(source):
+        with open(os.path.join(source, member), 'rb') as f:
+            return f.read()
+    with tarfile.open(source) as archive:
+        f = archive.extractfile(posixpath.normpath(member))
+        if f is None:
+            raise ValueError(f"'{member}' não é um arquivo em {source}")
+        return f.read()
+
+def _image_source_has(source: str, member: str) -> bool:
+    if os.path.isdir(source):
+        return os.path.isfile(os.path.join(source, member))
+    try:
+        with tarfile.open(source) as archive:
+            archive.getmember(member)
+        return True
+    except (KeyError, tarfile.TarError, OSError):
+        return False
+
+@contextlib.contextmanager
+def _open_image_blob(source: str, member: str):
+    if os.path.isdir(source):
+        with open(os.path.join(source, member), 'rb') as f:
+            yield f
+        return
+    with tarfile.open(source) as archive:
+        f = archive.extractfile(posixpath.normpath(member))
+        if f is None:
+            raise ValueError(f"'{member}' não é um arquivo em {source}")
+        yield f
+
+def _oci_blob_path(digest: str) -> str:
+    algorithm, _, hexdigest = digest.partition(':')
+    return f"blobs/{algorithm}/{hexdigest}"
+
+def _oci_image_specs(source: str, descriptor: Dict, name: str) -> List[ImageSpec]:
+    """Expande um descritor OCI (índice ou manifesto) em imagens"""
+    document = json.loads(_read_image_source(source, _oci_blob_path(descriptor['digest'])))
+    media_type = descriptor.get('mediaType') or document.get('mediaType', '')
+    if media_type in _OCI_INDEX_TYPES or 'manifests' in document:
+        specs = []
+        for child in document.get('manifests', []):
+            platform = child.get('platform') or {}
+            if platform.get('os') == 'unknown':
+                # Atestados/SBOM do buildx não são sistemas de arquivos
+                continue
+            suffix = f" [{platform['os']}/{platform.get('architecture', '?')}]" if platform else ""
+            specs.extend(_oci_image_specs(source, child, name + suffix))
+        return specs
+    
+    config = json.loads(_read_image_source(source, _oci_blob_path(document['config']['digest'])))
+    diff_ids = config.get('rootfs', {}).get('diff_ids', [])
+    layers = document.get('layers', [])
+    if len(diff_ids) != len(layers):
+        raise ValueError(f"{name}: {len(layers)} camada(s) mas {len(diff_ids)} diff_id(s)")
+    return [ImageSpec(name, [
+        ImageLayer(diff_id, source, _oci_blob_path(layer['digest']), layer.get('mediaType', ''))
+        for diff_id, layer in zip(diff_ids, layers)
+    ])]
+
+def read_image_specs(source: str) -> List[ImageSpec]:
+    """Lê as imagens de um 'docker save' ou layout OCI (diretório ou tar)"""
+    label = os.path.basename(os.path.normpath(source))
+    if _image_source_has(source, 'index.json'):
+        index = json.loads(_read_image_source(source, 'index.json'))
+        specs = []
+        for descriptor in index.get('manifests', []):
+            annotations = descriptor.get('annotations') or {}
+            name = (annotations.get('io.containerd.image.name')
+                    or annotations.get('org.opencontainers.image.ref.name')
+                    or f"{label}@{descriptor['digest'][:19]}")
+            specs.extend(_oci_image_specs(source, descriptor, name))
+        return specs
+    
+    if _image_source_has(source, 'manifest.json'):
+        specs = []
+        for entry in json.loads(_read_image_source(source, 'manifest.json')):
+            config = json.loads(_read_image_source(source, entry['Config']))
+            diff_ids = config.get('rootfs', {}).get('diff_ids', [])
+            if len(diff_ids) != len(entry['Layers']):
+                raise ValueError(f"{source}: camadas e diff_ids não correspondem")
+            name = (entry.get('RepoTags') or [f"{label}@{entry['Config'][:12]}"])[0]
+            specs.append(ImageSpec(name, [
+                ImageLayer(diff_id, source, member, '') for diff_id, member in zip(diff_ids, entry['Layers'])
+            ]))
+        return specs
+    
+    raise ValueError(f"'{source}' não é um 'docker save' nem um layout OCI")
+
+def discover_images(path: str) -> List[ImageSpec]:
+    """Aceita um arquivo de imagem, um layout OCI ou um diretório que os contenha"""
+    if os.path.isfile(path) or _image_source_has(path, 'index.json') or _image_source_has(path, 'manifest.json'):
+        return read_image_specs(path)
+    
+    specs = []
+    for entry in sorted(os.scandir(path), key=lambda entry: entry.name):
+        if entry.is_dir() or entry.name.endswith(('.tar', '.tar.gz', '.tgz')):
+            try:
+                specs.extend(discover_images(entry.path))
+            except (ValueError, OSError, tarfile.TarError) as e:
+                logging.debug(f"Ignorando '{entry.path}': {e}")
+    return specs
+
+def extract_layer_facts(layer: ImageLayer, targets: Tuple[str, ...] = ()) -> Dict:
+    """Lê a camada em streaming uma única vez, guardando só as entradas relevantes
+    
+    Com 'targets', lê apenas esses caminhos (e o que estiver abaixo deles): destinos
+    de symlinks relevantes que apontam para fora dos caminhos conhecidos.
+    """
+    if 'zstd' in layer.media_type:
+        raise ValueError(f"Camada {layer.key[:19]} comprimida com zstd (não suportado pela biblioteca padrão)")
+    
+    prefixes = tuple(target + '/' for target in targets)
+    entries: Dict[str, list] = {}
+    whiteouts: List[str] = []
+    opaque: List[str] = []
+    with _open_image_blob(layer.source, layer.member) as blob:
+        with tarfile.open(fileobj=blob, mode='r|*') as archive:
+            for member in archive:
+                path = normalize_logical(member.name)
+                directory, name = posixpath.split(path)
+                if targets:
+                    if member.issym() or name.startswith('.wh.') or not (path in targets or path.startswith(prefixes)):
+                        continue
+                    wanted = image_content_allowed(path)
+                elif name == '.wh..wh..opq':
+                    opaque.append(directory)
+                    continue
+                elif name.startswith('.wh.'):
+                    whiteouts.append(posixpath.join(directory, name[4:]))
+                    continue
+                else:
+                    wanted = image_path_wanted(path)
+                    if wanted is None and not member.issym():
+                        # Symlinks são sempre guardados: podem redirecionar /home, /etc/ssh etc.
+                        continue
+                
+                content = None
+                if member.islnk():
+                    target = entries.get(normalize_logical(member.linkname))
+                    kind, content = 'f', target[6] if target and wanted else None
+                elif member.issym():
+                    kind = 'l'
+                elif member.isdir():
+                    kind = 'd'
+                else:
+                    kind = 'f'
+                    if wanted and member.isfile() and member.size <= IMAGE_MAX_CONTENT:
+                        content = base64.b64encode(archive.extractfile(member).read()).decode('ascii')
+                
+                entries[path] = [kind, member.mode, member.uid, member.gid, member.size,
+                                 member.linkname if member.issym() else '', content]
+    return {'entries': entries, 'whiteouts': whiteouts, 'opaque': opaque}
+
+def merge_image_layers(layers: List[Dict]) -> Dict[str, list]:
+    """Sobrepõe as camadas aplicando whiteouts e diretórios opacos (semântica OCI)"""
+    merged: Dict[str, list] = {}
+    for facts in layers:
+        removed = [directory.rstrip('/') + '/' for directory in facts['opaque']]
+        for path in facts['whiteouts']:
+            merged.pop(path, None)
+            removed.append(path + '/')
+        if removed:
+            prefixes = tuple(removed)
+            for path in [path for path in merged if path.startswith(prefixes)]:
+                del merged[path]
+        for path, entry in facts['entries'].items():
+            content = entry[6]
+            merged[path] = entry[:6] + [base64.b64decode(content) if content is not None else None]
+    return merged
+
+def image_cache_dir(cache_dir: str = None) -> str:
+    """Diretório do cache de camadas e resultados de imagens"""
+    return persistent_cache_dir(('layers', 'images'), cache_dir)
+
+def _write_cache_json(path: str, data) -> None:
+    # 0600: mesmo restrito a arquivos públicos, o cache descreve o sistema auditado
+    write_file_atomic(path, json.dumps(data, separators=(',', ':')), mode=0o600)
+
+def _layer_cache_path(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, 'layers', f"v{IMAGE_FACTS_VERSION}_" + key.replace(':', '_') + '.json')
+
+def extract_layer_worker(layer: ImageLayer, cache_dir: str) -> Tuple[str, Optional[str]]:
+    """Extrai uma camada para o cache em processo isolado: retorna (diff_id, erro)"""
+    try:
+        _write_cache_json(_layer_cache_path(cache_dir, layer.key), extract_layer_facts(layer))
+    except Exception as e:
+        return layer.key, f"{type(e).__name__}: {e}"
+    return layer.key, None
+
+def image_chain_key(image: ImageSpec, profile_name: str) -> str:
+    """Chave do resultado: cadeia de camadas + conteúdo do perfil + versão da ferramenta"""
+    digest = hashlib.sha256()
+    for layer in image.layers:
+        digest.update(layer.key.encode() + b'\n')
+    digest.update(json.dumps(read_profile_spec(profile_name), sort_keys=True).encode())
+    digest.update(f"{VERSION}/{IMAGE_FACTS_VERSION}".encode())
+    return digest.hexdigest()
+
+def _dangling_targets(root: ImageRoot) -> Tuple[str, ...]:
+    """Destinos de symlinks relevantes que não estão entre as entradas guardadas"""
+    targets = set()
+    for path, entry in root.entries.items():
+        if entry[0] != 'l' or image_path_wanted(path) is None:
+            continue
+        try:
+            resolved = root._resolve(path)
+        except OSError:
+            continue
+        if resolved not in root.entries and resolved not in root._children:
+            targets.add(resolved)
+    return tuple(sorted(targets))
+
+def load_image_root(image: ImageSpec, cache_dir: str) -> ImageRoot:
+    """Monta a raiz da imagem a partir das camadas em cache, completando destinos de symlinks"""
+    layers = []
+    for layer in image.layers:
+        with open(_layer_cache_path(cache_dir, layer.key)) as f:
+            layers.append(json.load(f))
+    root = ImageRoot(image.name, merge_image_layers(layers))
+    
+    targets = _dangling_targets(root)
+    if not targets:
+        return root
+    
+    # Segunda leitura restrita aos destinos, também em cache por camada + conjunto de destinos
+    suffix = '+' + hashlib.sha256('\n'.join(targets).encode()).hexdigest()[:16]
+    for layer, facts in zip(image.layers, layers):
+        supplement_path = _layer_cache_path(cache_dir, layer.key + suffix)
+        if os.path.exists(supplement_path):
+            with open(supplement_path) as f:
+                supplement = json.load(f)
+        else:
+            supplement = extract_layer_facts(layer, targets)
+            _write_cache_json(supplement_path, supplement)
+        facts['entries'].update(supplement['entries'])
+    return ImageRoot(image.name, merge_image_layers(layers))
+
+def scan_image_worker(image: ImageSpec, profile_name: str, cache_dir: str) -> Tuple[str, Optional[str], object]:
+    """Audita uma imagem a partir das camadas em cache: retorna (imagem, relatório, total ou erro)"""
+    try:
+        result_path = os.path.join(cache_dir, 'images', image_chain_key(image, profile_name) + '.json')
+        if os.path.exists(result_path):
+            with open(result_path) as f:
+                all_issues = issues_from_json(json.load(f))
+            set_audit_root(ImageRoot(image.name, {}))
+        else:
+            set_audit_root(load_image_root(image, cache_dir))
+            all_issues = run_full_audit(load_profile(profile_name))
+            _write_cache_json(result_path, issues_to_json(all_issues))
+    except Exception as e:
+        return image.name, None, f"{type(e).__name__}: {e}"
+    return image.name, generate_audit_report(all_issues), sum(len(issues) for issues in all_issues.values())
+
+def scan_images(paths: List[str], profile_name: str = DEFAULT_PROFILE, jobs: int = None,
+                cache_dir: str = None) -> bool:
+    """Audita imagens OCI/Docker lendo cada camada distinta uma única vez"""
+    success = True
+    images: List[ImageSpec] = []
+    for path in paths:
+        try:
+            images.extend(discover_images(path))
+        except (ValueError, KeyError, OSError, tarfile.TarError) as e:
+            logging.error(f"❌ Imagem inválida '{path}': {e}")
+            success = False
+    if not images:
+        logging.error("Nenhuma imagem encontrada")
+        return False
+    
+    cache_dir = image_cache_dir(cache_dir)
+    distinct = {layer.key: layer for image in images for layer in image.layers}
+    pending = [layer for key, layer in distinct.items() if not os.path.exists(_layer_cache_path(cache_dir, key))]
+    logging.info(f"{len(images)} imagem(ns), {len(distinct)} camada(s) distinta(s), "
+                 f"{len(pending)} fora do cache ({cache_dir})")
+    
+    with_issues = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        failed_layers = set()
+        for key, error in executor.map(extract_layer_worker, pending, [cache_dir] * len(pending)):
+            if error:
+                logging.error(f"❌ Falha ao ler camada {key[:19]}: {error}")
+                failed_layers.add(key)
+        
+        scannable = [image for image in images if not any(layer.key in failed_layers for layer in image.layers)]
+        success = success and len(scannable) == len(images)
+        futures = [executor.submit(scan_image_worker, image, profile_name, cache_dir) for image in scannable]
+        for future in concurrent.futures.as_completed(futures):
+            name, report, result = future.result()
+            if report is None:
+                logging.error(f"❌ Falha ao auditar imagem '{name}': {result}")
+                success = False
+                continue
+            if result:
+                with_issues += 1
+            print("\n" + report + "\n")
+    
+    logging.info(f"{len(images)} imagem(ns) auditada(s), {with_issues} com issues")
+    return success
+
+# --- Conformidade em Lote (Frota) ---
+FLEET_OK = 0
+FLEET_MISSING = 1
+FLEET_MISCONFIGURED = 2
+
+class ConfigTable:
+    """Tabela colunar de snapshots de sshd_config: uma coluna por keyword"""
+    
+    def __init__(self, size: int):
+        self.size = size
+        self.hosts: List[Optional[str]] = [None] * size
+        # keyword (minúsculo) -> códigos por host (0 = ausente)
+        self.columns: Dict[str, array] = {}
+        # keyword -> valores internados; o índice na lista é o código
+        self.values: Dict[str, List[Optional[str]]] = {}
+        self._codes: Dict[str, Dict[str, int]] = {}
+    
+    @classmethod
+    def from_snapshots(cls, snapshots: List[Tuple[str, Dict[str, str]]]) -> 'ConfigTable':
+        """Monta a tabela a partir de pares (host, config)"""
+        table = cls(len(snapshots))
+        for row, (host, config) in enumerate(snapshots):
+            table.set_row(row, host, config)
+        return table
+    
+    def set_row(self, row: int, host: str, config: Dict[str, str]):
+        """Preenche a linha de um host, internando os valores por coluna"""
+        self.hosts[row] = host
+        for param, value in config.items():
+            key = param.lower()
+            column = self.columns.get(key)
+            if column is None:
+                column = self.columns[key] = array('I', [0]) * self.size
+                self.values[key] = [None]
+                self._codes[key] = {}
+            codes = self._codes[key]
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(self.values[key])
+                self.values[key].append(sys.intern(value))
+            column[row] = code
+    
+    def value(self, key: str, row: int) -> Optional[str]:
+        """Valor original de uma célula (None se ausente)"""
+        column = self.columns.get(key)
+        if column is None:
+            return None
+        return self.values[key][column[row]]
+
+class FleetComplianceResult:
+    """Matriz compacta host × regra: uma linha de bytes por regra, 1 byte por host"""
+    
+    def __init__(self, table: ConfigTable, rules: List[ComplianceRule], matrix: List[bytes]):
+        self.table = table
+        self.rules = rules
+        self.matrix = matrix
+    
+    def rule_counts(self, rule_index: int) -> Tuple[int, int]:
+        """Retorna (ausentes, divergentes) de uma regra em toda a frota"""
+        row = self.matrix[rule_index]
+        return row.count(FLEET_MISSING), row.count(FLEET_MISCONFIGURED)
+    
+    def compliant_hosts(self) -> int:
+        """Número de hosts sem nenhuma falha (OR bit a bit das linhas)"""
+        combined = 0
+        for row in self.matrix:
+            combined |= int.from_bytes(row, 'big')
+        return combined.to_bytes(self.table.size, 'big').count(0)
+    
+    def host_issues(self, row: int) -> List[Issue]:
+        """Expande sob demanda as issues de um host no formato de audit_ssh_config"""
+        issues = []
+        for rule, statuses in zip(self.rules, self.matrix):
+            if statuses[row] != FLEET_OK:
+                issues.append(rule.evaluate(self.table.value(rule.key, row)))
+        return issues
+    
+    def iter_issues(self):
+        """Itera (host, issue) para todos os hosts com falhas"""
+        for row, host in enumerate(self.table.hosts):
+            for issue in self.host_issues(row):
+                yield host, issue
+
+def evaluate_fleet(table: ConfigTable, profile: Optional[ComplianceProfile] = None) -> FleetComplianceResult:
+    """Avalia todas as regras do perfil sobre a frota em uma passada por coluna"""
+    profile = profile or load_profile(DEFAULT_PROFILE)
+    missing_row = bytes([FLEET_MISSING]) * table.size
+    matrix = []
+    
+    for rule in profile.rules:
+        column = table.columns.get(rule.key)
+        if column is None:
+            matrix.append(missing_row)
+            continue
+        
+        # O comparador roda uma vez por valor distinto, não uma vez por host
+        verdicts = bytes([FLEET_MISSING] + [
+            FLEET_OK if rule.test(value) else FLEET_MISCONFIGURED
+            for value in table.values[rule.key][1:]
+        ])
+        matrix.append(bytes(map(verdicts.__getitem__, column)))
+    
+    return FleetComplianceResult(table, list(profile.rules), matrix)
+
+def load_fleet_configs(directory: str) -> ConfigTable:
+    """Carrega snapshots de sshd_config de um diretório (um arquivo por host)"""
+    entries = sorted((entry for entry in os.scandir(directory) if entry.is_file()), key=lambda entry: entry.name)
+    table = ConfigTable(len(entries))
+    
+    for row, entry in enumerate(entries):
+        table.set_row(row, entry.name, SSHDConfigParser(entry.path).config)
+    
+    logging.info(f"{table.size} snapshot(s) carregado(s) de '{directory}' ({len(table.columns)} keywords)")
+    return table
+
+def load_fleet_moduli(directory: str) -> Tuple[Dict[str, List[str]], Dict[str, Dict]]:
+    """Moduli coletados da frota (um arquivo por host), agrupados por conteúdo
+    
+    Retorna (sha256 -> hosts, sha256 -> resumo). Cada conteúdo distinto é
+    analisado uma única vez; execuções seguintes só fazem stat dos arquivos.
+    """
+    entries = sorted((entry for entry in os.scandir(directory) if entry.is_file()), key=lambda entry: entry.name)
+    hosts_by_digest: Dict[str, List[str]] = {}
+    summaries: Dict[str, Dict] = {}
+    
+    for entry in entries:
+        try:
+            summary = moduli_summary(lambda: open(entry.path, 'rb'), entry.path, summaries)
+        except OSError as e:
+            logging.warning(f"Moduli ignorado '{entry.path}': {e}")
+            continue
+        summaries[summary['sha256']] = summary
+        hosts_by_digest.setdefault(summary['sha256'], []).append(entry.name)
+    
+    logging.info(f"{sum(map(len, hosts_by_digest.values()))} moduli carregado(s) de '{directory}' "
+                 f"({len(hosts_by_digest)} conteúdo(s) distinto(s))")
+    return hosts_by_digest, summaries
+
+def generate_fleet_moduli_report(hosts_by_digest: Dict[str, List[str]], summaries: Dict[str, Dict]) -> str:
+    """Relatório dos moduli da frota: um bloco por conteúdo distinto com grupos fracos"""
+    report = []
+    report.append("=" * 80)
+    report.append("MODULI DA FROTA (GRUPOS DIFFIE-HELLMAN)")
+    report.append(f"Hosts: {sum(map(len, hosts_by_digest.values()))} | conteúdos distintos: {len(hosts_by_digest)}")
+    report.append("=" * 80)
+    
+    weak = [(moduli_issue(summaries[digest], digest), hosts) for digest, hosts in hosts_by_digest.items()
+            if summaries[digest]['weak']]
+    if not weak:
+        report.append("")
+        report.append(f"✅ NENHUM GRUPO COM MENOS DE {MIN_MODULI_BITS} BITS NA FROTA")
+    
+    for issue, hosts in sorted(weak, key=lambda item: (item[0].severity, -len(item[1]))):
+        digest = issue.sha256
+        report.append(f"\n{SEVERITY_EMOJI[issue.severity]} [{issue.severity}] sha256 {digest[:16]}...: "
+                      f"{len(hosts)} host(s)")
+        report.append(f"   {issue.comment}")
+        report.append(f"   exemplos: {', '.join(hosts[:5])}")
+    
+    report.append("\n" + "=" * 80)
+    return "\n".join(report)
+
+def generate_fleet_report(result: FleetComplianceResult) -> str:
+    """Gera relatório resumido de conformidade da frota"""
+    total_hosts = result.table.size
+    compliant = result.compliant_hosts()
+    
+    report = []
+    report.append("=" * 80)
+    report.append("RELATÓRIO DE CONFORMIDADE DA FROTA - ENTERPRISE EDITION")
+    report.append(f"Data: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    report.append(f"Hosts avaliados: {total_hosts}")
+    report.append(f"Hosts em conformidade: {compliant}")
+    report.append("=" * 80)
+    
+    rows = []
+    for index, rule in enumerate(result.rules):
+        missing, misconfigured = result.rule_counts(index)
+        if missing or misconfigured:
+            rows.append((rule.severity, -(missing + misconfigured), rule, missing, misconfigured))
+    
+    if not rows:
+        report.append("")
+        report.append("✅ NENHUMA FALHA DETECTADA NA FROTA")
+    
+    for _, _, rule, missing, misconfigured in sorted(rows, key=lambda row: row[:2]):
+        report.append(f"\n{SEVERITY_EMOJI[rule.severity]} [{rule.severity}] {rule.param}: "
+                      f"{missing + misconfigured}/{total_hosts} hosts")
+        report.append(f"   ausente: {missing} | divergente: {misconfigured}")
+        report.append(f"   recommended: {rule.recommended}")
+    
+    report.append("\n" + "=" * 80)
+    return "\n".join(report)
+
+def run_fleet_audit(directory: str, profile_name: str = DEFAULT_PROFILE, json_path: str = None,
+                    moduli_dir: str = None) -> bool:
+    """Executa a auditoria de frota e opcionalmente exporta as issues em JSON Lines"""
+    try:
+        profile = load_profile(profile_name)
+        table = load_fleet_configs(directory)
+        hosts_by_digest, summaries = load_fleet_moduli(moduli_dir) if moduli_dir else ({}, {})
+    except (ValueError, OSError) as e:
+        logging.error(f"❌ {e}")
+        return False
+    
+    start = time.perf_counter()
+    result = evaluate_fleet(table, profile)
+    logging.info(f"Avaliação: {table.size} hosts × {len(result.rules)} regras "
+                 f"em {time.perf_counter() - start:.3f}s")
+    
+    print("\n" + generate_fleet_report(result) + "\n")
+    if moduli_dir:
+        print(generate_fleet_moduli_report(hosts_by_digest, summaries) + "\n")
+    
+    if json_path:
+        try:
+            with open(json_path, 'w') as f:
+                for host, issue in result.iter_issues():
+                    f.write(json.dumps({'host': host, **issue.to_dict()}) + "\n")
+                for digest, hosts in hosts_by_digest.items():
+                    for host in hosts:
+                        issue = moduli_issue(summaries[digest], os.path.join(moduli_dir, host))
+                        if issue:
+                            f.write(json.dumps({'host': host, **issue.to_dict()}) + "\n")
+            logging.info(f"📄 Issues da frota exportadas em: {json_path}")
+        except OSError as e:
+            logging.error(f"Não foi possível exportar issues da frota: {e}")
+            return False
+    
+    return True
+
+class AuthorizedKeyIndex:
+    """Índice de fingerprints da frota: detecta a mesma chave em várias contas/hosts
+    
+    A memória cresce com o número de chaves distintas, não de linhas: cada
+    chave guarda o digest truncado, um contador e até SAMPLES locais.
+    """
+    SAMPLES = 5
+    
+    def __init__(self):
+        self.keys: Dict[bytes, list] = {}
+        self.lines = 0
+        self.invalid = 0
+        self.by_type: Dict[Tuple[str, int], int] = {}
+        self.weak = 0
+        self.unrestricted = 0
+    
+    def add_file(self, f, location: str):
+        """Indexa um arquivo authorized_keys em streaming, linha a linha"""
+        keys = self.keys
+        for line in f:
+            try:
+                key = parse_authorized_key(line)
+            except (ValueError, KeyError):
+                self.invalid += 1
+                continue
+            if key is None:
+                continue
+            
+            self.lines += 1
+            type_key = (key.key_type, key.bits)
+            self.by_type[type_key] = self.by_type.get(type_key, 0) + 1
+            if key.key_type == 'DSA' or (key.key_type == 'RSA' and key.bits < MIN_RSA_KEY_BITS):
+                self.weak += 1
+            if not any(option in key.options for option in RESTRICTING_KEY_OPTIONS):
+                self.unrestricted += 1
+            
+            # 16 bytes do SHA-256 bastam para distinguir chaves sem colisões práticas
+            digest = key.digest[:16]
+            entry = keys.get(digest)
+            if entry is None:
+                keys[digest] = [1, key.key_type, key.bits, location]
+            else:
+                entry[0] += 1
+                if len(entry) < 3 + self.SAMPLES and location not in entry[3:]:
+                    entry.append(location)
+    
+    def add_host_directory(self, host: str, directory: str):
+        """Indexa todos os authorized_keys* sob .ssh/ de um diretório coletado de um host"""
+        for current, dirnames, filenames in os.walk(directory):
+            dirnames.sort()
+            if os.path.basename(current) != '.ssh':
+                continue
+            user = os.path.basename(os.path.dirname(current)) or 'root'
+            for name in sorted(fnmatch.filter(filenames, 'authorized_keys*')):
+                try:
+                    with open(os.path.join(current, name), errors='replace') as f:
+                        self.add_file(f, f"{host}:{user}")
+                except OSError as e:
+                    logging.debug(f"Erro ao ler {os.path.join(current, name)}: {e}")
+    
+    def reused(self, min_count: int = 2) -> List[Tuple[bytes, list]]:
+        """Chaves presentes em min_count ou mais locais, da mais repetida para a menos"""
+        found = [(digest, entry) for digest, entry in self.keys.items() if entry[0] >= min_count]
+        return sorted(found, key=lambda item: -item[1][0])
+
+def generate_key_index_report(index: AuthorizedKeyIndex, top: int = 20) -> str:
+    """Gera relatório do índice de authorized_keys da frota"""
+    reused = index.reused()
+    report = []
+    report.append("=" * 80)
+    report.append("RELATÓRIO DE CHAVES AUTORIZADAS DA FROTA - ENTERPRISE EDITION")
+    report.append(f"Data: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    report.append(f"Linhas de chave: {index.lines} | distintas: {len(index.keys)} | inválidas: {index.invalid}")
+    report.append(f"Fracas (DSA/RSA < {MIN_RSA_KEY_BITS}): {index.weak} | sem restrições: {index.unrestricted}")
+    report.append("=" * 80)
+    
+    report.append("\nTipos de chave:")
+    for (key_type, bits), count in sorted(index.by_type.items(), key=lambda item: -item[1]):
+        report.append(f"   {key_type} {bits}: {count}")
+    
+    if not reused:
+        report.append("\n✅ NENHUMA CHAVE REUTILIZADA ENTRE CONTAS/HOSTS")
+    else:
+        report.append(f"\n🟡 {len(reused)} chave(s) reutilizada(s) (top {min(top, len(reused))}):")
+        for digest, entry in reused[:top]:
+            count, key_type, bits = entry[:3]
+            report.append(f"\n   {format_fingerprint(digest)}... ({key_type} {bits}) em {count} local(is)")
+            report.append(f"   exemplos: {', '.join(entry[3:])}")
+    
+    report.append("\n" + "=" * 80)
+    return "\n".join(report)
+
+def run_key_index(directory: str) -> bool:
+    """Indexa authorized_keys coletados da frota (um subdiretório por host)"""
+    index = AuthorizedKeyIndex()
+    start = time.perf_counter()
+    try:
+        hosts = sorted((entry for entry in os.scandir(directory) if entry.is_dir()), key=lambda entry: entry.name)
+    except OSError as e:
+        logging.error(f"❌ {e}")
+        return False
+    for entry in hosts:
+        index.add_host_directory(entry.name, entry.path)
+    logging.info(f"Indexação: {len(hosts)} hosts, {index.lines} chaves em {time.perf_counter() - start:.3f}s")
+    
+    print("\n" + generate_key_index_report(index) + "\n")
+    return True
+
+# --- Chaves de Host da Frota ---
+def machine_id() -> str:
+    """/etc/machine-id da raiz ativa ('' se ausente)"""
+    try:
+        with core.AUDIT_ROOT.open('/etc/machine-id') as f:
+            return f.read().strip()
+    except OSError:
+        return ''
+
+def host_key_records(host: str = None) -> List[Dict]:
+    """Registros (host, machine-id, tipo, bits, fingerprint) das chaves de host da raiz ativa, sem ssh-keygen"""
+    host = host or core.AUDIT_ROOT.hostname()
+    machine = machine_id()
+    records = []
+    for logical_path in core.AUDIT_ROOT.glob(core.SSH_DIR, 'ssh_host_*_key.pub'):
+        try:
+            with core.AUDIT_ROOT.open(logical_path) as f:
+                key = parse_authorized_key(f.readline())
+        except (OSError, ValueError, KeyError) as e:
+            logging.debug(f"Chave de host ignorada {core.AUDIT_ROOT.path(logical_path)}: {e}")
+            continue
+        if key is not None:
+            records.append({'host': host, 'machine_id': machine, 'key_type': key.key_type, 'bits': key.bits,
+                            'fingerprint': format_fingerprint(key.digest)})
+    return records
+
+def collect_host_keys(output: str, roots: List[str] = ()) -> bool:
+    """Grava em JSON Lines ('-' = stdout) os registros das raízes (ou do sistema vivo)"""
+    try:
+        with contextlib.ExitStack() as stack:
+            # Sobrescreve: repetir a coleta num host não duplica os registros dele
+            f = sys.stdout if output == '-' else stack.enter_context(open(output, 'w'))
+            count = 0
+            for root in roots or [None]:
+                if root is not None:
+                    set_audit_root(LocalRoot(root))
+                # Identifica esta coleta: clones mantêm hostname e, às vezes, o machine-id do template
+                collection = secrets.token_hex(8)
+                for record in host_key_records():
+                    record['collection'] = collection
+                    if root is not None:
+                        record['root'] = root
+                    f.write(json.dumps(record) + "\n")
+                    count += 1
+    except OSError as e:
+        logging.error(f"❌ Não foi possível gravar '{output}': {e}")
+        return False
+    logging.info(f"{count} chave(s) de host registrada(s) de {len(roots) or 1} raiz(es)")
+    return True
+
+class HostKeyIndex:
+    """Junção por hash (fingerprint) dos registros de chaves de host da frota
+    
+    Uma passada sobre os registros. Cada chave guarda tipo, bits, o contador
+    de hosts distintos, o hash de cada origem já vista e até SAMPLES hosts de
+    exemplo: a memória cresce com as chaves distintas e, só para as
+    repetidas, com um inteiro por host.
+    
+    A origem é a coleta que gerou o registro (campo 'collection'), nunca o
+    hostname: clones costumam manter o hostname do template. Registros sem
+    coleta (versões anteriores) contam cada um como uma origem.
+    """
+    SAMPLES = 5
+    
+    def __init__(self):
+        # fingerprint -> [hosts, tipo, bits, origens vistas, exemplos]
+        self.keys: Dict[str, list] = {}
+        self.records = 0
+        self.invalid = 0
+    
+    @staticmethod
+    def is_weak(key_type: str, bits: int) -> bool:
+        return key_type == 'DSA' or (key_type == 'RSA' and bits < MIN_RSA_KEY_BITS)
+    
+    def add_record(self, host: str, key_type: str, bits: int, fingerprint: str, origin: str = None,
+                   machine: str = ''):
+        """Conta a origem uma vez por chave; origin=None conta o registro como uma origem nova"""
+        self.records += 1
+        origin = hash(origin) if origin is not None else self.records
+        entry = self.keys.get(fingerprint)
+        if entry is None:
+            self.keys[fingerprint] = [1, key_type, bits, {origin}, [host]]
+        elif origin not in entry[3]:
+            entry[0] += 1
+            entry[3].add(origin)
+            if len(entry[4]) < self.SAMPLES:
+                label = host
+                if label in entry[4]:
+                    label = f"{host} #{entry[0]}" + (f" (machine-id {machine[:12]})" if machine else '')
+                entry[4].append(label)
+    
+    def add_file(self, f):
+        """Agrega um arquivo JSON Lines de registros em streaming"""
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                collection = record.get('collection')
+                self.add_record(str(record['host']), str(record['key_type']), int(record['bits']),
+                                str(record['fingerprint']), str(collection) if collection else None,
+                                str(record.get('machine_id') or ''))
+            except (ValueError, KeyError, TypeError):
+                self.invalid += 1
+    
+    def duplicated(self) -> List[Tuple[str, list]]:
+        """Chaves presentes em mais de um host, da mais repetida para a menos"""
+        return sorted(((fingerprint, entry) for fingerprint, entry in self.keys.items() if entry[0] > 1),
+                      key=lambda item: -item[1][0])
+    
+    def weak(self) -> List[Tuple[str, list]]:
+        return sorted(((fingerprint, entry) for fingerprint, entry in self.keys.items()
+                       if self.is_weak(entry[1], entry[2])), key=lambda item: -item[1][0])
+
+def generate_host_key_report(index: HostKeyIndex, top: int = 20) -> str:
+    """Gera relatório de chaves de host reutilizadas e fracas na frota"""
+    duplicated = index.duplicated()
+    weak = index.weak()
+    report = []
+    report.append("=" * 80)
+    report.append("RELATÓRIO DE CHAVES DE HOST DA FROTA - ENTERPRISE EDITION")
+    report.append(f"Data: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    report.append(f"Registros: {index.records} | chaves distintas: {len(index.keys)} | inválidos: {index.invalid}")
+    report.append("=" * 80)
+    
+    if not duplicated:
+        report.append("\n✅ NENHUMA CHAVE DE HOST REPETIDA ENTRE HOSTS")
+    else:
+        hosts = sum(entry[0] for _, entry in duplicated)
+        report.append(f"\n🔴 [CRITICAL] {len(duplicated)} chave(s) de host em mais de um host "
+                      f"({hosts} ocorrências host/chave)")
+        report.append("   Servidores clonados de um template: um invasor com uma chave privada se passa por todos")
+        report.append("   Regenere em cada host: rm /etc/ssh/ssh_host_* && ssh-keygen -A")
+        for fingerprint, entry in duplicated[:top]:
+            report.append(f"\n   {fingerprint} ({entry[1]} {entry[2]}) em {entry[0]} hosts")
+            report.append(f"   exemplos: {', '.join(entry[4])}")
+    
+    if weak:
+        hosts = sum(entry[0] for _, entry in weak)
+        report.append(f"\n🟠 [HIGH] {len(weak)} chave(s) de host fraca(s) (DSA/RSA < {MIN_RSA_KEY_BITS}), "
+                      f"{hosts} ocorrências host/chave")
+        for fingerprint, entry in weak[:top]:
+            report.append(f"   {fingerprint} ({entry[1]} {entry[2]}): {', '.join(entry[4])}"
+                          + (f" e mais {entry[0] - len(entry[4])}" if entry[0] > len(entry[4]) else ''))
+    
+    report.append("\n" + "=" * 80)
+    return "\n".join(report)
+
+def run_host_key_report(paths: List[str]) -> bool:
+    """Agrega registros de chaves de host (arquivos, diretórios ou '-' para stdin) e gera o relatório"""
+    index = HostKeyIndex()
+    start = time.perf_counter()
+    try:
+        for path in paths:
+            if path == '-':
+                index.add_file(sys.stdin)
+                continue
+            files = [path]
+            if os.path.isdir(path):
+                files = sorted(entry.path for entry in os.scandir(path) if entry.is_file())
+            for file_path in files:
+                with open(file_path, errors='replace') as f:
+                    index.add_file(f)
+    except OSError as e:
+        logging.error(f"❌ {e}")
+        return False
+    logging.info(f"Agregação: {index.records} registros, {len(index.keys)} chaves distintas "
+                 f"em {time.perf_counter() - start:.3f}s")
+    
+    print("\n" + generate_host_key_report(index) + "\n")
+    return True
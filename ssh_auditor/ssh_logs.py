@@ -0,0 +1,113 @@
+"""
+SSH Auditor - logs e relatórios
+
+Leitura do log JSON de auditoria (incluindo as rotações do logrotate, mesmo
+compactadas) e listagem dos relatórios salvos, usadas pelo menu interativo.
+"""
+
+import os
+import re
+import bz2
+import gzip
+import json
+import lzma
+import fnmatch
+import collections
+from typing import Iterator, List, Tuple
+
+REPORT_DIR = "/var/log"
+REPORT_PATTERN = "ssh_audit_*.txt"
+LOG_READ_BLOCK = 1024 * 1024
+LOG_DECOMPRESSORS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+# Rotações do logrotate: ssh_auditor.log.1, ssh_auditor.log.2.gz ou ssh_auditor.log-20261018.gz (dateext).
+# .zst não é lido: zstd não faz parte da biblioteca padrão
+LOG_ROTATION_SUFFIX = re.compile(r'^(?:\.(?P<index>\d+)|-(?P<date>\d{8,10}))(?:\.(?:gz|bz2|xz))?$')
+
+def tail_lines(path: str, count: int, block_size: int = 65536) -> List[str]:
+    """Últimas `count` linhas do arquivo, lendo blocos a partir do fim (sem carregar o log inteiro)"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b''
+        while position > 0 and data.count(b'\n') <= count:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.decode(errors='replace').splitlines()
+    return lines[-count:] if count > 0 else []
+
+def log_segments(path: str) -> List[str]:
+    """Arquivo de log e suas rotações, do segmento mais antigo ao atual"""
+    directory = os.path.dirname(path) or '.'
+    name = os.path.basename(path)
+    segments = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name == name:
+                    segments.append(((2, 0), entry.path))
+                elif entry.name.startswith(name):
+                    match = LOG_ROTATION_SUFFIX.match(entry.name[len(name):])
+                    if match is None:
+                        continue
+                    if match.group('index'):
+                        # Número maior = rotação mais antiga
+                        segments.append(((1, -int(match.group('index'))), entry.path))
+                    else:
+                        segments.append(((0, int(match.group('date'))), entry.path))
+    except OSError:
+        return []
+    return [segment for _, segment in sorted(segments)]
+
+def read_log_lines(path: str, block_size: int = LOG_READ_BLOCK) -> Iterator[str]:
+    """Linhas de um segmento, descompactando em streaming (blocos grandes, nada vai para o disco)"""
+    opener = LOG_DECOMPRESSORS.get(os.path.splitext(path)[1], open)
+    carry = b''
+    with opener(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            lines = (carry + block).split(b'\n')
+            carry = lines.pop()
+            for line in lines:
+                yield line.decode(errors='replace')
+    if carry:
+        yield carry.decode(errors='replace')
+
+def tail_log(path: str, count: int) -> List[str]:
+    """Últimas `count` linhas do log, completando com as rotações anteriores se o atual for curto"""
+    lines: List[str] = []
+    for segment in reversed(log_segments(path)):
+        missing = count - len(lines)
+        if missing <= 0:
+            break
+        if os.path.splitext(segment)[1] in LOG_DECOMPRESSORS:
+            older = list(collections.deque(read_log_lines(segment), maxlen=missing))
+        else:
+            older = tail_lines(segment, missing)
+        lines = older + lines
+    return lines
+
+def format_log_entry(line: str) -> str:
+    """Linha do log JSON em formato legível; linhas não-JSON são exibidas como estão"""
+    try:
+        entry = json.loads(line)
+        timestamp = entry.get('timestamp', 'N/A')
+        level = entry.get('level', 'N/A')
+        message = entry.get('message', 'N/A')
+        return f"[{timestamp}] [{level}] {message}"
+    except (json.JSONDecodeError, AttributeError):
+        return line.strip()
+
+def list_reports(directory: str = REPORT_DIR, pattern: str = REPORT_PATTERN) -> List[Tuple[str, os.stat_result]]:
+    """Relatórios salvos (caminho, stat), do mais recente para o mais antigo"""
+    reports = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if fnmatch.fnmatch(entry.name, pattern) and entry.is_file():
+                    reports.append((entry.path, entry.stat()))
+    except OSError:
+        return []
+    # O nome contém o timestamp (ssh_audit_AAAAMMDD_HHMMSS.txt)
+    reports.sort(key=lambda report: os.path.basename(report[0]), reverse=True)
+    return reports
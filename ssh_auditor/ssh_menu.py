@@ -0,0 +1,372 @@
+"""
+SSH Auditor - menu interativo
+"""
+
+import os
+import sys
+import time
+import logging
+import datetime
+
+import ssh_auditor as core
+from ssh_auditor import detect_distro
+from ssh_audit import generate_audit_report, run_full_audit
+from ssh_fix import (create_sudo_user, fix_authorized_keys, fix_file_permissions, fix_moduli, fix_ssh_config,
+                     install_fail2ban, restart_ssh_with_retry)
+from ssh_logs import format_log_entry, list_reports, log_segments, tail_log
+
+# --- Menu Interativo ---
+def interactive_menu():
+    """Menu interativo para facilitar o uso do script"""
+    
+    def print_header():
+        os.system('clear' if os.name == 'posix' else 'cls')
+        print("=" * 80)
+        print("SSH AUDITOR AND HARDENING TOOL - ENTERPRISE EDITION v1.0")
+        print(f"Servidor: {os.uname().nodename}")
+        print(f"Distro: {detect_distro()}")
+        print("=" * 80)
+        print()
+    
+    def print_menu():
+        print("MENU PRINCIPAL:")
+        print()
+        print("  [1] Auditoria de Segurança SSH")
+        print("  [2] Simular Correções (Dry-Run)")
+        print("  [3] Aplicar Correções (CUIDADO!)")
+        print("  [4] Instalar/Configurar Fail2ban")
+        print("  [5] Criar Usuário Sudo")
+        print("  [6] Auditoria + Hardening Completo")
+        print("  [7] Ver Logs de Auditoria")
+        print("  [8] Ver Relatórios Salvos")
+        print()
+        print("  [0] Sair")
+        print()
+        print("-" * 80)
+    
+    def wait_key():
+        input("\nPressione ENTER para continuar...")
+    
+    def confirm_action(message):
+        while True:
+            response = input(f"\n{message} (s/n): ").lower().strip()
+            if response in ['s', 'sim', 'y', 'yes']:
+                return True
+            elif response in ['n', 'nao', 'não', 'no']:
+                return False
+            print("Resposta inválida. Digite 's' para sim ou 'n' para não.")
+    
+    def run_audit():
+        print_header()
+        print("EXECUTANDO AUDITORIA DE SEGURANÇA SSH...")
+        print("-" * 80)
+        print()
+        
+        all_issues = run_full_audit()
+        
+        report = generate_audit_report(all_issues)
+        print(report)
+        
+        report_path = f"/var/log/ssh_audit_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+        try:
+            with open(report_path, 'w') as f:
+                f.write(report)
+            print(f"\nRelatório salvo em: {report_path}")
+        except Exception as e:
+            logging.warning(f"Não foi possível salvar relatório: {e}")
+        
+        wait_key()
+    
+    def run_dry_run():
+        print_header()
+        print("SIMULAÇÃO DE CORREÇÕES (DRY-RUN)")
+        print("-" * 80)
+        print()
+        
+        logging.info("Modo Dry-Run ativado - nenhuma alteração será feita")
+        print()
+        
+        fix_ssh_config(dry_run=True)
+        fix_file_permissions(dry_run=True)
+        fix_authorized_keys(dry_run=True)
+        fix_moduli(dry_run=True)
+        
+        print()
+        print("=" * 80)
+        print("SIMULAÇÃO CONCLUÍDA")
+        print("Nenhuma alteração foi aplicada ao sistema.")
+        print("=" * 80)
+        
+        wait_key()
+    
+    def run_fix():
+        print_header()
+        print("APLICAR CORREÇÕES DE HARDENING")
+        print("-" * 80)
+        print()
+        print("ATENÇÃO: Esta operação irá modificar configurações do SSH!")
+        print()
+        print("Recomendações antes de continuar:")
+        print("  - Certifique-se de ter acesso alternativo ao servidor (console/IPMI)")
+        print("  - Verifique se há pelo menos 1 usuário com chave SSH configurada")
+        print("  - Backup do sshd_config será criado automaticamente")
+        print()
+        
+        if not confirm_action("Deseja continuar com as correções?"):
+            print("\nOperação cancelada pelo usuário.")
+            wait_key()
+            return
+        
+        print()
+        print("Aplicando correções...")
+        print("-" * 80)
+        print()
+        
+        success = True
+        
+        if not fix_ssh_config(dry_run=False):
+            logging.error("Falha ao corrigir configurações SSH")
+            success = False
+        
+        if not fix_file_permissions(dry_run=False):
+            logging.error("Falha ao corrigir permissões")
+            success = False
+        
+        if not fix_authorized_keys(dry_run=False):
+            logging.error("Falha ao corrigir authorized_keys")
+            success = False
+        
+        if not fix_moduli(dry_run=False):
+            logging.error("Falha ao filtrar moduli")
+            success = False
+        
+        if success:
+            print()
+            print("Reiniciando serviço SSH...")
+            if not restart_ssh_with_retry():
+                logging.error("FALHA CRÍTICA: SSH não reiniciou corretamente")
+                print()
+                print("ATENÇÃO: Verifique o serviço SSH manualmente!")
+                print("Comando: systemctl status sshd")
+                success = False
+        
+        print()
+        print("=" * 80)
+        if success:
+            print("CORREÇÕES APLICADAS COM SUCESSO")
+        else:
+            print("CORREÇÕES CONCLUÍDAS COM FALHAS")
+            print("Verifique os logs em: " + core.LOG_FILE)
+        print("=" * 80)
+        
+        wait_key()
+    
+    def run_fail2ban():
+        print_header()
+        print("INSTALAR/CONFIGURAR FAIL2BAN")
+        print("-" * 80)
+        print()
+        
+        if install_fail2ban(dry_run=False):
+            print()
+            print("=" * 80)
+            print("FAIL2BAN CONFIGURADO COM SUCESSO")
+            print("=" * 80)
+        else:
+            print()
+            print("=" * 80)
+            print("FALHA AO CONFIGURAR FAIL2BAN")
+            print("=" * 80)
+        
+        wait_key()
+    
+    def run_create_user():
+        print_header()
+        print("CRIAR USUÁRIO SUDO")
+        print("-" * 80)
+        print()
+        
+        username = input("Digite o nome do usuário (formato: [a-z_][a-z0-9_-]{0,31}): ").strip()
+        
+        if not username:
+            print("\nOperação cancelada.")
+            wait_key()
+            return
+        
+        print()
+        if create_sudo_user(username, dry_run=False):
+            print()
+            print("=" * 80)
+            print("USUÁRIO CRIADO COM SUCESSO")
+            print("=" * 80)
+        else:
+            print()
+            print("=" * 80)
+            print("FALHA AO CRIAR USUÁRIO")
+            print("=" * 80)
+        
+        wait_key()
+    
+    def run_full_hardening():
+        print_header()
+        print("AUDITORIA + HARDENING COMPLETO")
+        print("-" * 80)
+        print()
+        print("Esta operação irá:")
+        print("  1. Executar auditoria completa")
+        print("  2. Aplicar todas as correções de hardening")
+        print("  3. Instalar e configurar Fail2ban")
+        print()
+        print("ATENÇÃO: Certifique-se de ter acesso alternativo ao servidor!")
+        print()
+        
+        if not confirm_action("Deseja continuar?"):
+            print("\nOperação cancelada pelo usuário.")
+            wait_key()
+            return
+        
+        print()
+        print("Executando auditoria...")
+        print("-" * 80)
+        
+        all_issues = run_full_audit()
+        
+        report = generate_audit_report(all_issues)
+        print(report)
+        
+        print()
+        if not confirm_action("Deseja aplicar as correções?"):
+            print("\nOperação cancelada pelo usuário.")
+            wait_key()
+            return
+        
+        print()
+        print("Aplicando correções...")
+        print("-" * 80)
+        
+        success = True
+        
+        if not fix_ssh_config(dry_run=False):
+            success = False
+        
+        if not fix_file_permissions(dry_run=False):
+            success = False
+        
+        if not fix_authorized_keys(dry_run=False):
+            success = False
+        
+        if not fix_moduli(dry_run=False):
+            success = False
+        
+        if success:
+            if not restart_ssh_with_retry():
+                success = False
+        
+        print()
+        print("Instalando Fail2ban...")
+        if not install_fail2ban(dry_run=False):
+            success = False
+        
+        print()
+        print("=" * 80)
+        if success:
+            print("HARDENING COMPLETO APLICADO COM SUCESSO")
+        else:
+            print("HARDENING CONCLUÍDO COM FALHAS")
+        print("=" * 80)
+        
+        wait_key()
+    
+    def view_logs():
+        print_header()
+        print("LOGS DE AUDITORIA")
+        print("-" * 80)
+        print()
+        
+        segments = log_segments(core.LOG_FILE)
+        if not segments:
+            print(f"Arquivo de log não encontrado: {core.LOG_FILE}")
+            wait_key()
+            return
+        
+        print(f"Exibindo últimas 30 linhas de: {core.LOG_FILE}")
+        if len(segments) > 1:
+            print(f"(incluindo {len(segments) - 1} rotação(ões) anteriores)")
+        print()
+        
+        try:
+            for line in tail_log(core.LOG_FILE, 30):
+                print(format_log_entry(line))
+        except Exception as e:
+            print(f"Erro ao ler logs: {e}")
+        
+        wait_key()
+    
+    def view_reports():
+        print_header()
+        print("RELATÓRIOS SALVOS")
+        print("-" * 80)
+        print()
+        
+        reports = list_reports()
+        
+        if not reports:
+            print("Nenhum relatório encontrado.")
+            wait_key()
+            return
+        
+        print(f"Encontrados {len(reports)} relatório(s):\n")
+        
+        for i, (report, stat) in enumerate(reports[:10], 1):
+            size = stat.st_size
+            mtime = datetime.datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+            print(f"  [{i}] {os.path.basename(report)}")
+            print(f"      Data: {mtime} | Tamanho: {size} bytes")
+            print()
+        
+        if len(reports) > 10:
+            print(f"... e mais {len(reports) - 10} relatório(s)")
+            print()
+        
+        choice = input("Digite o número do relatório para visualizar (ou ENTER para voltar): ").strip()
+        
+        if choice.isdigit() and 1 <= int(choice) <= min(10, len(reports)):
+            print()
+            print("=" * 80)
+            with open(reports[int(choice) - 1][0], 'r') as f:
+                print(f.read())
+            print("=" * 80)
+        
+        wait_key()
+    
+    # Loop principal do menu
+    while True:
+        print_header()
+        print_menu()
+        
+        choice = input("Escolha uma opção: ").strip()
+        
+        if choice == '1':
+            run_audit()
+        elif choice == '2':
+            run_dry_run()
+        elif choice == '3':
+            run_fix()
+        elif choice == '4':
+            run_fail2ban()
+        elif choice == '5':
+            run_create_user()
+        elif choice == '6':
+            run_full_hardening()
+        elif choice == '7':
+            view_logs()
+        elif choice == '8':
+            view_reports()
+        elif choice == '0':
+            print()
+            print("Encerrando...")
+            sys.exit(0)
+        else:
+            print()
+            print("Opção inválida. Tente novamente.")
+            time.sleep(1)
@@ -0,0 +1,237 @@
+"""
+SSH Auditor - servidor local
+
+Processo de longa duração (--serve) que atende requisições JSON em um socket
+Unix. O servidor habilita o FILE_CACHE do núcleo: o modelo do sshd_config, os
+mapas uid/gid, a lista de usuários e os fatos do host (distro, chaves de host)
+só são recalculados quando os arquivos de origem mudam.
+
+Protocolo: uma requisição JSON por linha, uma resposta JSON por linha (a
+conexão pode ser reutilizada). O campo opcional "id" é devolvido na resposta.
+  {"op": "audit", "profile": "cis-l2"}   auditoria completa
+  {"op": "plan"}                         plano do --fix --dry-run (nada é alterado)
+  {"op": "history", "limit": 20}         auditorias e planos atendidos
+  {"op": "status"}                       versão, fatos do host e estatísticas de cache
+"""
+
+import os
+import json
+import time
+import socket
+import signal
+import logging
+import datetime
+import threading
+import collections
+import socketserver
+from typing import Dict, List, Optional
+
+import ssh_auditor as core
+from ssh_auditor import (FILE_CACHE, VERSION, Severity, detect_distro, get_sftp_server_path, issues_to_json,
+                         load_profile, log_event)
+from ssh_audit import is_complete, run_full_audit
+from ssh_fix import plan_fixes
+
+SERVER_HISTORY = 200
+SERVER_MAX_REQUEST = 1024 * 1024
+# Usuários vêm de getent (NSS/LDAP): mudanças fora de /etc/passwd aparecem em até 5 minutos
+SERVER_CACHE_TTL = 300
+
+class AuditService:
+    """Despacha requisições do socket; auditorias e planos são serializados"""
+    
+    def __init__(self, default_profile: str):
+        self.default_profile = default_profile
+        self.started = time.time()
+        self.requests = 0
+        self.history = collections.deque(maxlen=SERVER_HISTORY)
+        # audit/plan compartilham a raiz auditada e o COMMAND_RUNNER: um por vez;
+        # status e history respondem mesmo durante uma auditoria longa
+        self._lock = threading.Lock()
+        self._handlers = {
+            'audit': self.audit,
+            'plan': self.plan,
+            'history': self.query_history,
+            'status': self.status,
+        }
+    
+    def handle(self, request: Dict) -> Dict:
+        self.requests += 1
+        op = request.get('op')
+        handler = self._handlers.get(op)
+        if handler is None:
+            response = {'ok': False, 'error': f"Operação desconhecida: {op!r} (use {', '.join(self._handlers)})"}
+        else:
+            try:
+                response = {'ok': True, 'op': op, 'result': handler(request)}
+            except ValueError as e:
+                response = {'ok': False, 'op': op, 'error': str(e)}
+            except Exception as e:
+                logging.exception(f"Erro ao atender '{op}'")
+                response = {'ok': False, 'op': op, 'error': f"{type(e).__name__}: {e}"}
+        if 'id' in request:
+            response['id'] = request['id']
+        return response
+    
+    def _record(self, op: str, profile: str, elapsed: float, counts: Dict[str, int]):
+        self.history.append({
+            'op': op,
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'profile': profile,
+            'elapsed_ms': round(elapsed * 1000, 1),
+            **counts,
+        })
+    
+    def audit(self, request: Dict) -> Dict:
+        profile = load_profile(request.get('profile') or self.default_profile)
+        durations: Dict[str, float] = {}
+        with self._lock:
+            start = time.perf_counter()
+            all_issues = run_full_audit(profile, durations)
+            elapsed = time.perf_counter() - start
+        
+        counts = collections.Counter(issue.severity for issues in all_issues.values() for issue in issues)
+        by_severity = {severity.name: counts[severity] for severity in Severity}
+        summary = {'total': sum(by_severity.values()), 'by_severity': by_severity, 'complete': is_complete(all_issues)}
+        self._record('audit', profile.name, elapsed, summary)
+        
+        result = {
+            'profile': profile.name,
+            'host': core.AUDIT_ROOT.hostname(),
+            'summary': summary,
+            'durations_ms': {category: round(seconds * 1000, 1) for category, seconds in durations.items()},
+        }
+        if not request.get('summary_only'):
+            result['issues'] = issues_to_json(all_issues)
+        return result
+    
+    def plan(self, request: Dict) -> Dict:
+        profile = load_profile(request.get('profile') or self.default_profile)
+        with self._lock:
+            start = time.perf_counter()
+            actions = plan_fixes(profile)
+            elapsed = time.perf_counter() - start
+        self._record('plan', profile.name, elapsed,
+                     {'total': sum(len(items) for items in actions.values())})
+        return {'profile': profile.name, 'actions': actions}
+    
+    def query_history(self, request: Dict) -> List[Dict]:
+        limit = request.get('limit', 20)
+        if not isinstance(limit, int) or limit < 0:
+            raise ValueError("'limit' deve ser um inteiro >= 0")
+        entries = list(self.history)
+        return entries[-limit:] if limit else []
+    
+    def status(self, request: Dict) -> Dict:
+        return {
+            'version': VERSION,
+            'pid': os.getpid(),
+            'uptime_s': round(time.time() - self.started, 1),
+            'requests': self.requests,
+            'host': core.AUDIT_ROOT.hostname(),
+            'distro': detect_distro(),
+            'sftp_server': get_sftp_server_path(),
+            'default_profile': self.default_profile,
+            'cache': FILE_CACHE.stats(),
+        }
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline(SERVER_MAX_REQUEST + 1)
+            if not line:
+                return
+            if len(line) > SERVER_MAX_REQUEST:
+                self._reply({'ok': False, 'error': f"Requisição maior que {SERVER_MAX_REQUEST} bytes"})
+                return
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("a requisição deve ser um objeto JSON")
+            except ValueError as e:
+                self._reply({'ok': False, 'error': f"JSON inválido: {e}"})
+                continue
+            logging.debug(f"Requisição: {request.get('op')!r}")
+            self._reply(self.server.service.handle(request))
+    
+    def _reply(self, response: Dict):
+        self.wfile.write(json.dumps(response, ensure_ascii=False).encode() + b'\n')
+        self.wfile.flush()
+
+class AuditServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    
+    def __init__(self, socket_path: str, service: AuditService):
+        self.service = service
+        # Socket criado já com 0600: só root (o dono do processo) pode consultar
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+def _remove_stale_socket(socket_path: str) -> bool:
+    """Remove socket de uma execução anterior; False se outro servidor ainda responde nele"""
+    if not os.path.exists(socket_path):
+        return True
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+        return False
+    except OSError:
+        os.unlink(socket_path)
+        return True
+    finally:
+        probe.close()
+
+def serve(socket_path: str, profile_name: str = core.DEFAULT_PROFILE,
+          cache_ttl: Optional[float] = SERVER_CACHE_TTL) -> bool:
+    """Atende requisições em socket_path até SIGTERM/Ctrl+C"""
+    try:
+        os.makedirs(os.path.dirname(socket_path) or '.', exist_ok=True)
+        if not _remove_stale_socket(socket_path):
+            logging.error(f"❌ Já existe um servidor ativo em {socket_path}")
+            return False
+    except OSError as e:
+        logging.error(f"❌ Não foi possível preparar o socket {socket_path}: {e}")
+        return False
+    
+    FILE_CACHE.enabled = True
+    FILE_CACHE.ttl = cache_ttl
+    service = AuditService(profile_name)
+    
+    # Primeira auditoria aquece os caches antes de aceitar conexões
+    logging.info("Aquecendo caches (auditoria inicial)...")
+    warmup = service.handle({'op': 'audit', 'summary_only': True})
+    if not warmup['ok']:
+        logging.error(f"❌ Auditoria inicial falhou: {warmup['error']}")
+        return False
+    
+    try:
+        server = AuditServer(socket_path, service)
+    except OSError as e:
+        logging.error(f"❌ Não foi possível escutar em {socket_path}: {e}")
+        return False
+    
+    def stop(signum, frame):
+        # shutdown() bloqueia até serve_forever sair: precisa de outra thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    
+    log_event('server_started', f"Servidor escutando em {socket_path}", {
+        'socket': socket_path,
+        'warmup_ms': warmup['result']['durations_ms'],
+    })
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        try:
+            os.unlink(socket_path)
+        except OSError:
+            pass
+    logging.info(f"Servidor encerrado ({service.requests} requisições atendidas)")
+    return True
@@ -0,0 +1,112 @@
+"""Agregação dos banimentos do Fail2ban em blocos CIDR"""
+
+import ipaddress
+import random
+
+import pytest
+
+from ssh_fix import (BAN_MIN_PREFIX, aggregate_bans, format_ban_set, ipset_rule_hint, load_ban_dump,
+                     parse_allowlist)
+
+def _networks(result):
+    return sorted(str(network) for network in result['networks'])
+
+def _covers(result, address):
+    address = ipaddress.ip_address(address)
+    return any(address in network for network in result['networks'])
+
+def test_dense_block_becomes_one_rule():
+    addresses = [f"198.51.100.{host}" for host in range(64, 128)]
+    result = aggregate_bans(addresses, [], min_density=1.0)
+    assert _networks(result) == ['198.51.100.64/26']
+    assert result['banned'] == result['covered'] == 64
+
+def test_density_descent_picks_halves_and_single_hosts():
+    # 10.0.0.0/29: seis banidos (densidade 0.75); 10.0.0.9 isolado na outra metade do /28
+    addresses = ['10.0.0.0', '10.0.0.1', '10.0.0.2', '10.0.0.4', '10.0.0.5', '10.0.0.6', '10.0.0.9']
+    assert _networks(aggregate_bans(addresses, [], min_density=0.75)) == ['10.0.0.0/29', '10.0.0.9/32']
+    # Com densidade 1.0 só blocos cheios: nenhum endereço extra é bloqueado
+    strict = aggregate_bans(addresses, [], min_density=1.0)
+    assert strict['covered'] == strict['banned'] == len(addresses)
+
+def test_ipv4_blocks_never_exceed_slash_16():
+    addresses = ['10.0.0.1', '10.0.255.1', '10.1.0.1', '10.1.255.1']
+    result = aggregate_bans(addresses, [], min_density=1e-9)
+    assert _networks(result) == ['10.0.0.0/16', '10.1.0.0/16']
+    assert min(network.prefixlen for network in result['networks']) == BAN_MIN_PREFIX[4]
+
+def test_ipv6_blocks_never_exceed_slash_48():
+    addresses = ['2001:db8::1', '2001:db8:0:ffff::1', '2001:db8:1::1', '2001:db8:1:ffff::1', '192.0.2.1']
+    result = aggregate_bans(addresses, [], min_density=1e-30)
+    assert _networks(result) == ['192.0.2.1/32', '2001:db8:1::/48', '2001:db8::/48']
+    assert all(network.prefixlen >= BAN_MIN_PREFIX[6] for network in result['networks'] if network.version == 6)
+    assert result['covered'] == 1 + 2 * 2 ** 80
+
+def test_allowlist_is_carved_out_of_dense_block():
+    addresses = [f"192.0.2.{host}" for host in range(256)]
+    allowlist = parse_allowlist(['192.0.2.77', '2001:db8::/64'])
+    result = aggregate_bans(addresses + ['2001:db8::5'], allowlist, min_density=0.5)
+    assert result['allowlisted'] == ['192.0.2.77', '2001:db8::5']
+    assert not _covers(result, '192.0.2.77')
+    assert all(_covers(result, address) for address in addresses if address != '192.0.2.77')
+    # Cobertura mínima ao redor do buraco: um bloco por bit do endereço liberado
+    assert len(result['networks']) == 8
+
+def test_allowlist_ranges_never_overlap_aggregated_prefixes():
+    rng = random.Random(48)
+    allowlist = parse_allowlist(['203.0.113.128/27', '198.51.100.9', '2001:db8:0:42::/64', 'not-an-ip'])
+    addresses = [f"203.0.113.{rng.randrange(256)}" for _ in range(200)]
+    addresses += [f"198.51.100.{rng.randrange(256)}" for _ in range(200)] + ['198.51.100.9']
+    addresses += [f"2001:db8:0:{rng.randrange(0x40, 0x44):x}::{rng.randrange(1 << 16):x}" for _ in range(200)]
+    for density in (0.01, 0.25, 0.5, 1.0):
+        result = aggregate_bans(addresses, allowlist, min_density=density)
+        for network in result['networks']:
+            assert not any(network.overlaps(allowed) for allowed in allowlist if allowed.version == network.version)
+        for address in addresses:
+            allowed = any(ipaddress.ip_address(address) in network for network in allowlist)
+            assert _covers(result, address) is not allowed
+
+def test_invalid_entries_are_counted():
+    result = aggregate_bans(['192.0.2.1', 'bogus', '10.0.0.0/24'], [])
+    assert result['invalid'] == 2
+    assert _networks(result) == ['192.0.2.1/32']
+
+@pytest.mark.parametrize('dump, expected', [
+    ("Status for the jail: sshd\n"
+     "|- Filter\n|  |- Currently failed:\t3\n|  `- Total failed:\t1024\n"
+     "`- Actions\n   |- Currently banned:\t2\n   `- Banned IP list:\t192.0.2.10 2001:db8::a\n",
+     ['192.0.2.10', '2001:db8::a']),
+    ("create f2b-sshd hash:ip family inet hashsize 1024 maxelem 65536 timeout 600\n"
+     "add f2b-sshd 198.51.100.7 timeout 554\nadd f2b-sshd 198.51.100.8/32\n",
+     ['198.51.100.7', '198.51.100.8']),
+    ("table inet f2b-table {\n\tset addr-set-sshd {\n\t\ttype ipv4_addr\n"
+     "\t\telements = { 203.0.113.5 expires 9m59s, 203.0.113.0/24, dead::beef }\n\t}\n}\n",
+     ['203.0.113.5', '203.0.113.0/24', 'dead::beef']),
+    ("2024-05-01 12:34:56,789 fail2ban.actions [811]: NOTICE [sshd] Ban 192.0.2.99\n", ['192.0.2.99']),
+])
+def test_load_ban_dump_reads_status_ipset_and_nft(tmp_path, dump, expected):
+    path = tmp_path / 'bans.txt'
+    path.write_text(dump)
+    assert load_ban_dump(str(path)) == expected
+
+def test_nft_output_defines_sets_chain_and_rules():
+    networks = [ipaddress.ip_network('192.0.2.0/24'), ipaddress.ip_network('2001:db8::1/128')]
+    content = format_ban_set(networks, 'nft', ports=[22, 2222])
+    assert content.startswith("table inet ssh_auditor\ndelete table inet ssh_auditor\n")
+    assert "elements = { 192.0.2.0/24 }" in content
+    assert "elements = { 2001:db8::1 }" in content
+    assert "type filter hook input priority -1; policy accept;" in content
+    assert "ip saddr @ssh_auditor_bans_v4 tcp dport { 22, 2222 } drop" in content
+    assert "ip6 saddr @ssh_auditor_bans_v6 tcp dport { 22, 2222 } drop" in content
+
+def test_ipset_output_is_sets_only_with_rule_hint():
+    content = format_ban_set([ipaddress.ip_network('192.0.2.0/24')], 'ipset')
+    assert content.splitlines() == [
+        "create ssh_auditor_bans hash:net family inet -exist",
+        "create ssh_auditor_bans6 hash:net family inet6 -exist",
+        "add ssh_auditor_bans 192.0.2.0/24 -exist",
+    ]
+    assert ipset_rule_hint(ports=[2222]) == [
+        "iptables -I INPUT -p tcp -m multiport --dports 2222 -m set --match-set ssh_auditor_bans src -j DROP",
+        "ip6tables -I INPUT -p tcp -m multiport --dports 2222 -m set --match-set ssh_auditor_bans6 src -j DROP",
+    ]
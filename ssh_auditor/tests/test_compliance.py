@@ -0,0 +1,182 @@
+"""Motor de regras de conformidade: comparadores, herança de perfis e avaliação"""
+
+import json
+
+import pytest
+
+import ssh_auditor
+from ssh_auditor import (ComplianceRule, Severity, SSHDConfigParser, compile_profile, compile_rule_check,
+                         parse_sshd_time, read_profile_spec)
+
+@pytest.mark.parametrize('value, expected', [
+    ('3', True), ('1', True), ('0', False), ('4', False), ('-3', False),
+    ('--3', False), ('3a', False), ('', False), (' 3', False), ('+3', False),
+])
+def test_range_rejects_malformed_integers(value, expected):
+    check = compile_rule_check('MaxAuthTries', {'check': 'range', 'min': 1, 'max': 3}, '3')
+    assert check(value) is expected
+
+@pytest.mark.parametrize('value, seconds', [
+    ('60', 60), ('30s', 30), ('1m', 60), ('1m30s', 90), ('1H', 3600), ('2w', 1209600),
+    ('', None), ('1x', None), ('m1', None), ('-1', None),
+])
+def test_parse_sshd_time(value, seconds):
+    assert parse_sshd_time(value) == seconds
+
+def test_range_with_time_units():
+    check = compile_rule_check('LoginGraceTime', {'check': 'range', 'min': 1, 'max': 60, 'units': 'time'}, '60')
+    assert check('1m')
+    assert check('45s')
+    assert not check('1m1s')
+    assert not check('2m')
+    assert not check('forever')
+
+def test_enum_is_case_insensitive():
+    check = compile_rule_check('PermitRootLogin', {'check': 'enum', 'allowed': ['no']}, 'no')
+    assert check('NO')
+    assert not check('prohibit-password')
+
+def test_subset_rejects_unknown_members_and_list_modifiers():
+    check = compile_rule_check('Ciphers', {'check': 'subset', 'allowed': ['aes256-ctr', 'aes128-ctr']},
+                               'aes256-ctr,aes128-ctr')
+    assert check('aes256-ctr')
+    assert check('aes128-ctr, aes256-ctr')
+    assert not check('aes256-ctr,3des-cbc')
+    assert not check('+aes256-ctr')
+    assert not check('')
+
+def test_subset_defaults_to_recommended_list():
+    check = compile_rule_check('MACs', {'check': 'subset'}, 'hmac-sha2-512,hmac-sha2-256')
+    assert check('hmac-sha2-256')
+    assert not check('hmac-sha1')
+
+def test_forbidden_allows_removal_lists():
+    check = compile_rule_check('PubkeyAcceptedAlgorithms', {'check': 'forbidden', 'forbidden': ['ssh-dss']},
+                               'ssh-ed25519')
+    assert check('ssh-ed25519,rsa-sha2-512')
+    assert check('-ssh-dss')
+    assert not check('+ssh-dss')
+    assert not check('ssh-ed25519,ssh-dss')
+
+def test_regex_is_anchored():
+    check = compile_rule_check('Banner', {'check': 'regex', 'pattern': r'/\S+'}, '/etc/issue.net')
+    assert check('/etc/issue.net')
+    assert not check('none')
+    assert not check('x /etc/issue.net')
+
+def test_invalid_rule_specs_raise_value_error():
+    with pytest.raises(ValueError):
+        compile_rule_check('X', {'check': 'regex', 'pattern': '('}, 'x')
+    with pytest.raises(ValueError):
+        compile_rule_check('X', {'check': 'between'}, 'x')
+    with pytest.raises(ValueError):
+        ComplianceRule.from_spec('X', {'check': 'equals'})
+
+def test_rule_evaluate_reports_missing_and_misconfigured():
+    rule = ComplianceRule.from_spec('MaxAuthTries', {'check': 'range', 'min': 1, 'max': 3,
+                                                     'recommended': '3', 'severity': 'HIGH'})
+    missing = rule.evaluate(None)
+    assert (missing.type, missing.severity, missing.parameter) == ('missing', Severity.HIGH, 'MaxAuthTries')
+    misconfigured = rule.evaluate('--3')
+    assert misconfigured.type == 'misconfigured'
+    assert misconfigured.current == '--3'
+    assert rule.evaluate('2') is None
+
+def write_profile(directory, name, spec):
+    path = directory / f"{name}.json"
+    path.write_text(json.dumps(spec))
+    return str(path)
+
+def test_extends_merges_overrides_and_removes_rules(tmp_path):
+    base = write_profile(tmp_path, 'base', {'name': 'base', 'rules': {
+        'MaxAuthTries': {'check': 'range', 'min': 1, 'max': 3, 'recommended': '3', 'severity': 'HIGH'},
+        'X11Forwarding': {'check': 'enum', 'allowed': ['no'], 'recommended': 'no'},
+        'LogLevel': {'check': 'enum', 'allowed': ['VERBOSE'], 'recommended': 'VERBOSE'},
+    }})
+    child = write_profile(tmp_path, 'child', {'name': 'child', 'extends': base, 'rules': {
+        'MaxAuthTries': {'max': 2, 'recommended': '2'},
+        'X11Forwarding': None,
+        'UsePAM': {'check': 'enum', 'allowed': ['yes'], 'recommended': 'yes'},
+    }})
+    spec = read_profile_spec(child)
+    assert set(spec['rules']) == {'MaxAuthTries', 'LogLevel', 'UsePAM'}
+    assert spec['rules']['MaxAuthTries'] == {'check': 'range', 'min': 1, 'max': 2, 'recommended': '2',
+                                             'severity': 'HIGH'}
+    
+    profile = compile_profile(spec)
+    issues = profile.evaluate({'maxauthtries': '3', 'LogLevel': 'verbose', 'UsePAM': 'yes'})
+    assert [(issue.type, issue.parameter) for issue in issues] == [('misconfigured', 'MaxAuthTries')]
+
+def test_extends_builtin_profile():
+    spec = read_profile_spec('fips')
+    assert spec['rules']['Ciphers']['severity'] == 'HIGH'
+    assert 'PermitRootLogin' in spec['rules']
+
+def test_circular_extends_is_rejected(tmp_path):
+    first = str(tmp_path / 'a.json')
+    second = write_profile(tmp_path, 'b', {'extends': first, 'rules': {}})
+    write_profile(tmp_path, 'a', {'extends': second, 'rules': {}})
+    with pytest.raises(ValueError, match='circular'):
+        read_profile_spec(first)
+
+def test_builtin_profile_evaluates_malformed_value_without_crashing():
+    profile = ssh_auditor.load_profile()
+    issues = profile.evaluate({'MaxAuthTries': '--3'})
+    assert any(issue.get('parameter') == 'MaxAuthTries' and issue.type == 'misconfigured' for issue in issues)
+
+def test_parser_keeps_first_occurrence_case_insensitively(tmp_path):
+    config = tmp_path / 'sshd_config'
+    config.write_text("permitrootlogin yes\nPermitRootLogin no\n")
+    parser = SSHDConfigParser(str(config))
+    assert parser.get('PermitRootLogin') == 'yes'
+    assert parser.has_param('PERMITROOTLOGIN')
+    assert parser.update_config({'PermitRootLogin': 'no'}) == ["PermitRootLogin no\n", "PermitRootLogin no\n"]
+
+@pytest.fixture
+def include_root(tmp_path):
+    ssh_dir = tmp_path / 'etc' / 'ssh'
+    (ssh_dir / 'sshd_config.d').mkdir(parents=True)
+    (ssh_dir / 'sshd_config').write_text(
+        "Include /etc/ssh/sshd_config.d/*.conf\n"
+        "X11Forwarding yes\n"
+        "Include extra.conf\n"
+        "LogLevel INFO\n"
+        "\nMatch User backup\n    PasswordAuthentication yes\n"
+    )
+    (ssh_dir / 'sshd_config.d' / '20-b.conf').write_text("X11Forwarding no\nMaxAuthTries 6\n")
+    (ssh_dir / 'sshd_config.d' / '10-a.conf').write_text("MaxAuthTries 2\n")
+    (ssh_dir / 'sshd_config.d' / 'notes.txt').write_text("PermitRootLogin yes\n")
+    (ssh_dir / 'extra.conf').write_text("LogLevel VERBOSE\n")
+    previous = ssh_auditor.AUDIT_ROOT
+    ssh_auditor.set_audit_root(ssh_auditor.LocalRoot(str(tmp_path)))
+    yield ssh_dir
+    ssh_auditor.set_audit_root(previous)
+
+def test_parser_expands_include_with_first_match_across_files(include_root):
+    parser = SSHDConfigParser()
+    assert parser.includes == ['/etc/ssh/sshd_config.d/10-a.conf', '/etc/ssh/sshd_config.d/20-b.conf',
+                               '/etc/ssh/extra.conf']
+    # Glob em ordem alfabética, expandido no ponto da diretiva: o include vence o principal
+    assert parser.get('MaxAuthTries') == '2'
+    assert parser.get('X11Forwarding') == 'no'
+    # Include relativo é resolvido em /etc/ssh; o LogLevel do principal vem depois dele
+    assert parser.get('LogLevel') == 'VERBOSE'
+    assert not parser.has_param('PermitRootLogin')
+    assert parser.origins['x11forwarding'] == '/etc/ssh/sshd_config.d/20-b.conf'
+
+def test_update_config_overrides_included_values(include_root):
+    parser = SSHDConfigParser()
+    new_lines = parser.update_config({'X11Forwarding': 'no', 'MaxAuthTries': '3', 'PermitRootLogin': 'no'})
+    assert new_lines[:3] == ["X11Forwarding no\n", "MaxAuthTries 3\n", "PermitRootLogin no\n"]
+    (include_root / 'sshd_config').write_text(''.join(new_lines))
+    
+    reparsed = SSHDConfigParser()
+    assert reparsed.get('MaxAuthTries') == '3'
+    assert reparsed.get('PermitRootLogin') == 'no'
+    assert new_lines.index("PermitRootLogin no\n") < new_lines.index("Match User backup\n")
+
+def test_include_is_not_followed_for_standalone_snapshots(tmp_path):
+    (tmp_path / 'extra.conf').write_text("PermitRootLogin yes\n")
+    config = tmp_path / 'sshd_config'
+    config.write_text(f"Include {tmp_path}/extra.conf\nPermitRootLogin no\n")
+    assert SSHDConfigParser(str(config)).get('PermitRootLogin') == 'no'
@@ -0,0 +1,29 @@
+"""Agregação de chaves de host da frota: clones com o mesmo hostname"""
+
+import io
+import json
+
+from ssh_fleet import HostKeyIndex
+
+def records(*rows):
+    return io.StringIO(''.join(json.dumps(dict(row, key_type='ED25519', bits=256)) + "\n" for row in rows))
+
+def test_clones_sharing_hostname_in_one_file_are_counted():
+    index = HostKeyIndex()
+    index.add_file(records({'host': 'ubuntu', 'fingerprint': 'SHA256:clone', 'collection': 'a1'},
+                           {'host': 'ubuntu', 'fingerprint': 'SHA256:clone', 'collection': 'b2'}))
+    assert [(fingerprint, entry[0]) for fingerprint, entry in index.duplicated()] == [('SHA256:clone', 2)]
+
+def test_legacy_records_sharing_hostname_are_counted():
+    index = HostKeyIndex()
+    index.add_file(records({'host': 'ubuntu', 'fingerprint': 'SHA256:clone', 'machine_id': 'f00d' * 8},
+                           {'host': 'ubuntu', 'fingerprint': 'SHA256:clone', 'machine_id': 'f00d' * 8}))
+    assert index.keys['SHA256:clone'][0] == 2
+
+def test_same_collection_counts_once():
+    index = HostKeyIndex()
+    index.add_file(records({'host': 'web1', 'fingerprint': 'SHA256:k', 'collection': 'c'},
+                           {'host': 'web1', 'fingerprint': 'SHA256:k', 'collection': 'c'},
+                           {'host': 'web2', 'fingerprint': 'SHA256:other', 'collection': 'd'}))
+    assert index.duplicated() == []
+    assert index.records == 3
@@ -0,0 +1,47 @@
+"""Cache de camadas de imagem: só conteúdo lido pelas auditorias, gravado com 0600"""
+
+import io
+import os
+import stat
+import tarfile
+
+import pytest
+
+from ssh_fleet import ImageLayer, _write_cache_json, extract_layer_facts, image_path_wanted
+
+@pytest.mark.parametrize('path, wanted', [
+    ('/etc/ssh/sshd_config', True),
+    ('/etc/ssh/sshd_config.d/50-cloud-init.conf', True),
+    ('/etc/ssh/moduli', True),
+    ('/etc/ssh/ssh_host_ed25519_key.pub', True),
+    ('/home/alice/.ssh/authorized_keys', True),
+    ('/etc/ssh/ssh_host_ed25519_key', False),
+    ('/etc/ssh/ssh_host_rsa_key.bak', False),
+    ('/etc/ssh/ca_user_key', False),
+    ('/etc/ssh/signing.key', False),
+    ('/etc/ssh/sshd_config.d/secret.key', False),
+    ('/home/alice/.ssh/id_ed25519', False),
+    ('/var/lib/app/data', None),
+])
+def test_image_path_wanted(path, wanted):
+    assert image_path_wanted(path) is wanted
+
+def test_private_files_keep_only_metadata(tmp_path):
+    layer_path = tmp_path / 'layer.tar'
+    with tarfile.open(layer_path, 'w') as archive:
+        for name, content in (('etc/ssh/sshd_config', b'PermitRootLogin no\n'),
+                              ('etc/ssh/ssh_host_rsa_key.bak', b'PRIVATE'),
+                              ('etc/ssh/ca.key', b'PRIVATE')):
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    facts = extract_layer_facts(ImageLayer('sha256:test', str(tmp_path), 'layer.tar', ''))
+    entries = facts['entries']
+    assert entries['/etc/ssh/sshd_config'][6] is not None
+    assert entries['/etc/ssh/ssh_host_rsa_key.bak'][6] is None
+    assert entries['/etc/ssh/ca.key'][6] is None
+
+def test_cache_files_are_private(tmp_path):
+    path = tmp_path / 'layer.json'
+    _write_cache_json(str(path), {'entries': {}})
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
@@ -0,0 +1,51 @@
+"""Modelo compacto de issues: acesso por campo e round-trip sem perdas"""
+
+import json
+
+import pytest
+
+from ssh_auditor import Issue, Severity, issues_from_json, issues_to_json
+
+def test_fields_are_reachable_as_attribute_key_and_get():
+    issue = Issue('misconfigured', 'HIGH', parameter='PermitRootLogin', current='yes', recommended='no')
+    assert issue.severity is Severity.HIGH
+    assert issue.parameter == issue['parameter'] == issue.get('parameter') == 'PermitRootLogin'
+    assert issue.get('path') is None
+    assert 'current' in issue and 'path' not in issue
+    with pytest.raises(AttributeError):
+        issue.path
+    with pytest.raises(KeyError):
+        issue['path']
+
+@pytest.mark.parametrize('issue', [
+    Issue('missing', Severity.MEDIUM, parameter='Banner', recommended='/etc/issue.net', comment=''),
+    Issue('insecure_permissions', 'CRITICAL', 'permissions', path='/etc/ssh', mode=0o777, expected=[0o755]),
+    Issue('audit_incomplete', 'LOW', collector='homes', skipped=8000, total=20003, extra={'nested': [1, None]}),
+    Issue('no_details', 'HIGH'),
+])
+def test_to_dict_from_dict_round_trip_is_lossless(issue):
+    data = issue.to_dict()
+    assert data['severity'] == issue.severity.name
+    restored = Issue.from_dict(json.loads(json.dumps(data)))
+    assert restored == issue
+    assert restored.to_dict() == data
+    assert list(restored.fields()) == list(issue.fields())
+
+def test_field_order_does_not_depend_on_keyword_order():
+    first = Issue('misconfigured', 'HIGH', parameter='X', current='1', recommended='2')
+    second = Issue('misconfigured', 'HIGH', recommended='2', current='1', parameter='X')
+    assert first == second
+    assert first.layout.names == second.layout.names
+
+def test_from_dict_accepts_legacy_dicts_and_rejects_incomplete_ones():
+    legacy = {'parameter': 'UsePAM', 'type': 'missing', 'severity': 'high', 'recommended': 'yes'}
+    issue = Issue.from_dict(legacy)
+    assert issue.severity is Severity.HIGH
+    assert issue.category is None
+    with pytest.raises(ValueError):
+        Issue.from_dict({'severity': 'HIGH'})
+
+def test_issues_json_round_trip():
+    result = {'ssh_config': [Issue('missing', 'HIGH', parameter='UsePAM')],
+              'permissions': [Issue('insecure_permissions', 'CRITICAL', 'permissions', path='/root/.ssh')]}
+    assert issues_from_json(json.loads(json.dumps(issues_to_json(result)))) == result
@@ -0,0 +1,33 @@
+"""Textfile do Prometheus: amostras do Fail2ban por estado do coletor"""
+
+import pytest
+
+import ssh_auditor
+from ssh_audit import format_metrics
+from ssh_auditor import Issue, Severity
+
+def _samples(all_issues, name):
+    text = format_metrics(all_issues, ssh_auditor.load_profile(), {}, finished_at=0)
+    full_name = f"ssh_auditor_{name}"
+    return [line.split()[1] for line in text.splitlines() if line.split()[0] == full_name]
+
+@pytest.mark.parametrize('types, installed, active', [
+    ([], ['1'], ['1']),
+    (['fail2ban_inactive'], ['1'], ['0']),
+    (['fail2ban_missing'], ['0'], ['0']),
+])
+def test_fail2ban_metrics_follow_collector_issues(types, installed, active):
+    all_issues = {'fail2ban': [Issue(kind, Severity.HIGH, 'fail2ban') for kind in types]}
+    assert _samples(all_issues, 'fail2ban_installed') == installed
+    assert _samples(all_issues, 'fail2ban_active') == active
+
+def test_fail2ban_active_ignores_unrelated_issue_types():
+    all_issues = {'fail2ban': [Issue('fail2ban_jail_weak', Severity.LOW, 'fail2ban')]}
+    assert _samples(all_issues, 'fail2ban_active') == ['1']
+
+@pytest.mark.parametrize('all_issues', [
+    {}, {'fail2ban': [Issue('audit_incomplete', Severity.MEDIUM, 'fail2ban')]},
+])
+def test_fail2ban_metrics_absent_when_collector_did_not_finish(all_issues):
+    assert _samples(all_issues, 'fail2ban_installed') == []
+    assert _samples(all_issues, 'fail2ban_active') == []
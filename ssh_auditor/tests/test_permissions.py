@@ -0,0 +1,76 @@
+"""Política de permissões: links em diretórios de usuários não são seguidos nem corrigidos"""
+
+import os
+import stat
+
+import pytest
+
+import ssh_auditor
+from ssh_audit import audit_file_permissions
+from ssh_fix import apply_fix_action, plan_file_permissions
+
+MALLORY_UID = 4242
+
+@pytest.fixture
+def image(tmp_path):
+    """Raiz offline com uma home cujo ~/.ssh/config aponta para um arquivo do root"""
+    etc = tmp_path / 'etc'
+    (etc / 'ssh').mkdir(parents=True)
+    (etc / 'ssh' / 'sshd_config').write_text("PermitRootLogin no\n")
+    (etc / 'shadow').write_text("root:*:19000::::::\n")
+    os.chmod(etc / 'shadow', 0o640)
+    (etc / 'passwd').write_text(f"root:x:0:0:root:/root:/bin/bash\n"
+                                f"mallory:x:{MALLORY_UID}:{MALLORY_UID}::/home/mallory:/bin/bash\n"
+                                f"alias:x:4243:4243::/home/mallory:/bin/sh\n"
+                                f"eve:x:4244:4244::/home/eve:/bin/bash\n")
+    (etc / 'group').write_text(f"root:x:0:\nmallory:x:{MALLORY_UID}:\n")
+    for user in ('mallory', 'eve'):
+        ssh_dir = tmp_path / 'home' / user / '.ssh'
+        ssh_dir.mkdir(parents=True)
+        os.symlink('/etc/shadow', ssh_dir / 'config')
+        os.symlink('/etc/shadow', ssh_dir / 'authorized_keys')
+        (ssh_dir / 'id_ed25519').write_text("chave\n")
+    previous = ssh_auditor.AUDIT_ROOT
+    ssh_auditor.set_audit_root(ssh_auditor.LocalRoot(str(tmp_path)))
+    yield tmp_path
+    ssh_auditor.set_audit_root(previous)
+
+def test_symlinks_in_home_are_reported_not_planned(image):
+    issues = audit_file_permissions()
+    config = str(image / 'home' / 'eve' / '.ssh' / 'config')
+    assert any(issue.type == 'unexpected_symlink' and issue.path == config for issue in issues)
+    
+    actions = plan_file_permissions()
+    targets = {action['path'] for action in actions}
+    assert config not in targets
+    assert not any(path.endswith(('/config', '/authorized_keys')) for path in targets)
+    # Arquivos comuns da mesma home continuam sendo corrigidos
+    assert str(image / 'home' / 'eve' / '.ssh' / 'id_ed25519') in targets
+
+def test_home_shared_by_different_uids_is_flagged_not_owned(image):
+    issues = audit_file_permissions()
+    shared = [issue for issue in issues if issue.type == 'shared_home']
+    assert [issue.users for issue in shared] == ['mallory, alias']
+    assert not any(issue.get('user') in ('mallory', 'alias') for issue in issues)
+
+def test_apply_fix_action_does_not_follow_symlinks(image):
+    target = image / 'etc' / 'shadow'
+    link = image / 'home' / 'eve' / '.ssh' / 'config'
+    assert not apply_fix_action({'action': 'chmod', 'path': str(link), 'mode': '0o600'})
+    assert not apply_fix_action({'action': 'chown', 'path': str(link), 'owner': 'root', 'group': None})
+    assert stat.S_IMODE(os.stat(target).st_mode) == 0o640
+
+def test_apply_fix_action_refuses_user_owned_directory_links(image):
+    target_dir = image / 'etc'
+    home = image / 'home' / 'eve'
+    os.rename(home / '.ssh', home / 'ssh.old')
+    os.symlink(str(target_dir), home / '.ssh')
+    os.lchown(home / '.ssh', MALLORY_UID + 2, MALLORY_UID + 2)
+    assert not apply_fix_action({'action': 'chmod', 'path': str(home / '.ssh' / 'shadow'), 'mode': '0o600'})
+    assert stat.S_IMODE(os.stat(target_dir / 'shadow').st_mode) == 0o640
+
+def test_apply_fix_action_changes_regular_files(image):
+    key = image / 'home' / 'eve' / '.ssh' / 'id_ed25519'
+    os.chmod(key, 0o644)
+    assert apply_fix_action({'action': 'chmod', 'path': str(key), 'mode': '0o600'})
+    assert stat.S_IMODE(os.stat(key).st_mode) == 0o600
@@ -0,0 +1,52 @@
+"""Sondagem de sessões SSH sobre uma árvore /proc falsa"""
+
+import os
+
+from ssh_fix import probe_ssh_sessions
+
+def make_process(proc, pid, name, ppid, cmdline, sockets=()):
+    directory = proc / str(pid)
+    (directory / 'fd').mkdir(parents=True)
+    (directory / 'stat').write_text(f"{pid} ({name}) S {ppid} {pid} {pid} 0 -1 4194560\n")
+    (directory / 'cmdline').write_bytes(cmdline.encode() + b'\0')
+    for number, inode in enumerate(sockets, 3):
+        os.symlink(f"socket:[{inode}]", directory / 'fd' / str(number))
+
+def make_tcp_table(proc, established, listening=()):
+    (proc / 'net').mkdir()
+    lines = ["  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n"]
+    for number, (inode, state) in enumerate([(inode, '01') for inode in established] +
+                                            [(inode, '0A') for inode in listening]):
+        lines.append(f"   {number}: 0100007F:0016 0100007F:C350 {state} 00000000:00000000 00:00000000 "
+                     f"00000000     0        0 {inode}\n")
+    (proc / 'net' / 'tcp').write_text(''.join(lines))
+
+def fake_proc(tmp_path):
+    proc = tmp_path / 'proc'
+    make_process(proc, 1, 'systemd', 0, '/sbin/init')
+    make_process(proc, 100, 'sshd', 1, 'sshd: /usr/sbin/sshd -D [listener] 1 of 10-100 startups', [10])
+    # Conexão ainda não autenticada (força bruta): monitor [accepted] e filho [preauth]
+    make_process(proc, 200, 'sshd', 100, 'sshd: unknown [accepted]', [20])
+    make_process(proc, 201, 'sshd', 200, 'sshd: unknown [preauth]', [20])
+    # Sessão de outra pessoa: monitor [priv] e processo do usuário no mesmo socket
+    make_process(proc, 300, 'sshd', 100, 'sshd: alice [priv]', [30])
+    make_process(proc, 301, 'sshd', 300, 'sshd: alice@pts/0', [30])
+    # Sessão de quem executa a ferramenta: sshd -> bash -> python
+    make_process(proc, 400, 'sshd', 100, 'sshd: bob [priv]', [40])
+    make_process(proc, 401, 'sshd', 400, 'sshd: bob@pts/1', [40])
+    make_process(proc, 402, 'bash', 401, '-bash')
+    make_process(proc, 403, 'python3', 402, 'python3 ssh_auditor.py --fix')
+    make_tcp_table(proc, established=[20, 30, 40], listening=[10])
+    return str(proc)
+
+def test_probe_ignores_unauthenticated_and_own_session(tmp_path):
+    assert probe_ssh_sessions(fake_proc(tmp_path), own_pid=403) == 1
+
+def test_probe_counts_own_session_when_not_descendant(tmp_path):
+    assert probe_ssh_sessions(fake_proc(tmp_path), own_pid=1) == 2
+
+def test_probe_without_sessions(tmp_path):
+    proc = tmp_path / 'proc'
+    make_process(proc, 100, 'sshd', 1, 'sshd: /usr/sbin/sshd -D [listener] 0 of 10-100 startups', [10])
+    make_tcp_table(proc, established=[], listening=[10])
+    assert probe_ssh_sessions(str(proc), own_pid=100) == 0
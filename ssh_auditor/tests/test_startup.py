@@ -0,0 +1,48 @@
+"""Inicialização do núcleo: quais módulos 'import ssh_auditor' carrega (sem medir tempo)"""
+
+import importlib
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import ssh_auditor
+
+AUDITOR_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMPONENTS = ('ssh_audit', 'ssh_fix', 'ssh_fleet', 'ssh_logs', 'ssh_menu', 'ssh_server')
+# Mesma lista do 'run_benchmarks.py --check-startup', além dos componentes
+HEAVY_MODULES = ('asyncio', 'subprocess', 'argparse', 'tarfile', 'random')
+
+def loaded_modules(code: str, *names: str) -> dict:
+    """Quais de 'names' estão em sys.modules após rodar 'code' em um interpretador novo"""
+    probe = f"{code}\nimport json, sys\nprint(json.dumps({{n: n in sys.modules for n in {names!r}}}))"
+    result = subprocess.run([sys.executable, '-c', probe], cwd=AUDITOR_DIR, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+def test_import_does_not_load_components_or_heavy_modules():
+    loaded = loaded_modules("import ssh_auditor", *COMPONENTS, *HEAVY_MODULES)
+    assert not [name for name, present in loaded.items() if present]
+
+def test_version_does_not_load_components():
+    code = "import sys; sys.argv = ['ssh_auditor.py', '--version']\nimport ssh_auditor; ssh_auditor.main()"
+    loaded = loaded_modules(code, *COMPONENTS, *HEAVY_MODULES)
+    assert not [name for name, present in loaded.items() if present]
+
+def test_unknown_attribute_raises_without_importing_components():
+    code = "import ssh_auditor\nassert not hasattr(ssh_auditor, 'no_such_name')\nassert not hasattr(ssh_auditor, '__path__')"
+    assert not any(loaded_modules(code, *COMPONENTS).values())
+
+def test_lazy_attribute_imports_only_its_component():
+    loaded = loaded_modules("import ssh_auditor\nssh_auditor.evaluate_fleet", *COMPONENTS)
+    assert loaded['ssh_fleet']
+    assert not loaded['ssh_menu'] and not loaded['ssh_server']
+
+def test_private_component_names_are_not_reexported():
+    with pytest.raises(AttributeError):
+        ssh_auditor.open_no_follow
+
+@pytest.mark.parametrize('name, component', sorted(ssh_auditor._LAZY_ATTRIBUTES.items()))
+def test_lazy_attribute_map_matches_components(name, component):
+    assert getattr(ssh_auditor, name) is getattr(importlib.import_module(component), name)
@@ -0,0 +1,30 @@
+"""Criação de usuários em lote: validação do arquivo antes de qualquer alteração"""
+
+import grp
+
+import pytest
+
+import ssh_fix
+from ssh_fix import UserSpec, local_group_members, validate_user_batch
+
+def test_username_matching_existing_group_is_rejected():
+    group = grp.getgrgid(0).gr_name
+    errors = validate_user_batch([UserSpec(group, '/bin/bash', '')])
+    assert any('grupo' in error for error in errors)
+
+def test_valid_batch_has_no_errors():
+    assert validate_user_batch([UserSpec('zz_batch_user', '/bin/bash', 'Equipe')]) == []
+
+def test_local_group_members_reads_only_the_group_file(tmp_path):
+    group_file = tmp_path / 'group'
+    group_file.write_text("root:x:0:\nsudo:x:27:alice,bob\nwheel:x:10:\n")
+    assert local_group_members('sudo', str(group_file)) == ['alice', 'bob']
+    assert local_group_members('wheel', str(group_file)) == []
+    with pytest.raises(KeyError):
+        local_group_members('docker', str(group_file))
+
+def test_default_home_base_follows_useradd(monkeypatch):
+    class Result:
+        stdout = "GROUP=100\nHOME=/srv/home\nSHELL=/bin/sh\n"
+    monkeypatch.setattr(ssh_fix, 'run_command', lambda *args, **kwargs: Result())
+    assert ssh_fix.default_home_base() == '/srv/home'